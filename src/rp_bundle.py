@@ -0,0 +1,223 @@
+"""
+Bundle the outputs of a job into one archive upload.
+
+Every output file otherwise costs its own TUS creation request and at least
+one PATCH, which adds up on high latency links when a job writes many small
+files next to its PSD. With `"bundle"` in the job input (or OUTPUT_BUNDLE for
+every job), the outputs are streamed as one archive into a single TUS upload:
+
+- `tar`: a POSIX (pax) tar.
+- `zip`: a zip with stored (uncompressed) entries.
+- `tar.zst`: a zstd compressed tar, needs the `zstandard` package (not in
+  requirements.txt, jobs asking for it are rejected if it is not installed).
+
+No archive is written to disk. The headers of a tar or zip are built up
+front, so the archive is a list of header bytes and file ranges with a known
+length that rp_tus sends without copying the files. A `tar.zst` has no known
+length and is uploaded with the TUS creation-defer-length extension.
+
+The manifest of the archive lists every entry with its size, MIME type and
+the offset of its data in the (uncompressed) archive.
+"""
+import importlib.util
+import mimetypes
+import os
+import struct
+import tarfile
+import time
+import zlib
+
+try:
+    from . import rp_tus
+except ImportError:
+    # Running as a script (e.g. /rp_handler.py in the container)
+    import rp_tus
+
+# Bundle the outputs of every job in this format ("tar", "zip" or "tar.zst") unless the job input says otherwise
+OUTPUT_BUNDLE = os.environ.get("OUTPUT_BUNDLE", "").lower()
+# zstd compression level of "tar.zst" bundles
+OUTPUT_BUNDLE_ZSTD_LEVEL = int(os.environ.get("OUTPUT_BUNDLE_ZSTD_LEVEL", 3))
+
+FORMATS = ("tar", "zip", "tar.zst")
+MIME_TYPES = {"tar": "application/x-tar", "zip": "application/zip", "tar.zst": "application/zstd"}
+# Packages beyond the standard library that a format needs
+REQUIRED_PACKAGES = {"tar.zst": "zstandard"}
+TAR_BLOCK_SIZE = tarfile.BLOCKSIZE
+# Zip without the zip64 extension
+ZIP_MAX_SIZE = 0xFFFFFFFF
+ZIP_MAX_ENTRIES = 0xFFFF
+# General purpose flag: the names are UTF-8
+ZIP_UTF8_FLAG = 0x800
+ZIP_STORED = 0
+ZIP_VERSION = 20
+# Bytes read at a time to checksum zip entries and to feed the zstd compressor
+READ_BLOCK_SIZE = 1024 * 1024
+
+
+def missing_package(bundle_format):
+    """The package that a format needs and that is not installed, None if the format can be written"""
+    package = REQUIRED_PACKAGES.get(bundle_format)
+    if package is not None and importlib.util.find_spec(package) is None:
+        return package
+    return None
+
+
+class Bundle:
+    """
+    An archive of output files, described as segments for rp_tus.
+
+    Args:
+        files (list): The paths of the files.
+        output_path (str): The directory the entry names are relative to.
+        bundle_format (str): "tar", "zip" or "tar.zst".
+    """
+
+    def __init__(self, files, output_path, bundle_format):
+        if bundle_format not in FORMATS:
+            raise ValueError(f"Unsupported bundle format: '{bundle_format}'")
+        self.format = bundle_format
+        self.mime_type = MIME_TYPES[bundle_format]
+        self.entries = []
+        self.segments = []
+        self.size = 0
+        for path in files:
+            name = os.path.relpath(path, output_path).replace(os.sep, "/")
+            mime_type, _ = mimetypes.guess_type(path)
+            self.entries.append({
+                "name": name,
+                "size": os.path.getsize(path),
+                "mime_type": mime_type or "application/octet-stream",
+                "path": path,
+            })
+        if bundle_format == "zip":
+            self._build_zip()
+        else:
+            self._build_tar()
+
+    def _add(self, segment):
+        self.segments.append(segment)
+        self.size += len(segment) if isinstance(segment, bytes) else segment[2]
+
+    def _build_tar(self):
+        for entry in self.entries:
+            info = tarfile.TarInfo(entry["name"])
+            info.size = entry["size"]
+            info.mtime = int(os.path.getmtime(entry["path"]))
+            info.mode = 0o644
+            self._add(info.tobuf(tarfile.PAX_FORMAT, "utf-8", "surrogateescape"))
+            entry["offset"] = self.size
+            self._add((entry["path"], 0, entry["size"]))
+            padding = -entry["size"] % TAR_BLOCK_SIZE
+            if padding:
+                self._add(bytes(padding))
+        # End of archive marker
+        self._add(bytes(2 * TAR_BLOCK_SIZE))
+
+    def _build_zip(self):
+        if len(self.entries) > ZIP_MAX_ENTRIES:
+            raise ValueError(f"A zip bundle holds at most {ZIP_MAX_ENTRIES} files, use tar")
+        central_directory = []
+        for entry in self.entries:
+            if entry["size"] > ZIP_MAX_SIZE:
+                raise ValueError(f"{entry['name']} is too large for a zip bundle, use tar")
+            name = entry["name"].encode("utf-8")
+            crc = file_crc32(entry["path"])
+            dos_time, dos_date = dos_timestamp(os.path.getmtime(entry["path"]))
+            header_offset = self.size
+            self._add(struct.pack(
+                "<IHHHHHIIIHH", 0x04034B50, ZIP_VERSION, ZIP_UTF8_FLAG, ZIP_STORED,
+                dos_time, dos_date, crc, entry["size"], entry["size"], len(name), 0,
+            ) + name)
+            entry["offset"] = self.size
+            self._add((entry["path"], 0, entry["size"]))
+            central_directory.append(struct.pack(
+                "<IHHHHHHIIIHHHHHII", 0x02014B50, (3 << 8) | ZIP_VERSION, ZIP_VERSION, ZIP_UTF8_FLAG,
+                ZIP_STORED, dos_time, dos_date, crc, entry["size"], entry["size"], len(name),
+                0, 0, 0, 0, 0o100644 << 16, header_offset,
+            ) + name)
+        directory_offset = self.size
+        directory = b"".join(central_directory)
+        if directory_offset + len(directory) > ZIP_MAX_SIZE:
+            raise ValueError("The outputs are too large for a zip bundle, use tar")
+        self._add(directory + struct.pack(
+            "<IHHHHIIH", 0x06054B50, 0, 0, len(self.entries), len(self.entries), len(directory), directory_offset, 0,
+        ))
+
+    def chunks(self):
+        """
+        The bytes of the archive, compressed for "tar.zst".
+
+        Yields:
+            bytes: Consecutive parts of the archive.
+        """
+        if self.format == "tar.zst":
+            import zstandard
+
+            compressor = zstandard.ZstdCompressor(level=OUTPUT_BUNDLE_ZSTD_LEVEL).compressobj()
+            for data in self._read_segments():
+                compressed = compressor.compress(data)
+                if compressed:
+                    yield compressed
+            yield compressor.flush()
+        else:
+            yield from self._read_segments()
+
+    def _read_segments(self):
+        for segment in self.segments:
+            if isinstance(segment, bytes):
+                yield segment
+                continue
+            path, start, length = segment
+            with open(path, "rb") as f:
+                f.seek(start)
+                while length > 0:
+                    data = f.read(min(READ_BLOCK_SIZE, length))
+                    if not data:
+                        raise OSError(f"{path} shrank while it was bundled")
+                    length -= len(data)
+                    yield data
+
+    def upload(self, upload_url, name):
+        """
+        Stream the archive into one TUS upload.
+
+        Args:
+            upload_url (str): The TUS endpoint.
+            name (str): The file name of the archive, sent as upload metadata.
+
+        Returns:
+            tuple: The URL of the upload and its size in bytes.
+        """
+        headers = {"mimeType": self.mime_type}
+        metadata = {"filename": name}
+        if self.format == "tar.zst":
+            uploader = rp_tus.DeferredUploader(self.chunks(), upload_url, headers, metadata=metadata)
+        else:
+            uploader = rp_tus.StreamUploader(self.segments, upload_url, headers, metadata=metadata)
+        return uploader.upload(), uploader.length
+
+    def manifest(self):
+        """The entries of the archive, for the job result"""
+        return [
+            {key: entry[key] for key in ("name", "size", "offset", "mime_type")}
+            for entry in self.entries
+        ]
+
+
+def file_crc32(path):
+    crc = 0
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(READ_BLOCK_SIZE)
+            if not data:
+                return crc
+            crc = zlib.crc32(data, crc)
+
+
+def dos_timestamp(mtime):
+    """The MS-DOS time and date of a zip entry"""
+    # The format starts in 1980, a day later to be safe in any time zone
+    local = time.localtime(max(mtime, 315619200))
+    dos_time = (local.tm_hour << 11) | (local.tm_min << 5) | (local.tm_sec // 2)
+    dos_date = ((local.tm_year - 1980) << 9) | (local.tm_mon << 5) | local.tm_mday
+    return dos_time, dos_date
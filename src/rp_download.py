@@ -0,0 +1,268 @@
+"""
+Parallel ranged download of input images.
+
+A single TCP stream to a presigned URL in another region stays far below the
+available bandwidth. `download` starts with a plain GET and checks its
+`Accept-Ranges` and `Content-Length`. If the server supports ranges and the
+file spans at least two DOWNLOAD_RANGE_SIZE ranges, the file is preallocated
+and its ranges are fetched by DOWNLOAD_CONCURRENCY threads, each writing its
+blocks in place with `os.pwrite`. The probe response itself serves the first
+range, so no request is wasted; the first GET is also what presigned URLs
+are signed for, unlike a HEAD.
+
+A failed range is retried from its last written byte, up to
+DOWNLOAD_RETRIES times. Servers without range support, or small files, are
+streamed to disk in one request.
+
+`open_stream` and `MultipartBody` hand a download to another server without
+touching the disk: the blocks of the response are sent as the file part of a
+multipart/form-data request as they arrive, e.g. to ComfyUI's /upload/image.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+
+# Number of ranges of a file downloaded in parallel, 1 to always stream
+DOWNLOAD_CONCURRENCY = int(os.environ.get("DOWNLOAD_CONCURRENCY", 4))
+# Size of each ranged request in bytes, smaller files are streamed
+DOWNLOAD_RANGE_SIZE = int(os.environ.get("DOWNLOAD_RANGE_SIZE", 16 * 1024 * 1024))
+# Attempts per range
+DOWNLOAD_RETRIES = int(os.environ.get("DOWNLOAD_RETRIES", 3))
+
+BLOCK_SIZE = 1024 * 1024
+# Timeout of the range requests
+TIMEOUT_S = 60
+# Wait before the second attempt of a range, doubled for every further attempt
+BACKOFF_S = 0.5
+
+
+class DownloadError(Exception):
+    """The download failed or returned unexpected data"""
+
+
+class InputTooLarge(DownloadError):
+    """The file is larger than the allowed size"""
+
+
+_sessions = threading.local()
+
+
+def session():
+    """A session per thread, so the ranges of a thread reuse one connection"""
+    if not hasattr(_sessions, "session"):
+        _sessions.session = requests.Session()
+    return _sessions.session
+
+
+def preallocate(fd, length):
+    """Reserve the blocks of the file, a sparse file where the file system cannot"""
+    try:
+        os.posix_fallocate(fd, 0, length)
+    except (AttributeError, OSError):
+        os.ftruncate(fd, length)
+
+
+def pwrite_all(fd, data, offset):
+    """Write all of `data` at `offset`, returns its length"""
+    view = memoryview(data)
+    written = 0
+    while written < len(view):
+        written += os.pwrite(fd, view[written:], offset + written)
+    return written
+
+
+def file_length(response):
+    """The size of the file of a response, None if it is unknown"""
+    content_length = response.headers.get("Content-Length")
+    # The length of an encoded body is not the length of the file
+    if not content_length or not str(content_length).isdigit() or response.headers.get("Content-Encoding"):
+        return None
+    return int(content_length)
+
+
+def download(url, save_path, concurrency=DOWNLOAD_CONCURRENCY, range_size=DOWNLOAD_RANGE_SIZE,
+             retries=DOWNLOAD_RETRIES, max_bytes=0):
+    """
+    Download a URL to a file, in parallel ranges when the server supports them.
+
+    Args:
+        url (str): The URL to download.
+        save_path (str): The path to save the file to.
+        concurrency (int, optional): The number of ranges downloaded at once.
+        range_size (int, optional): The size of each range in bytes.
+        retries (int, optional): Attempts per range.
+        max_bytes (int, optional): Raise InputTooLarge for larger files, 0 for no limit.
+
+    Returns:
+        dict: The downloaded `bytes`, the `mode` ("ranged" or "stream") and the number of `ranges`.
+
+    Raises:
+        requests.RequestException: The first request failed.
+        DownloadError: A range failed after all attempts, or the file is too large.
+    """
+    response = requests.get(url, stream=True)
+    response.raise_for_status()
+
+    length = file_length(response)
+    if max_bytes and length and length > max_bytes:
+        response.close()
+        raise InputTooLarge(f"Input image is larger than {max_bytes} bytes")
+
+    ranged = (
+        concurrency > 1
+        and length is not None
+        and length >= 2 * range_size
+        and str(response.headers.get("Accept-Ranges", "")).lower() == "bytes"
+    )
+    try:
+        with open(save_path, "wb") as f:
+            if not ranged:
+                return {"bytes": stream(f, response, max_bytes), "mode": "stream", "ranges": 1}
+            fd = f.fileno()
+            preallocate(fd, length)
+            ranges = [(start, min(range_size, length - start)) for start in range(0, length, range_size)]
+            with ThreadPoolExecutor(max_workers=min(concurrency, len(ranges))) as executor:
+                # The probe response serves the first range
+                futures = [executor.submit(fetch_range, url, fd, *ranges[0], retries, response)]
+                futures += [executor.submit(fetch_range, url, fd, start, size, retries) for start, size in ranges[1:]]
+                for future in as_completed(futures):
+                    if future.exception() is not None:
+                        # Fail now rather than after the rest of the file, only the ranges in flight finish
+                        for pending in futures:
+                            pending.cancel()
+                        raise future.exception()
+            return {"bytes": length, "mode": "ranged", "ranges": len(ranges)}
+    finally:
+        response.close()
+
+
+def stream(f, response, max_bytes=0):
+    """Write a whole response body to the file, returns its size"""
+    written = 0
+    for block in response.iter_content(BLOCK_SIZE):
+        written += len(block)
+        if max_bytes and written > max_bytes:
+            raise InputTooLarge(f"Input image is larger than {max_bytes} bytes")
+        f.write(block)
+    return written
+
+
+def fetch_range(url, fd, start, size, retries, response=None):
+    """
+    Download one byte range into its place in the file, resuming after failures.
+
+    Args:
+        response (requests.Response, optional): An open response whose body starts at `start`.
+    """
+    done = 0
+    error = None
+    for attempt in range(retries):
+        if attempt:
+            time.sleep(BACKOFF_S * 2 ** (attempt - 1))
+        try:
+            if response is None:
+                end = start + size - 1
+                response = session().get(url, headers={"Range": f"bytes={start + done}-{end}"}, stream=True, timeout=TIMEOUT_S)
+                response.raise_for_status()
+                content_range = response.headers.get("Content-Range", "")
+                if response.status_code != 206 or not content_range.startswith(f"bytes {start + done}-"):
+                    raise DownloadError(f"Unexpected response to a range request: {response.status_code} {content_range}")
+            # Count every written block, a retry resumes after the last one
+            for block in response.iter_content(BLOCK_SIZE):
+                done += pwrite_all(fd, block[:size - done], start + done)
+                if done >= size:
+                    return
+            error = DownloadError(f"Range {start}-{start + size - 1} ended after {done} bytes")
+        except (requests.RequestException, DownloadError) as e:
+            error = e
+        finally:
+            if response is not None:
+                response.close()
+        response = None
+    raise DownloadError(f"Failed to download bytes {start}-{start + size - 1}: {error}")
+
+
+def open_stream(url, max_bytes=0):
+    """
+    Start a download whose body is passed on block by block instead of being saved.
+
+    Args:
+        url (str): The URL to download.
+        max_bytes (int, optional): Raise InputTooLarge for larger files, 0 for no limit.
+
+    Returns:
+        tuple: The response (to close), the size of the file or None if unknown, and an iterator of its blocks.
+            The iterator raises DownloadError if the body does not match the announced size.
+
+    Raises:
+        requests.RequestException: The request failed.
+        InputTooLarge: The announced size is larger than `max_bytes`.
+    """
+    response = requests.get(url, stream=True)
+    response.raise_for_status()
+    length = file_length(response)
+    if max_bytes and length and length > max_bytes:
+        response.close()
+        raise InputTooLarge(f"Input image is larger than {max_bytes} bytes")
+
+    def blocks():
+        received = 0
+        for block in response.iter_content(BLOCK_SIZE):
+            received += len(block)
+            if max_bytes and received > max_bytes:
+                raise InputTooLarge(f"Input image is larger than {max_bytes} bytes")
+            yield block
+        if length is not None and received != length:
+            raise DownloadError(f"Download ended after {received} of {length} bytes")
+
+    return response, length, blocks()
+
+
+class MultipartBody:
+    """
+    A multipart/form-data request body whose file part is streamed from an iterator of blocks.
+
+    requests sends it as it is iterated, with a Content-Length when the size
+    of the file is known and chunked otherwise. The blocks are written to the
+    socket as they are, without being joined.
+    """
+
+    def __init__(self, fields, name, filename, content_type, blocks, size=None):
+        """
+        Args:
+            fields (dict): Form fields sent before the file.
+            name (str): The form field of the file.
+            filename (str): The filename of the file part.
+            content_type (str): The MIME type of the file.
+            blocks (iterable): The bytes of the file.
+            size (int, optional): The size of the file if known.
+        """
+        boundary = os.urandom(16).hex()
+        self.content_type = f"multipart/form-data; boundary={boundary}"
+        head = "".join(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{key}"\r\n\r\n{value}\r\n'
+            for key, value in fields.items()
+        )
+        head += (
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            f"Content-Type: {content_type}\r\n\r\n"
+        )
+        self.head = head.encode()
+        self.tail = f"\r\n--{boundary}--\r\n".encode()
+        self.blocks = blocks
+        self.size = size
+        # Read by requests for the Content-Length, None sends the body chunked
+        self.len = len(self.head) + size + len(self.tail) if size is not None else None
+        self.sent = 0
+
+    def __iter__(self):
+        yield self.head
+        for block in self.blocks:
+            self.sent += len(block)
+            yield block
+        if self.size is not None and self.sent != self.size:
+            raise DownloadError(f"Sent {self.sent} of {self.size} bytes")
+        yield self.tail
@@ -1,21 +1,61 @@
-import runpod
+import time
+
+# Taken before the other imports for the startup timeline
+IMPORT_STARTED_AT = time.time()
+
+import asyncio
+import atexit
+import base64
+import binascii
+import contextvars
 import json
 import urllib.request
 import urllib.parse
-import time
 import os
+import re
 import requests
 import uuid
 import logging
 import sys
 import glob
+import tempfile
+import threading
 import mimetypes
-from io import BytesIO
-from tusclient import client as tus_client
-from loki_logger_handler.loki_logger_handler import LokiLoggerHandler
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import ExitStack, contextmanager
+
+try:
+    from . import rp_bundle, rp_download, rp_job_trace, rp_logging, rp_memory, rp_metrics, rp_model_cache, rp_node_profile, rp_output_sink, rp_prewarm, rp_preview, rp_profiler, rp_resize, rp_scheduler, rp_staging, rp_startup, rp_tracing, rp_tus, rp_upload_spool
+except ImportError:
+    # Running as a script (e.g. /rp_handler.py in the container)
+    import rp_bundle
+    import rp_download
+    import rp_job_trace
+    import rp_logging
+    import rp_memory
+    import rp_metrics
+    import rp_model_cache
+    import rp_node_profile
+    import rp_output_sink
+    import rp_prewarm
+    import rp_preview
+    import rp_profiler
+    import rp_resize
+    import rp_scheduler
+    import rp_staging
+    import rp_startup
+    import rp_tracing
+    import rp_tus
+    import rp_upload_spool
 
 # Logging level - set to "debug" for verbose logging
 LOG_LEVEL = os.environ.get("LOG_LEVEL", "info").lower()
+# Maximum number of log records waiting to be shipped to Loki before the oldest are dropped
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", 10000))
+# Number of log records that triggers a flush to Loki
+LOG_BATCH_SIZE = int(os.environ.get("LOG_BATCH_SIZE", 100))
+# Maximum time between flushes to Loki in seconds
+LOG_FLUSH_INTERVAL_S = float(os.environ.get("LOG_FLUSH_INTERVAL_S", 2))
 # Time to wait between API check attempts in milliseconds
 COMFY_API_AVAILABLE_INTERVAL_MS = 50
 # Maximum number of API check attempts
@@ -25,21 +65,57 @@ COMFY_POLLING_INTERVAL_MS = int(os.environ.get("COMFY_POLLING_INTERVAL_MS", 250)
 # Maximum number of poll attempts
 COMFY_POLLING_MAX_RETRIES = int(os.environ.get("COMFY_POLLING_MAX_RETRIES", 500))
 # Host where ComfyUI is running
-COMFY_HOST = "127.0.0.1:8188"
+COMFY_HOST = os.environ.get("COMFY_HOST", "127.0.0.1:8188")
 # Enforce a clean state after each job is done
 # see https://docs.runpod.io/docs/handler-additional-controls#refresh-worker
 REFRESH_WORKER = os.environ.get("REFRESH_WORKER", "false").lower() == "true"
 # Enable dry mode - skip ComfyUI processing and just pass through images
 DRY_MODE = os.environ.get("DRY_MODE", "false").lower() == "true"
+# Collect a per-node execution profile from the ComfyUI websocket
+NODE_PROFILE = os.environ.get("NODE_PROFILE", "false").lower() == "true"
+# Write the node profile as a Chrome trace next to the outputs (uploaded with them)
+NODE_PROFILE_TRACE = os.environ.get("NODE_PROFILE_TRACE", "false").lower() == "true"
+# Size of each TUS PATCH request in bytes
+TUS_CHUNK_SIZE = int(os.environ.get("TUS_CHUNK_SIZE", 5 * 1024 * 1024))
+# Number of output files of a job uploaded in parallel
+UPLOAD_CONCURRENCY = int(os.environ.get("UPLOAD_CONCURRENCY", 1))
+# Split files larger than one chunk into this many parts uploaded in parallel (needs the TUS concatenation extension)
+TUS_PARALLEL_PARTS = int(os.environ.get("TUS_PARALLEL_PARTS", 1))
+# "tuspy", or "stream" for the zero-copy engine with adaptive chunks in rp_tus.py
+TUS_ENGINE = os.environ.get("TUS_ENGINE", "tuspy").lower()
+# Number of jobs the worker accepts at once, they take turns on ComfyUI ordered by estimated cost
+JOB_CONCURRENCY = int(os.environ.get("JOB_CONCURRENCY", 1))
+# Largest input image in bytes, downloaded or inline (0 = no limit)
+INPUT_MAX_BYTES = int(os.environ.get("INPUT_MAX_BYTES", 0))
+# "shared" saves the input into COMFY_INPUT_PATH, "upload" streams it to ComfyUI's /upload/image (ComfyUI may run elsewhere)
+INPUT_TRANSFER = os.environ.get("INPUT_TRANSFER", "shared").lower()
+
+# Base64 characters decoded at a time from inline inputs, a multiple of 4
+INLINE_DECODE_CHUNK = 1024 * 1024
+BASE64_PATTERN = re.compile(r"[A-Za-z0-9+/]*={0,2}")
+# Bytes of a streamed input kept to read its resolution, enough for the EXIF segment of a JPEG
+INPUT_HEADER_BYTES = 128 * 1024
 
 # Module-level logger
 logger = None
+# Hands ComfyUI to the waiting jobs of the worker, cheapest first
+scheduler = rp_scheduler.PriorityScheduler()
+# Estimates the execution time of a job from the jobs before it
+cost_model = rp_scheduler.CostModel()
+# Uploads the outputs after the handler returned, see get_upload_spool()
+upload_spool = None
+# Names of inputs uploaded to ComfyUI that no running job uses, see take_upload_name()
+upload_names = []
+upload_names_count = 0
+upload_names_lock = threading.Lock()
+# Ships queued log records to Loki in the background
+log_listener = None
 
 def setup_logger():
     """
     Sets up and configures the module-level logger instance.
     """
-    global logger
+    global logger, log_listener
     if logger is not None:
         return logger
         
@@ -50,11 +126,26 @@ def setup_logger():
 
     if LOKI_URL:
         logger.info("Configuring Loki logging.")
+        # Only imported when Loki is used
+        from loki_logger_handler.loki_logger_handler import LokiLoggerHandler
+
         loki_handler = LokiLoggerHandler(
             url=LOKI_URL,
-            labels={"app": "ois-gold-serverless-worker"}
+            labels={"app": "ois-gold-serverless-worker"},
+            timeout=LOG_FLUSH_INTERVAL_S,
         )
-        logger.addHandler(loki_handler)
+        # Keep Loki off the job hot path: records go through a bounded queue
+        # and are shipped in batches by a background thread
+        queue_handler, log_listener = rp_logging.create_queue_pipeline(
+            loki_handler,
+            maxsize=LOG_QUEUE_SIZE,
+            batch_size=LOG_BATCH_SIZE,
+            flush_interval=LOG_FLUSH_INTERVAL_S,
+            on_drop=rp_metrics.LOG_RECORDS_DROPPED.inc,
+        )
+        log_listener.start()
+        atexit.register(log_listener.stop)
+        logger.addHandler(queue_handler)
     else:
         logger.warning("Loki credentials not provided, falling back to local logging.")
         
@@ -76,6 +167,81 @@ def ensure_logger():
     if logger is None:
         setup_logger()
 
+def load_tus_client():
+    """
+    Import the TUS client on first use.
+
+    tusclient is only needed once outputs are uploaded, so it is kept out of
+    the handler import. It is also available as the module attribute `tus_client`.
+
+    Returns:
+        module: The `tusclient.client` module.
+    """
+    global tus_client
+    from tusclient import client as tus_client
+    return tus_client
+
+
+def __getattr__(name):
+    if name == "tus_client":
+        return load_tus_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def log_startup_timeline():
+    """
+    Log the startup timeline recorded so far, see rp_startup.
+    """
+    ensure_logger()
+    logger.info("Startup timeline", extra=rp_startup.timeline.durations())
+
+def log_prewarm_report(report):
+    """
+    Log the result of warming the page cache with the workflow models, see rp_prewarm.
+
+    Args:
+        report (dict): The report of `rp_prewarm.prewarm_workflow_models()`.
+    """
+    ensure_logger()
+    rp_startup.timeline.mark("models_prewarmed")
+    if "error" in report:
+        logger.warning("Model prewarm failed", extra={"error": report["error"]})
+        return
+    logger.info("Model prewarm finished", extra={
+        "files": report["files"],
+        "bytes": report["bytes"],
+        "seconds": report["seconds"],
+        "mb_per_second": report["mb_per_second"],
+    })
+    if report["missing"] or report["errors"] or report["skipped_over_budget"]:
+        logger.warning("Some models were not prewarmed", extra={
+            "missing": report["missing"],
+            "errors": report["errors"],
+            "skipped_over_budget": report["skipped_over_budget"],
+        })
+
+@contextmanager
+def timed_phase(timings, phase):
+    """
+    Measure the duration of a job phase.
+
+    The duration is added to the `timings` dict under `phase`, recorded in
+    the phase duration histogram and traced as a span named after the phase.
+
+    Args:
+        timings (dict): Per-job phase durations in seconds.
+        phase (str): The name of the phase, e.g. "download" or "execution".
+    """
+    start = time.perf_counter()
+    with rp_tracing.span(phase):
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            timings[phase] = timings.get(phase, 0) + elapsed
+            rp_metrics.PHASE_DURATION.observe(elapsed, phase)
+
+
 def validate_input(job_input):
     """
     Validates the input for the handler function.
@@ -102,6 +268,12 @@ def validate_input(job_input):
     input_url = job_input.get("input")
     if not isinstance(input_url, str):
         return None, "'input' must be a string containing an image URL"
+    if not input_url.startswith(("http://", "https://")):
+        inline = inline_input(input_url)
+        if inline is None:
+            return None, "'input' must be an image URL, a base64 data: URI or base64"
+        if INPUT_MAX_BYTES and inline[1] > INPUT_MAX_BYTES:
+            return None, f"'input' is larger than {INPUT_MAX_BYTES} bytes"
 
     # Validate 'output' in input
     output_url = job_input.get("output")
@@ -122,8 +294,39 @@ def validate_input(job_input):
     if denoise not in ["0.4", "0.6"]:
         return None, "'denoise' must be either '0.4' or '0.6'"
 
+    validated_data = {"input": input_url, "output": output_url, "params": params}
+
+    # Validate the optional 'priority' in input
+    if "priority" in job_input:
+        priority = job_input["priority"]
+        if (
+            not isinstance(priority, int)
+            or isinstance(priority, bool)
+            or not rp_scheduler.MIN_PRIORITY <= priority <= rp_scheduler.MAX_PRIORITY
+        ):
+            return None, f"'priority' must be an integer between {rp_scheduler.MIN_PRIORITY} and {rp_scheduler.MAX_PRIORITY}"
+        validated_data["priority"] = priority
+
+    # Validate the optional 'callback' in input
+    if "callback" in job_input:
+        callback = job_input["callback"]
+        if not isinstance(callback, str) or not callback.startswith(("http://", "https://")):
+            return None, "'callback' must be an http(s) URL"
+        validated_data["callback"] = callback
+
+    # Validate the optional 'bundle' in input, OUTPUT_BUNDLE is the default
+    bundle = job_input.get("bundle", rp_bundle.OUTPUT_BUNDLE)
+    if bundle:
+        if bundle not in rp_bundle.FORMATS:
+            return None, f"'bundle' must be one of {', '.join(rp_bundle.FORMATS)}"
+        # Fail now rather than after ComfyUI has run the job
+        package = rp_bundle.missing_package(bundle)
+        if package is not None:
+            return None, f"'bundle' {bundle} needs the {package} package, which is not installed"
+        validated_data["bundle"] = bundle
+
     # Return validated data and no error
-    return {"input": input_url, "output": output_url, "params": params}, None
+    return validated_data, None
 
 
 def check_server(url, retries=500, delay=50):
@@ -163,6 +366,9 @@ def download_image(url, save_path):
     """
     Download an image from a presigned URL and save it to a specified path.
 
+    Large files are downloaded in parallel byte ranges when the server
+    supports them, see rp_download.
+
     Args:
         url (str): The presigned URL to download the image from.
         save_path (str): The path to save the downloaded image.
@@ -176,56 +382,186 @@ def download_image(url, save_path):
     
     try:
         logger.info("Downloading image", extra={"url": url})
-        response = requests.get(url, stream=True)
-        response.raise_for_status()  # Raise an exception for HTTP errors
-
-        # Save the image to the specified path
-        with open(save_path, 'wb') as f:
-            f.write(response.content)
+        start_time = time.perf_counter()
+        download = rp_download.download(url, save_path, max_bytes=INPUT_MAX_BYTES)
+        elapsed = time.perf_counter() - start_time
+        logger.info("Image downloaded", extra={
+            "size_bytes": download["bytes"],
+            "mode": download["mode"],
+            "ranges": download["ranges"],
+            "seconds": round(elapsed, 3),
+        })
+
+        if rp_metrics.ENABLED:
+            rp_metrics.DOWNLOAD_BYTES.inc(download["bytes"])
+            if elapsed > 0:
+                rp_metrics.DOWNLOAD_THROUGHPUT.observe(download["bytes"] / elapsed)
 
         return True, None
-    except requests.RequestException as e:
+    except rp_download.InputTooLarge as e:
+        logger.error("Input image is too large", extra={"url": url, "max_bytes": INPUT_MAX_BYTES})
+        error_message = str(e)
+    except (requests.RequestException, rp_download.DownloadError, OSError) as e:
         error_message = f"Error downloading image: {str(e)}"
         logger.error("Failed to download image", extra={"url": url, "error": str(e)})
-        return False, error_message
+
+    # Do not leave a partial download behind, a ranged one is preallocated to the full size
+    if os.path.isfile(save_path):
+        os.remove(save_path)
+    return False, error_message
 
 
-def upload_image_to_comfy(image_data):
+def inline_input(source):
+    """
+    Locate the base64 payload of an inline input, a `data:` URI or plain base64.
+
+    Args:
+        source (str): The `input` of the job.
+
+    Returns:
+        tuple: The offset of the payload in `source` and its decoded size, None if it is not inline.
+    """
+    start = 0
+    if source.startswith("data:"):
+        comma = source.find(",")
+        if comma < 0 or not source[:comma].endswith(";base64"):
+            return None
+        start = comma + 1
+    length = len(source) - start
+    if length % 4 or not BASE64_PATTERN.fullmatch(source, start):
+        return None
+    padding = 2 if source.endswith("==") else 1 if source.endswith("=") else 0
+    return start, length // 4 * 3 - padding
+
+
+def decode_inline_image(source, save_path):
+    """
+    Decode an inline input image to a file.
+
+    The payload is decoded in slices of INLINE_DECODE_CHUNK characters, so
+    neither a copy of the payload nor the whole decoded image is held in
+    memory at once.
+
+    Args:
+        source (str): A base64 `data:` URI or plain base64.
+        save_path (str): The path to save the image to.
+
+    Returns:
+        tuple: (success_flag, error_message) like `download_image`.
+    """
+    ensure_logger()
+
+    inline = inline_input(source)
+    if inline is None:
+        return False, "Input is not a base64 data: URI or base64"
+    start, size = inline
+    if INPUT_MAX_BYTES and size > INPUT_MAX_BYTES:
+        return False, f"Input image is larger than {INPUT_MAX_BYTES} bytes"
+
+    logger.info("Decoding inline image", extra={"size_bytes": size})
+    try:
+        with open(save_path, "wb") as f:
+            for offset in range(start, len(source), INLINE_DECODE_CHUNK):
+                # validate=True rejects non-alphabet characters (binascii.Error), also on Python 3.10
+                f.write(base64.b64decode(source[offset:offset + INLINE_DECODE_CHUNK], validate=True))
+    except (binascii.Error, OSError) as e:
+        logger.error("Failed to decode inline image", extra={"error": str(e)})
+        return False, f"Error decoding inline image: {str(e)}"
+    return True, None
+
+
+def fetch_input_image(source, save_path):
+    """
+    Save the input image of a job, downloaded from its URL or decoded from inline base64.
+
+    Args:
+        source (str): The `input` of the job.
+        save_path (str): The path to save the image to.
+
+    Returns:
+        tuple: (success_flag, error_message) like `download_image`.
+    """
+    if source.startswith(("http://", "https://")):
+        return download_image(source, save_path)
+    return decode_inline_image(source, save_path)
+
+
+def take_upload_name():
+    """
+    A name to upload the input of a job to ComfyUI under, given back with `release_upload_name`.
+
+    ComfyUI keeps the uploads in its input directory. The names are reused,
+    the upload of a job overwrites the input of an earlier job, so there are
+    only as many of them as jobs ran at once.
+
+    Returns:
+        str: The file name.
+    """
+    global upload_names_count
+    with upload_names_lock:
+        if upload_names:
+            return upload_names.pop()
+        upload_names_count += 1
+        return f"input_{upload_names_count}.jpg"
+
+
+def release_upload_name(name):
+    """Give back a name from `take_upload_name` once ComfyUI has run the job"""
+    with upload_names_lock:
+        upload_names.append(name)
+
+
+def upload_image_to_comfy(image_data, filename=None, size=None, overwrite=True):
     """
     Upload an image to the ComfyUI server using the /upload/image endpoint.
 
+    The data is streamed into the multipart request as it is read, so an
+    image can be passed on from a download without saving or buffering it.
+
     Args:
-        image_data (tuple): A tuple containing (filename, binary_data) of the image.
+        image_data (tuple): A tuple containing (filename, data) of the image, the data as bytes or an iterable of byte blocks.
+        filename (str, optional): The filename to upload the image as, a UUID filename if not given.
+        size (int, optional): The size of the image if the data is an iterable and its size is known.
+        overwrite (bool, optional): Replace an input of the same name instead of ComfyUI choosing a new name.
 
     Returns:
-        dict: A dictionary containing the status and details of the upload.
+        dict: A dictionary containing the status and details of the upload. The `filename`
+              is the name ComfyUI assigned, as used by the `image` input of a LoadImage node.
     """
     ensure_logger()
     
     if not image_data:
         return {"status": "error", "message": "No image data provided"}
 
-    # Generate a UUID filename
-    image_filename = f"{uuid.uuid4()}.png"
-    binary_data = image_data[1]  # We only need the binary data, not the original filename
-    logger.info("Uploading image to ComfyUI", extra={"image_filename": image_filename})
+    # Generate a UUID filename unless the caller needs a specific one
+    image_filename = filename or f"{uuid.uuid4()}.png"
+    binary_data = image_data[1]  # We only need the data, not the original filename
+    if isinstance(binary_data, (bytes, bytearray)):
+        binary_data, size = [binary_data], len(binary_data)
+    logger.info("Uploading image to ComfyUI", extra={"image_filename": image_filename, "size_bytes": size})
 
     try:
-        # Prepare the form data
-        files = {
-            "image": (image_filename, BytesIO(binary_data), "image/png"),
-            "overwrite": (None, "true"),
-        }
+        body = rp_download.MultipartBody(
+            {"overwrite": "true" if overwrite else "false", "type": "input"},
+            "image", image_filename, get_mime_type(image_filename), binary_data, size,
+        )
 
         # POST request to upload the image
-        response = requests.post(f"http://{COMFY_HOST}/upload/image", files=files)
+        response = requests.post(f"http://{COMFY_HOST}/upload/image", data=body, headers={"Content-Type": body.content_type})
         response.raise_for_status()  # Raise an exception for HTTP errors
-        
-        logger.info("Image upload complete", extra={"image_filename": image_filename})
+
+        # ComfyUI renames the upload if the name is taken and overwrite is off
+        uploaded = response.json()
+        assigned_filename = uploaded.get("name", image_filename)
+        if uploaded.get("subfolder"):
+            assigned_filename = f"{uploaded['subfolder']}/{assigned_filename}"
+
+        logger.info("Image upload complete", extra={"image_filename": assigned_filename, "size_bytes": body.sent})
         return {
             "status": "success",
-            "message": f"Successfully uploaded {image_filename}",
-            "filename": image_filename
+            "message": f"Successfully uploaded {assigned_filename}",
+            "filename": assigned_filename,
+            "size_bytes": body.sent,
         }
     except requests.RequestException as e:
         error_message = f"Error uploading {image_filename}: {str(e)}"
@@ -236,19 +572,101 @@ def upload_image_to_comfy(image_data):
         }
 
 
-def queue_workflow(workflow):
+def stream_input_to_comfy(source, name):
+    """
+    Hand the input image of a job to ComfyUI over /upload/image instead of the shared input directory.
+
+    A download is passed on block by block as it arrives and inline base64 is
+    decoded slice by slice, so the image is neither saved nor held in memory
+    as a whole. Only its first INPUT_HEADER_BYTES are kept for its resolution.
+
+    Args:
+        source (str): The `input` of the job, a URL or inline base64.
+        name (str): The filename to upload the image as.
+
+    Returns:
+        tuple: (success_flag, result_or_error_message). The result contains the `filename`
+               ComfyUI assigned, the `size_bytes` and the `megapixels` of the image (None if unknown).
+    """
+    ensure_logger()
+
+    response = None
+    if source.startswith(("http://", "https://")):
+        try:
+            logger.info("Downloading image", extra={"url": source, "transfer": "upload"})
+            response, size, blocks = rp_download.open_stream(source, max_bytes=INPUT_MAX_BYTES)
+        except rp_download.InputTooLarge as e:
+            logger.error("Input image is too large", extra={"url": source, "max_bytes": INPUT_MAX_BYTES})
+            return False, str(e)
+        except requests.RequestException as e:
+            logger.error("Failed to download image", extra={"url": source, "error": str(e)})
+            return False, f"Error downloading image: {str(e)}"
+    else:
+        inline = inline_input(source)
+        if inline is None:
+            return False, "Input is not a base64 data: URI or base64"
+        start, size = inline
+        if INPUT_MAX_BYTES and size > INPUT_MAX_BYTES:
+            return False, f"Input image is larger than {INPUT_MAX_BYTES} bytes"
+        blocks = (
+            base64.b64decode(source[offset:offset + INLINE_DECODE_CHUNK], validate=True)
+            for offset in range(start, len(source), INLINE_DECODE_CHUNK)
+        )
+
+    header = bytearray()
+
+    def keep_header(blocks):
+        for block in blocks:
+            if len(header) < INPUT_HEADER_BYTES:
+                header.extend(block[:INPUT_HEADER_BYTES - len(header)])
+            yield block
+
+    start_time = time.perf_counter()
+    try:
+        upload = upload_image_to_comfy((name, keep_header(blocks)), filename=name, size=size)
+    except rp_download.InputTooLarge as e:
+        logger.error("Input image is too large", extra={"max_bytes": INPUT_MAX_BYTES})
+        return False, str(e)
+    except (rp_download.DownloadError, binascii.Error) as e:
+        logger.error("Failed to pass the input image to ComfyUI", extra={"error": str(e)})
+        return False, f"Error passing the input image to ComfyUI: {str(e)}"
+    finally:
+        if response is not None:
+            response.close()
+    if upload["status"] != "success":
+        return False, upload["message"]
+
+    elapsed = time.perf_counter() - start_time
+    if response is not None and rp_metrics.ENABLED:
+        rp_metrics.DOWNLOAD_BYTES.inc(upload["size_bytes"])
+        if elapsed > 0:
+            rp_metrics.DOWNLOAD_THROUGHPUT.observe(upload["size_bytes"] / elapsed)
+
+    resolution = rp_scheduler.header_image_size(bytes(header))
+    return True, {
+        "filename": upload["filename"],
+        "size_bytes": upload["size_bytes"],
+        "megapixels": resolution[0] * resolution[1] / 1_000_000 if resolution else None,
+    }
+
+
+def queue_workflow(workflow, client_id=None):
     """
     Queue a workflow to be processed by ComfyUI
 
     Args:
         workflow (dict): A dictionary containing the workflow to be processed
+        client_id (str, optional): The websocket client that receives the execution events
 
     Returns:
         dict: The JSON response from ComfyUI after processing the workflow
     """
 
     # The top level element "prompt" is required by ComfyUI
-    data = json.dumps({"prompt": workflow}).encode("utf-8")
+    payload = {"prompt": workflow}
+    if client_id is not None:
+        payload["client_id"] = client_id
+    data = json.dumps(payload).encode("utf-8")
 
     req = urllib.request.Request(f"http://{COMFY_HOST}/prompt", data=data)
     return json.loads(urllib.request.urlopen(req).read())
@@ -285,17 +703,295 @@ def get_mime_type(file_path):
     return mime_type
 
 
-def process_output_images(job_id, upload_url=None):
+class FileSlice:
+    """
+    A read-only file object over a byte range of a file.
+
+    Used as the stream of a partial TUS upload, each slice has its own file
+    handle so that the parts can be uploaded from separate threads.
+    """
+
+    def __init__(self, path, start, length):
+        self._file = open(path, "rb")
+        self.start = start
+        self.length = length
+        self._position = 0
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self._position
+        elif whence == os.SEEK_END:
+            offset += self.length
+        self._position = max(0, min(offset, self.length))
+        return self._position
+
+    def tell(self):
+        return self._position
+
+    def read(self, size=-1):
+        remaining = self.length - self._position
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        self._file.seek(self.start + self._position)
+        data = self._file.read(size)
+        self._position += len(data)
+        return data
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def upload_file(file_path, upload_url, mime_type=None):
+    """
+    Upload a single file using the TUS protocol.
+
+    Files larger than one chunk are split into `TUS_PARALLEL_PARTS` parts
+    when it is set, see `upload_file_in_parts`.
+
+    Args:
+        file_path (str): The path of the file to upload.
+        upload_url (str): The TUS endpoint to upload the file to.
+        mime_type (str, optional): The MIME type of the file. Detected from the extension if not given.
+
+    Returns:
+        str: The URL of the uploaded file.
+    """
+    if mime_type is None:
+        mime_type = get_mime_type(file_path)
+
+    if TUS_PARALLEL_PARTS > 1 and os.path.getsize(file_path) > TUS_CHUNK_SIZE:
+        return upload_file_in_parts(file_path, upload_url, mime_type, TUS_PARALLEL_PARTS)
+
+    if TUS_ENGINE == "stream":
+        return rp_tus.upload(file_path, upload_url, {"mimeType": mime_type})
+
+    # Create a TUS client with mimeType header
+    my_client = load_tus_client().TusClient(upload_url)
+    my_client.set_headers({"mimeType": mime_type})
+
+    # Set up the uploader and upload the file
+    uploader = my_client.uploader(file_path, chunk_size=TUS_CHUNK_SIZE)
+    uploader.upload()
+    return uploader.url
+
+
+def upload_file_in_parts(file_path, upload_url, mime_type, parts):
+    """
+    Upload a file as parallel partial uploads joined by the TUS concatenation extension.
+
+    Every part is created with `Upload-Concat: partial` and uploaded from its
+    own thread, the final upload is then created from the part URLs.
+
+    Args:
+        file_path (str): The path of the file to upload.
+        upload_url (str): The TUS endpoint to upload the file to.
+        mime_type (str): The MIME type of the file.
+        parts (int): The number of parts to split the file into.
+
+    Returns:
+        str: The URL of the concatenated upload.
+    """
+    file_size = os.path.getsize(file_path)
+    part_size = -(-file_size // parts)
+    ranges = [(start, min(part_size, file_size - start)) for start in range(0, file_size, part_size)]
+    # The parts share one link, so they share its measurements too
+    sizer = rp_tus.ChunkSizer()
+
+    def upload_part(byte_range):
+        start, length = byte_range
+        if TUS_ENGINE == "stream":
+            return rp_tus.upload(file_path, upload_url, {"mimeType": mime_type, "Upload-Concat": "partial"}, start, length, sizer)
+        my_client = load_tus_client().TusClient(upload_url)
+        my_client.set_headers({"mimeType": mime_type, "Upload-Concat": "partial"})
+        with FileSlice(file_path, start, length) as part:
+            uploader = my_client.uploader(file_stream=part, chunk_size=TUS_CHUNK_SIZE)
+            uploader.upload()
+        return uploader.url
+
+    with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+        part_urls = list(executor.map(upload_part, ranges))
+
+    response = requests.post(upload_url, headers={
+        "Tus-Resumable": "1.0.0",
+        "Upload-Concat": "final;" + " ".join(part_urls),
+        "mimeType": mime_type,
+    })
+    response.raise_for_status()
+    return urllib.parse.urljoin(upload_url, response.headers["Location"])
+
+
+class TusSink(rp_output_sink.OutputSink):
+    """
+    Uploads outputs to a TUS endpoint, see `upload_file`.
+    """
+
+    protocol = "TUS protocol"
+
+    def upload(self, file_path, relative_path, mime_type):
+        return upload_file(file_path, self.url, mime_type)
+
+
+rp_output_sink.register_sink(("http", "https"), TusSink)
+
+
+def upload_output_file(job_id, file_path, sink, output_path):
+    """
+    Upload one output file to the sink of the job and remove it afterwards.
+
+    Args:
+        job_id (str): The unique identifier for the job.
+        file_path (str): The path of the file to upload.
+        sink (rp_output_sink.OutputSink): The sink to upload the file to.
+        output_path (str): The ComfyUI output directory, used for relative paths.
+
+    Returns:
+        tuple: The number of uploaded bytes and an error message, which is None on success.
+    """
+    relative_path = os.path.relpath(file_path, output_path)
+    try:
+        # Get file info for logging
+        file_size = os.path.getsize(file_path)
+
+        # Detect MIME type
+        mime_type = get_mime_type(file_path)
+
+        logger.info("Starting file upload", extra={
+            "file_path": file_path,
+            "file_size_bytes": file_size,
+            "mime_type": mime_type,
+            "upload_url": sink.url,
+            "job_id": job_id
+        })
+
+        # Upload the file
+        upload_start = time.perf_counter()
+        with rp_tracing.span("tus_upload" if isinstance(sink, TusSink) else "upload", {
+            "file.path": relative_path,
+            "file.size_bytes": file_size,
+            "file.mime_type": mime_type,
+        }):
+            uploaded_url = sink.upload(file_path, relative_path, mime_type)
+        upload_elapsed = time.perf_counter() - upload_start
+
+        rp_metrics.UPLOAD_BYTES.inc(file_size)
+        if upload_elapsed > 0:
+            rp_metrics.UPLOAD_THROUGHPUT.observe(file_size / upload_elapsed)
+
+        logger.info("File uploaded successfully", extra={
+            "file_path": file_path,
+            "file_size_bytes": file_size,
+            "mime_type": mime_type,
+            "uploaded_url": uploaded_url,
+            "job_id": job_id
+        })
+    except Exception as e:
+        logger.error(f"Failed to upload file using {sink.protocol}", extra={
+            "file_path": relative_path,
+            "error": str(e),
+            "job_id": job_id
+        })
+        return 0, f"Error uploading file {relative_path} using {sink.protocol}: {str(e)}"
+
+    # Remove the file after successful upload
+    try:
+        os.remove(file_path)
+        logger.info("File removed after upload", extra={
+            "file_path": file_path,
+            "job_id": job_id
+        })
+    except OSError as e:
+        logger.warning("Failed to remove file after upload", extra={
+            "file_path": file_path,
+            "error": str(e),
+            "job_id": job_id
+        })
+
+    return file_size, None
+
+
+def publish_preview(job, upload_url, data, name, mime_type):
+    """
+    Return a small preview inline, upload a larger one through the sink of the job.
+
+    The preview is also sent as a progress update, so that clients polling
+    the job status see it before the full size outputs are uploaded.
+
+    Args:
+        job (dict): The job the preview belongs to.
+        upload_url (str): The output URL of the job.
+        data (bytes): The encoded preview.
+        name (str): The file name of the preview.
+        mime_type (str): The MIME type of the preview.
+
+    Returns:
+        dict: The preview as `data` (base64) or `url`, and its `mime_type`.
+    """
+    if len(data) <= rp_preview.PREVIEW_INLINE_MAX_BYTES:
+        preview = {"data": base64.b64encode(data).decode(), "mime_type": mime_type}
+    else:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_path = os.path.join(temp_dir, name)
+            with open(file_path, "wb") as f:
+                f.write(data)
+            preview = {"url": rp_output_sink.get_sink(upload_url).upload(file_path, name, mime_type), "mime_type": mime_type}
+    logger.info("Preview ready", extra={"job_id": job["id"], "bytes": len(data), "inline": "data" in preview})
+
+    # Only loaded when serving jobs
+    runpod = sys.modules.get("runpod")
+    if runpod is not None:
+        runpod.serverless.progress_update(job, {"preview": preview})
+    return preview
+
+
+def get_upload_spool():
+    """
+    The upload spool of the worker, created on first use.
+
+    Returns:
+        rp_upload_spool.UploadSpool: The spool in UPLOAD_SPOOL_DIR.
+    """
+    global upload_spool
+    if upload_spool is None:
+        upload_spool = rp_upload_spool.UploadSpool(rp_upload_spool.UPLOAD_SPOOL_DIR, upload_spooled_file)
+    return upload_spool
+
+
+def upload_spooled_file(job_id, file_path, upload_url, job_dir):
+    """
+    Upload one file of a spooled job, called by the spool in the background.
+
+    Returns:
+        tuple: The number of uploaded bytes and an error message, which is None on success.
+    """
+    return upload_output_file(job_id, file_path, rp_output_sink.get_sink(upload_url), job_dir)
+
+
+def process_output_images(job_id, upload_url=None, callback=None, bundle=None):
     """
-    This function scans the output directory for all files and uploads them using the TUS protocol.
+    This function scans the output directory for all files and uploads them to the output URL.
     After successful upload, each file is removed to prevent re-uploading in subsequent runs.
 
+    The output URL selects the sink: `http(s)://` URLs are TUS endpoints and
+    `s3://<bucket>/<prefix>` URLs are uploaded to S3, see rp_output_sink.
+    With UPLOAD_SPOOL_DIR, the files are moved into the upload spool instead
+    and uploaded in the background, the status is then 'queued'. With a
+    bundle format, all files are streamed into one archive upload instead,
+    see `upload_output_bundle`.
+
     Args:
         job_id (str): The unique identifier for the job.
-        upload_url (str): The URL to upload the files to using the TUS protocol.
+        upload_url (str): The URL to upload the files to.
+        callback (str, optional): URL to POST the final upload status to, with UPLOAD_SPOOL_DIR.
+        bundle (str, optional): Upload the files as one archive of this format, see rp_bundle.
 
     Returns:
-        dict: A dictionary with the status ('success' or 'error') and the message.
+        dict: A dictionary with the status ('success', 'queued' or 'error') and the message.
     """
     ensure_logger()
     
@@ -305,6 +1001,14 @@ def process_output_images(job_id, upload_url=None):
             "message": "No upload URL provided in the job output property",
         }
 
+    try:
+        sink = rp_output_sink.get_sink(upload_url)
+    except ValueError as e:
+        return {
+            "status": "error",
+            "message": str(e),
+        }
+
     # The path where ComfyUI stores the generated images
     COMFY_OUTPUT_PATH = os.environ.get("COMFY_OUTPUT_PATH", "/comfyui/output")
 
@@ -336,78 +1040,75 @@ def process_output_images(job_id, upload_url=None):
             "message": "No files found to upload"
         }
 
-    uploaded_count = 0
-    
-    # Upload each file
+    # Skip files that disappeared since the scan
+    existing_files = []
     for file_path in all_files:
-        if not os.path.exists(file_path):
+        if os.path.exists(file_path):
+            existing_files.append(file_path)
+        else:
             logger.warning("File no longer exists, skipping", extra={"file_path": file_path, "job_id": job_id})
-            continue
 
-        try:
-            # Get file info for logging
-            file_size = os.path.getsize(file_path)
-            relative_path = os.path.relpath(file_path, COMFY_OUTPUT_PATH)
-            
-            # Detect MIME type
-            mime_type = get_mime_type(file_path)
-            
-            logger.info("Starting file upload", extra={
-                "file_path": file_path,
-                "file_size_bytes": file_size,
-                "mime_type": mime_type,
-                "upload_url": upload_url,
-                "job_id": job_id
-            })
+    if bundle:
+        if not isinstance(sink, TusSink):
+            return {
+                "status": "error",
+                "message": "Bundles can only be uploaded to a TUS endpoint",
+            }
+        return upload_output_bundle(job_id, existing_files, upload_url, bundle, COMFY_OUTPUT_PATH)
 
-            # Create a TUS client with mimeType header
-            my_client = tus_client.TusClient(upload_url)
-            my_client.set_headers({"mimeType": mime_type})
-            
-            # Set up the uploader
-            uploader = my_client.uploader(file_path, chunk_size=5*1024*1024)
-            
-            # Upload the file
-            uploader.upload()
-            
-            # Get the URL of the uploaded file
-            uploaded_url = uploader.url
-            
-            logger.info("File uploaded successfully", extra={
-                "file_path": file_path,
-                "file_size_bytes": file_size,
-                "mime_type": mime_type,
-                "uploaded_url": uploaded_url,
-                "job_id": job_id
-            })
-            
-            # Remove the file after successful upload
-            try:
-                os.remove(file_path)
-                logger.info("File removed after upload", extra={
-                    "file_path": file_path,
-                    "job_id": job_id
-                })
-            except OSError as e:
-                logger.warning("Failed to remove file after upload", extra={
-                    "file_path": file_path,
-                    "error": str(e),
-                    "job_id": job_id
-                })
-            
-            uploaded_count += 1
-            
-        except Exception as e:
-            error_message = f"Error uploading file {relative_path} using TUS protocol: {str(e)}"
-            logger.error("Failed to upload file using TUS protocol", extra={
-                "file_path": relative_path,
-                "error": str(e),
-                "job_id": job_id
-            })
+    if rp_upload_spool.ENABLED:
+        spool = get_upload_spool()
+        try:
+            status = spool.put(job_id, existing_files, COMFY_OUTPUT_PATH, upload_url, callback)
+        except OSError as e:
+            logger.error("Failed to spool files for upload", extra={"error": str(e), "job_id": job_id})
             return {
                 "status": "error",
-                "message": error_message,
+                "message": f"Error spooling files for upload: {str(e)}",
             }
+        logger.info("Files spooled for upload", extra={
+            "queued_count": status["file_count"],
+            "queued_bytes": status["total_bytes"],
+            "job_id": job_id
+        })
+        return {
+            "status": "queued",
+            "queued_count": status["file_count"],
+            "queued_bytes": status["total_bytes"],
+            "status_file": spool.status_path(job_id),
+        }
+
+    def upload(file_path):
+        return upload_output_file(job_id, file_path, sink, COMFY_OUTPUT_PATH)
+
+    if UPLOAD_CONCURRENCY > 1 and len(existing_files) > 1:
+        with ThreadPoolExecutor(max_workers=min(UPLOAD_CONCURRENCY, len(existing_files))) as executor:
+            # In a copy of the context of the job each, so that the upload spans are children of the job span
+            futures = [executor.submit(contextvars.copy_context().run, upload, file_path) for file_path in existing_files]
+            for future in as_completed(futures):
+                if future.result()[1] is not None:
+                    # Stop at the first failed upload, the files not uploaded yet stay in place
+                    for pending in futures:
+                        pending.cancel()
+                    break
+        results = [future.result() for future in futures if not future.cancelled()]
+    else:
+        # Stop at the first failed upload
+        results = []
+        for file_path in existing_files:
+            results.append(upload(file_path))
+            if results[-1][1] is not None:
+                break
+
+    errors = [error for _, error in results if error is not None]
+    if errors:
+        return {
+            "status": "error",
+            "message": errors[0],
+        }
+
+    uploaded_count = len(results)
+    uploaded_bytes = sum(size for size, _ in results)
 
     logger.info("All files uploaded successfully", extra={
         "uploaded_count": uploaded_count,
@@ -416,7 +1117,82 @@ def process_output_images(job_id, upload_url=None):
 
     return {
         "status": "success",
-        "uploaded_count": uploaded_count
+        "uploaded_count": uploaded_count,
+        "uploaded_bytes": uploaded_bytes
+    }
+
+
+def upload_output_bundle(job_id, files, upload_url, bundle_format, output_path):
+    """
+    Stream the output files of a job into one archive upload and remove them afterwards.
+
+    Saves a TUS creation request and its PATCHes per file, which matters on
+    high latency links with many small outputs.
+
+    Args:
+        job_id (str): The unique identifier for the job.
+        files (list): The paths of the output files.
+        upload_url (str): The TUS endpoint to upload the archive to.
+        bundle_format (str): "tar", "zip" or "tar.zst".
+        output_path (str): The ComfyUI output directory, the entry names are relative to it.
+
+    Returns:
+        dict: The status, the counts and the `bundle` with its URL and manifest.
+    """
+    name = f"{job_id}.{bundle_format}"
+    try:
+        bundle = rp_bundle.Bundle(files, output_path, bundle_format)
+        logger.info("Starting bundle upload", extra={
+            "bundle_format": bundle_format,
+            "file_count": len(files),
+            "archive_size_bytes": bundle.size,
+            "upload_url": upload_url,
+            "job_id": job_id
+        })
+        upload_start = time.perf_counter()
+        with rp_tracing.span("tus_upload", {
+            "file.path": name,
+            "file.size_bytes": bundle.size,
+            "file.mime_type": bundle.mime_type,
+        }):
+            uploaded_url, uploaded_bytes = bundle.upload(upload_url, name)
+        upload_elapsed = time.perf_counter() - upload_start
+    except Exception as e:
+        logger.error("Failed to upload bundle using TUS protocol", extra={"error": str(e), "job_id": job_id})
+        return {
+            "status": "error",
+            "message": f"Error uploading bundle {name} using TUS protocol: {str(e)}",
+        }
+
+    rp_metrics.UPLOAD_BYTES.inc(uploaded_bytes)
+    if upload_elapsed > 0:
+        rp_metrics.UPLOAD_THROUGHPUT.observe(uploaded_bytes / upload_elapsed)
+    logger.info("Bundle uploaded successfully", extra={
+        "uploaded_url": uploaded_url,
+        "uploaded_bytes": uploaded_bytes,
+        "job_id": job_id
+    })
+
+    for file_path in files:
+        try:
+            os.remove(file_path)
+        except OSError as e:
+            logger.warning("Failed to remove file after upload", extra={
+                "file_path": file_path,
+                "error": str(e),
+                "job_id": job_id
+            })
+
+    return {
+        "status": "success",
+        "uploaded_count": len(files),
+        "uploaded_bytes": uploaded_bytes,
+        "bundle": {
+            "url": uploaded_url,
+            "format": bundle_format,
+            "bytes": uploaded_bytes,
+            "entries": bundle.manifest(),
+        },
     }
 
 
@@ -426,7 +1202,7 @@ def process_dry_mode(input_url, upload_url):
     Waits 5 seconds before uploading and tracks total processing time.
 
     Args:
-        input_url (str): URL to download the input image from
+        input_url (str): URL to download the input image from, or the image as inline base64
         upload_url (str): URL to upload the image to using TUS protocol
 
     Returns:
@@ -437,7 +1213,7 @@ def process_dry_mode(input_url, upload_url):
         temp_filename = f"/tmp/{uuid.uuid4()}.png"
         
         # Download the input image
-        success, error_message = download_image(input_url, temp_filename)
+        success, error_message = fetch_input_image(input_url, temp_filename)
         if not success:
             return {"status": "error", "message": error_message}
 
@@ -448,7 +1224,7 @@ def process_dry_mode(input_url, upload_url):
         mime_type = get_mime_type(temp_filename)
 
         # Create a TUS client with mimeType header
-        my_client = tus_client.TusClient(upload_url)
+        my_client = load_tus_client().TusClient(upload_url)
         my_client.set_headers({"mimeType": mime_type})
 
         try:
@@ -464,7 +1240,7 @@ def process_dry_mode(input_url, upload_url):
             
             # Use context manager to ensure file is properly closed
             with open(temp_filename, 'rb') as file_obj:
-                uploader = my_client.uploader(file_obj, chunk_size=5*1024*1024)
+                uploader = my_client.uploader(file_obj, chunk_size=TUS_CHUNK_SIZE)
                 # Upload the file
                 uploader.upload()
             
@@ -488,12 +1264,82 @@ def process_dry_mode(input_url, upload_url):
         return {"status": "error", "message": f"Error in dry mode processing: {str(e)}"}
 
 
+def get_queue_depth():
+    """
+    Get the number of prompts running or pending in ComfyUI.
+
+    Returns:
+        int: The queue depth, as reported by the ComfyUI /queue endpoint.
+    """
+    with urllib.request.urlopen(f"http://{COMFY_HOST}/queue", timeout=2) as response:
+        queue = json.loads(response.read())
+    return len(queue.get("queue_running", [])) + len(queue.get("queue_pending", []))
+
+
+def count_cached_nodes(history_entry):
+    """
+    Count the nodes ComfyUI served from its cache for a finished prompt.
+
+    Args:
+        history_entry (dict): The history of a single prompt.
+
+    Returns:
+        int: The number of cached nodes.
+    """
+    messages = history_entry.get("status", {}).get("messages", [])
+    for message in messages:
+        if len(message) == 2 and message[0] == "execution_cached":
+            return len(message[1].get("nodes", []))
+    return 0
+
+
+def upload_profile_files(job_id, files, upload_url):
+    """
+    Upload CPU profile files next to the job outputs.
+
+    Failures are logged and do not fail the job.
+
+    Args:
+        job_id (str): The unique identifier for the job.
+        files (list): The paths of the profile files.
+        upload_url (str): The output URL of the job.
+
+    Returns:
+        list: The URLs of the uploaded files.
+    """
+    uploaded_urls = []
+    if not isinstance(upload_url, str):
+        return uploaded_urls
+    try:
+        sink = rp_output_sink.get_sink(upload_url)
+    except ValueError:
+        return uploaded_urls
+    for file_path in files:
+        try:
+            uploaded_urls.append(sink.upload(file_path, os.path.basename(file_path), "application/octet-stream"))
+            os.remove(file_path)
+        except Exception as e:
+            logger.warning("Failed to upload CPU profile", extra={
+                "file_path": file_path,
+                "error": str(e),
+                "job_id": job_id
+            })
+    return uploaded_urls
+
+
 def handler(job):
     """
     The main function that handles a job of generating an image.
 
-    This function validates the input, sends a prompt to ComfyUI for processing,
-    polls ComfyUI for result, and retrieves generated images.
+    This function sets up logging, runs the job inside a trace span (whose
+    parent is the optional `traceparent` of the job input) and records the
+    job latency in the metrics exporter. The duration of each job phase is
+    returned as `timings` in seconds. With MEMORY_PROFILING, a memory
+    profile of the job is logged and returned as `memory_profile`. With
+    CPU_PROFILING or `"profile": true` in the job input, the job is CPU
+    profiled and the profile files are reported as `cpu_profile`. With
+    JOB_TRACE_FILE, a sanitized record of the job is appended to the trace.
+    The first job also logs the startup timeline of the worker.
 
     Args:
         job (dict): A dictionary containing job details and input parameters.
@@ -506,6 +1352,101 @@ def handler(job):
     except Exception as e:
         logger.error("Error setting up logger", extra={"error": str(e)})
 
+    if rp_startup.timeline.mark("first_job_accepted"):
+        log_startup_timeline()
+
+    job_input = job.get("input")
+    params = job_input.get("params") if isinstance(job_input, dict) else None
+    params = params if isinstance(params, dict) else {}
+    tiling = str(params.get("tiling", "unknown"))
+    denoise = str(params.get("denoise", "unknown"))
+
+    memory_profiler = None
+    memory_profile = None
+    cpu_profiler = None
+    cpu_profile = None
+    timings = {}
+    arrived_at = time.time()
+    start_time = time.perf_counter()
+    rp_metrics.JOBS_IN_PROGRESS.inc()
+    try:
+        if rp_memory.MEMORY_PROFILING:
+            memory_profiler = rp_memory.JobMemoryProfiler()
+            memory_profiler.start()
+        if rp_profiler.CPU_PROFILING or (isinstance(job_input, dict) and job_input.get("profile") is True):
+            cpu_profiler = rp_profiler.JobProfiler(job.get("id"))
+            cpu_profiler.start()
+        with rp_tracing.span(
+            "handler",
+            {"job.id": str(job.get("id")), "job.tiling": tiling, "job.denoise": denoise},
+            context=rp_tracing.extract_context(job_input),
+        ) as job_span:
+            result = process_job(job, timings)
+            error = result.get("error") or (result.get("message") if result.get("status") == "error" else None)
+            if error:
+                rp_tracing.set_error(job_span, error)
+    finally:
+        timings["total"] = time.perf_counter() - start_time
+        rp_metrics.JOBS_IN_PROGRESS.dec()
+        # Also if the job raised, cProfile and the sampler thread would keep running
+        # and the first memory snapshot would be kept until the next job
+        if cpu_profiler is not None:
+            cpu_profile = cpu_profiler.stop()
+        if memory_profiler is not None:
+            memory_profile = memory_profiler.stop()
+
+    status = "error" if error else "success"
+    rp_metrics.JOB_DURATION.observe(timings["total"], tiling, denoise, status)
+    result = {**result, "timings": {phase: round(seconds, 4) for phase, seconds in timings.items()}}
+
+    if cpu_profile is not None:
+        if rp_profiler.CPU_PROFILING_UPLOAD and isinstance(job_input, dict):
+            cpu_profile["uploaded_urls"] = upload_profile_files(job.get("id"), cpu_profile["files"], job_input.get("output"))
+        logger.info("Job CPU profile", extra={"job_id": job.get("id"), **cpu_profile})
+        result = {**result, "cpu_profile": cpu_profile}
+
+    if memory_profile is not None:
+        logger.info("Job memory profile", extra={"job_id": job.get("id"), **memory_profile})
+        result = {**result, "memory_profile": memory_profile}
+
+    if rp_job_trace.JOB_TRACE_FILE:
+        try:
+            rp_job_trace.record_job(job_input, result, arrived_at)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning("Failed to record job trace", extra={"error": str(e), "job_id": job.get("id")})
+
+    return result
+
+
+async def concurrent_handler(job):
+    """
+    Run the handler in a thread, so that the worker can hold JOB_CONCURRENCY jobs at once.
+
+    Args:
+        job (dict): A dictionary containing job details and input parameters.
+
+    Returns:
+        dict: The result of `handler()`.
+    """
+    # Set up once here, not racing in the job threads
+    ensure_logger()
+    return await asyncio.to_thread(handler, job)
+
+
+def process_job(job, timings):
+    """
+    Process a single job.
+
+    This function validates the input, sends a prompt to ComfyUI for processing,
+    polls ComfyUI for result, and retrieves generated images.
+
+    Args:
+        job (dict): A dictionary containing job details and input parameters.
+        timings (dict): Collects the duration of each job phase in seconds.
+
+    Returns:
+        dict: A dictionary containing either an error message or a success status with generated images.
+    """
     validated_data, error_message = validate_input(job['input'])
     if error_message:
         return {"error": error_message}
@@ -517,7 +1458,7 @@ def handler(job):
 
     # Check if ComfyUI input directory exists early to fail fast
     COMFY_INPUT_PATH = os.environ.get("COMFY_INPUT_PATH", "/comfyui/input")
-    if not os.path.exists(COMFY_INPUT_PATH):
+    if INPUT_TRANSFER != "upload" and not os.path.exists(COMFY_INPUT_PATH):
         error_message = f"ComfyUI input directory does not exist: {COMFY_INPUT_PATH}"
         logger.error("ComfyUI input directory not found", extra={"input_path": COMFY_INPUT_PATH})
         return {"error": error_message}
@@ -528,10 +1469,46 @@ def handler(job):
         result = process_dry_mode(input_url, upload_url)
         return {**result, "refresh_worker": REFRESH_WORKER}
 
-    # Download the input image
-    success, error_message = download_image(input_url, f"{COMFY_INPUT_PATH}/input.jpg")
-    if not success:
-        return {"error": error_message}
+    # Download the input image, to a name of its own when several jobs share the input directory
+    upload_name = None
+    if JOB_CONCURRENCY <= 1:
+        input_name = "input.jpg"
+    elif INPUT_TRANSFER == "upload":
+        # Overwrites the upload of an earlier job, ComfyUI would keep one per job
+        input_name = upload_name = take_upload_name()
+    else:
+        input_name = f"input_{uuid.uuid4().hex}.jpg"
+    input_path = f"{COMFY_INPUT_PATH}/{input_name}"
+    remove_input = False
+
+    def release_input():
+        """Remove the local copy of the input, or give back the name of its upload"""
+        if remove_input:
+            rp_staging.remove(input_path)
+        if upload_name is not None:
+            release_upload_name(upload_name)
+
+    if INPUT_TRANSFER == "upload":
+        # ComfyUI keeps the upload in its own input directory, there is no local copy to remove
+        with timed_phase(timings, "download"):
+            success, uploaded = stream_input_to_comfy(input_url, input_name)
+        if not success:
+            release_input()
+            return {"error": uploaded}
+        input_name, input_size, megapixels = uploaded["filename"], uploaded["size_bytes"], uploaded["megapixels"]
+    else:
+        # With STAGING_TMPFS the input goes to the tmpfs, or to the disk if it is short of space
+        staging = rp_staging.get_staging()
+        save_path = staging.place_input(input_path) if staging is not None else input_path
+        with timed_phase(timings, "download"):
+            success, error_message = fetch_input_image(input_url, save_path)
+        if not success:
+            # A partial download or decode, and the link to it if it was spilled to disk
+            rp_staging.remove(input_path)
+            return {"error": error_message}
+        input_size = os.path.getsize(input_path) if os.path.exists(input_path) else None
+        megapixels = input_megapixels(input_path)
+        remove_input = input_name != "input.jpg"
 
     # Load workflow from file based on params
     workflow_file_path = f"workflows/{params['tiling']}_{params['denoise']}/workflow.json"
@@ -542,8 +1519,120 @@ def handler(job):
         with open(workflow_file_path, 'r') as f:
             workflow = json.load(f)
     except Exception as e:
+        release_input()
         return {"error": f"Error loading workflow file: {str(e)}"}
 
+    # Copy the models of the workflow to local disk for the next jobs
+    model_cache = rp_model_cache.get_cache()
+    if model_cache is not None:
+        model_cache.use(rp_prewarm.workflow_models(workflow))
+
+    # Point the image loader at the input of this job, by the name ComfyUI assigned to an upload
+    if input_name != "input.jpg":
+        for node in workflow.values():
+            if node.get("inputs", {}).get("image") == "input.jpg":
+                node["inputs"]["image"] = input_name
+
+    # Downscale an oversized input to the largest size the workflow reads, streamed inputs are not on this worker
+    input_resize = None
+    max_side = rp_resize.target_side(workflow, input_name) if rp_resize.INPUT_RESIZE and INPUT_TRANSFER != "upload" else None
+    if max_side:
+        with timed_phase(timings, "resize"):
+            input_resize = resize_input(input_path, max_side)
+        if input_resize is not None:
+            megapixels = input_megapixels(input_path)
+
+    # Wait for ComfyUI, the cheapest waiting job of the worker goes first
+    cost = cost_model.estimate(params["tiling"], params["denoise"], megapixels)
+    priority = validated_data.get("priority", 0)
+    try:
+        with ExitStack() as stack:
+            with timed_phase(timings, "queue_wait"):
+                ticket = stack.enter_context(scheduler.slot(job["id"], cost, priority))
+            logger.info("Scheduled job", extra={
+                "job_id": job["id"],
+                "estimated_cost_seconds": round(cost, 2),
+                "priority": priority,
+                "queue_wait_seconds": round(ticket.waited, 4),
+                "jobs_waiting": scheduler.waiting(),
+            })
+            # The outputs go to the tmpfs while the largest expected output fits there
+            staging = rp_staging.get_staging()
+            if staging is not None:
+                logger.info("Staging outputs", extra={"job_id": job["id"], "location": staging.select()})
+            result = run_workflow(job, workflow, upload_url, timings, validated_data.get("callback"), validated_data.get("bundle"))
+    finally:
+        release_input()
+    if "error" in result:
+        return result
+
+    if "execution" in timings:
+        cost_model.record(f"{params['tiling']}_{params['denoise']}", timings["execution"], megapixels)
+    if input_resize is not None:
+        result = {**result, "input_resize": input_resize}
+    return {**result, "input_size_bytes": input_size, "refresh_worker": REFRESH_WORKER}
+
+
+def resize_input(input_path, max_side):
+    """
+    Downscale the input image of a job to the largest size its workflow reads, see rp_resize.
+
+    A failed resize is logged and the job goes on with the original image.
+
+    Args:
+        input_path (str): The downloaded input image.
+        max_side (int): The longest side in pixels, from `rp_resize.target_side`.
+
+    Returns:
+        dict: The sizes, bytes and seconds of the resize, or None if the input was kept as it is.
+    """
+    try:
+        report = rp_resize.resize(input_path, max_side)
+    except Exception as e:
+        logger.warning("Failed to resize the input image", extra={"max_side": max_side, "error": str(e)})
+        return None
+    if report is not None:
+        logger.info("Input image resized", extra={"max_side": max_side, **report})
+    return report
+
+
+def input_megapixels(input_path):
+    """
+    The resolution of the input image in megapixels, for the cost of the job.
+
+    Args:
+        input_path (str): The downloaded input image.
+
+    Returns:
+        float: The megapixels, or None if the image size cannot be read.
+    """
+    try:
+        size = rp_scheduler.image_size(input_path)
+    except OSError:
+        return None
+    if not size:
+        return None
+    return size[0] * size[1] / 1_000_000
+
+
+def run_workflow(job, workflow, upload_url, timings, callback=None, bundle=None):
+    """
+    Run the workflow of a job on ComfyUI and upload the outputs.
+
+    Only one job at a time may run this, ComfyUI and its output directory
+    are shared by all jobs of the worker.
+
+    Args:
+        job (dict): A dictionary containing job details and input parameters.
+        workflow (dict): The workflow to queue.
+        upload_url (str): The URL to upload the outputs to.
+        timings (dict): Collects the duration of each job phase in seconds.
+        callback (str, optional): URL to POST the final upload status to, see `process_output_images`.
+        bundle (str, optional): Upload the outputs as one archive of this format, see `process_output_images`.
+
+    Returns:
+        dict: A dictionary containing either an error message or the result of the upload.
+    """
     # Make sure that the ComfyUI API is available
     check_server(
         f"http://{COMFY_HOST}",
@@ -551,45 +1640,150 @@ def handler(job):
         COMFY_API_AVAILABLE_INTERVAL_MS,
     )
 
+    # Listen for execution events before queueing so that none are missed
+    node_profiler = None
+    client_id = None
+    if NODE_PROFILE:
+        client_id = str(uuid.uuid4())
+        node_profiler = rp_node_profile.NodeProfileListener(COMFY_HOST, client_id, workflow)
+        if not node_profiler.start():
+            logger.warning("Could not connect to the ComfyUI websocket, skipping node profile", extra={
+                "error": str(node_profiler.error)
+            })
+            node_profiler = None
+
     # Queue the workflow
     try:
-        queued_workflow = queue_workflow(workflow)
+        with timed_phase(timings, "queue"):
+            queued_workflow = queue_workflow(workflow, client_id)
         prompt_id = queued_workflow["prompt_id"]
         logger.info("Queued workflow", extra={"prompt_id": prompt_id})
     except Exception as e:
+        if node_profiler is not None:
+            node_profiler.stop(timeout=0)
         return {"error": f"Error queuing workflow: {str(e)}"}
 
+    if node_profiler is not None:
+        node_profiler.set_prompt_id(prompt_id)
+
+    # Watch for the first output image to preview it early
+    preview_job = None
+    if rp_preview.PREVIEW:
+        COMFY_OUTPUT_PATH = os.environ.get("COMFY_OUTPUT_PATH", "/comfyui/output")
+        preview_job = rp_preview.PreviewJob(
+            COMFY_OUTPUT_PATH,
+            lambda data, name, mime_type: publish_preview(job, upload_url, data, name, mime_type),
+            ignore=glob.glob(os.path.join(COMFY_OUTPUT_PATH, "**", "*"), recursive=True),
+        )
+
     # Poll for completion
     logger.info("Waiting for image generation to complete", extra={})
     retries = 0
+    node_profile = None
     try:
-        while retries < COMFY_POLLING_MAX_RETRIES:
-            history = get_history(prompt_id)
-
-            # Log history output every fifth iteration only in debug mode
-            if LOG_LEVEL == "debug" and retries % 5 == 0:
-                logger.debug("Polling iteration", extra={"iteration": retries, "history": json.dumps(history)})
-
-            # Exit the loop if we have found the history
-            if prompt_id in history and history[prompt_id].get("outputs"):
-                break
+        with timed_phase(timings, "execution"):
+            while retries < COMFY_POLLING_MAX_RETRIES:
+                history = get_history(prompt_id)
+                rp_metrics.COMFY_POLLS.inc()
+
+                # Log history output every fifth iteration only in debug mode
+                if LOG_LEVEL == "debug" and retries % 5 == 0:
+                    logger.debug("Polling iteration", extra={"iteration": retries, "history": rp_logging.LazyJson(history)})
+
+                if preview_job is not None:
+                    preview_job.poll()
+
+                # Exit the loop if we have found the history
+                if prompt_id in history and history[prompt_id].get("outputs"):
+                    break
+                else:
+                    # Wait before trying again
+                    time.sleep(COMFY_POLLING_INTERVAL_MS / 1000)
+                    retries += 1
             else:
-                # Wait before trying again
-                time.sleep(COMFY_POLLING_INTERVAL_MS / 1000)
-                retries += 1
-        else:
-            return {"error": "Max retries reached while waiting for image generation"}
+                return {"error": "Max retries reached while waiting for image generation"}
     except Exception as e:
         return {"error": f"Error waiting for image generation: {str(e)}"}
+    finally:
+        if node_profiler is not None:
+            node_profile = node_profiler.stop()
+
+    node_profile_summary = None
+    if node_profile is not None:
+        node_profile_summary = node_profile.summary()
+        logger.info("Node execution profile", extra={
+            "prompt_id": prompt_id,
+            "job_id": job["id"],
+            "top_nodes": node_profile_summary[:5],
+        })
+        if NODE_PROFILE_TRACE:
+            COMFY_OUTPUT_PATH = os.environ.get("COMFY_OUTPUT_PATH", "/comfyui/output")
+            try:
+                node_profile.write_chrome_trace(os.path.join(COMFY_OUTPUT_PATH, f"node_profile_{job['id']}.trace.json"))
+            except OSError as e:
+                logger.warning("Failed to write node profile trace", extra={"error": str(e), "job_id": job["id"]})
+
+    if rp_metrics.ENABLED:
+        cached_nodes = count_cached_nodes(history[prompt_id])
+        rp_metrics.COMFY_NODES.inc(cached_nodes, "cached")
+        rp_metrics.COMFY_NODES.inc(max(len(workflow) - cached_nodes, 0), "executed")
+
+    # The preview goes out before the full size outputs
+    preview = None
+    if preview_job is not None:
+        with timed_phase(timings, "preview"):
+            preview_job.poll(final=True)
+            preview = preview_job.result()
+        if preview_job.error:
+            logger.warning("Failed to create a preview", extra={"error": preview_job.error, "job_id": job["id"]})
 
     # Get the generated image and upload it using TUS protocol
-    images_result = process_output_images(job["id"], upload_url)
+    with timed_phase(timings, "upload"):
+        images_result = process_output_images(job["id"], upload_url, callback, bundle)
 
-    result = {**images_result, "refresh_worker": REFRESH_WORKER}
+    result = images_result
+    if preview is not None:
+        result["preview"] = preview
+    if node_profile_summary is not None:
+        result["node_profile"] = node_profile_summary
 
     return result
 
 
+rp_startup.timeline.mark("handler_import_started", IMPORT_STARTED_AT)
+rp_startup.timeline.mark("handler_imported")
+
+
 # Start the handler only if this script is run directly
 if __name__ == "__main__":
-    runpod.serverless.start({"handler": handler})
+    rp_startup.timeline.watch_comfyui(COMFY_HOST, on_ready=log_startup_timeline)
+    if rp_prewarm.MODEL_PREWARM:
+        rp_startup.timeline.mark("models_prewarm_started")
+        rp_prewarm.start_background(
+            os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "workflows"),
+            on_done=log_prewarm_report,
+        )
+    if rp_model_cache.ENABLED:
+        rp_model_cache.get_cache().schedule(rp_model_cache.read_hotlist(
+            rp_model_cache.MODEL_CACHE_HOTLIST,
+            os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "workflows"),
+        ))
+    if rp_metrics.ENABLED:
+        rp_metrics.COMFY_QUEUE_DEPTH.set_function(get_queue_depth)
+        rp_metrics.start_server()
+    if rp_upload_spool.ENABLED:
+        # Resume the uploads a previous worker left in the spool
+        get_upload_spool().start()
+    if rp_job_trace.JOB_TRACE_FILE and os.path.exists(rp_job_trace.JOB_TRACE_FILE):
+        cost_model.load_trace(rp_job_trace.JOB_TRACE_FILE)
+    # Only needed to serve jobs, not to import the handler in tools and tests
+    import runpod
+
+    rp_startup.timeline.mark("runpod_imported")
+    if JOB_CONCURRENCY > 1:
+        runpod.serverless.start({
+            "handler": concurrent_handler,
+            "concurrency_modifier": lambda current_concurrency: JOB_CONCURRENCY,
+        })
+    else:
+        runpod.serverless.start({"handler": handler})
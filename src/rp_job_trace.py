@@ -0,0 +1,98 @@
+"""
+Job trace recorder.
+
+With JOB_TRACE_FILE set, one JSON line per job is appended to that file. Each
+line records when the job arrived, its workflow parameters, the input and
+output sizes and the phase timings. URLs, ids and all other input fields are
+left out, so a trace recorded in production can be shared and replayed
+against the local mocks (see tests/integration/load_replay.py).
+
+Trace format, one object per line:
+
+    {"arrived_at": 1718000000.123, "params": {"tiling": 2, "denoise": "0.4"},
+     "input_size_bytes": 1048576, "output_size_bytes": 73400320,
+     "status": "success", "timings": {"download": 0.41, ..., "total": 38.2}}
+"""
+import json
+import os
+import threading
+
+# Append a sanitized record of every job to this JSONL file
+JOB_TRACE_FILE = os.environ.get("JOB_TRACE_FILE")
+
+# Input parameters that are safe to record
+RECORDED_PARAMS = ("tiling", "denoise")
+
+_write_lock = threading.Lock()
+
+
+def sanitize_params(job_input):
+    """
+    Keep only the workflow parameters of a job input.
+
+    Args:
+        job_input (dict): The raw job input.
+
+    Returns:
+        dict: The recorded parameters.
+    """
+    params = job_input.get("params") if isinstance(job_input, dict) else None
+    if not isinstance(params, dict):
+        return {}
+    return {key: params[key] for key in RECORDED_PARAMS if key in params}
+
+
+def make_record(job_input, result, arrived_at):
+    """
+    Build the trace record of a finished job.
+
+    Args:
+        job_input (dict): The raw job input.
+        result (dict): The handler result.
+        arrived_at (float): The time the job arrived, in seconds since the epoch.
+
+    Returns:
+        dict: The trace record.
+    """
+    failed = result.get("error") or result.get("status") == "error"
+    return {
+        "arrived_at": round(arrived_at, 3),
+        "params": sanitize_params(job_input),
+        "input_size_bytes": result.get("input_size_bytes"),
+        "output_size_bytes": result.get("uploaded_bytes"),
+        "status": "error" if failed else "success",
+        "timings": result.get("timings", {}),
+    }
+
+
+def record_job(job_input, result, arrived_at, path=None):
+    """
+    Append the trace record of a finished job to the trace file.
+
+    Args:
+        job_input (dict): The raw job input.
+        result (dict): The handler result.
+        arrived_at (float): The time the job arrived, in seconds since the epoch.
+        path (str, optional): The trace file. Defaults to JOB_TRACE_FILE.
+    """
+    path = path or JOB_TRACE_FILE
+    if not path:
+        return
+    line = json.dumps(make_record(job_input, result, arrived_at)) + "\n"
+    with _write_lock, open(path, "a") as f:
+        f.write(line)
+
+
+def read_trace(path):
+    """
+    Read a trace file.
+
+    Args:
+        path (str): The JSONL trace file.
+
+    Returns:
+        list: The records, ordered by arrival time.
+    """
+    with open(path) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    return sorted(records, key=lambda record: record.get("arrived_at", 0))
@@ -0,0 +1,172 @@
+"""
+Non-blocking, batched log shipping.
+
+Records are put on a bounded queue by a QueueHandler on the calling thread and
+shipped to the real handler (e.g. Loki) by a QueueListener thread in batches.
+When the queue is full the oldest record is dropped, so a slow or unreachable
+log backend never blocks a job.
+"""
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+
+
+class LazyJson:
+    """
+    Defers `json.dumps` of a log payload until a handler actually ships it.
+
+    Use it for large `extra` values, e.g. `extra={"history": LazyJson(history)}`.
+    The payload is serialized on the listener thread, and never if no handler
+    reads the field.
+    """
+    __slots__ = ("payload",)
+
+    def __init__(self, payload):
+        self.payload = payload
+
+    def __str__(self):
+        return json.dumps(self.payload)
+
+    __repr__ = __str__
+
+
+def resolve_lazy_fields(record):
+    """
+    Serialize every LazyJson attribute of a log record in place.
+    """
+    for key, value in list(record.__dict__.items()):
+        if isinstance(value, LazyJson):
+            record.__dict__[key] = str(value)
+
+
+class DropOldestQueueHandler(logging.handlers.QueueHandler):
+    """
+    A QueueHandler with a bounded queue that drops the oldest record when full.
+    """
+
+    def __init__(self, maxsize, on_drop=None):
+        super().__init__(queue.Queue(maxsize))
+        self.dropped = 0
+        self._on_drop = on_drop
+
+    def enqueue(self, record):
+        while True:
+            try:
+                self.queue.put_nowait(record)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    continue
+                self.dropped += 1
+                if self._on_drop is not None:
+                    self._on_drop()
+
+
+class BatchingQueueListener(logging.handlers.QueueListener):
+    """
+    A QueueListener that hands records to its handlers in batches.
+
+    A batch is shipped when it reaches `batch_size` records or when
+    `flush_interval` seconds have passed since the last batch. After each batch
+    the handlers are flushed; handlers with a `flush_event` (such as
+    LokiLoggerHandler) are woken up to send immediately.
+    """
+
+    def __init__(self, queue_handler, *handlers, batch_size=100, flush_interval=2.0):
+        super().__init__(queue_handler.queue, *handlers, respect_handler_level=True)
+        self.queue_handler = queue_handler
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._reported_drops = 0
+
+    def _monitor(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                record = self.queue.get(timeout=max(deadline - time.monotonic(), 0.001))
+            except queue.Empty:
+                record = None
+            else:
+                if record is self._sentinel:
+                    self.ship(batch)
+                    break
+                batch.append(record)
+
+            if len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                self.ship(batch)
+                batch = []
+                deadline = time.monotonic() + self.flush_interval
+
+    def ship(self, batch):
+        """
+        Hand a batch of records to the handlers and flush them.
+
+        Args:
+            batch (list): The log records to ship.
+        """
+        dropped = self.queue_handler.dropped - self._reported_drops
+        if dropped:
+            self._reported_drops += dropped
+            batch = batch + [self._dropped_record(dropped)]
+        if not batch:
+            return
+
+        for record in batch:
+            resolve_lazy_fields(record)
+            self.handle(record)
+
+        for handler in self.handlers:
+            flush_event = getattr(handler, "flush_event", None)
+            if isinstance(flush_event, threading.Event):
+                flush_event.set()
+            else:
+                handler.flush()
+
+    def _dropped_record(self, dropped):
+        record = logging.LogRecord(
+            name=__name__,
+            level=logging.WARNING,
+            pathname=__file__,
+            lineno=0,
+            msg="Log queue full, dropped oldest records",
+            args=None,
+            exc_info=None,
+        )
+        record.dropped_records = dropped
+        record.dropped_records_total = self.queue_handler.dropped
+        return record
+
+    def enqueue_sentinel(self):
+        # The queue may be full, so make room instead of raising queue.Full
+        self.queue_handler.enqueue(self._sentinel)
+
+
+def create_queue_pipeline(handler, maxsize=10000, batch_size=100, flush_interval=2.0, on_drop=None):
+    """
+    Route a handler through a bounded queue and a batching listener thread.
+
+    Args:
+        handler (logging.Handler): The handler that ships the records.
+        maxsize (int): Maximum number of queued records before the oldest are dropped.
+        batch_size (int): Number of records that triggers a flush.
+        flush_interval (float): Maximum seconds between flushes.
+        on_drop (callable, optional): Called once for every dropped record.
+
+    Returns:
+        tuple: (queue_handler, listener). Attach the queue handler to the
+               logger and start the listener.
+    """
+    queue_handler = DropOldestQueueHandler(maxsize, on_drop=on_drop)
+    listener = BatchingQueueListener(
+        queue_handler,
+        handler,
+        batch_size=batch_size,
+        flush_interval=flush_interval,
+    )
+    return queue_handler, listener
@@ -0,0 +1,154 @@
+"""
+Opt-in memory profiling per job.
+
+With MEMORY_PROFILING=true, tracemalloc snapshots are taken around every job
+and the allocations that grew the most are reported together with the peak
+traced memory. The resident set size (RSS) of the handler and of the ComfyUI
+process are read from /proc, so a leak in either process shows up as a steady
+increase over a few dozen jobs on a long-lived worker.
+
+tracemalloc keeps running between jobs once started; the "before" snapshot of
+a job therefore still contains whatever earlier jobs left behind, and the
+diff shows only what the current job added or freed.
+"""
+import os
+import tracemalloc
+
+# Take tracemalloc snapshots around each job and report memory usage
+MEMORY_PROFILING = os.environ.get("MEMORY_PROFILING", "false").lower() == "true"
+# Number of allocation diffs to report per job
+MEMORY_PROFILING_TOP = int(os.environ.get("MEMORY_PROFILING_TOP", 10))
+# Number of stack frames stored per allocation
+MEMORY_PROFILING_FRAMES = int(os.environ.get("MEMORY_PROFILING_FRAMES", 1))
+# Command line fragment that identifies the ComfyUI process
+COMFYUI_CMDLINE = os.environ.get("COMFYUI_CMDLINE", "comfyui/main.py")
+
+# Allocations made by the profiler and the import system are not interesting
+_SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+def read_rss(pid="self"):
+    """
+    Read the current and peak resident set size of a process from /proc.
+
+    Args:
+        pid (int or str, optional): The process id. Defaults to the current process.
+
+    Returns:
+        dict: {"rss_bytes", "rss_peak_bytes"}, or None if /proc is not readable.
+    """
+    values = {}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("VmRSS", "VmHWM"):
+                    # The values are reported in kB
+                    values[key] = int(value.split()[0]) * 1024
+    except (OSError, ValueError, IndexError):
+        return None
+    if "VmRSS" not in values:
+        return None
+    return {"rss_bytes": values["VmRSS"], "rss_peak_bytes": values.get("VmHWM")}
+
+
+def find_pids(cmdline_fragment):
+    """
+    Find the processes whose command line contains a fragment.
+
+    Args:
+        cmdline_fragment (str): The text to look for, e.g. "comfyui/main.py".
+
+    Returns:
+        list: The matching process ids, excluding the current process.
+    """
+    pids = []
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return pids
+    fragment = cmdline_fragment.encode()
+    for entry in entries:
+        if not entry.isdigit() or int(entry) == os.getpid():
+            continue
+        try:
+            with open(f"/proc/{entry}/cmdline", "rb") as f:
+                cmdline = f.read()
+        except OSError:
+            # The process exited or belongs to someone else
+            continue
+        if fragment in cmdline:
+            pids.append(int(entry))
+    return pids
+
+
+def sample_rss():
+    """
+    Sample the RSS of the handler and of the ComfyUI process.
+
+    Returns:
+        dict: {"handler": {...}, "comfyui": {...}}; a value is None when it
+              could not be read.
+    """
+    comfyui = None
+    for pid in find_pids(COMFYUI_CMDLINE):
+        rss = read_rss(pid)
+        if rss is not None:
+            comfyui = {"pid": pid, **rss}
+            break
+    return {"handler": read_rss(), "comfyui": comfyui}
+
+
+class JobMemoryProfiler:
+    """
+    Takes tracemalloc snapshots around a single job.
+    """
+
+    def __init__(self, top=None, frames=None):
+        self.top = MEMORY_PROFILING_TOP if top is None else top
+        self.frames = MEMORY_PROFILING_FRAMES if frames is None else frames
+        self._before = None
+
+    def start(self):
+        """
+        Start tracing (if needed), reset the peak and take the first snapshot.
+        """
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+        tracemalloc.reset_peak()
+        self._before = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+
+    def stop(self):
+        """
+        Take the second snapshot and build the report.
+
+        Returns:
+            dict: The peak and current traced memory, the top allocation diffs
+                  and the RSS of the handler and ComfyUI.
+        """
+        current, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+        stats = after.compare_to(self._before, "traceback" if self.frames > 1 else "lineno")
+        self._before = None
+
+        top_allocations = [
+            {
+                "location": " <- ".join(f"{frame.filename}:{frame.lineno}" for frame in stat.traceback),
+                "size_diff_bytes": stat.size_diff,
+                "count_diff": stat.count_diff,
+                "size_bytes": stat.size,
+            }
+            for stat in stats[:self.top]
+            if stat.size_diff != 0
+        ]
+        return {
+            "traced_peak_bytes": peak,
+            "traced_current_bytes": current,
+            "top_allocations": top_allocations,
+            "rss": sample_rss(),
+        }
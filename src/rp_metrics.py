@@ -0,0 +1,353 @@
+"""
+Optional Prometheus/OpenMetrics exporter for the worker.
+
+The exporter is enabled by setting METRICS_PORT. When it is not set every
+recording call returns immediately, so instrumented code paths cost a single
+attribute lookup and a branch.
+
+Counters and histograms keep one value shard per thread. Recording only
+touches the calling thread's shard, so no lock is taken on the hot path; the
+shards are summed when /metrics is scraped. The shards of threads that have
+exited (e.g. the threads of per-job upload and download pools) are folded into
+a single retired shard at that point, so they do not pile up.
+"""
+import bisect
+import http.server
+import math
+import os
+import threading
+
+# Port to serve /metrics on - the exporter is disabled when not set
+METRICS_PORT = os.environ.get("METRICS_PORT")
+# Whether metrics are recorded at all
+ENABLED = bool(METRICS_PORT)
+
+# Default latency buckets in seconds, sized for jobs that take seconds to minutes
+DEFAULT_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1200)
+
+# All metrics in the order they were declared
+REGISTRY = []
+
+
+class _Metric:
+    """
+    Base class for metrics that keep their values in per-thread shards.
+    """
+    metric_type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        # (thread, values) of the threads that recorded a value
+        self._shards = []
+        # The values of the threads that have exited
+        self._retired = {}
+        self._shards_lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _shard(self):
+        """
+        Return the value shard of the calling thread, creating it on first use.
+        """
+        try:
+            return self._local.values
+        except AttributeError:
+            values = {}
+            # Only taken once per thread and metric
+            with self._shards_lock:
+                self._shards.append((threading.current_thread(), values))
+            self._local.values = values
+            return values
+
+    def _snapshots(self):
+        with self._shards_lock:
+            shards = []
+            for thread, values in self._shards:
+                if thread.is_alive():
+                    shards.append((thread, values))
+                else:
+                    # An exited thread no longer writes to its shard
+                    self._merge(self._retired, values)
+            self._shards = shards
+            retired = self._merge({}, self._retired)
+        # dict.copy() runs without releasing the GIL, so it is safe against concurrent writers
+        return [retired] + [values.copy() for _, values in shards]
+
+    def _merge(self, into, values):
+        """
+        Add the values of a shard to `into`.
+
+        Returns:
+            dict: `into`.
+        """
+        raise NotImplementedError
+
+    def _format_labels(self, labelvalues, extra=None):
+        pairs = list(zip(self.labelnames, labelvalues))
+        if extra:
+            pairs.append(extra)
+        if not pairs:
+            return ""
+        body = ",".join(f'{key}="{_escape(value)}"' for key, value in pairs)
+        return "{" + body + "}"
+
+    def render(self):
+        """
+        Render the metric in the Prometheus text exposition format.
+
+        Returns:
+            list: The lines describing this metric.
+        """
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.metric_type}",
+        ]
+        lines.extend(self._render_samples())
+        return lines
+
+    def _render_samples(self):
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """
+    A monotonically increasing counter.
+    """
+    metric_type = "counter"
+
+    def inc(self, amount=1, *labelvalues):
+        """
+        Increment the counter for the given label values.
+
+        Args:
+            amount (float): The amount to add.
+            *labelvalues: One value per label name, in declaration order.
+        """
+        if not ENABLED:
+            return
+        values = self._shard()
+        values[labelvalues] = values.get(labelvalues, 0) + amount
+
+    def _merge(self, into, values):
+        for key, value in values.items():
+            into[key] = into.get(key, 0) + value
+        return into
+
+    def _totals(self):
+        totals = {}
+        for shard in self._snapshots():
+            self._merge(totals, shard)
+        return totals
+
+    def _render_samples(self):
+        return [
+            f"{self.name}{self._format_labels(key)} {_format_value(value)}"
+            for key, value in sorted(self._totals().items())
+        ]
+
+
+class Gauge(Counter):
+    """
+    A value that can go up and down, or be computed when scraped.
+    """
+    metric_type = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._function = None
+
+    def dec(self, amount=1, *labelvalues):
+        """
+        Decrement the gauge for the given label values.
+        """
+        self.inc(-amount, *labelvalues)
+
+    def set_function(self, function):
+        """
+        Compute the gauge on every scrape instead of tracking it in-process.
+
+        Args:
+            function (callable): Returns the current value, or None to skip the sample.
+        """
+        self._function = function
+
+    def _render_samples(self):
+        if self._function is None:
+            return super()._render_samples()
+        try:
+            value = self._function()
+        except Exception:
+            value = None
+        if value is None:
+            return []
+        return [f"{self.name} {_format_value(value)}"]
+
+
+class Histogram(_Metric):
+    """
+    A histogram with fixed, cumulative buckets.
+    """
+    metric_type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labelvalues):
+        """
+        Record an observation for the given label values.
+
+        Args:
+            value (float): The observed value.
+            *labelvalues: One value per label name, in declaration order.
+        """
+        if not ENABLED:
+            return
+        values = self._shard()
+        state = values.get(labelvalues)
+        if state is None:
+            # One slot per bucket plus +Inf, followed by the sum
+            state = values[labelvalues] = [0] * (len(self.buckets) + 2)
+        state[bisect.bisect_left(self.buckets, value)] += 1
+        state[-1] += value
+
+    def _merge(self, into, values):
+        for key, state in values.items():
+            total = into.setdefault(key, [0] * len(state))
+            for i, value in enumerate(state):
+                total[i] += value
+        return into
+
+    def _render_samples(self):
+        merged = {}
+        for shard in self._snapshots():
+            self._merge(merged, shard)
+
+        lines = []
+        for key, state in sorted(merged.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), state[:-1]):
+                cumulative += count
+                labels = self._format_labels(key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = self._format_labels(key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(state[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def generate_latest():
+    """
+    Render every registered metric in the Prometheus text exposition format.
+
+    Returns:
+        bytes: The encoded exposition body.
+    """
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+class _MetricsRequestHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = generate_latest()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes would otherwise be written to stderr on every request
+        pass
+
+
+def start_server(port=None, host="0.0.0.0"):
+    """
+    Serve /metrics from a daemon thread.
+
+    Args:
+        port (int, optional): The port to listen on. Defaults to METRICS_PORT.
+        host (str, optional): The interface to bind to.
+
+    Returns:
+        ThreadingHTTPServer: The running server.
+    """
+    port = int(port if port is not None else METRICS_PORT)
+    server = http.server.ThreadingHTTPServer((host, port), _MetricsRequestHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True)
+    thread.start()
+    return server
+
+
+# Byte-sized buckets for transfer throughput (1 MB/s .. 1 GB/s)
+THROUGHPUT_BUCKETS = tuple(mb * 1024 * 1024 for mb in (1, 5, 10, 25, 50, 100, 250, 500, 1000))
+
+JOB_DURATION = Histogram(
+    "comfy_worker_job_duration_seconds",
+    "End-to-end handler latency per job.",
+    ("tiling", "denoise", "status"),
+)
+PHASE_DURATION = Histogram(
+    "comfy_worker_phase_duration_seconds",
+    "Duration of the individual job phases.",
+    ("phase",),
+)
+DOWNLOAD_BYTES = Counter(
+    "comfy_worker_download_bytes_total",
+    "Bytes downloaded from job inputs.",
+)
+UPLOAD_BYTES = Counter(
+    "comfy_worker_upload_bytes_total",
+    "Bytes uploaded to job outputs.",
+)
+DOWNLOAD_THROUGHPUT = Histogram(
+    "comfy_worker_download_throughput_bytes_per_second",
+    "Throughput of input downloads.",
+    buckets=THROUGHPUT_BUCKETS,
+)
+UPLOAD_THROUGHPUT = Histogram(
+    "comfy_worker_upload_throughput_bytes_per_second",
+    "Throughput of output uploads, per file.",
+    buckets=THROUGHPUT_BUCKETS,
+)
+COMFY_POLLS = Counter(
+    "comfy_worker_comfy_polls_total",
+    "Number of ComfyUI /history polls.",
+)
+COMFY_QUEUE_DEPTH = Gauge(
+    "comfy_worker_comfy_queue_depth",
+    "Prompts running or pending in ComfyUI, read from /queue at scrape time.",
+)
+JOBS_IN_PROGRESS = Gauge(
+    "comfy_worker_jobs_in_progress",
+    "Jobs currently inside the handler.",
+)
+COMFY_NODES = Counter(
+    "comfy_worker_comfy_nodes_total",
+    "ComfyUI workflow nodes per job by cache result; cached / all is the node cache hit ratio.",
+    ("result",),
+)
+LOG_RECORDS_DROPPED = Counter(
+    "comfy_worker_log_records_dropped_total",
+    "Log records dropped because the log shipping queue was full.",
+)
@@ -0,0 +1,390 @@
+"""
+Local disk cache tier for the models on the network volume.
+
+With MODEL_CACHE_DIR set (a directory on local NVMe), the models of the
+workflows are copied from the network volume into that directory and linked
+into ComfyUI's default models folder (`/comfyui/models/<folder>/<name>`).
+ComfyUI searches that folder before the `extra_model_paths.yaml` folders, so
+it loads the local copy once the link exists and the network volume until
+then.
+
+Models are copied ahead of time from a hotness list at boot and on first use
+by a job, one at a time by a background thread so that copies do not compete
+with ComfyUI for the volume. Every copy is written to a temporary file,
+hashed while reading the source, fsynced, read back and hashed again, and
+compared against the checksum recorded by rp_model_fetch on the volume if
+there is one. Only then is it renamed into place and linked, so neither
+ComfyUI nor another worker sharing the cache directory ever sees a partial
+file. The cache keeps to a size budget by evicting the least recently used
+models; the index and every copy are guarded by file locks, so several
+workers can share one cache directory.
+
+Only single file models are cached; model directories (the Florence-2
+repositories) keep being read from where they are.
+"""
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+import uuid
+
+try:
+    from . import rp_model_fetch, rp_prewarm
+except ImportError:
+    # Running as a script (e.g. /rp_handler.py in the container)
+    import rp_model_fetch
+    import rp_prewarm
+
+# Local directory to cache the models in - the cache is disabled when not set
+MODEL_CACHE_DIR = os.environ.get("MODEL_CACHE_DIR")
+# Whether the cache is used at all
+ENABLED = bool(MODEL_CACHE_DIR)
+# Size budget of the cache in bytes, defaults to 90% of the free space of MODEL_CACHE_DIR
+MODEL_CACHE_MAX_BYTES = int(os.environ.get("MODEL_CACHE_MAX_BYTES", 0))
+# Models to copy at boot: a file with one "<folder>/<name>" per line, or "workflows" for all models of the workflows
+MODEL_CACHE_HOTLIST = os.environ.get("MODEL_CACHE_HOTLIST", "workflows")
+# Directory the cached models are linked into, searched by ComfyUI before the network volume
+MODEL_CACHE_LINK_DIR = os.environ.get("MODEL_CACHE_LINK_DIR", os.path.join(rp_prewarm.COMFYUI_PATH, "models"))
+
+INDEX_FILE = "index.json"
+COPY_BLOCK_SIZE = 8 * 1024 * 1024
+# How many directories above a model to look for the checksums recorded by rp_model_fetch
+FETCH_STATE_DEPTH = 4
+
+# The cache of this process, see get_cache()
+_cache = None
+_cache_lock = threading.Lock()
+
+
+class CacheError(Exception):
+    """A model could not be copied into the cache"""
+
+
+def hash_file(path, drop_cache=False):
+    """
+    Hash a file, optionally dropping it from the page cache first so that
+    the data is read back from the disk and not from memory.
+    """
+    sha256 = hashlib.sha256()
+    buffer = bytearray(COPY_BLOCK_SIZE)
+    view = memoryview(buffer)
+    with open(path, "rb", buffering=0) as f:
+        if drop_cache and hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+        while True:
+            read = f.readinto(buffer)
+            if not read:
+                break
+            sha256.update(view[:read])
+    return sha256.hexdigest()
+
+
+def recorded_sha256(source):
+    """
+    Look up the checksum of a model recorded by rp_model_fetch in one of the
+    directories above it, if its size and mtime still match.
+    """
+    stat = os.stat(source)
+    directory = os.path.dirname(source)
+    for _ in range(FETCH_STATE_DEPTH + 1):
+        state_path = os.path.join(directory, rp_model_fetch.STATE_FILE)
+        if os.path.exists(state_path):
+            try:
+                with open(state_path) as f:
+                    entry = json.load(f).get(os.path.relpath(source, directory))
+            except (OSError, ValueError):
+                entry = None
+            if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+                return entry["sha256"]
+            return None
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            break
+        directory = parent
+    return None
+
+
+class ModelCache:
+    """
+    LRU cache of model files on local disk.
+
+    Args:
+        cache_dir (str): The local directory to store the copies in.
+        max_bytes (int, optional): The size budget, 0 for 90% of the free space of `cache_dir`.
+        link_dir (str, optional): The models folder the copies are linked into.
+        search_paths (dict, optional): The model folders, see `rp_prewarm.model_search_paths()`.
+    """
+
+    def __init__(self, cache_dir, max_bytes=0, link_dir=MODEL_CACHE_LINK_DIR, search_paths=None):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.link_dir = os.path.abspath(link_dir)
+        os.makedirs(os.path.join(self.cache_dir, ".tmp"), exist_ok=True)
+        os.makedirs(os.path.join(self.cache_dir, ".locks"), exist_ok=True)
+        if not max_bytes:
+            usage = shutil.disk_usage(self.cache_dir)
+            max_bytes = int((usage.free + self.cached_bytes()) * 0.9)
+        self.max_bytes = max_bytes
+        if search_paths is None:
+            search_paths = rp_prewarm.model_search_paths()
+        self.search_paths = search_paths
+        self._queue = queue.Queue()
+        self._queued = set()
+        self._queued_lock = threading.Lock()
+        self._worker = None
+        # Copies that failed in the background, by "<folder>/<name>"
+        self.errors = {}
+
+    @contextlib.contextmanager
+    def _lock(self, name):
+        with open(os.path.join(self.cache_dir, ".locks", name), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @contextlib.contextmanager
+    def _index(self):
+        """Load the index under the index lock and write it back afterwards"""
+        index_path = os.path.join(self.cache_dir, INDEX_FILE)
+        with self._lock("index"):
+            try:
+                with open(index_path) as f:
+                    index = json.load(f)
+            except (OSError, ValueError):
+                index = {}
+            yield index
+            temp_path = os.path.join(self.cache_dir, ".tmp", f"{INDEX_FILE}.{uuid.uuid4().hex}")
+            with open(temp_path, "w") as f:
+                json.dump(index, f, indent=2, sort_keys=True)
+            os.replace(temp_path, index_path)
+
+    def cached_bytes(self):
+        try:
+            with open(os.path.join(self.cache_dir, INDEX_FILE)) as f:
+                return sum(entry["size"] for entry in json.load(f).values())
+        except (OSError, ValueError):
+            return 0
+
+    def source_path(self, folder, name):
+        """
+        Find a model on the volume, skipping the link directory.
+
+        Returns:
+            str: The path of the model file, or None if it is missing, a directory or already local.
+        """
+        link_folder = os.path.join(self.link_dir, folder)
+        local = os.path.join(link_folder, name)
+        if os.path.isfile(local) and not os.path.islink(local):
+            # Part of the image, already on local disk
+            return None
+        for directory in self.search_paths.get(folder, []):
+            if os.path.abspath(directory).startswith(self.link_dir + os.sep):
+                continue
+            path = os.path.join(directory, name)
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def add(self, folder, name):
+        """
+        Copy a model into the cache and link it, unless it is cached already.
+
+        Returns:
+            str: The path of the cached copy, or None if the model is not cached.
+        """
+        key = f"{folder}/{name}"
+        source = self.source_path(folder, name)
+        if source is None:
+            return None
+        cache_path = os.path.join(self.cache_dir, folder, name)
+
+        with self._lock(hashlib.sha1(key.encode()).hexdigest()):
+            with self._index() as index:
+                entry = index.get(key)
+                if entry and os.path.exists(cache_path):
+                    entry["last_used"] = time.time()
+                    self.link(folder, name, cache_path)
+                    return cache_path
+                size = os.path.getsize(source)
+                if size > self.max_bytes:
+                    return None
+                self._evict(index, size)
+                # Reserve the space so that other workers do not overfill the cache meanwhile
+                index[key] = {"size": size, "last_used": time.time(), "complete": False}
+
+            try:
+                sha256 = self._copy(source, cache_path)
+            except Exception:
+                with self._index() as index:
+                    index.pop(key, None)
+                raise
+
+            with self._index() as index:
+                index[key] = {"size": size, "last_used": time.time(), "complete": True, "sha256": sha256, "source": source}
+            self.link(folder, name, cache_path)
+            return cache_path
+
+    def _copy(self, source, cache_path):
+        """Copy a file atomically and verify the copy, returning its sha256"""
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        temp_path = os.path.join(self.cache_dir, ".tmp", f"{os.path.basename(cache_path)}.{uuid.uuid4().hex}")
+        expected = recorded_sha256(source)
+        sha256 = hashlib.sha256()
+        buffer = bytearray(COPY_BLOCK_SIZE)
+        view = memoryview(buffer)
+        try:
+            with open(source, "rb", buffering=0) as src, open(temp_path, "wb") as dst:
+                while True:
+                    read = src.readinto(buffer)
+                    if not read:
+                        break
+                    sha256.update(view[:read])
+                    dst.write(view[:read])
+                dst.flush()
+                os.fsync(dst.fileno())
+            digest = sha256.hexdigest()
+            if expected is not None and digest != expected:
+                raise CacheError(f"Checksum of {source} does not match the one recorded on the volume")
+            if hash_file(temp_path, drop_cache=True) != digest:
+                raise CacheError(f"Copy of {source} does not match the source")
+            os.replace(temp_path, cache_path)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.remove(temp_path)
+            raise
+        return digest
+
+    def _evict(self, index, needed):
+        """Drop the least recently used complete models until `needed` bytes fit"""
+        used = sum(entry["size"] for entry in index.values())
+        for key, entry in sorted(index.items(), key=lambda item: item[1]["last_used"]):
+            if used + needed <= self.max_bytes:
+                break
+            if not entry.get("complete"):
+                continue
+            folder, name = key.split("/", 1)
+            self.unlink(folder, name)
+            with contextlib.suppress(OSError):
+                # Loaded copies stay readable until ComfyUI closes them
+                os.remove(os.path.join(self.cache_dir, folder, name))
+            del index[key]
+            used -= entry["size"]
+
+    def link(self, folder, name, cache_path):
+        """Atomically point `<link_dir>/<folder>/<name>` at the cached copy"""
+        link_path = os.path.join(self.link_dir, folder, name)
+        if os.path.exists(link_path) and not os.path.islink(link_path):
+            return
+        os.makedirs(os.path.dirname(link_path), exist_ok=True)
+        temp_link = f"{link_path}.{uuid.uuid4().hex}.tmp"
+        os.symlink(cache_path, temp_link)
+        os.replace(temp_link, link_path)
+
+    def unlink(self, folder, name):
+        link_path = os.path.join(self.link_dir, folder, name)
+        if os.path.islink(link_path):
+            with contextlib.suppress(OSError):
+                os.remove(link_path)
+
+    def touch(self, models):
+        """Mark models as used now"""
+        now = time.time()
+        with self._index() as index:
+            for folder, name in models:
+                entry = index.get(f"{folder}/{name}")
+                if entry is not None:
+                    entry["last_used"] = now
+
+    def use(self, models):
+        """
+        Record that a job uses `models` and copy the uncached ones in the background.
+
+        Args:
+            models (iterable): (folder, name) pairs, see `rp_prewarm.workflow_models()`.
+        """
+        models = list(models)
+        self.touch(models)
+        self.schedule(models)
+
+    def schedule(self, models):
+        """Queue models for copying by the background thread, in the given order"""
+        with self._queued_lock:
+            for model in models:
+                if model not in self._queued:
+                    self._queued.add(model)
+                    self._queue.put(model)
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._work, name="model-cache", daemon=True)
+                self._worker.start()
+
+    def _work(self):
+        while True:
+            model = self._queue.get()
+            try:
+                self.add(*model)
+            except Exception as e:
+                self.errors[f"{model[0]}/{model[1]}"] = str(e)
+            finally:
+                with self._queued_lock:
+                    self._queued.discard(model)
+                self._queue.task_done()
+
+    def wait(self):
+        """Block until all queued copies are done"""
+        self._queue.join()
+
+    def stats(self):
+        with self._index() as index:
+            complete = [entry for entry in index.values() if entry.get("complete")]
+            return {
+                "models": len(complete),
+                "bytes": sum(entry["size"] for entry in complete),
+                "max_bytes": self.max_bytes,
+            }
+
+
+def read_hotlist(hotlist, workflows_dir):
+    """
+    Read the models to cache ahead of time.
+
+    Args:
+        hotlist (str): "workflows" for all models of the workflows, or a file with one "<folder>/<name>" per line.
+        workflows_dir (str): The directory with the workflow templates.
+
+    Returns:
+        list: (folder, name) pairs in order of priority.
+    """
+    if not hotlist:
+        return []
+    if hotlist == "workflows":
+        return rp_prewarm.required_models(workflows_dir)
+    models = []
+    with open(hotlist) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                folder, name = line.split("/", 1)
+                models.append((folder, name))
+    return models
+
+
+def get_cache():
+    """
+    The cache of this process, created from the environment on first use.
+
+    Returns:
+        ModelCache: The cache, or None if MODEL_CACHE_DIR is not set.
+    """
+    global _cache
+    if not ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = ModelCache(MODEL_CACHE_DIR, MODEL_CACHE_MAX_BYTES)
+        return _cache
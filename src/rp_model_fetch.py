@@ -0,0 +1,432 @@
+"""
+Manifest driven model fetcher.
+
+Downloads the models listed in a JSON manifest into a models directory, e.g.
+at build time into /comfyui or at first boot onto the network volume:
+
+    python rp_model_fetch.py --manifest models.json --dest /runpod-volume
+
+Manifest format:
+
+    {"models": [
+        {"url": "https://huggingface.co/lllyasviel/FLUX.1-dev-gguf/resolve/main/flux1-dev-F16.gguf",
+         "path": "models/unet/flux1-dev-F16.gguf", "size": 23802932552, "sha256": "..."},
+        {"repo": "microsoft/Florence-2-large-ft", "path": "models/LLM/Florence-2-large-ft"}
+    ]}
+
+`size` and `sha256` are optional; `--update-manifest` fills them in from the
+downloaded files so that later runs verify against them. `repo` entries are
+expanded into one entry per file of the Hugging Face repository.
+
+Every file is streamed into `<path>.part` while it is hashed, and moved into
+place only once its size and checksum match. An interrupted download resumes
+from the partial file with an HTTP range request. Files that are already
+present and verified are skipped; their verification is remembered in a state
+file in the destination, so the multi-GB files are not re-hashed on every run
+unless they changed. All downloads share one concurrency limit and an optional
+bandwidth cap, and the largest files are started first so that a single slow
+file does not hold back the rest.
+"""
+import argparse
+import fnmatch
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+# Token sent to Hugging Face for gated models
+HUGGINGFACE_ACCESS_TOKEN = os.environ.get("HUGGINGFACE_ACCESS_TOKEN")
+# Hugging Face endpoint used to expand `repo` entries
+HF_ENDPOINT = os.environ.get("HF_ENDPOINT", "https://huggingface.co").rstrip("/")
+# Number of files downloaded in parallel
+MODEL_FETCH_CONCURRENCY = int(os.environ.get("MODEL_FETCH_CONCURRENCY", 4))
+# Bandwidth cap shared by all downloads in bytes per second, 0 = unlimited
+MODEL_FETCH_MAX_BANDWIDTH = int(os.environ.get("MODEL_FETCH_MAX_BANDWIDTH", 0))
+# Attempts per file before giving up
+MODEL_FETCH_RETRIES = int(os.environ.get("MODEL_FETCH_RETRIES", 5))
+
+# Size of the blocks read from the network and from disk
+BLOCK_SIZE = 1024 * 1024
+# Verification results of the files in the destination, relative to it
+STATE_FILE = ".model_fetch_state.json"
+
+logger = logging.getLogger("rp_model_fetch")
+
+
+class FetchError(Exception):
+    """A model could not be downloaded or verified"""
+
+
+class RateLimiter:
+    """
+    Token bucket shared by all downloads.
+
+    Every consumer reserves the time its bytes take at the configured rate,
+    so the total stays under the cap no matter how many threads download.
+    """
+
+    def __init__(self, bytes_per_second):
+        self.bytes_per_second = bytes_per_second
+        self._lock = threading.Lock()
+        self._next_free = 0
+
+    def consume(self, size):
+        if not self.bytes_per_second:
+            return
+        with self._lock:
+            now = time.monotonic()
+            # Do not bank unused bandwidth for more than a second
+            self._next_free = max(self._next_free, now - 1) + size / self.bytes_per_second
+            wait = self._next_free - now
+        if wait > 0:
+            time.sleep(wait)
+
+
+def load_manifest(path):
+    """
+    Read the entries of a manifest file.
+
+    Args:
+        path (str): The path of the JSON manifest.
+
+    Returns:
+        list: The manifest entries.
+    """
+    with open(path) as f:
+        manifest = json.load(f)
+    entries = manifest["models"] if isinstance(manifest, dict) else manifest
+    for entry in entries:
+        if "path" not in entry or ("url" not in entry and "repo" not in entry):
+            raise ValueError(f"Manifest entry needs a 'path' and a 'url' or 'repo': {entry}")
+    return entries
+
+
+def expand_repo(entry, session=None):
+    """
+    Turn a `repo` entry into one entry per file of the Hugging Face repository.
+
+    Args:
+        entry (dict): The manifest entry with `repo`, `path` and an optional `revision`.
+        session (requests.Session, optional): The session to query the API with.
+
+    Returns:
+        list: Entries with `url`, `path`, `size` and, for LFS files, `sha256`.
+    """
+    session = session or requests.Session()
+    revision = entry.get("revision", "main")
+    response = session.get(
+        f"{HF_ENDPOINT}/api/models/{entry['repo']}/revision/{revision}",
+        params={"blobs": "true"},
+        headers=auth_headers(HF_ENDPOINT),
+        timeout=30,
+    )
+    response.raise_for_status()
+    files = []
+    for sibling in response.json().get("siblings", []):
+        name = sibling["rfilename"]
+        lfs = sibling.get("lfs") or {}
+        files.append({
+            "url": f"{HF_ENDPOINT}/{entry['repo']}/resolve/{revision}/{urllib.parse.quote(name)}",
+            "path": f"{entry['path'].rstrip('/')}/{name}",
+            "size": lfs.get("size", sibling.get("size")),
+            "sha256": lfs.get("sha256"),
+        })
+    return files
+
+
+def auth_headers(url):
+    """Send the Hugging Face token to Hugging Face only"""
+    host = urllib.parse.urlparse(url).hostname or ""
+    hf_host = urllib.parse.urlparse(HF_ENDPOINT).hostname
+    if HUGGINGFACE_ACCESS_TOKEN and (host == hf_host or host.endswith(".huggingface.co")):
+        return {"Authorization": f"Bearer {HUGGINGFACE_ACCESS_TOKEN}"}
+    return {}
+
+
+def file_sha256(path):
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(BLOCK_SIZE), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+class ModelFetcher:
+    """
+    Downloads manifest entries into `dest`.
+
+    Args:
+        dest (str): The directory the manifest paths are relative to.
+        concurrency (int, optional): The number of files downloaded in parallel.
+        max_bandwidth (int, optional): The total bandwidth cap in bytes per second, 0 = unlimited.
+        retries (int, optional): The attempts per file.
+    """
+
+    def __init__(self, dest, concurrency=MODEL_FETCH_CONCURRENCY, max_bandwidth=MODEL_FETCH_MAX_BANDWIDTH,
+                 retries=MODEL_FETCH_RETRIES):
+        self.dest = dest
+        self.concurrency = max(1, concurrency)
+        self.limiter = RateLimiter(max_bandwidth)
+        self.retries = max(1, retries)
+        self.state_path = os.path.join(dest, STATE_FILE)
+        self._state_lock = threading.Lock()
+        try:
+            with open(self.state_path) as f:
+                self.state = json.load(f)
+        except (OSError, ValueError):
+            self.state = {}
+
+    def fetch(self, entries):
+        """
+        Download all entries that are not present and verified yet.
+
+        Args:
+            entries (list): The manifest entries, `repo` entries are expanded.
+
+        Returns:
+            dict: A report with the downloaded, skipped and failed files and the bytes and time taken.
+        """
+        start = time.perf_counter()
+        files = []
+        failed_repos = []
+        for entry in entries:
+            if "repo" not in entry:
+                files.append(entry)
+                continue
+            expanded, failure = self.expand(entry)
+            files.extend(expanded)
+            if failure is not None:
+                failed_repos.append(failure)
+        # Largest first, unknown sizes are probably large
+        files.sort(key=lambda entry: entry.get("size") or float("inf"), reverse=True)
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            results = failed_repos + list(executor.map(self.fetch_file, files))
+
+        report = {
+            "files": results,
+            "downloaded": sum(1 for result in results if result["status"] == "downloaded"),
+            "skipped": sum(1 for result in results if result["status"] == "skipped"),
+            "failed": sum(1 for result in results if result["status"] == "failed"),
+            "downloaded_bytes": sum(result.get("downloaded_bytes", 0) for result in results),
+            "seconds": round(time.perf_counter() - start, 3),
+        }
+        logger.info(
+            "Model fetch finished: %d downloaded, %d skipped, %d failed, %.1f MB in %.1fs",
+            report["downloaded"], report["skipped"], report["failed"],
+            report["downloaded_bytes"] / 1024 ** 2, report["seconds"],
+        )
+        return report
+
+    def expand(self, entry):
+        """
+        Expand a `repo` entry with `expand_repo`, retried like a file download.
+
+        Returns:
+            tuple: The entries of the files of the repository, and a "failed" result
+                   for the repository if it could not be listed (None otherwise).
+        """
+        last_error = None
+        for attempt in range(self.retries):
+            try:
+                return expand_repo(entry), None
+            except (requests.RequestException, ValueError) as e:
+                last_error = e
+                logger.warning("Listing of %s failed (attempt %d/%d): %s", entry["repo"], attempt + 1, self.retries, e)
+                time.sleep(min(2 ** attempt, 30))
+        error = f"Giving up on {entry['repo']}: {last_error}"
+        logger.error(error)
+        return [], {"path": entry["path"], "repo": entry["repo"], "status": "failed", "error": error}
+
+    def fetch_file(self, entry):
+        """
+        Download a single entry unless it is present and verified.
+
+        Returns:
+            dict: The path, status ("downloaded", "skipped" or "failed"), size and sha256 of the file.
+        """
+        target = os.path.join(self.dest, entry["path"])
+        result = {"path": entry["path"], "url": entry["url"]}
+        try:
+            sha256 = self.verified_sha256(entry, target)
+            if sha256 is not None:
+                return {**result, "status": "skipped", "size": os.path.getsize(target), "sha256": sha256}
+
+            last_error = None
+            for attempt in range(self.retries):
+                try:
+                    size, sha256, downloaded = self.download(entry, target)
+                    return {**result, "status": "downloaded", "size": size, "sha256": sha256, "downloaded_bytes": downloaded}
+                except (requests.RequestException, OSError) as e:
+                    last_error = e
+                    logger.warning("Download of %s failed (attempt %d/%d): %s", entry["path"], attempt + 1, self.retries, e)
+                    time.sleep(min(2 ** attempt, 30))
+            raise FetchError(f"Giving up on {entry['path']}: {last_error}")
+        except FetchError as e:
+            logger.error(str(e))
+            return {**result, "status": "failed", "error": str(e)}
+
+    def verified_sha256(self, entry, target):
+        """
+        Check a file that is already present against the manifest.
+
+        Returns:
+            str: The sha256 of the file if it is present and matches, otherwise None.
+        """
+        try:
+            stat = os.stat(target)
+        except OSError:
+            return None
+        if entry.get("size") is not None and stat.st_size != entry["size"]:
+            logger.info("Size of %s does not match the manifest, downloading it again", entry["path"])
+            return None
+
+        with self._state_lock:
+            known = self.state.get(entry["path"])
+        if known and known["size"] == stat.st_size and known["mtime_ns"] == stat.st_mtime_ns:
+            sha256 = known["sha256"]
+        else:
+            sha256 = file_sha256(target)
+            self.remember(entry["path"], target, sha256)
+
+        if entry.get("sha256") and sha256 != entry["sha256"].lower():
+            logger.info("Checksum of %s does not match the manifest, downloading it again", entry["path"])
+            return None
+        return sha256
+
+    def remember(self, path, target, sha256):
+        stat = os.stat(target)
+        with self._state_lock:
+            self.state[path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256}
+            temp_path = f"{self.state_path}.{os.getpid()}.{threading.get_ident()}"
+            with open(temp_path, "w") as f:
+                json.dump(self.state, f, indent=2, sort_keys=True)
+            os.replace(temp_path, self.state_path)
+
+    def download(self, entry, target):
+        """
+        Stream an entry into `<target>.part`, resuming it if it exists, and
+        move it into place once it is verified.
+
+        Returns:
+            tuple: The size and sha256 of the file and the number of bytes downloaded.
+        """
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        part_path = f"{target}.part"
+        sha256 = hashlib.sha256()
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        expected_size = entry.get("size")
+        if expected_size is not None and offset > expected_size:
+            offset = 0
+
+        headers = auth_headers(entry["url"])
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+        with requests.get(entry["url"], headers=headers, stream=True, timeout=60) as response:
+            if response.status_code == 416 and offset:
+                # Nothing left to download, unless the partial file is not what we think it is
+                if offset != expected_size:
+                    os.remove(part_path)
+                    raise requests.RequestException(f"Cannot resume {entry['path']} at {offset} bytes, starting over")
+            else:
+                response.raise_for_status()
+                if offset and response.status_code != 206:
+                    logger.info("Server ignored the range request for %s, starting over", entry["path"])
+                    offset = 0
+
+            # Hash what is already on disk before appending to it
+            if offset:
+                with open(part_path, "rb") as f:
+                    for block in iter(lambda: f.read(BLOCK_SIZE), b""):
+                        sha256.update(block)
+                logger.info("Resuming %s at %d bytes", entry["path"], offset)
+
+            downloaded = 0
+            with open(part_path, "ab" if offset else "wb") as f:
+                if response.status_code != 416:
+                    for block in response.iter_content(BLOCK_SIZE):
+                        self.limiter.consume(len(block))
+                        sha256.update(block)
+                        f.write(block)
+                        downloaded += len(block)
+                f.flush()
+                os.fsync(f.fileno())
+
+        size = offset + downloaded
+        digest = sha256.hexdigest()
+        if expected_size is not None and size != expected_size:
+            raise requests.RequestException(f"Incomplete download of {entry['path']}: {size} of {expected_size} bytes")
+        if entry.get("sha256") and digest != entry["sha256"].lower():
+            os.remove(part_path)
+            raise FetchError(f"Checksum mismatch for {entry['path']}: expected {entry['sha256']}, got {digest}")
+
+        os.replace(part_path, target)
+        self.remember(entry["path"], target, digest)
+        logger.info("Downloaded %s (%d bytes)", entry["path"], size)
+        return size, digest, downloaded
+
+
+def update_manifest(path, results):
+    """Pin the size and sha256 of the fetched files in the manifest"""
+    with open(path) as f:
+        manifest = json.load(f)
+    entries = manifest["models"] if isinstance(manifest, dict) else manifest
+    by_path = {result["path"]: result for result in results if result.get("sha256")}
+    for entry in entries:
+        result = by_path.get(entry["path"])
+        if result is not None:
+            entry["size"] = result["size"]
+            entry["sha256"] = result["sha256"]
+    with open(path, "w") as f:
+        json.dump(manifest, f, indent=2)
+        f.write("\n")
+
+
+def parse_bandwidth(text):
+    """Parse a bandwidth like "50MB" (per second) into bytes per second"""
+    text = text.strip().upper().removesuffix("/S")
+    for unit, factor in (("GB", 1024 ** 3), ("MB", 1024 ** 2), ("KB", 1024)):
+        if text.endswith(unit):
+            return int(float(text[:-len(unit)]) * factor)
+    return int(text)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Download the models of a manifest")
+    parser.add_argument("--manifest", required=True, help="JSON manifest of the models")
+    parser.add_argument("--dest", required=True, help="Directory the manifest paths are relative to")
+    parser.add_argument("--include", action="append", help="Only fetch paths matching this glob, can be repeated")
+    parser.add_argument("--concurrency", type=int, default=MODEL_FETCH_CONCURRENCY, help="Files downloaded in parallel")
+    parser.add_argument("--max-bandwidth", type=parse_bandwidth, default=MODEL_FETCH_MAX_BANDWIDTH,
+                        help="Total bandwidth cap, e.g. 200MB (per second)")
+    parser.add_argument("--retries", type=int, default=MODEL_FETCH_RETRIES, help="Attempts per file")
+    parser.add_argument("--update-manifest", action="store_true", help="Write the size and sha256 of the files back into the manifest")
+    parser.add_argument("--report", help="Write the report as JSON to this file")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    entries = load_manifest(args.manifest)
+    if args.include:
+        entries = [entry for entry in entries if any(fnmatch.fnmatch(entry["path"], pattern) for pattern in args.include)]
+
+    fetcher = ModelFetcher(args.dest, args.concurrency, args.max_bandwidth, args.retries)
+    report = fetcher.fetch(entries)
+
+    if args.update_manifest:
+        update_manifest(args.manifest, report["files"])
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+
+    return 1 if report["failed"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,233 @@
+"""
+Per-node execution profile of a ComfyUI prompt.
+
+ComfyUI reports progress over its websocket: `executing` when a node starts
+(and with `node: null` once the prompt is done), `executed` when an output
+node finishes and `execution_cached` with the nodes served from the cache.
+Nodes run one after another, so a node is busy from its `executing` event
+until the next `executing` event for the same prompt.
+"""
+import asyncio
+import json
+import threading
+import time
+
+
+class NodeProfile:
+    """
+    Collects ComfyUI execution events for one prompt and turns them into a
+    per-node profile.
+    """
+
+    def __init__(self, prompt_id=None, workflow=None):
+        self.prompt_id = prompt_id
+        self.workflow = workflow or {}
+        # node_id -> list of (start, end) intervals
+        self.intervals = {}
+        self.cached_nodes = []
+        self.started_at = None
+        self.finished_at = None
+        self._current = None
+
+    def record(self, event_type, data, timestamp=None):
+        """
+        Record a single websocket event.
+
+        Args:
+            event_type (str): The `type` of the ComfyUI message.
+            data (dict): The `data` of the ComfyUI message.
+            timestamp (float, optional): When the event was received. Defaults to now.
+
+        Returns:
+            bool: True once the prompt has finished executing.
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        if self.prompt_id is not None and data.get("prompt_id") not in (None, self.prompt_id):
+            return False
+
+        if event_type == "execution_start":
+            self.started_at = timestamp
+        elif event_type == "execution_cached":
+            self.cached_nodes.extend(str(node) for node in data.get("nodes", []))
+            if self.started_at is None:
+                self.started_at = timestamp
+        elif event_type == "executing":
+            self._close_current(timestamp)
+            node = data.get("node")
+            if node is None:
+                self.finished_at = timestamp
+                return True
+            self._current = (str(node), timestamp)
+            if self.started_at is None:
+                self.started_at = timestamp
+        elif event_type == "executed":
+            # Output nodes report completion before the next node starts
+            if self._current and self._current[0] == str(data.get("node")):
+                self._close_current(timestamp)
+        elif event_type in ("execution_success", "execution_error", "execution_interrupted"):
+            self._close_current(timestamp)
+            self.finished_at = timestamp
+            return True
+        return False
+
+    def _close_current(self, timestamp):
+        if self._current is None:
+            return
+        node, start = self._current
+        self.intervals.setdefault(node, []).append((start, timestamp))
+        self._current = None
+
+    def class_type(self, node_id):
+        return self.workflow.get(node_id, {}).get("class_type", "unknown")
+
+    def summary(self):
+        """
+        Build the per-node profile.
+
+        Returns:
+            list: One dict per node, sorted by self-time (descending). Cached
+                  nodes are included with a self-time of 0.
+        """
+        entries = []
+        for node_id, intervals in self.intervals.items():
+            entries.append({
+                "node_id": node_id,
+                "class_type": self.class_type(node_id),
+                "self_time_seconds": round(sum(end - start for start, end in intervals), 4),
+                "calls": len(intervals),
+                "cached": False,
+            })
+        for node_id in self.cached_nodes:
+            if node_id not in self.intervals:
+                entries.append({
+                    "node_id": node_id,
+                    "class_type": self.class_type(node_id),
+                    "self_time_seconds": 0.0,
+                    "calls": 0,
+                    "cached": True,
+                })
+        entries.sort(key=lambda entry: entry["self_time_seconds"], reverse=True)
+        return entries
+
+    def to_chrome_trace(self):
+        """
+        Convert the profile to the Chrome trace event format
+        (chrome://tracing, Perfetto).
+
+        Returns:
+            dict: The trace document.
+        """
+        origin = self.started_at or 0
+        events = []
+        for node_id, intervals in self.intervals.items():
+            for start, end in intervals:
+                events.append({
+                    "name": self.class_type(node_id),
+                    "cat": "node",
+                    "ph": "X",
+                    "ts": round((start - origin) * 1e6),
+                    "dur": round((end - start) * 1e6),
+                    "pid": 1,
+                    "tid": 1,
+                    "args": {"node_id": node_id},
+                })
+        for node_id in self.cached_nodes:
+            events.append({
+                "name": self.class_type(node_id),
+                "cat": "cached",
+                "ph": "i",
+                "s": "t",
+                "ts": 0,
+                "pid": 1,
+                "tid": 1,
+                "args": {"node_id": node_id},
+            })
+        events.sort(key=lambda event: event["ts"])
+        return {
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+            "otherData": {"prompt_id": self.prompt_id},
+        }
+
+    def write_chrome_trace(self, path):
+        """
+        Write the Chrome trace JSON to `path`.
+        """
+        with open(path, "w") as f:
+            json.dump(self.to_chrome_trace(), f)
+
+
+class NodeProfileListener:
+    """
+    Listens on the ComfyUI websocket in a background thread and feeds the
+    events of one prompt into a NodeProfile.
+
+    The listener must be started before the prompt is queued, with the same
+    `client_id` that is sent along with the prompt.
+    """
+
+    def __init__(self, comfy_host, client_id, workflow=None):
+        self.url = f"ws://{comfy_host}/ws?clientId={client_id}"
+        self.profile = NodeProfile(workflow=workflow)
+        self.connected = threading.Event()
+        self.done = threading.Event()
+        self.error = None
+        self._thread = threading.Thread(target=self._run, name="node-profile", daemon=True)
+
+    def start(self, connect_timeout=2):
+        """
+        Start listening.
+
+        Args:
+            connect_timeout (float): Seconds to wait for the websocket connection.
+
+        Returns:
+            bool: True if the websocket is connected.
+        """
+        self._thread.start()
+        self.connected.wait(connect_timeout)
+        return self.connected.is_set()
+
+    def set_prompt_id(self, prompt_id):
+        self.profile.prompt_id = prompt_id
+
+    def stop(self, timeout=1):
+        """
+        Stop listening, waiting up to `timeout` seconds for the final events.
+
+        Returns:
+            NodeProfile: The collected profile.
+        """
+        self.done.wait(timeout)
+        # The receive loop checks the flag between messages
+        self.done.set()
+        self._thread.join(timeout)
+        return self.profile
+
+    def _run(self):
+        try:
+            asyncio.run(self._listen())
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done.set()
+
+    async def _listen(self):
+        # aiohttp is only needed when profiling is enabled
+        import aiohttp
+
+        async with aiohttp.ClientSession() as session:
+            async with session.ws_connect(self.url, heartbeat=30) as ws:
+                self.connected.set()
+                while not self.done.is_set():
+                    try:
+                        message = await ws.receive(timeout=0.2)
+                    except asyncio.TimeoutError:
+                        continue
+                    if message.type == aiohttp.WSMsgType.TEXT:
+                        event = json.loads(message.data)
+                        if self.profile.record(event.get("type"), event.get("data") or {}):
+                            break
+                    elif message.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                        break
+                    # Binary messages are latent previews and are ignored
@@ -0,0 +1,247 @@
+"""
+Output sinks: where the outputs of a job are uploaded to.
+
+The sink of a job is picked by the scheme of its `output` URL. The handler
+registers its TUS upload for `http` and `https`; `s3://<bucket>/<prefix>`
+URLs are uploaded straight to an S3 compatible bucket (BUCKET_ENDPOINT_URL,
+BUCKET_ACCESS_KEY_ID, BUCKET_SECRET_ACCESS_KEY), each output to
+`<prefix><path in the output directory>`.
+
+Files larger than S3_PART_SIZE are sent as a multipart upload whose parts
+are read and uploaded by S3_UPLOAD_CONCURRENCY threads. Every part is read
+once: its MD5 is computed from the bytes in memory and sent as Content-MD5,
+so S3 rejects a part that was corrupted on the way.
+"""
+import base64
+import hashlib
+import os
+import threading
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+# Endpoint of the S3 API, e.g. a regional endpoint or a MinIO server; AWS when not set
+BUCKET_ENDPOINT_URL = os.environ.get("BUCKET_ENDPOINT_URL")
+# Access key for s3:// outputs, boto3 falls back to its own credential chain when not set
+BUCKET_ACCESS_KEY_ID = os.environ.get("BUCKET_ACCESS_KEY_ID")
+# Secret key for s3:// outputs
+BUCKET_SECRET_ACCESS_KEY = os.environ.get("BUCKET_SECRET_ACCESS_KEY")
+# Region of the bucket
+BUCKET_REGION = os.environ.get("BUCKET_REGION", "us-east-1")
+# "path" for S3 compatible servers that do not support bucket subdomains
+S3_ADDRESSING_STYLE = os.environ.get("S3_ADDRESSING_STYLE", "auto")
+# Size of each part of a multipart upload in bytes (S3 needs at least 5 MB)
+S3_PART_SIZE = int(os.environ.get("S3_PART_SIZE", 16 * 1024 * 1024))
+# Number of parts uploaded in parallel
+S3_UPLOAD_CONCURRENCY = int(os.environ.get("S3_UPLOAD_CONCURRENCY", 8))
+
+# URL scheme -> sink class
+_sinks = {}
+
+# Shared S3 client, see s3_client()
+_s3_client = None
+_s3_client_lock = threading.Lock()
+
+
+class OutputSink:
+    """
+    Uploads the outputs of a job to the `output` URL of the job.
+
+    Args:
+        url (str): The `output` URL of the job.
+    """
+
+    # Named in log messages and errors
+    protocol = None
+
+    def __init__(self, url):
+        self.url = url
+
+    def upload(self, file_path, relative_path, mime_type):
+        """
+        Upload one output file.
+
+        Args:
+            file_path (str): The path of the file to upload.
+            relative_path (str): The path of the file in the output directory.
+            mime_type (str): The MIME type of the file.
+
+        Returns:
+            str: The URL of the uploaded file.
+        """
+        raise NotImplementedError
+
+
+def register_sink(schemes, sink_class):
+    """
+    Use `sink_class` for output URLs with one of the given schemes.
+
+    Args:
+        schemes (iterable): URL schemes, e.g. ("http", "https").
+        sink_class (type): A subclass of OutputSink.
+    """
+    for scheme in schemes:
+        _sinks[scheme] = sink_class
+
+
+def get_sink(url):
+    """
+    Create the sink for an output URL.
+
+    Args:
+        url (str): The `output` URL of a job.
+
+    Returns:
+        OutputSink: The sink for the scheme of the URL.
+
+    Raises:
+        ValueError: If no sink is registered for the scheme.
+    """
+    scheme = urllib.parse.urlsplit(url).scheme.lower()
+    if scheme not in _sinks:
+        raise ValueError(f"Unsupported output URL scheme: '{scheme}'")
+    return _sinks[scheme](url)
+
+
+def service_endpoint(endpoint_url):
+    """
+    Strip the bucket from a virtual hosted AWS endpoint.
+
+    BUCKET_ENDPOINT_URL is documented as `https://<bucket>.s3.<region>.amazonaws.com`,
+    but the bucket is taken from the output URL of each job.
+
+    Args:
+        endpoint_url (str): The configured endpoint, may be None.
+
+    Returns:
+        str: The endpoint of the S3 service.
+    """
+    if not endpoint_url:
+        return endpoint_url
+    parts = urllib.parse.urlsplit(endpoint_url)
+    host = parts.hostname or ""
+    bucket, _, service = host.partition(".")
+    if bucket != "s3" and service.startswith("s3.") and service.endswith(".amazonaws.com"):
+        return urllib.parse.urlunsplit((parts.scheme, service, "", "", ""))
+    return endpoint_url
+
+
+def s3_client():
+    """
+    The S3 client shared by all uploads, created on first use.
+
+    boto3 is only imported here, it takes a while to import and is not
+    needed by workers that upload through TUS.
+    """
+    global _s3_client
+    with _s3_client_lock:
+        if _s3_client is None:
+            import boto3
+            from botocore.config import Config
+
+            _s3_client = boto3.client(
+                "s3",
+                endpoint_url=service_endpoint(BUCKET_ENDPOINT_URL),
+                aws_access_key_id=BUCKET_ACCESS_KEY_ID,
+                aws_secret_access_key=BUCKET_SECRET_ACCESS_KEY,
+                region_name=BUCKET_REGION,
+                config=Config(
+                    s3={"addressing_style": S3_ADDRESSING_STYLE},
+                    max_pool_connections=max(S3_UPLOAD_CONCURRENCY, 10),
+                    retries={"max_attempts": 5, "mode": "standard"},
+                    # Parts carry a Content-MD5, do not read them a second time for a CRC
+                    request_checksum_calculation="when_required",
+                ),
+            )
+        return _s3_client
+
+
+def content_md5(data):
+    return base64.b64encode(hashlib.md5(data).digest()).decode()
+
+
+class S3Sink(OutputSink):
+    """
+    Uploads outputs to `s3://<bucket>/<prefix>`, large files as parallel multipart uploads.
+
+    Args:
+        url (str): The `output` URL of the job.
+        part_size (int, optional): The size of each part in bytes.
+        concurrency (int, optional): The number of parts uploaded in parallel.
+        client (optional): The boto3 S3 client, see `s3_client()`.
+    """
+
+    protocol = "S3"
+
+    def __init__(self, url, part_size=S3_PART_SIZE, concurrency=S3_UPLOAD_CONCURRENCY, client=None):
+        super().__init__(url)
+        parts = urllib.parse.urlsplit(url)
+        if not parts.netloc:
+            raise ValueError(f"Missing bucket in output URL: '{url}'")
+        self.bucket = parts.netloc
+        self.prefix = parts.path.lstrip("/")
+        # s3://bucket/outputs writes outputs/<file>, not outputs<file>
+        if self.prefix and not self.prefix.endswith("/"):
+            self.prefix += "/"
+        self.part_size = part_size
+        self.concurrency = concurrency
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = s3_client()
+        return self._client
+
+    def key(self, relative_path):
+        return self.prefix + relative_path.replace(os.sep, "/")
+
+    def upload(self, file_path, relative_path, mime_type):
+        key = self.key(relative_path)
+        file_size = os.path.getsize(file_path)
+        if file_size <= self.part_size:
+            with open(file_path, "rb") as f:
+                data = f.read()
+            self.client.put_object(
+                Bucket=self.bucket, Key=key, Body=data, ContentType=mime_type, ContentMD5=content_md5(data),
+            )
+        else:
+            self.upload_multipart(file_path, key, file_size, mime_type)
+        return f"s3://{self.bucket}/{key}"
+
+    def upload_multipart(self, file_path, key, file_size, mime_type):
+        """
+        Upload a file in parts of `part_size` from `concurrency` threads.
+
+        The upload is aborted if any part fails, so no parts are left behind
+        in the bucket.
+        """
+        upload_id = self.client.create_multipart_upload(Bucket=self.bucket, Key=key, ContentType=mime_type)["UploadId"]
+        fd = os.open(file_path, os.O_RDONLY)
+
+        def upload_part(part_number):
+            # pread does not share a file position between the threads
+            data = os.pread(fd, self.part_size, (part_number - 1) * self.part_size)
+            response = self.client.upload_part(
+                Bucket=self.bucket, Key=key, UploadId=upload_id, PartNumber=part_number,
+                Body=data, ContentMD5=content_md5(data),
+            )
+            return {"PartNumber": part_number, "ETag": response["ETag"]}
+
+        try:
+            part_count = -(-file_size // self.part_size)
+            with ThreadPoolExecutor(max_workers=min(self.concurrency, part_count)) as executor:
+                parts = list(executor.map(upload_part, range(1, part_count + 1)))
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket, Key=key, UploadId=upload_id, MultipartUpload={"Parts": parts},
+            )
+        except BaseException:
+            try:
+                self.client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+            except Exception:
+                pass
+            raise
+        finally:
+            os.close(fd)
+
+
+register_sink(("s3",), S3Sink)
@@ -0,0 +1,147 @@
+"""
+Early low resolution preview of the first output image of a job.
+
+With PREVIEW enabled, the handler watches the ComfyUI output directory while
+the workflow runs. As soon as the first PNG is complete (its size did not
+change between two polls), a worker thread decodes it at reduced size and
+encodes a small JPEG or WebP, which the handler publishes before it uploads
+the full size outputs.
+
+Pillow is imported on first use. PNG has no reduced decoding, so the image
+is decoded once and shrunk by an integer factor with `Image.reduce()` (a box
+filter that only reads every pixel once) before the final resample; JPEG
+inputs are decoded at reduced size with `Image.draft()`.
+"""
+import io
+import os
+import threading
+import time
+
+# Generate a preview of the first output PNG of each job
+PREVIEW = os.environ.get("PREVIEW", "false").lower() == "true"
+# Longest edge of the preview in pixels
+PREVIEW_MAX_SIZE = int(os.environ.get("PREVIEW_MAX_SIZE", 512))
+# "jpeg" or "webp"
+PREVIEW_FORMAT = os.environ.get("PREVIEW_FORMAT", "jpeg").lower()
+# Encoder quality of the preview
+PREVIEW_QUALITY = int(os.environ.get("PREVIEW_QUALITY", 80))
+# Previews up to this size are returned inline as base64 instead of uploaded, 0 to always upload
+PREVIEW_INLINE_MAX_BYTES = int(os.environ.get("PREVIEW_INLINE_MAX_BYTES", 64 * 1024))
+
+MIME_TYPES = {"jpeg": "image/jpeg", "webp": "image/webp"}
+
+
+def make_preview(path, max_size=PREVIEW_MAX_SIZE, image_format=PREVIEW_FORMAT, quality=PREVIEW_QUALITY):
+    """
+    Encode a downscaled copy of an image.
+
+    Args:
+        path (str): The image to preview.
+        max_size (int, optional): The longest edge of the preview in pixels.
+        image_format (str, optional): "jpeg" or "webp".
+        quality (int, optional): The encoder quality.
+
+    Returns:
+        tuple: The encoded preview, its width and its height.
+    """
+    from PIL import Image
+
+    with Image.open(path) as image:
+        # Only JPEG decoders support this, others ignore it
+        image.draft("RGB", (max_size, max_size))
+        if image.mode.startswith("I"):
+            # 16-bit grayscale, scaled to 8 bits instead of clipped
+            image = image.convert("I").point(lambda value: value / 256)
+        # reduce() does not support palette, bilevel or 16-bit images, and would resample palette indices
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        # Reduce to at least twice the preview size, the final resample keeps the quality
+        factor = max(image.size) // (2 * max_size)
+        if factor > 1:
+            image = image.reduce(factor)
+        image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+        output = io.BytesIO()
+        image.save(output, format=image_format.upper(), quality=quality)
+        return output.getvalue(), image.width, image.height
+
+
+class PreviewJob:
+    """
+    Watches the output directory for the first PNG of a job and previews it in a thread.
+
+    Args:
+        output_path (str): The ComfyUI output directory.
+        publish (callable): `publish(data, name, mime_type)` uploads or inlines the
+            encoded preview and returns a dict describing it.
+        ignore (iterable, optional): Files already in the output directory before the job.
+    """
+
+    def __init__(self, output_path, publish, ignore=()):
+        self.output_path = output_path
+        self.publish = publish
+        self.ignore = set(ignore)
+        self.preview = None
+        self.error = None
+        self._sizes = {}
+        self._thread = None
+
+    def find_png(self, final=False):
+        """The first PNG whose size is stable, any PNG if the job is done"""
+        candidates = []
+        for root, _, files in os.walk(self.output_path):
+            for name in files:
+                path = os.path.join(root, name)
+                if name.lower().endswith(".png") and not name.startswith((".", "_")) and path not in self.ignore:
+                    candidates.append(path)
+        for path in sorted(candidates):
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                continue
+            if final or (size > 0 and self._sizes.get(path) == size):
+                return path
+            self._sizes[path] = size
+        return None
+
+    def poll(self, final=False):
+        """
+        Start the preview once the first PNG is complete. Call this while the workflow runs.
+
+        Args:
+            final (bool, optional): The workflow is done, so every PNG is complete.
+        """
+        if self._thread is not None:
+            return
+        path = self.find_png(final)
+        if path is not None:
+            self._thread = threading.Thread(target=self._run, args=(path,), name="preview", daemon=True)
+            self._thread.start()
+
+    def _run(self, path):
+        start = time.perf_counter()
+        try:
+            data, width, height = make_preview(path)
+            name = f"{os.path.splitext(os.path.basename(path))[0]}_preview.{PREVIEW_FORMAT.replace('jpeg', 'jpg')}"
+            preview = self.publish(data, name, MIME_TYPES[PREVIEW_FORMAT])
+            self.preview = {
+                **preview,
+                "source": os.path.relpath(path, self.output_path),
+                "width": width,
+                "height": height,
+                "bytes": len(data),
+                "seconds": round(time.perf_counter() - start, 4),
+            }
+        except Exception as e:
+            self.error = str(e)
+
+    def result(self, timeout=None):
+        """
+        Wait for the preview.
+
+        Returns:
+            dict: The published preview, or None if there is none.
+        """
+        if self._thread is None:
+            return None
+        self._thread.join(timeout)
+        return self.preview
@@ -0,0 +1,359 @@
+"""
+Model discovery and page cache prewarming.
+
+The workflows name their models in loader node inputs (`ckpt_name`,
+`lora_name`, `unet_name`, `model`, ...). `required_models()` extracts that
+set statically from the workflow templates and `resolve_models()` finds the
+files the same way ComfyUI does: in `<comfyui>/models/<folder>` first and
+then in the folders of `extra_model_paths.yaml`, which point at the network
+volume.
+
+With MODEL_PREWARM=true the handler reads those files once in a background
+thread pool at boot, so that the first job loads them from the page cache
+instead of the network volume. The report lists the bytes warmed, the time
+taken and the models that could not be found:
+
+    python rp_prewarm.py --workflows /workflows --list
+    python rp_prewarm.py --workflows /workflows --mode read --workers 4
+"""
+import argparse
+import glob
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Read the models of the workflows at boot to warm the page cache
+MODEL_PREWARM = os.environ.get("MODEL_PREWARM", "false").lower() == "true"
+# "read" reads every file sequentially, "fadvise" only asks the kernel to read ahead
+MODEL_PREWARM_MODE = os.environ.get("MODEL_PREWARM_MODE", "read").lower()
+# Number of files read in parallel
+MODEL_PREWARM_WORKERS = int(os.environ.get("MODEL_PREWARM_WORKERS", 4))
+# Stop warming after this many bytes, defaults to the available memory
+MODEL_PREWARM_MAX_BYTES = int(os.environ.get("MODEL_PREWARM_MAX_BYTES", 0))
+# ComfyUI installation with the default models directory
+COMFYUI_PATH = os.environ.get("COMFYUI_PATH", "/comfyui")
+# Additional model folders, usually on the network volume
+EXTRA_MODEL_PATHS = os.environ.get("EXTRA_MODEL_PATHS", os.path.join(COMFYUI_PATH, "extra_model_paths.yaml"))
+
+# Loader inputs that name a model: (class_type, input) -> model folder
+MODEL_INPUTS = {
+    ("CheckpointLoaderSimple", "ckpt_name"): "checkpoints",
+    ("UnetLoaderGGUF", "unet_name"): "unet",
+    ("UNETLoader", "unet_name"): "unet",
+    ("VAELoader", "vae_name"): "vae",
+    ("LoraLoader", "lora_name"): "loras",
+    ("LoraLoaderModelOnly", "lora_name"): "loras",
+    ("CLIPLoader", "clip_name"): "clip",
+    ("DualCLIPLoader", "clip_name1"): "clip",
+    ("DualCLIPLoader", "clip_name2"): "clip",
+    ("ControlNetLoader", "control_net_name"): "controlnet",
+    ("DiffControlNetLoader", "control_net_name"): "controlnet",
+    ("UpscaleModelLoader", "model_name"): "upscale_models",
+    ("SAMModelLoader (segment anything)", "model_name"): "sams",
+    ("DownloadAndLoadDepthAnythingV2Model", "model"): "depthanything",
+    ("DownloadAndLoadFlorence2Model", "model"): "LLM",
+}
+
+# Folders that newer ComfyUI versions also look up under another name
+FOLDER_ALIASES = {
+    "unet": ("unet", "diffusion_models"),
+    "clip": ("clip", "text_encoders"),
+}
+
+# Size of the reads when warming a file
+READ_BLOCK_SIZE = 8 * 1024 * 1024
+
+
+def model_file_name(folder, name):
+    """
+    Map a loader input value to the path of the model inside its folder.
+
+    Florence-2 models are repositories ("microsoft/Florence-2-base") stored
+    as a directory named after the repository, the SAM loader offers names
+    like "sam_hq_vit_h (2.57GB)" for the file sam_hq_vit_h.pth.
+    """
+    if folder == "LLM":
+        return name.rsplit("/", 1)[-1]
+    if folder == "sams":
+        return re.sub(r"\s*\(.*\)$", "", name) + ".pth"
+    return name
+
+
+def workflow_models(workflow):
+    """
+    Extract the models referenced by the loader nodes of a workflow.
+
+    Args:
+        workflow (dict): The workflow in ComfyUI API format.
+
+    Returns:
+        set: (folder, name) pairs, name relative to the folder.
+    """
+    models = set()
+    for node in workflow.values():
+        for input_name, value in node.get("inputs", {}).items():
+            folder = MODEL_INPUTS.get((node.get("class_type"), input_name))
+            if folder is not None and isinstance(value, str) and value:
+                models.add((folder, model_file_name(folder, value)))
+    return models
+
+
+def required_models(workflows_dir):
+    """
+    Extract the models referenced by all workflow templates.
+
+    Args:
+        workflows_dir (str): The directory with the `<tiling>_<denoise>/workflow.json` templates.
+
+    Returns:
+        list: Sorted (folder, name) pairs, name relative to the folder.
+    """
+    models = set()
+    for path in glob.glob(os.path.join(workflows_dir, "*", "workflow.json")):
+        with open(path) as f:
+            models |= workflow_models(json.load(f))
+    return sorted(models)
+
+
+def model_search_paths(extra_model_paths=EXTRA_MODEL_PATHS, comfyui_path=COMFYUI_PATH):
+    """
+    Build the model folders the way ComfyUI searches them.
+
+    Args:
+        extra_model_paths (str): The path of `extra_model_paths.yaml`, ignored if it does not exist.
+        comfyui_path (str): The ComfyUI installation.
+
+    Returns:
+        dict: Folder name -> list of directories, the default directory first.
+    """
+    search_paths = {}
+
+    def add(folder, directory):
+        for alias in FOLDER_ALIASES.get(folder, (folder,)):
+            search_paths.setdefault(alias, [])
+            if directory not in search_paths[alias]:
+                search_paths[alias].append(directory)
+
+    for folder in set(MODEL_INPUTS.values()):
+        for alias in FOLDER_ALIASES.get(folder, (folder,)):
+            add(folder, os.path.join(comfyui_path, "models", alias))
+
+    if extra_model_paths and os.path.exists(extra_model_paths):
+        import yaml
+
+        with open(extra_model_paths) as f:
+            config = yaml.safe_load(f) or {}
+        for section in config.values():
+            if not isinstance(section, dict):
+                continue
+            base_path = os.path.expanduser(section.get("base_path", ""))
+            for folder, paths in section.items():
+                if folder in ("base_path", "is_default") or not isinstance(paths, str):
+                    continue
+                # Like ComfyUI, several directories can be given one per line
+                for path in paths.split("\n"):
+                    if path.strip():
+                        add(folder, os.path.join(base_path, path.strip()))
+    return search_paths
+
+
+def resolve_models(models, search_paths):
+    """
+    Find the files of the required models.
+
+    Args:
+        models (list): (folder, name) pairs from `required_models()`.
+        search_paths (dict): The folders from `model_search_paths()`.
+
+    Returns:
+        tuple: A dict of (folder, name) -> path of the first match and a list of the missing models.
+    """
+    resolved = {}
+    missing = []
+    for folder, name in models:
+        for directory in search_paths.get(folder, []):
+            path = os.path.join(directory, name)
+            if os.path.exists(path):
+                resolved[(folder, name)] = path
+                break
+        else:
+            missing.append((folder, name))
+    return resolved, missing
+
+
+def model_files(path):
+    """All files of a model, which may be a directory (Florence-2 repositories)"""
+    if os.path.isfile(path):
+        return [path]
+    files = []
+    for root, _, names in os.walk(path):
+        files.extend(os.path.join(root, name) for name in sorted(names))
+    return files
+
+
+def available_memory():
+    """MemAvailable from /proc/meminfo in bytes, or None"""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def warm_file(path, mode="read"):
+    """
+    Pull a file into the page cache.
+
+    "read" reads the file sequentially into a reused buffer, which works on
+    every file system; "fadvise" only issues POSIX_FADV_WILLNEED and returns
+    while the kernel reads ahead in the background.
+
+    Returns:
+        int: The size of the file in bytes.
+    """
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        size = os.fstat(fd).st_size
+        if mode == "fadvise":
+            os.posix_fadvise(fd, 0, size, os.POSIX_FADV_WILLNEED)
+            return size
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(fd, 0, size, os.POSIX_FADV_SEQUENTIAL)
+        buffer = bytearray(READ_BLOCK_SIZE)
+        with open(fd, "rb", buffering=0, closefd=False) as f:
+            while f.readinto(buffer):
+                pass
+        return size
+    finally:
+        os.close(fd)
+
+
+def prewarm(paths, mode=MODEL_PREWARM_MODE, workers=MODEL_PREWARM_WORKERS, max_bytes=MODEL_PREWARM_MAX_BYTES):
+    """
+    Warm the page cache with the given model files in a thread pool.
+
+    Args:
+        paths (list): The model files or directories, in order of priority.
+        mode (str, optional): "read" or "fadvise", see `warm_file()`.
+        workers (int, optional): The number of files read in parallel.
+        max_bytes (int, optional): Skip files beyond this many bytes, 0 for the available memory.
+
+    Returns:
+        dict: The files warmed and skipped, the bytes warmed, the time taken and errors.
+    """
+    if not max_bytes:
+        max_bytes = available_memory() or 0
+
+    files = []
+    planned_bytes = 0
+    skipped = []
+    for path in paths:
+        for file_path in model_files(path):
+            size = os.path.getsize(file_path)
+            if max_bytes and planned_bytes + size > max_bytes:
+                skipped.append(file_path)
+                continue
+            planned_bytes += size
+            files.append(file_path)
+
+    errors = {}
+    lock = threading.Lock()
+
+    def warm(file_path):
+        try:
+            return warm_file(file_path, mode)
+        except OSError as e:
+            with lock:
+                errors[file_path] = str(e)
+            return 0
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        warmed_bytes = sum(executor.map(warm, files))
+    seconds = time.perf_counter() - start
+
+    return {
+        "mode": mode,
+        "files": len(files) - len(errors),
+        "bytes": warmed_bytes,
+        "seconds": round(seconds, 3),
+        "mb_per_second": round(warmed_bytes / 1024 ** 2 / seconds, 1) if seconds > 0 else None,
+        "skipped_over_budget": skipped,
+        "errors": errors,
+    }
+
+
+def prewarm_workflow_models(workflows_dir, mode=MODEL_PREWARM_MODE, workers=MODEL_PREWARM_WORKERS,
+                            max_bytes=MODEL_PREWARM_MAX_BYTES, extra_model_paths=EXTRA_MODEL_PATHS,
+                            comfyui_path=COMFYUI_PATH):
+    """
+    Resolve the models of the workflows and warm the page cache with them.
+
+    Returns:
+        dict: The `prewarm()` report plus the resolved and missing models.
+    """
+    models = required_models(workflows_dir)
+    resolved, missing = resolve_models(models, model_search_paths(extra_model_paths, comfyui_path))
+    report = prewarm(list(resolved.values()), mode, workers, max_bytes)
+    report["models"] = {f"{folder}/{name}": path for (folder, name), path in resolved.items()}
+    report["missing"] = [f"{folder}/{name}" for folder, name in missing]
+    return report
+
+
+def start_background(workflows_dir, on_done=None, **kwargs):
+    """
+    Run `prewarm_workflow_models()` in a daemon thread.
+
+    Args:
+        workflows_dir (str): The directory with the workflow templates.
+        on_done (callable, optional): Called with the report, or with {"error": ...} if warming failed.
+
+    Returns:
+        threading.Thread: The started thread.
+    """
+    def run():
+        try:
+            report = prewarm_workflow_models(workflows_dir, **kwargs)
+        except Exception as e:
+            report = {"error": str(e)}
+        if on_done is not None:
+            on_done(report)
+
+    thread = threading.Thread(target=run, name="model-prewarm", daemon=True)
+    thread.start()
+    return thread
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="List the models of the workflows and warm the page cache with them")
+    parser.add_argument("--workflows", default="/workflows", help="Directory with the workflow templates")
+    parser.add_argument("--extra-model-paths", default=EXTRA_MODEL_PATHS, help="ComfyUI extra_model_paths.yaml")
+    parser.add_argument("--comfyui", default=COMFYUI_PATH, help="ComfyUI installation")
+    parser.add_argument("--list", action="store_true", help="Only list the required models and where they resolve to")
+    parser.add_argument("--mode", choices=("read", "fadvise"), default=MODEL_PREWARM_MODE)
+    parser.add_argument("--workers", type=int, default=MODEL_PREWARM_WORKERS)
+    parser.add_argument("--max-bytes", type=int, default=MODEL_PREWARM_MAX_BYTES)
+    args = parser.parse_args(argv)
+
+    if args.list:
+        models = required_models(args.workflows)
+        resolved, _ = resolve_models(models, model_search_paths(args.extra_model_paths, args.comfyui))
+        for folder, name in models:
+            print(f"{folder}/{name}: {resolved.get((folder, name), 'MISSING')}")
+        return 0
+
+    report = prewarm_workflow_models(
+        args.workflows, args.mode, args.workers, args.max_bytes, args.extra_model_paths, args.comfyui
+    )
+    print(json.dumps(report, indent=2))
+    return 1 if report["missing"] or report["errors"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,170 @@
+"""
+On-demand CPU profiling of the handler.
+
+Profiling is enabled for every job with CPU_PROFILING=true, or for a single
+job with `"profile": true` in its input. Two profilers are available:
+
+- "cprofile": deterministic profiling with cProfile, written as a .pstats file
+  (open it with `python -m pstats` or snakeviz).
+- "sampling": a thread that samples the handler thread's stack every
+  CPU_PROFILING_INTERVAL_MS and writes collapsed stacks (.collapsed) that can
+  be rendered with flamegraph.pl or speedscope.
+
+Nothing in this module runs unless profiling was requested.
+"""
+import cProfile
+import os
+import pstats
+import sys
+import threading
+
+# Profile every job
+CPU_PROFILING = os.environ.get("CPU_PROFILING", "false").lower() == "true"
+# Profilers to run: "cprofile", "sampling" or "both"
+CPU_PROFILER = os.environ.get("CPU_PROFILER", "both").lower()
+# Interval between stack samples in milliseconds
+CPU_PROFILING_INTERVAL_MS = float(os.environ.get("CPU_PROFILING_INTERVAL_MS", 5))
+# Directory the profile files are written to
+CPU_PROFILING_DIR = os.environ.get("CPU_PROFILING_DIR", "/tmp/cpu_profiles")
+# Upload the profile files to the job's output URL
+CPU_PROFILING_UPLOAD = os.environ.get("CPU_PROFILING_UPLOAD", "false").lower() == "true"
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """
+    Samples the stack of a single thread from a background thread.
+
+    The samples are aggregated as collapsed stacks, i.e. a count per unique
+    "root;...;leaf" stack.
+    """
+
+    def __init__(self, interval_ms=None, thread_id=None):
+        self.interval = (CPU_PROFILING_INTERVAL_MS if interval_ms is None else interval_ms) / 1000
+        self.thread_id = thread_id
+        self.stacks = {}
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        Start sampling. Samples the calling thread unless a thread id was given.
+        """
+        if self.thread_id is None:
+            self.thread_id = threading.get_ident()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop sampling and wait for the sampler thread.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            stack = ";".join(reversed(labels))
+            self.stacks[stack] = self.stacks.get(stack, 0) + 1
+            self.samples += 1
+
+    def write_collapsed(self, path):
+        """
+        Write the samples in the collapsed stack format.
+
+        Args:
+            path (str): The file to write.
+        """
+        with open(path, "w") as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write(f"{stack} {count}\n")
+
+
+def top_functions(profile, limit=10):
+    """
+    Get the functions with the most self time from a cProfile profile.
+
+    Args:
+        profile (cProfile.Profile): A disabled profile.
+        limit (int, optional): Number of functions to return.
+
+    Returns:
+        list: Dicts with the function, call count, self and cumulative seconds.
+    """
+    stats = pstats.Stats(profile).stats
+    entries = sorted(stats.items(), key=lambda item: item[1][2], reverse=True)[:limit]
+    return [
+        {
+            "function": f"{name} ({os.path.basename(filename)}:{lineno})",
+            "calls": calls,
+            "self_seconds": round(self_time, 6),
+            "cumulative_seconds": round(cumulative_time, 6),
+        }
+        for (filename, lineno, name), (_, calls, self_time, cumulative_time, _) in entries
+    ]
+
+
+class JobProfiler:
+    """
+    Runs the configured CPU profilers around a single job.
+    """
+
+    def __init__(self, job_id, profiler=None, interval_ms=None, output_dir=None):
+        self.job_id = job_id
+        self.profiler = CPU_PROFILER if profiler is None else profiler
+        self.output_dir = CPU_PROFILING_DIR if output_dir is None else output_dir
+        self._cprofile = None
+        self._sampler = None
+        if self.profiler in ("cprofile", "both"):
+            self._cprofile = cProfile.Profile()
+        if self.profiler in ("sampling", "both"):
+            self._sampler = StackSampler(interval_ms)
+
+    def start(self):
+        """
+        Start profiling the calling thread.
+        """
+        if self._sampler is not None:
+            self._sampler.start()
+        if self._cprofile is not None:
+            self._cprofile.enable()
+
+    def stop(self):
+        """
+        Stop profiling and write the profile files.
+
+        Returns:
+            dict: The written `files`, the number of stack `samples` and the
+                  `top_functions` by self time (cProfile only).
+        """
+        if self._cprofile is not None:
+            self._cprofile.disable()
+        if self._sampler is not None:
+            self._sampler.stop()
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        report = {"files": []}
+        if self._cprofile is not None:
+            path = os.path.join(self.output_dir, f"cpu_profile_{self.job_id}.pstats")
+            self._cprofile.dump_stats(path)
+            report["files"].append(path)
+            report["top_functions"] = top_functions(self._cprofile)
+        if self._sampler is not None:
+            path = os.path.join(self.output_dir, f"cpu_profile_{self.job_id}.collapsed")
+            self._sampler.write_collapsed(path)
+            report["files"].append(path)
+            report["samples"] = self._sampler.samples
+        return report
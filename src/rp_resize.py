@@ -0,0 +1,163 @@
+"""
+CPU pre-resize of oversized input images.
+
+Inputs are often photos of 6000 pixels or more, which ComfyUI decodes and
+resamples at full size. If every node that reads the input image of a
+workflow is a DF_Image_scale_to_side node (longest side), the workflow never
+uses more than the largest of their sizes, and the handler downscales the
+input to that size before ComfyUI reads it. The workflows of this repository
+also pass the original image to the stitchers and PSD savers, so they read it
+at full resolution and are only resized if INPUT_MAX_SIDE caps the size,
+which lowers the resolution of the outputs as well.
+
+The EXIF orientation is applied, the resized image has no orientation tag.
+JPEG inputs are decoded at reduced size with `Image.draft()`, the others are
+shrunk with `Image.reduce()` before the final LANCZOS resample, as in
+rp_preview. Pillow releases the GIL while decoding and resampling; the resizes
+run in a pool of INPUT_RESIZE_THREADS threads, so that concurrent jobs do not
+take every core of the worker. Pillow is imported on first use.
+"""
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Downscale inputs larger than the workflow reads
+INPUT_RESIZE = os.environ.get("INPUT_RESIZE", "true").lower() == "true"
+# Longest side of the inputs in pixels regardless of the workflow (lowers the output resolution), 0 for no cap
+INPUT_MAX_SIDE = int(os.environ.get("INPUT_MAX_SIDE", 0))
+# Number of inputs resized at once
+INPUT_RESIZE_THREADS = int(os.environ.get("INPUT_RESIZE_THREADS", 2))
+# Encoder quality of resized JPEG inputs
+INPUT_RESIZE_QUALITY = int(os.environ.get("INPUT_RESIZE_QUALITY", 95))
+
+# Nodes that read an image only at a given longest side
+SCALE_NODES = ("DF_Image_scale_to_side",)
+# Formats resized inputs are written in, by the format of the input (MPO is a JPEG with extra frames)
+SAVE_FORMATS = {"JPEG": "JPEG", "MPO": "JPEG", "PNG": "PNG", "WEBP": "WEBP"}
+EXIF_ORIENTATION = 0x0112
+
+# The resize threads of this process, see resize()
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def scaled(size, max_side):
+    """Scale (width, height) so that the longest side is `max_side`"""
+    scale = max_side / max(size)
+    return max(1, round(size[0] * scale)), max(1, round(size[1] * scale))
+
+
+def workflow_max_side(workflow, image_name="input.jpg"):
+    """
+    The largest longest side at which a workflow reads its input image.
+
+    Args:
+        workflow (dict): The workflow in API format.
+        image_name (str, optional): The `image` input of the loader node.
+
+    Returns:
+        int: The longest side in pixels, or None if a node reads the image at full resolution.
+    """
+    loaders = {node_id for node_id, node in workflow.items() if node.get("inputs", {}).get("image") == image_name}
+    if not loaders:
+        return None
+    sides = []
+    for node in workflow.values():
+        for value in node.get("inputs", {}).values():
+            if not (isinstance(value, list) and len(value) == 2 and value[0] in loaders):
+                continue
+            inputs = node["inputs"]
+            if node.get("class_type") not in SCALE_NODES or inputs.get("side") != "Longest" or inputs.get("crop") != "disabled":
+                return None
+            sides.append(int(inputs["side_length"]))
+    return max(sides) if sides else None
+
+
+def target_side(workflow, image_name="input.jpg", max_side=INPUT_MAX_SIDE):
+    """
+    The longest side to resize the input of a workflow to, from the workflow and INPUT_MAX_SIDE.
+
+    Returns:
+        int: The longest side in pixels, or None to keep the input as it is.
+    """
+    sides = [side for side in (workflow_max_side(workflow, image_name), max_side) if side]
+    return min(sides) if sides else None
+
+
+def resize_image(path, max_side, quality=INPUT_RESIZE_QUALITY):
+    """
+    Downscale an image in place so that its longest side is at most `max_side`.
+
+    The file is only rewritten if the image is larger, in its own format
+    (JPEG, PNG or WebP, other formats become PNG), and only if the resized
+    file is smaller. A link (a spilled staging input) keeps pointing at the
+    resized file.
+
+    Args:
+        path (str): The image.
+        max_side (int): The longest side in pixels.
+        quality (int, optional): The JPEG encoder quality.
+
+    Returns:
+        dict: The `original_size` and `size` (width, height), `original_bytes`, `bytes`,
+              `bytes_saved` and the `seconds` it took, or None if the image was kept.
+    """
+    from PIL import Image, ImageOps
+
+    start = time.perf_counter()
+    path = os.path.realpath(path)
+    original_bytes = os.path.getsize(path)
+    with Image.open(path) as image:
+        image_format = image.format
+        original_size = image.size
+        if max(original_size) <= max_side:
+            return None
+        # Rotated by the EXIF orientation, the longest side stays the longest side
+        if image.getexif().get(EXIF_ORIENTATION, 1) in (5, 6, 7, 8):
+            original_size = original_size[::-1]
+        # Only JPEG decoders support this, others ignore it
+        image.draft("RGB", scaled(image.size, max_side))
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ("1", "P"):
+            # Palette images would be resampled with NEAREST
+            image = image.convert("RGBA")
+        # A box filter down to at least three times the size, the final resample keeps the quality
+        resized = image.resize(scaled(image.size, max_side), Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+    temporary = os.path.join(os.path.dirname(path), f".resize-{uuid.uuid4().hex}")
+    try:
+        save_format = SAVE_FORMATS.get(image_format, "PNG")
+        if save_format == "JPEG":
+            resized.convert("RGB").save(temporary, format="JPEG", quality=quality)
+        elif save_format == "WEBP":
+            resized.save(temporary, format="WEBP", quality=quality)
+        else:
+            resized.save(temporary, format="PNG", compress_level=1)
+        size_bytes = os.path.getsize(temporary)
+        # E.g. a palette GIF written as an RGBA PNG, the original is the better input
+        if size_bytes >= original_bytes:
+            return None
+        os.replace(temporary, path)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+    return {
+        "original_size": list(original_size),
+        "size": list(resized.size),
+        "original_bytes": original_bytes,
+        "bytes": size_bytes,
+        "bytes_saved": original_bytes - size_bytes,
+        "seconds": round(time.perf_counter() - start, 4),
+    }
+
+
+def resize(path, max_side, quality=INPUT_RESIZE_QUALITY):
+    """Like `resize_image`, in one of the INPUT_RESIZE_THREADS resize threads"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max(1, INPUT_RESIZE_THREADS), thread_name_prefix="input-resize")
+    return _executor.submit(resize_image, path, max_side, quality).result()
@@ -0,0 +1,263 @@
+"""
+Cost-aware scheduling of the jobs of a worker.
+
+With JOB_CONCURRENCY above 1, a worker accepts several jobs at once. Their
+inputs are downloaded in parallel, but ComfyUI executes one prompt at a time
+and its output directory is shared, so the part of a job from submitting the
+workflow to uploading the outputs runs in a slot of the scheduler. Waiting
+jobs get the slot in order of their estimated cost instead of their arrival,
+so a quick tiling 2 job does not wait behind a tiling 5 job that takes many
+times longer.
+
+The cost of a job is the expected execution time of its variant
+(`<tiling>_<denoise>`) scaled by the resolution of its input. It is learned
+from the finished jobs of the worker (and the job trace, if JOB_TRACE_FILE is
+set) and falls back to a fixed time per tile until a variant has been seen.
+Jobs can move ahead with an optional `priority`; every second a job waits
+counts as SCHEDULER_AGING seconds less cost, so expensive jobs still run
+eventually.
+"""
+import heapq
+import io
+import itertools
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    from . import rp_job_trace
+except ImportError:
+    # Running as a script (e.g. /rp_handler.py in the container)
+    import rp_job_trace
+
+# Estimated execution time per tile of a variant that has not been seen yet, in seconds
+SCHEDULER_TILE_SECONDS = float(os.environ.get("SCHEDULER_TILE_SECONDS", 6))
+# Estimated seconds a job moves ahead per level of its `priority`
+SCHEDULER_PRIORITY_SECONDS = float(os.environ.get("SCHEDULER_PRIORITY_SECONDS", 60))
+# Estimated seconds a job moves ahead per second it waits
+SCHEDULER_AGING = float(os.environ.get("SCHEDULER_AGING", 1))
+
+# Weight of the latest job in the moving average of a variant
+HISTORY_WEIGHT = 0.3
+# Range of the `priority` job input
+MIN_PRIORITY = -10
+MAX_PRIORITY = 10
+
+
+def image_size(path):
+    """
+    Read the dimensions of a PNG, JPEG, GIF or WebP image from its header.
+
+    Args:
+        path (str): The image file.
+
+    Returns:
+        tuple: (width, height), or None if the format is not recognised.
+    """
+    try:
+        with open(path, "rb") as f:
+            return _read_image_size(f)
+    except struct.error:
+        # Truncated header
+        return None
+
+
+def header_image_size(header):
+    """
+    Like `image_size`, from the first bytes of an image that is not saved to a file.
+
+    Args:
+        header (bytes): The start of the image, JPEG headers may need tens of kilobytes.
+
+    Returns:
+        tuple: (width, height), or None if the format is not recognised or the header is cut off.
+    """
+    try:
+        return _read_image_size(io.BytesIO(header))
+    except struct.error:
+        return None
+
+
+def _read_image_size(f):
+    header = f.read(32)
+    if header.startswith(b"\x89PNG\r\n\x1a\n"):
+        return struct.unpack(">II", header[16:24])
+    if header[:6] in (b"GIF87a", b"GIF89a"):
+        return struct.unpack("<HH", header[6:10])
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        chunk = header[12:16]
+        if chunk == b"VP8 ":
+            width, height = struct.unpack("<HH", header[26:30])
+            return width & 0x3FFF, height & 0x3FFF
+        if chunk == b"VP8L":
+            bits = int.from_bytes(header[21:25], "little")
+            return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        if chunk == b"VP8X":
+            return int.from_bytes(header[24:27], "little") + 1, int.from_bytes(header[27:30], "little") + 1
+        return None
+    if header[:2] != b"\xff\xd8":
+        return None
+    # Walk the JPEG segments up to the start of frame
+    f.seek(2)
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+        if marker[1] in (0xD8, 0x01) or 0xD0 <= marker[1] <= 0xD7:
+            continue
+        length = struct.unpack(">H", f.read(2))[0]
+        if 0xC0 <= marker[1] <= 0xCF and marker[1] not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack(">xHH", f.read(5))
+            return width, height
+        f.seek(length - 2, os.SEEK_CUR)
+
+
+class CostModel:
+    """
+    Estimates the execution time of a job from the history of its variant.
+
+    Args:
+        tile_seconds (float, optional): Time per tile of a variant without history.
+    """
+
+    def __init__(self, tile_seconds=SCHEDULER_TILE_SECONDS):
+        self.tile_seconds = tile_seconds
+        # variant -> {"seconds": moving average, "megapixels": moving average or None, "jobs": count}
+        self.history = {}
+        self._lock = threading.Lock()
+
+    def record(self, variant, seconds, megapixels=None):
+        """
+        Add the execution time of a finished job.
+
+        Args:
+            variant (str): `<tiling>_<denoise>`.
+            seconds (float): The execution time of the job.
+            megapixels (float, optional): The resolution of the input of the job.
+        """
+        with self._lock:
+            entry = self.history.get(variant)
+            if entry is None:
+                self.history[variant] = {"seconds": seconds, "megapixels": megapixels, "jobs": 1}
+                return
+            entry["seconds"] += HISTORY_WEIGHT * (seconds - entry["seconds"])
+            if megapixels is not None:
+                if entry["megapixels"] is None:
+                    entry["megapixels"] = megapixels
+                else:
+                    entry["megapixels"] += HISTORY_WEIGHT * (megapixels - entry["megapixels"])
+            entry["jobs"] += 1
+
+    def estimate(self, tiling, denoise, megapixels=None):
+        """
+        Estimate the execution time of a job.
+
+        Args:
+            tiling (int): The tiling grid of the job.
+            denoise (str): The denoise strength of the job.
+            megapixels (float, optional): The resolution of the input of the job.
+
+        Returns:
+            float: The estimated execution time in seconds.
+        """
+        with self._lock:
+            entry = self.history.get(f"{tiling}_{denoise}")
+            if entry is None:
+                return tiling * tiling * self.tile_seconds
+            seconds = entry["seconds"]
+            if megapixels and entry["megapixels"]:
+                seconds *= megapixels / entry["megapixels"]
+            return seconds
+
+    def load_trace(self, path):
+        """
+        Learn from the successful jobs of a job trace, see rp_job_trace.
+
+        Args:
+            path (str): The JSONL trace file.
+
+        Returns:
+            int: The number of jobs learned from.
+        """
+        count = 0
+        for record in rp_job_trace.read_trace(path):
+            params = record.get("params", {})
+            seconds = record.get("timings", {}).get("execution")
+            if record.get("status") == "success" and seconds and "tiling" in params and "denoise" in params:
+                self.record(f"{params['tiling']}_{params['denoise']}", seconds)
+                count += 1
+        return count
+
+
+class Ticket:
+    """A job waiting for or holding a slot of the scheduler"""
+
+    def __init__(self, job_id, cost, priority, enqueued_at):
+        self.job_id = job_id
+        self.cost = cost
+        self.priority = priority
+        self.enqueued_at = enqueued_at
+        self.waited = None
+
+
+class PriorityScheduler:
+    """
+    Hands out a limited number of slots to the cheapest waiting jobs first.
+
+    A job is ranked by `cost - priority * priority_seconds - aging * waited`.
+    All waiting jobs age at the same rate, so the ranking never changes while
+    they wait and is kept as a heap keyed by `cost - priority * priority_seconds
+    + aging * enqueued_at`.
+
+    Args:
+        slots (int, optional): The number of jobs that hold a slot at the same time.
+        priority_seconds (float, optional): The cost a job moves ahead per priority level.
+        aging (float, optional): The cost a job moves ahead per second it waits.
+    """
+
+    def __init__(self, slots=1, priority_seconds=SCHEDULER_PRIORITY_SECONDS, aging=SCHEDULER_AGING):
+        self.slots = slots
+        self.priority_seconds = priority_seconds
+        self.aging = aging
+        self._condition = threading.Condition()
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._running = 0
+
+    def waiting(self):
+        with self._condition:
+            return len(self._waiting)
+
+    @contextmanager
+    def slot(self, job_id, cost, priority=0):
+        """
+        Wait for a slot and hold it for the duration of the `with` block.
+
+        Args:
+            job_id (str): The id of the job, for logging.
+            cost (float): The estimated cost of the job in seconds.
+            priority (int, optional): Higher runs earlier.
+
+        Yields:
+            Ticket: The ticket of the job, with `waited` set to the seconds it waited.
+        """
+        ticket = Ticket(job_id, cost, priority, time.monotonic())
+        key = cost - priority * self.priority_seconds + self.aging * ticket.enqueued_at
+        entry = (key, next(self._sequence), ticket)
+        with self._condition:
+            heapq.heappush(self._waiting, entry)
+            while self._running >= self.slots or self._waiting[0] is not entry:
+                self._condition.wait()
+            heapq.heappop(self._waiting)
+            self._running += 1
+            ticket.waited = time.monotonic() - ticket.enqueued_at
+            # The next job may fit in another free slot
+            self._condition.notify_all()
+        try:
+            yield ticket
+        finally:
+            with self._condition:
+                self._running -= 1
+                self._condition.notify_all()
@@ -0,0 +1,270 @@
+"""
+RAM-backed staging of the ComfyUI input, output and temp directories.
+
+Every job writes its input image, ComfyUI's temp previews and the outputs to
+the container disk, and the outputs are read back for the upload right
+after. With STAGING_TMPFS, ComfyUI is started with its input, output and temp
+directories pointing at links in STAGING_LINK_DIR (see start.sh). Each link
+points either at a directory in STAGING_DIR on a tmpfs (`/dev/shm`) or at
+the regular directory under STAGING_DISK_DIR, so the files of a job live in
+memory while there is room for them and spill to disk when there is not:
+
+- An input image is written to the tmpfs if more than
+  STAGING_OUTPUT_RESERVE_BYTES would stay free, otherwise to the disk with a
+  link to it in the input directory.
+- Before a job runs on ComfyUI, the output and temp links are pointed at the
+  tmpfs if STAGING_OUTPUT_RESERVE_BYTES (the largest expected output, a
+  layered PSD) are free there, and at the disk otherwise. They only move
+  while the output directory is empty, so no output is left behind.
+
+The capacity of the tmpfs is the size of its file system, capped at
+STAGING_MAX_BYTES. It is checked when the links are prepared at startup; if
+it cannot hold the largest expected output, the links point at the disk for
+good.
+"""
+import logging
+import os
+import shutil
+import threading
+import uuid
+
+# Stage the files of the jobs on a tmpfs
+STAGING_TMPFS = os.environ.get("STAGING_TMPFS", "false").lower() == "true"
+# Directory on the tmpfs
+STAGING_DIR = os.environ.get("STAGING_DIR", "/dev/shm/comfyui")
+# Directory of the input, output and temp links that ComfyUI is started with
+STAGING_LINK_DIR = os.environ.get("STAGING_LINK_DIR", "/comfyui/staging")
+# Directory of the regular input, output and temp directories, used to spill to disk
+STAGING_DISK_DIR = os.environ.get("STAGING_DISK_DIR", "/comfyui")
+# Most bytes staged on the tmpfs, 0 for the size of the tmpfs
+STAGING_MAX_BYTES = int(os.environ.get("STAGING_MAX_BYTES", 0))
+# Space to keep free on the tmpfs for the outputs of a job, the size of the largest expected PSD
+STAGING_OUTPUT_RESERVE_BYTES = int(os.environ.get("STAGING_OUTPUT_RESERVE_BYTES", 2 * 1024 ** 3))
+
+DIRECTORIES = ("input", "output", "temp")
+TMPFS = "tmpfs"
+DISK = "disk"
+
+logger = logging.getLogger(__name__)
+
+# The staging of this process, see get_staging()
+_staging = None
+_staging_lock = threading.Lock()
+
+
+def directory_size(path):
+    """The total size of the files below a directory, not following links"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                # Removed while walking
+                pass
+    return total
+
+
+def has_files(path):
+    """Whether a directory contains any file"""
+    return any(files for _, _, files in os.walk(path))
+
+
+def remove(path):
+    """Remove a file, and the file on disk it links to if it was spilled"""
+    if os.path.islink(path):
+        target = os.path.realpath(path)
+        os.remove(path)
+        if os.path.exists(target):
+            os.remove(target)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+class Staging:
+    """
+    Points the ComfyUI directories at the tmpfs or the disk.
+
+    Args:
+        tmpfs_dir (str): Directory on the tmpfs.
+        link_dir (str): Directory of the links ComfyUI uses.
+        disk_dir (str): Directory of the directories on disk.
+        max_bytes (int, optional): Most bytes staged on the tmpfs, 0 for the size of the tmpfs.
+        reserve_bytes (int, optional): Space to keep free for the outputs of a job.
+    """
+
+    def __init__(self, tmpfs_dir, link_dir, disk_dir, max_bytes=0, reserve_bytes=STAGING_OUTPUT_RESERVE_BYTES):
+        self.tmpfs_dir = tmpfs_dir
+        self.link_dir = link_dir
+        self.disk_dir = disk_dir
+        self.max_bytes = max_bytes
+        self.reserve_bytes = reserve_bytes
+        self.lock = threading.Lock()
+        self.enabled = False
+
+    def path(self, name, location):
+        return os.path.join(self.tmpfs_dir if location == TMPFS else self.disk_dir, name)
+
+    def link(self, name):
+        """The path of a ComfyUI directory, as passed to ComfyUI"""
+        return os.path.join(self.link_dir, name)
+
+    def location(self, name):
+        """Where a ComfyUI directory currently is, TMPFS or DISK"""
+        target = os.path.realpath(self.link(name))
+        return TMPFS if target == os.path.realpath(self.path(name, TMPFS)) else DISK
+
+    def capacity(self):
+        """The bytes the tmpfs can stage"""
+        stat = os.statvfs(self.tmpfs_dir)
+        size = stat.f_blocks * stat.f_frsize
+        return min(size, self.max_bytes) if self.max_bytes else size
+
+    def free(self):
+        """The bytes that can still be staged on the tmpfs"""
+        stat = os.statvfs(self.tmpfs_dir)
+        free = stat.f_bavail * stat.f_frsize
+        if self.max_bytes:
+            free = min(free, self.max_bytes - directory_size(self.tmpfs_dir))
+        return max(free, 0)
+
+    def check(self):
+        """
+        Check whether the tmpfs can hold the largest expected output.
+
+        Returns:
+            int: The capacity of the tmpfs in bytes, None if it is not usable.
+        """
+        try:
+            capacity = self.capacity()
+        except OSError as e:
+            logger.warning("Staging directory %s is not usable: %s", self.tmpfs_dir, e)
+            self.enabled = False
+            return None
+        self.enabled = capacity >= self.reserve_bytes
+        if not self.enabled:
+            logger.warning(
+                "Staging on %s disabled: its capacity of %d bytes is below the %d bytes of the largest expected output",
+                self.tmpfs_dir, capacity, self.reserve_bytes,
+            )
+        return capacity
+
+    def prepare(self):
+        """
+        Create the directories and links and check the capacity of the tmpfs, at startup.
+
+        Returns:
+            dict: The `location` of the directories, the `capacity_bytes` and the `reserve_bytes`.
+        """
+        for name in DIRECTORIES:
+            os.makedirs(self.path(name, DISK), exist_ok=True)
+            try:
+                os.makedirs(self.path(name, TMPFS), exist_ok=True)
+            except OSError:
+                # Reported by check()
+                pass
+        os.makedirs(self.link_dir, exist_ok=True)
+        capacity = self.check()
+
+        location = TMPFS if self.enabled else DISK
+        for name in DIRECTORIES:
+            self.point(name, location)
+        return {"location": location, "capacity_bytes": capacity, "reserve_bytes": self.reserve_bytes}
+
+    def point(self, name, location):
+        """Point the link of a ComfyUI directory at the tmpfs or the disk, atomically"""
+        link = self.link(name)
+        if os.path.isdir(link) and not os.path.islink(link):
+            raise OSError(f"{link} is a directory, not a link")
+        temporary = f"{link}.{uuid.uuid4().hex}"
+        os.symlink(self.path(name, location), temporary)
+        os.replace(temporary, link)
+
+    def place_input(self, path):
+        """
+        Choose where to write an input image that ComfyUI reads from `path` in the input directory.
+
+        The image stays on the tmpfs if the largest expected output still fits
+        next to it. Otherwise it is written to the disk and linked from `path`.
+        A file or link of the same name (e.g. the input of the previous job) is removed.
+
+        Args:
+            path (str): The path of the image in the input link directory.
+
+        Returns:
+            str: The path to write the image to.
+        """
+        remove(path)
+        if self.enabled and self.location("input") == TMPFS and self.free() > self.reserve_bytes:
+            return path
+        spill_path = os.path.join(self.path("input", DISK), os.path.basename(path))
+        if os.path.realpath(os.path.dirname(path)) != os.path.realpath(self.path("input", DISK)):
+            os.symlink(spill_path, path)
+        return spill_path
+
+    def select(self):
+        """
+        Point the output and temp directories of the next job at the tmpfs or the disk.
+
+        Called with the ComfyUI slot of a job held. The previews in the temp
+        directory of the previous job are removed first, the worker does not
+        serve them.
+
+        Returns:
+            str: Where the outputs of the job go, TMPFS or DISK.
+        """
+        with self.lock:
+            temp = self.link("temp")
+            if os.path.isdir(temp):
+                for entry in os.scandir(temp):
+                    if entry.is_dir(follow_symlinks=False):
+                        shutil.rmtree(entry.path, ignore_errors=True)
+                    else:
+                        os.remove(entry.path)
+
+            location = TMPFS if self.enabled and self.free() >= self.reserve_bytes else DISK
+            current = self.location("output")
+            if location != current:
+                # Outputs left behind would be uploaded with a later job, keep them where they are
+                if has_files(self.link("output")):
+                    return current
+                logger.info("Staging the outputs on %s", location)
+                self.point("output", location)
+                self.point("temp", location)
+            return location
+
+
+def get_staging():
+    """
+    The staging of this process, created from the environment on first use.
+
+    The links were prepared by start.sh before ComfyUI started, only the
+    capacity of the tmpfs is checked again.
+
+    Returns:
+        Staging: The staging, or None if STAGING_TMPFS is not set.
+    """
+    global _staging
+    if not STAGING_TMPFS:
+        return None
+    with _staging_lock:
+        if _staging is None:
+            _staging = Staging(STAGING_DIR, STAGING_LINK_DIR, STAGING_DISK_DIR, STAGING_MAX_BYTES, STAGING_OUTPUT_RESERVE_BYTES)
+            _staging.check()
+        return _staging
+
+
+def main():
+    """Prepare the links before ComfyUI starts, see start.sh"""
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    staging = Staging(STAGING_DIR, STAGING_LINK_DIR, STAGING_DISK_DIR, STAGING_MAX_BYTES, STAGING_OUTPUT_RESERVE_BYTES)
+    report = staging.prepare()
+    logger.info(
+        "Staging the ComfyUI directories on %s (capacity %s bytes, %d bytes reserved for outputs)",
+        report["location"], report["capacity_bytes"], report["reserve_bytes"],
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
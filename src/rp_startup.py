@@ -0,0 +1,155 @@
+"""
+Startup timeline of the worker.
+
+Records when the ComfyUI process was spawned (COMFY_SPAWNED_AT, exported by
+start.sh), when the handler process started and finished its imports, when
+ComfyUI answered HTTP and `/object_info` and when the first job was accepted.
+All events are wall clock timestamps so that they can be compared across the
+two processes; `durations()` turns them into the intervals worth logging:
+
+    {"interpreter_startup_seconds": 0.05, "import_seconds": 0.31,
+     "comfyui_http_ready_seconds": 14.2, "comfyui_object_info_ready_seconds": 14.9,
+     "first_job_seconds": 15.3, ...}
+"""
+import os
+import threading
+import time
+import urllib.request
+
+# Time ComfyUI was spawned in seconds since the epoch, set by start.sh
+COMFY_SPAWNED_AT = os.environ.get("COMFY_SPAWNED_AT")
+
+# Intervals reported by durations(): name -> (from event, to event)
+DURATIONS = {
+    "interpreter_startup_seconds": ("handler_process_started", "handler_import_started"),
+    "import_seconds": ("handler_import_started", "handler_imported"),
+    "runpod_import_seconds": ("handler_imported", "runpod_imported"),
+    "comfyui_http_ready_seconds": ("comfyui_spawned", "comfyui_http_ready"),
+    "comfyui_object_info_ready_seconds": ("comfyui_spawned", "comfyui_object_info_ready"),
+    "first_job_seconds": ("comfyui_spawned", "first_job_accepted"),
+    "handler_first_job_seconds": ("handler_process_started", "first_job_accepted"),
+    "models_prewarm_seconds": ("models_prewarm_started", "models_prewarmed"),
+}
+
+
+def process_start_time(pid="self"):
+    """
+    Read the start time of a process from /proc.
+
+    Args:
+        pid (int or str, optional): The process id. Defaults to the current process.
+
+    Returns:
+        float: The start time in seconds since the epoch, or None if /proc is not available.
+    """
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # The command may contain spaces, the fields after it do not
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+    except (OSError, IndexError, ValueError):
+        return None
+    # starttime (the 22nd field of stat, the 20th after the command) is in
+    # clock ticks since boot; btime in /proc/stat only has second resolution
+    started_after_boot = int(fields[19]) / os.sysconf("SC_CLK_TCK")
+    return time.time() - (uptime - started_after_boot)
+
+
+class StartupTimeline:
+    """
+    Collects the startup events of the worker, each at most once.
+    """
+
+    def __init__(self):
+        self.events = {}
+        self._lock = threading.Lock()
+
+    def mark(self, event, at=None):
+        """
+        Record an event unless it was recorded before.
+
+        Args:
+            event (str): The name of the event.
+            at (float, optional): The time of the event in seconds since the epoch. Defaults to now.
+
+        Returns:
+            bool: True if the event was recorded, False if it was already known.
+        """
+        with self._lock:
+            if event in self.events:
+                return False
+            self.events[event] = time.time() if at is None else at
+            return True
+
+    def durations(self):
+        """
+        Compute the intervals between the recorded events.
+
+        Returns:
+            dict: The known intervals of DURATIONS in seconds.
+        """
+        with self._lock:
+            events = dict(self.events)
+        durations = {}
+        for name, (start, end) in DURATIONS.items():
+            if start in events and end in events:
+                durations[name] = round(events[end] - events[start], 4)
+        return durations
+
+    def watch_comfyui(self, host, on_ready=None, interval=0.05, timeout=600):
+        """
+        Poll ComfyUI in a background thread and record when it becomes ready.
+
+        Marks "comfyui_http_ready" once `http://<host>/` answers and
+        "comfyui_object_info_ready" once `/object_info` does, then calls
+        `on_ready`.
+
+        Args:
+            host (str): The host and port of ComfyUI.
+            on_ready (callable, optional): Called without arguments once `/object_info` is ready.
+            interval (float, optional): Time between attempts in seconds.
+            timeout (float, optional): Give up after this many seconds.
+
+        Returns:
+            threading.Thread: The started watcher thread.
+        """
+        def wait_for(url, deadline):
+            while time.monotonic() < deadline:
+                try:
+                    with urllib.request.urlopen(url, timeout=5) as response:
+                        if response.status == 200:
+                            response.read()
+                            return True
+                except OSError:
+                    pass
+                time.sleep(interval)
+            return False
+
+        def watch():
+            deadline = time.monotonic() + timeout
+            if not wait_for(f"http://{host}/", deadline):
+                return
+            self.mark("comfyui_http_ready")
+            if not wait_for(f"http://{host}/object_info", deadline):
+                return
+            self.mark("comfyui_object_info_ready")
+            if on_ready is not None:
+                on_ready()
+
+        thread = threading.Thread(target=watch, name="comfyui-startup-watch", daemon=True)
+        thread.start()
+        return thread
+
+
+# The timeline of this process
+timeline = StartupTimeline()
+
+_process_started = process_start_time()
+if _process_started is not None:
+    timeline.mark("handler_process_started", _process_started)
+if COMFY_SPAWNED_AT:
+    try:
+        timeline.mark("comfyui_spawned", float(COMFY_SPAWNED_AT))
+    except ValueError:
+        pass
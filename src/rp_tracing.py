@@ -0,0 +1,169 @@
+"""
+Optional OpenTelemetry tracing for the handler.
+
+Tracing is enabled when an OTLP endpoint (OTEL_EXPORTER_OTLP_ENDPOINT or
+OTEL_EXPORTER_OTLP_TRACES_ENDPOINT) or a local JSONL file (OTEL_TRACES_FILE)
+is configured. The OpenTelemetry SDK is only imported in that case; without
+it, or when tracing is not configured, `span()` returns a shared no-op
+context manager.
+
+The parent context of a job is taken from the optional W3C `traceparent`
+(and `tracestate`) fields of the job input.
+"""
+import contextlib
+import os
+import threading
+
+# OTLP/HTTP endpoint to export spans to
+OTEL_EXPORTER_OTLP_ENDPOINT = os.environ.get("OTEL_EXPORTER_OTLP_TRACES_ENDPOINT") or os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT")
+# Local JSONL file to export spans to, one span per line
+OTEL_TRACES_FILE = os.environ.get("OTEL_TRACES_FILE")
+# Service name reported with every span
+OTEL_SERVICE_NAME = os.environ.get("OTEL_SERVICE_NAME", "ois-gold-serverless-worker")
+
+_NOOP_SPAN = contextlib.nullcontext()
+
+_tracer = None
+_provider = None
+_initialized = False
+_init_lock = threading.Lock()
+
+
+def init_tracing(otlp_endpoint=None, traces_file=None, service_name=None):
+    """
+    Set up the tracer provider and exporters.
+
+    Args:
+        otlp_endpoint (str, optional): OTLP/HTTP endpoint. Defaults to the OTEL_* environment.
+        traces_file (str, optional): JSONL file to write spans to. Defaults to OTEL_TRACES_FILE.
+        service_name (str, optional): The service name. Defaults to OTEL_SERVICE_NAME.
+
+    Returns:
+        bool: True if tracing is enabled.
+    """
+    global _tracer, _provider, _initialized
+
+    with _init_lock:
+        _initialized = True
+        use_otlp = bool(otlp_endpoint or OTEL_EXPORTER_OTLP_ENDPOINT)
+        traces_file = traces_file or OTEL_TRACES_FILE
+        if not use_otlp and not traces_file:
+            return False
+
+        try:
+            from opentelemetry.sdk.resources import Resource
+            from opentelemetry.sdk.trace import TracerProvider
+            from opentelemetry.sdk.trace.export import BatchSpanProcessor, SimpleSpanProcessor
+        except ImportError:
+            return False
+
+        provider = TracerProvider(resource=Resource.create({"service.name": service_name or OTEL_SERVICE_NAME}))
+        if use_otlp:
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+
+            # Without an explicit endpoint the exporter reads the OTEL_EXPORTER_OTLP_* environment
+            exporter = OTLPSpanExporter(endpoint=otlp_endpoint) if otlp_endpoint else OTLPSpanExporter()
+            provider.add_span_processor(BatchSpanProcessor(exporter))
+        if traces_file:
+            # Written synchronously so that the file is complete when a job returns
+            provider.add_span_processor(SimpleSpanProcessor(_json_lines_exporter(traces_file)))
+
+        _provider = provider
+        _tracer = provider.get_tracer(__name__)
+        return True
+
+
+def _json_lines_exporter(path):
+    from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+
+    class JsonLinesSpanExporter(SpanExporter):
+        """
+        Appends finished spans to a JSONL file, for offline testing.
+        """
+
+        def __init__(self, path):
+            self.path = path
+            self._lock = threading.Lock()
+
+        def export(self, spans):
+            with self._lock, open(self.path, "a") as f:
+                for finished_span in spans:
+                    f.write(finished_span.to_json(indent=None) + "\n")
+            return SpanExportResult.SUCCESS
+
+        def shutdown(self):
+            pass
+
+    return JsonLinesSpanExporter(path)
+
+
+def shutdown():
+    """
+    Flush pending spans and disable tracing.
+    """
+    global _tracer, _provider, _initialized
+    if _provider is not None:
+        _provider.shutdown()
+    _tracer = None
+    _provider = None
+    _initialized = False
+
+
+def extract_context(job_input):
+    """
+    Get the parent trace context from the job input.
+
+    Args:
+        job_input (dict): The job input with optional `traceparent` and `tracestate` fields.
+
+    Returns:
+        Context: The parent context, or None if tracing is disabled or no parent was given.
+    """
+    if not _initialized:
+        init_tracing()
+    if _tracer is None or not isinstance(job_input, dict):
+        return None
+    traceparent = job_input.get("traceparent")
+    if not isinstance(traceparent, str):
+        return None
+
+    from opentelemetry.trace.propagation.tracecontext import TraceContextTextMapPropagator
+
+    carrier = {"traceparent": traceparent}
+    if isinstance(job_input.get("tracestate"), str):
+        carrier["tracestate"] = job_input["tracestate"]
+    return TraceContextTextMapPropagator().extract(carrier)
+
+
+def span(name, attributes=None, context=None):
+    """
+    Start a span as the current span.
+
+    Args:
+        name (str): The span name.
+        attributes (dict, optional): Span attributes.
+        context (Context, optional): Explicit parent context.
+
+    Returns:
+        A context manager yielding the span, or None when tracing is disabled.
+    """
+    if not _initialized:
+        init_tracing()
+    if _tracer is None:
+        return _NOOP_SPAN
+    return _tracer.start_as_current_span(name, context=context, attributes=attributes)
+
+
+def set_error(current_span, message):
+    """
+    Mark a span as failed.
+
+    Args:
+        current_span (Span): The span yielded by `span()`, or None.
+        message (str): The error description.
+    """
+    if current_span is None:
+        return
+    from opentelemetry.trace import Status, StatusCode
+
+    current_span.set_status(Status(StatusCode.ERROR, message))
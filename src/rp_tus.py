@@ -0,0 +1,365 @@
+"""
+Streaming TUS upload engine.
+
+An alternative to tuspy for large outputs, selected with TUS_ENGINE=stream.
+tuspy reads every chunk into a new `bytes` object and sends it with
+`requests.patch` on a new connection. This engine keeps one HTTP connection
+per upload and sends the chunks straight from the file: with `sendfile`
+over plain HTTP (the kernel copies from the page cache to the socket) and
+from `memoryview` slices of an `mmap` of the file over HTTPS. No chunk is
+ever copied into a Python object. An upload can also be a sequence of byte
+strings and file ranges (see rp_bundle), or a stream of unknown length sent
+with the creation-defer-length extension.
+
+The chunk size adapts to the link. The creation request measures the round
+trip time and every PATCH the throughput; chunks are then sized so that the
+round trip of each PATCH costs at most TUS_RTT_OVERHEAD of its time, between
+TUS_MIN_CHUNK_SIZE and TUS_MAX_CHUNK_SIZE. The throughput of a small chunk
+includes its round trip and underestimates the link, so chunks grow over a
+few PATCHes until the round trip no longer dominates.
+"""
+import base64
+import contextlib
+import http.client
+import mmap
+import os
+import socket
+import time
+import urllib.parse
+
+# Chunk size of the first PATCH, before anything is measured
+TUS_MIN_CHUNK_SIZE = int(os.environ.get("TUS_MIN_CHUNK_SIZE", 1024 * 1024))
+# Upper bound of the adaptive chunk size
+TUS_MAX_CHUNK_SIZE = int(os.environ.get("TUS_MAX_CHUNK_SIZE", 256 * 1024 * 1024))
+# Share of the time of a PATCH that may be spent on its round trip
+TUS_RTT_OVERHEAD = float(os.environ.get("TUS_RTT_OVERHEAD", 0.05))
+
+# Attempts per chunk, a failed chunk resumes from the offset the server reports
+CHUNK_ATTEMPTS = 3
+# Weight of the latest measurement in the moving averages
+MEASUREMENT_WEIGHT = 0.5
+# Chunk sizes are multiples of this
+CHUNK_ALIGNMENT = 64 * 1024
+TIMEOUT_S = 60
+
+
+class TusError(Exception):
+    """The TUS server rejected a request"""
+
+
+class ChunkSizer:
+    """
+    Sizes the chunks of an upload from the measured round trip time and throughput.
+
+    Args:
+        minimum (int, optional): The smallest and first chunk size.
+        maximum (int, optional): The largest chunk size.
+        rtt_overhead (float, optional): The share of a PATCH that may be spent on the round trip.
+    """
+
+    def __init__(self, minimum=TUS_MIN_CHUNK_SIZE, maximum=TUS_MAX_CHUNK_SIZE, rtt_overhead=TUS_RTT_OVERHEAD):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.rtt_overhead = rtt_overhead
+        self.rtt = None
+        self.bytes_per_second = None
+
+    @staticmethod
+    def _average(current, value):
+        return value if current is None else current + MEASUREMENT_WEIGHT * (value - current)
+
+    def record_rtt(self, seconds):
+        self.rtt = self._average(self.rtt, seconds)
+
+    def record_chunk(self, size, seconds):
+        """Record the duration of a PATCH of `size` bytes, including its round trip"""
+        self.bytes_per_second = self._average(self.bytes_per_second, size / max(seconds, 1e-6))
+
+    @property
+    def size(self):
+        if self.bytes_per_second is None or self.rtt is None:
+            return self.minimum
+        # rtt / (rtt + size / rate) = overhead
+        size = self.bytes_per_second * self.rtt * (1 - self.rtt_overhead) / self.rtt_overhead
+        size = int(size) // CHUNK_ALIGNMENT * CHUNK_ALIGNMENT
+        return max(self.minimum, min(size, self.maximum))
+
+
+class StreamUploader:
+    """
+    Uploads a sequence of segments as one TUS upload over a single connection.
+
+    A segment is either `bytes` or a byte range `(file_path, start, length)` of
+    a file, which is sent without copying it.
+
+    Args:
+        segments (list): The segments, in upload order.
+        upload_url (str): The TUS endpoint to create the upload at.
+        headers (dict, optional): Extra headers of every request, e.g. `mimeType` or `Upload-Concat`.
+        sizer (ChunkSizer, optional): Sizes the chunks, shared between uploads to keep the measurements.
+        metadata (dict, optional): The `Upload-Metadata` of the upload, e.g. its `filename`.
+    """
+
+    def __init__(self, segments, upload_url, headers=None, sizer=None, metadata=None):
+        self.segments = segments
+        self.upload_url = upload_url
+        self.headers = {"Tus-Resumable": "1.0.0", **(headers or {})}
+        self.metadata = metadata or {}
+        self.length = sum(len(segment) if isinstance(segment, bytes) else segment[2] for segment in segments)
+        self.sizer = sizer or ChunkSizer()
+        self.url = None
+        self.chunks = []
+        self._target = urllib.parse.urlsplit(upload_url)
+        self._connection = None
+        # TLS sockets cannot sendfile, they would fall back to reading into buffers
+        self.use_sendfile = self._target.scheme == "http" and hasattr(os, "sendfile")
+
+    def connect(self):
+        if self._connection is None:
+            connection_class = http.client.HTTPSConnection if self._target.scheme == "https" else http.client.HTTPConnection
+            self._connection = connection_class(self._target.netloc, timeout=TIMEOUT_S)
+            self._connection.connect()
+            self._connection.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return self._connection
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def request(self, method, url, headers, send_body=None):
+        """
+        Send a request on the upload connection and read the whole response.
+
+        Args:
+            send_body (callable, optional): Writes the body to the socket, the
+                Content-Length must be in `headers`.
+
+        Returns:
+            http.client.HTTPResponse: The response, already read.
+        """
+        path = urllib.parse.urlsplit(url)
+        target = path.path + (f"?{path.query}" if path.query else "")
+        connection = self.connect()
+        try:
+            connection.putrequest(method, target, skip_accept_encoding=True)
+            for name, value in {**self.headers, **headers}.items():
+                connection.putheader(name, value)
+            connection.endheaders()
+            if send_body is not None:
+                send_body(connection.sock)
+            response = connection.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            self.close()
+            raise
+        if response.will_close:
+            self.close()
+        return response
+
+    def create(self, length_headers=None):
+        """Create the upload and measure the round trip time"""
+        metadata = ",".join(
+            f"{key} {base64.b64encode(str(value).encode()).decode()}" for key, value in self.metadata.items()
+        )
+        start = time.perf_counter()
+        response = self.request("POST", self.upload_url, {
+            **(length_headers or {"Upload-Length": str(self.length)}),
+            "Upload-Metadata": metadata,
+            "Content-Length": "0",
+        })
+        self.sizer.record_rtt(time.perf_counter() - start)
+        if response.status not in (200, 201):
+            raise TusError(f"Creating the upload failed with status {response.status}")
+        self.url = urllib.parse.urljoin(self.upload_url, response.getheader("Location"))
+        return self.url
+
+    def server_offset(self):
+        response = self.request("HEAD", self.url, {})
+        if response.status != 200:
+            raise TusError(f"Reading the upload offset failed with status {response.status}")
+        return int(response.getheader("Upload-Offset"))
+
+    def upload(self):
+        """
+        Create the upload and send the segments in adaptive chunks.
+
+        Returns:
+            str: The URL of the upload.
+        """
+        with contextlib.ExitStack() as stack:
+            # Also closes the connection if the creation is rejected
+            stack.callback(self.close)
+            self.create()
+            pieces = self.open_pieces(stack)
+            offset = 0
+            while offset < self.length:
+                size = min(self.sizer.size, self.length - offset)
+                offset = self.patch(offset, size, self._send_range(pieces, offset, size))
+        return self.url
+
+    def open_pieces(self, stack):
+        """
+        Open the file segments for sending.
+
+        Returns:
+            list: `(upload offset, length, send)` per segment, `send(sock, start, size)`
+                sends a range of the segment.
+        """
+        pieces = []
+        files = {}
+        position = 0
+        for segment in self.segments:
+            if isinstance(segment, bytes):
+                view = memoryview(segment)
+                send = self._view_sender(view)
+                length = len(segment)
+            else:
+                file_path, start, length = segment
+                if not length:
+                    continue
+                if file_path not in files:
+                    files[file_path] = stack.enter_context(open(file_path, "rb", buffering=0))
+                file = files[file_path]
+                if self.use_sendfile:
+                    send = self._file_sender(file, start)
+                else:
+                    # mmap offsets must be page aligned
+                    map_start = start - start % mmap.ALLOCATIONGRANULARITY
+                    mapped = mmap.mmap(file.fileno(), start - map_start + length, offset=map_start, access=mmap.ACCESS_READ)
+                    stack.callback(self._close_map, mapped)
+                    view = memoryview(mapped)[start - map_start:]
+                    stack.callback(view.release)
+                    send = self._view_sender(view)
+            pieces.append((position, length, send))
+            position += length
+        return pieces
+
+    @staticmethod
+    def _close_map(mapped):
+        try:
+            mapped.close()
+        except BufferError:
+            # A view escaped through an exception, the mapping goes with it
+            pass
+
+    @staticmethod
+    def _send_range(pieces, offset, size):
+        def send(sock):
+            end = offset + size
+            for position, length, send_piece in pieces:
+                if position + length <= offset or position >= end:
+                    continue
+                start = max(offset, position)
+                send_piece(sock, start - position, min(end, position + length) - start)
+        return send
+
+    def patch(self, offset, size, send_body, headers=None):
+        """Send one chunk, resuming from the server offset after a failure. Returns the new offset."""
+        for attempt in range(CHUNK_ATTEMPTS):
+            start = time.perf_counter()
+            try:
+                response = self.request("PATCH", self.url, {
+                    **(headers or {}),
+                    "Upload-Offset": str(offset),
+                    "Content-Type": "application/offset+octet-stream",
+                    "Content-Length": str(size),
+                }, send_body)
+                if response.status != 204:
+                    raise TusError(f"PATCH failed with status {response.status}")
+            except (OSError, http.client.HTTPException, TusError):
+                if attempt == CHUNK_ATTEMPTS - 1:
+                    raise
+                server_offset = self.server_offset()
+                if server_offset != offset:
+                    # Part of the chunk arrived, the next chunk continues from there
+                    return server_offset
+                continue
+            seconds = time.perf_counter() - start
+            self.sizer.record_chunk(size, seconds)
+            self.chunks.append((size, round(seconds, 4)))
+            return int(response.getheader("Upload-Offset", offset + size))
+
+    @staticmethod
+    def _file_sender(file, file_start):
+        def send(sock, start, size):
+            # Unlike os.sendfile this waits on the socket timeout
+            sock.sendfile(file, file_start + start, size)
+        return send
+
+    @staticmethod
+    def _view_sender(view):
+        def send(sock, start, size):
+            sock.sendall(view[start:start + size])
+        return send
+
+
+class DeferredUploader(StreamUploader):
+    """
+    Uploads a stream of unknown length, e.g. compressor output, as one TUS upload.
+
+    The upload is created with `Upload-Defer-Length` (the TUS
+    creation-defer-length extension) and the length is sent with the last
+    PATCH. The stream is collected into one reused buffer of the current
+    chunk size.
+
+    Args:
+        chunks (iterable): The `bytes` of the stream.
+        upload_url (str): The TUS endpoint to create the upload at.
+        headers (dict, optional): Extra headers of every request.
+        sizer (ChunkSizer, optional): Sizes the chunks.
+        metadata (dict, optional): The `Upload-Metadata` of the upload.
+    """
+
+    def __init__(self, chunks, upload_url, headers=None, sizer=None, metadata=None):
+        super().__init__([], upload_url, headers, sizer, metadata)
+        self.stream = chunks
+        self.length = None
+
+    def upload(self):
+        buffer = bytearray()
+        offset = 0
+        try:
+            self.create({"Upload-Defer-Length": "1"})
+            for data in self.stream:
+                buffer += data
+                if len(buffer) >= self.sizer.size:
+                    offset = self.patch_buffer(offset, buffer)
+                    buffer.clear()
+            self.length = offset + len(buffer)
+            self.patch_buffer(offset, buffer, {"Upload-Length": str(self.length)})
+        finally:
+            self.close()
+        return self.url
+
+    def patch_buffer(self, offset, buffer, headers=None):
+        """PATCH the whole buffer, in several requests if the server only took part of it"""
+        with memoryview(buffer) as view:
+            done = 0
+            while True:
+                with view[done:] as rest:
+                    send = self._view_sender(rest)
+                    new_offset = self.patch(offset + done, len(rest), lambda sock: send(sock, 0, len(rest)), headers)
+                done = new_offset - offset
+                if done >= len(view):
+                    return new_offset
+
+
+def upload(file_path, upload_url, headers=None, start=0, length=None, sizer=None):
+    """
+    Upload a file, or a byte range of it, as one TUS upload.
+
+    Args:
+        file_path (str): The file to upload.
+        upload_url (str): The TUS endpoint.
+        headers (dict, optional): Extra headers of every request.
+        start (int, optional): The first byte of the range.
+        length (int, optional): The length of the range, to the end of the file if not given.
+        sizer (ChunkSizer, optional): Shared chunk size measurements.
+
+    Returns:
+        str: The URL of the upload.
+    """
+    if length is None:
+        length = os.path.getsize(file_path) - start
+    return StreamUploader([(file_path, start, length)], upload_url, headers, sizer).upload()
@@ -0,0 +1,321 @@
+"""
+Durable local spool for output uploads.
+
+With UPLOAD_SPOOL_DIR set, the outputs of a job are moved into
+`<spool>/<job id>/` next to a `job.json` manifest instead of being uploaded
+before the handler returns, so the next job can start on ComfyUI right away.
+A background thread drains the spool one job at a time, retrying failed
+uploads with exponential backoff. Uploaded files are recorded in the manifest,
+so a spool left behind by a crashed worker is resumed on the next start
+without uploading anything twice.
+
+Several workers may share a spool on the network volume. A worker claims a
+job with an exclusive `flock` on its `<job id>/.lock` file and holds it until
+the job is done, so every job is uploaded by one worker only and the others
+skip it. A job that still fails after all retries is moved with its outputs
+to `<spool>/failed/<job id>/`, which does not count against the byte budget,
+and its status file records that path.
+
+The state of every spooled job is written to `<spool>/status/<job id>.json`
+(`queued`, `uploading`, `done` or `failed`) and, if the job input has a
+`callback` URL, POSTed there once the job is done or failed. New jobs wait
+while the spool holds more than UPLOAD_SPOOL_MAX_BYTES or its disk has less
+than UPLOAD_SPOOL_MIN_FREE_BYTES free.
+"""
+import fcntl
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+import requests
+
+# Directory of the upload spool - outputs are uploaded before the handler returns when not set
+UPLOAD_SPOOL_DIR = os.environ.get("UPLOAD_SPOOL_DIR")
+# Whether the spool is used at all
+ENABLED = bool(UPLOAD_SPOOL_DIR)
+# New jobs wait while the spool holds more than this many bytes (0 = no limit)
+UPLOAD_SPOOL_MAX_BYTES = int(os.environ.get("UPLOAD_SPOOL_MAX_BYTES", 0))
+# New jobs wait while the disk of the spool has less than this many bytes free
+UPLOAD_SPOOL_MIN_FREE_BYTES = int(os.environ.get("UPLOAD_SPOOL_MIN_FREE_BYTES", 1024 * 1024 * 1024))
+# Number of attempts to upload a file before the job fails
+UPLOAD_SPOOL_RETRIES = int(os.environ.get("UPLOAD_SPOOL_RETRIES", 5))
+# Wait before the first retry in seconds, doubled for every further retry
+UPLOAD_SPOOL_BACKOFF_S = float(os.environ.get("UPLOAD_SPOOL_BACKOFF_S", 2))
+
+MANIFEST_FILE = "job.json"
+LOCK_FILE = ".lock"
+STATUS_DIR = "status"
+FAILED_DIR = "failed"
+# Attempts and timeout of the completion callback
+CALLBACK_RETRIES = 3
+CALLBACK_TIMEOUT_S = 10
+
+logger = logging.getLogger(__name__)
+
+
+def write_json(path, data):
+    """Write a JSON file atomically and durably"""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(data, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+def read_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def claim(job_dir):
+    """
+    Lock a spooled job for this worker, see the module docstring.
+
+    Returns:
+        int: The file descriptor holding the lock, None if another worker holds it or the job is gone.
+    """
+    try:
+        fd = os.open(os.path.join(job_dir, LOCK_FILE), os.O_RDWR | os.O_CREAT, 0o644)
+    except FileNotFoundError:
+        return None
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return None
+    return fd
+
+
+class UploadSpool:
+    """
+    Spools the outputs of jobs and uploads them from a background thread.
+
+    Args:
+        directory (str): The spool directory, ideally on the file system of the ComfyUI output directory.
+        upload (callable): `upload(job_id, file_path, upload_url, job_dir)` uploads one file and
+            returns `(size, error)` like `rp_handler.upload_output_file`.
+        max_bytes (int, optional): Byte budget of the spool, 0 for no limit.
+        min_free_bytes (int, optional): Free space to keep on the disk of the spool.
+        retries (int, optional): Attempts per file.
+        backoff (float, optional): Wait before the first retry in seconds.
+    """
+
+    def __init__(self, directory, upload, max_bytes=UPLOAD_SPOOL_MAX_BYTES,
+                 min_free_bytes=UPLOAD_SPOOL_MIN_FREE_BYTES, retries=UPLOAD_SPOOL_RETRIES,
+                 backoff=UPLOAD_SPOOL_BACKOFF_S):
+        self.directory = directory
+        self.upload = upload
+        self.max_bytes = max_bytes
+        self.min_free_bytes = min_free_bytes
+        self.retries = retries
+        self.backoff = backoff
+        self.status_dir = os.path.join(directory, STATUS_DIR)
+        self.failed_dir = os.path.join(directory, FAILED_DIR)
+        os.makedirs(self.status_dir, exist_ok=True)
+        self._condition = threading.Condition()
+        self._pending = []
+        self._bytes = 0
+        self._busy = False
+        self._thread = None
+        # The lock of every job this worker uploads, by job id
+        self._claims = {}
+        # Jobs left behind by a previous worker come first, unless a worker sharing the spool has them
+        for job_id in sorted(os.listdir(directory)):
+            job_dir = os.path.join(directory, job_id)
+            if job_id in (STATUS_DIR, FAILED_DIR) or not os.path.exists(os.path.join(job_dir, MANIFEST_FILE)):
+                continue
+            fd = claim(job_dir)
+            if fd is None:
+                continue
+            try:
+                manifest = read_json(os.path.join(job_dir, MANIFEST_FILE))
+            except FileNotFoundError:
+                # Finished by another worker since the listing
+                os.close(fd)
+                continue
+            self._claims[job_id] = fd
+            self._bytes += sum(entry["size"] for entry in manifest["files"].values() if not entry["uploaded"])
+            self._pending.append(job_id)
+
+    def has_room(self, size):
+        """Whether `size` more bytes fit the budget; an empty spool always takes one job"""
+        if not self._pending and not self._busy:
+            return True
+        if self.max_bytes and self._bytes + size > self.max_bytes:
+            return False
+        return shutil.disk_usage(self.directory).free - size >= self.min_free_bytes
+
+    def put(self, job_id, files, output_path, upload_url, callback=None):
+        """
+        Move the outputs of a job into the spool and queue them for upload.
+
+        Blocks while the spool is over its budget.
+
+        Args:
+            job_id (str): The unique identifier for the job.
+            files (list): The paths of the output files.
+            output_path (str): The ComfyUI output directory, the paths below it are kept.
+            upload_url (str): The output URL of the job.
+            callback (str, optional): URL to POST the final status of the job to.
+
+        Returns:
+            dict: The status of the job.
+        """
+        size = sum(os.path.getsize(path) for path in files)
+        waited = time.perf_counter()
+        with self._condition:
+            while not self.has_room(size):
+                self._condition.wait(1)
+        waited = time.perf_counter() - waited
+        if waited >= 1:
+            logger.warning("Waited for room in the upload spool", extra={"job_id": job_id, "seconds": round(waited, 2)})
+
+        job_dir = os.path.join(self.directory, job_id)
+        os.makedirs(job_dir, exist_ok=True)
+        # Claimed before the manifest exists, so no other worker picks the job up
+        self._claims[job_id] = claim(job_dir)
+        manifest = {
+            "job_id": job_id,
+            "upload_url": upload_url,
+            "callback": callback,
+            "spooled_at": time.time(),
+            "files": {},
+        }
+        for path in files:
+            relative_path = os.path.relpath(path, output_path)
+            target = os.path.join(job_dir, relative_path)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            # A rename on the same file system, a copy otherwise
+            shutil.move(path, target)
+            manifest["files"][relative_path] = {"size": os.path.getsize(target), "uploaded": False}
+        write_json(os.path.join(job_dir, MANIFEST_FILE), manifest)
+
+        status = self.write_status(manifest, "queued")
+        with self._condition:
+            self._bytes += size
+            self._pending.append(job_id)
+            self._condition.notify_all()
+        self.start()
+        return status
+
+    def start(self):
+        """Start the background uploader, once"""
+        with self._condition:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._drain, name="upload-spool", daemon=True)
+                self._thread.start()
+
+    def wait(self, timeout=None):
+        """
+        Block until the spool is empty.
+
+        Returns:
+            bool: False if the timeout expired first.
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._pending and not self._busy, timeout)
+
+    def _drain(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending)
+                job_id = self._pending.pop(0)
+                self._busy = True
+            try:
+                self.upload_job(job_id)
+            except Exception as e:
+                logger.error("Spooled upload crashed", extra={"job_id": job_id, "error": str(e)})
+            finally:
+                with self._condition:
+                    self._busy = False
+                    self._condition.notify_all()
+
+    def upload_job(self, job_id):
+        """Upload the remaining files of a spooled job, then report and remove it"""
+        try:
+            self._upload_job(job_id)
+        finally:
+            fd = self._claims.pop(job_id, None)
+            if fd is not None:
+                os.close(fd)
+
+    def _upload_job(self, job_id):
+        job_dir = os.path.join(self.directory, job_id)
+        manifest_path = os.path.join(job_dir, MANIFEST_FILE)
+        manifest = read_json(manifest_path)
+        self.write_status(manifest, "uploading")
+
+        error = None
+        for relative_path, entry in manifest["files"].items():
+            if entry["uploaded"]:
+                continue
+            file_path = os.path.join(job_dir, relative_path)
+            for attempt in range(self.retries):
+                if attempt:
+                    time.sleep(self.backoff * 2 ** (attempt - 1))
+                _, error = self.upload(job_id, file_path, manifest["upload_url"], job_dir)
+                if error is None:
+                    break
+            if error is not None:
+                break
+            entry["uploaded"] = True
+            write_json(manifest_path, manifest)
+            with self._condition:
+                self._bytes -= entry["size"]
+                self._condition.notify_all()
+
+        with self._condition:
+            self._bytes -= sum(entry["size"] for entry in manifest["files"].values() if not entry["uploaded"])
+        if error:
+            # Kept for a manual retry, outside the budget so that it does not hold up new jobs
+            failed_path = os.path.join(self.failed_dir, job_id)
+            os.makedirs(self.failed_dir, exist_ok=True)
+            shutil.rmtree(failed_path, ignore_errors=True)
+            os.replace(job_dir, failed_path)
+            status = self.write_status(manifest, "failed", error, failed_path)
+        else:
+            status = self.write_status(manifest, "done")
+            shutil.rmtree(job_dir, ignore_errors=True)
+        if manifest.get("callback"):
+            self.notify(manifest["callback"], status)
+
+    def write_status(self, manifest, state, error=None, failed_path=None):
+        files = manifest["files"].values()
+        status = {
+            "job_id": manifest["job_id"],
+            "status": state,
+            "file_count": len(files),
+            "total_bytes": sum(entry["size"] for entry in files),
+            "uploaded_count": sum(1 for entry in files if entry["uploaded"]),
+            "uploaded_bytes": sum(entry["size"] for entry in files if entry["uploaded"]),
+            "updated_at": time.time(),
+        }
+        if error:
+            status["error"] = error
+        if failed_path:
+            status["failed_path"] = failed_path
+        write_json(self.status_path(manifest["job_id"]), status)
+        return status
+
+    def status_path(self, job_id):
+        return os.path.join(self.status_dir, f"{job_id}.json")
+
+    def notify(self, callback, status):
+        """POST the final status of a job to its callback URL"""
+        for attempt in range(CALLBACK_RETRIES):
+            try:
+                response = requests.post(callback, json=status, timeout=CALLBACK_TIMEOUT_S)
+                response.raise_for_status()
+                return True
+            except requests.RequestException as e:
+                logger.warning("Upload callback failed", extra={
+                    "job_id": status["job_id"],
+                    "attempt": attempt + 1,
+                    "error": str(e),
+                })
+                time.sleep(self.backoff * 2 ** attempt)
+        return False
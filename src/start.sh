@@ -4,10 +4,29 @@
 TCMALLOC="$(ldconfig -p | grep -Po "libtcmalloc.so.\d" | head -n 1)"
 export LD_PRELOAD="${TCMALLOC}"
 
+# Fetch missing models on first boot, e.g. onto an empty network volume
+if [ -n "$MODEL_MANIFEST" ]; then
+    echo "runpod-worker-comfy: Fetching models from $MODEL_MANIFEST"
+    python3 /rp_model_fetch.py --manifest "$MODEL_MANIFEST" --dest "${MODEL_FETCH_DEST:-/runpod-volume}"
+fi
+
+# Stage the ComfyUI input, output and temp directories on a tmpfs, see rp_staging.py
+COMFY_DIRECTORY_ARGS=""
+if [ "$STAGING_TMPFS" == "true" ]; then
+    STAGING_LINK_DIR="${STAGING_LINK_DIR:-/comfyui/staging}"
+    echo "runpod-worker-comfy: Staging the ComfyUI directories in $STAGING_LINK_DIR"
+    python3 /rp_staging.py
+    COMFY_DIRECTORY_ARGS="--input-directory $STAGING_LINK_DIR/input --output-directory $STAGING_LINK_DIR/output --temp-directory $STAGING_LINK_DIR"
+    export COMFY_INPUT_PATH="$STAGING_LINK_DIR/input"
+    export COMFY_OUTPUT_PATH="$STAGING_LINK_DIR/output"
+fi
+
 # Serve the API and don't shutdown the container
 if [ "$SERVE_API_LOCALLY" == "true" ]; then
     echo "runpod-worker-comfy: Starting ComfyUI with virtual environment"
-    /comfyui/venv/bin/python /comfyui/main.py --disable-auto-launch --disable-metadata --listen &
+    # Spawn time of ComfyUI for the startup timeline logged by the handler
+    export COMFY_SPAWNED_AT="$(date +%s.%N)"
+    /comfyui/venv/bin/python /comfyui/main.py --disable-auto-launch --disable-metadata --listen $COMFY_DIRECTORY_ARGS &
 
     # Create a symlink to the workspace directory because `runpod-volume` is only mounted in serverless container
     ln -s /workspace /runpod-volume
@@ -25,7 +44,9 @@ if [ "$SERVE_API_LOCALLY" == "true" ]; then
     python3 -u /rp_handler.py --rp_serve_api --rp_api_host=0.0.0.0
 else
     echo "runpod-worker-comfy: Starting ComfyUI with virtual environment"
-    /comfyui/venv/bin/python /comfyui/main.py --disable-auto-launch --disable-metadata &
+    # Spawn time of ComfyUI for the startup timeline logged by the handler
+    export COMFY_SPAWNED_AT="$(date +%s.%N)"
+    /comfyui/venv/bin/python /comfyui/main.py --disable-auto-launch --disable-metadata $COMFY_DIRECTORY_ARGS &
 
     echo "runpod-worker-comfy: Starting RunPod Handler with system Python"
     python3 -u /rp_handler.py
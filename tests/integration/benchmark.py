@@ -0,0 +1,302 @@
+"""
+End-to-end latency benchmark of the handler against the local mocks.
+
+Starts the mock ComfyUI, HTTP and TUS servers, runs `handler()` for a number
+of jobs across all tiling/denoise variants for every combination of input and
+output file size, and reports p50/p95/p99 per job phase plus throughput.
+Everything runs on localhost, so no GPU or network access is needed.
+
+Usage:
+    python benchmark.py --jobs 40 --input-sizes 512KB,8MB --output-sizes 1MB,32MB --output results.json
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(SCRIPT_DIR)
+sys.path.append(os.path.abspath(os.path.join(SCRIPT_DIR, "../..")))
+
+# All workflow variants, see workflows/<tiling>_<denoise>
+VARIANTS = [(tiling, denoise) for tiling in (2, 3, 4, 5) for denoise in ("0.4", "0.6")]
+PHASES = ("download", "queue", "execution", "upload", "total")
+SIZE_UNITS = {"B": 1, "KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3}
+
+
+def parse_size(text):
+    """Parse a size like "512KB" or "8MB" into bytes"""
+    text = text.strip().upper()
+    for unit in ("GB", "MB", "KB", "B"):
+        if text.endswith(unit):
+            return int(float(text[:-len(unit)]) * SIZE_UNITS[unit])
+    return int(text)
+
+
+def format_size(size):
+    for unit in ("GB", "MB", "KB"):
+        if size >= SIZE_UNITS[unit] and size % SIZE_UNITS[unit] == 0:
+            return f"{size // SIZE_UNITS[unit]}{unit}"
+    return f"{size}B"
+
+
+def percentile(values, q):
+    """Percentile with linear interpolation between the closest ranks"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+def summarize(values):
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 4),
+        "min": round(min(values), 4),
+        "p50": round(percentile(values, 50), 4),
+        "p95": round(percentile(values, 95), 4),
+        "p99": round(percentile(values, 99), 4),
+        "max": round(max(values), 4),
+    }
+
+
+class MockComfyUI:
+    """
+    Runs mock_comfyui.py in a subprocess with the given output size, or
+    comfyui_emulator.py when `time_scale` is set
+    """
+
+    def __init__(self, output_dir, delay, output_size, workdir, time_scale=None):
+        self.env = os.environ.copy()
+        self.env.update({
+            "COMFY_OUTPUT_PATH": output_dir,
+            "MOCK_COMFY_DELAY_S": str(delay),
+            "MOCK_OUTPUT_SIZE_BYTES": str(output_size),
+        })
+        if time_scale is None:
+            self.command = [sys.executable, os.path.join(SCRIPT_DIR, "mock_comfyui.py")]
+        else:
+            self.command = [
+                sys.executable, os.path.join(SCRIPT_DIR, "comfyui_emulator.py"),
+                "--output-dir", output_dir,
+                "--output-size", str(output_size or 1024),
+                "--time-scale", str(time_scale),
+            ]
+        self.workdir = workdir
+        self.process = None
+
+    def start(self):
+        self.process = subprocess.Popen(
+            self.command,
+            env=self.env,
+            cwd=self.workdir,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        for _ in range(100):
+            try:
+                if requests.get("http://127.0.0.1:8188/", timeout=1).status_code == 200:
+                    return
+            except requests.RequestException:
+                pass
+            time.sleep(0.1)
+        raise RuntimeError("Mock ComfyUI server did not start properly")
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait()
+
+
+def run_benchmark(rp_handler, http_server, tus_server, args, input_size, output_size, workdir):
+    """Run the jobs for one input/output size combination"""
+    comfy = MockComfyUI(os.environ["COMFY_OUTPUT_PATH"], args.comfy_delay, output_size, workdir, args.emulator_time_scale)
+    comfy.start()
+    try:
+        samples = {phase: [] for phase in PHASES}
+        per_variant = {}
+        failures = []
+        download_bytes = 0
+        upload_bytes = 0
+        wall_start = None
+
+        for i in range(args.warmup + args.jobs):
+            if i == args.warmup:
+                wall_start = time.perf_counter()
+            tiling, denoise = VARIANTS[i % len(VARIANTS)]
+            job = {
+                "id": f"benchmark-{format_size(input_size)}-{format_size(output_size)}-{i}",
+                "input": {
+                    "input": f"{http_server.url}/input_{input_size}.bin",
+                    "output": tus_server.url,
+                    "params": {"tiling": tiling, "denoise": denoise},
+                },
+            }
+            result = rp_handler.handler(job)
+            uploads = tus_server.get_uploads()
+            uploaded = sum(upload["offset"] for upload in uploads.values())
+            clear_uploads(tus_server)
+
+            if i < args.warmup:
+                continue
+            if result.get("error") or result.get("status") != "success":
+                failures.append(result.get("error") or result.get("message"))
+                continue
+
+            timings = result["timings"]
+            for phase in PHASES:
+                if phase in timings:
+                    samples[phase].append(timings[phase])
+            per_variant.setdefault(f"{tiling}_{denoise}", []).append(timings["total"])
+            download_bytes += input_size
+            upload_bytes += uploaded
+
+        wall_seconds = time.perf_counter() - wall_start if wall_start is not None else 0
+    finally:
+        comfy.stop()
+
+    completed = len(samples["total"])
+    download_time = sum(samples["download"])
+    upload_time = sum(samples["upload"])
+    return {
+        "input_size_bytes": input_size,
+        "output_size_bytes": output_size,
+        "jobs": args.jobs,
+        "completed": completed,
+        "failures": len(failures),
+        "failure_messages": sorted(set(failures))[:10],
+        "wall_seconds": round(wall_seconds, 4),
+        "jobs_per_second": round(completed / wall_seconds, 4) if wall_seconds else None,
+        "download_mb_per_second": round(download_bytes / download_time / SIZE_UNITS["MB"], 2) if download_time else None,
+        "upload_mb_per_second": round(upload_bytes / upload_time / SIZE_UNITS["MB"], 2) if upload_time else None,
+        "phases": {phase: summarize(values) for phase, values in samples.items()},
+        "variants": {variant: summarize(values) for variant, values in sorted(per_variant.items())},
+    }
+
+
+def clear_uploads(tus_server):
+    """Drop the received uploads so that long runs do not fill the disk"""
+    for upload in tus_server.get_uploads().values():
+        try:
+            os.remove(upload["path"])
+        except OSError:
+            pass
+    tus_server.clear_uploads()
+
+
+def print_run(run):
+    print(
+        f"\ninput={format_size(run['input_size_bytes'])} output={format_size(run['output_size_bytes'])} "
+        f"completed={run['completed']}/{run['jobs']} jobs/s={run['jobs_per_second']} "
+        f"download MB/s={run['download_mb_per_second']} upload MB/s={run['upload_mb_per_second']}"
+    )
+    print(f"  {'phase':<10} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+    for phase, summary in run["phases"].items():
+        if summary["count"]:
+            print(f"  {phase:<10} {summary['p50']:>8.3f} {summary['p95']:>8.3f} {summary['p99']:>8.3f} {summary['max']:>8.3f}")
+    for message in run["failure_messages"]:
+        print(f"  failure: {message}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=16, help="Measured jobs per size combination (cycles through all variants)")
+    parser.add_argument("--warmup", type=int, default=1, help="Jobs to run before measuring")
+    parser.add_argument("--input-sizes", default="1MB", help="Comma separated input file sizes, e.g. 512KB,8MB")
+    parser.add_argument("--output-sizes", default="1MB", help="Comma separated sizes of each generated output image")
+    parser.add_argument("--comfy-delay", type=float, default=0.5, help="Simulated ComfyUI execution time in seconds")
+    parser.add_argument(
+        "--emulator-time-scale", type=float,
+        help="Use comfyui_emulator.py with its per tiling grid latencies scaled by this factor instead of the mock",
+    )
+    parser.add_argument("--polling-interval-ms", default="50", help="COMFY_POLLING_INTERVAL_MS for the handler")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON file to write the results to")
+    parser.add_argument("--verbose", action="store_true", help="Keep the handler and mock server logs")
+    args = parser.parse_args()
+    output_path = os.path.abspath(args.output)
+
+    input_sizes = [parse_size(size) for size in args.input_sizes.split(",")]
+    output_sizes = [parse_size(size) for size in args.output_sizes.split(",")]
+
+    # The mocks write relative to the working directory, keep that out of the repository
+    workdir = tempfile.mkdtemp(prefix="comfy-benchmark-")
+    input_dir = os.path.join(workdir, "inputs")
+    os.makedirs(input_dir)
+    os.chdir(workdir)
+    os.environ["COMFY_INPUT_PATH"] = os.path.join(workdir, "comfyui_input")
+    os.environ["COMFY_OUTPUT_PATH"] = os.path.join(workdir, "comfyui_output")
+    os.environ.setdefault("COMFY_POLLING_INTERVAL_MS", args.polling_interval_ms)
+    os.environ.setdefault("COMFY_POLLING_MAX_RETRIES", "100000")
+    os.makedirs(os.environ["COMFY_INPUT_PATH"])
+    os.makedirs(os.environ["COMFY_OUTPUT_PATH"])
+
+    for size in input_sizes:
+        with open(os.path.join(input_dir, f"input_{size}.bin"), "wb") as f:
+            f.write(os.urandom(size))
+
+    from mock_http_server import MockHTTPServer
+    from mock_tus_server import TusServer
+    from src import rp_handler
+
+    if not args.verbose:
+        rp_handler.setup_logger().setLevel(logging.WARNING)
+        for name in ("werkzeug", "TUS-Server"):
+            logging.getLogger(name).setLevel(logging.WARNING)
+
+    http_server = MockHTTPServer(directory=input_dir)
+    http_server.start()
+    tus_server = TusServer()
+    tus_server.start()
+
+    runs = []
+    try:
+        for input_size in input_sizes:
+            for output_size in output_sizes:
+                run = run_benchmark(rp_handler, http_server, tus_server, args, input_size, output_size, workdir)
+                print_run(run)
+                runs.append(run)
+    finally:
+        tus_server.shutdown()
+        os.chdir(SCRIPT_DIR)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "host": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+        },
+        "config": {
+            "jobs": args.jobs,
+            "warmup": args.warmup,
+            "comfy_delay_seconds": args.comfy_delay,
+            "emulator_time_scale": args.emulator_time_scale,
+            "polling_interval_ms": int(os.environ["COMFY_POLLING_INTERVAL_MS"]),
+            "variants": [f"{tiling}_{denoise}" for tiling, denoise in VARIANTS],
+        },
+        "runs": runs,
+    }
+    with open(output_path, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {output_path}")
+
+    return 1 if any(run["failures"] for run in runs) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
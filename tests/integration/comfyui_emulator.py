@@ -0,0 +1,637 @@
+"""
+High-fidelity ComfyUI emulator for performance and failure testing.
+
+Unlike mock_comfyui.py, the emulator behaves like a single ComfyUI instance:
+
+- a FIFO prompt queue with unique prompt ids, executed one prompt at a time
+- the execution time of a prompt is drawn from a configurable distribution
+  per tiling grid, which is read from the StableContusionTileGrid node of the
+  submitted graph, and split over the nodes by weight
+- nodes whose inputs did not change since an earlier prompt are cached, until
+  /free is called
+- per-node websocket events (status, execution_start, execution_cached,
+  executing, executed, execution_success/error/interrupted) sent to the
+  client_id of the prompt
+- /prompt, /history, /queue, /interrupt, /free, /system_stats, /object_info,
+  /upload/image and /ws, all on a single port
+- output files of a configurable size and count
+- injectable errors and hangs, either at random (--error-rate, --hang-rate)
+  or for the next N prompts via POST /emulator/inject {"errors": N, "hangs": N}
+
+Usage:
+    python comfyui_emulator.py --port 8188 --output-dir /tmp/comfyui_output --time-scale 0.02
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import threading
+import time
+import uuid
+
+from aiohttp import web
+
+WORKFLOWS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../workflows"))
+
+# Mean execution time in seconds per tiling grid, as seen on the production GPUs
+DEFAULT_LATENCY = {
+    "default": {"distribution": "lognormal", "mean": 40.0, "cv": 0.15},
+    "2": {"distribution": "lognormal", "mean": 25.0, "cv": 0.15},
+    "3": {"distribution": "lognormal", "mean": 40.0, "cv": 0.15},
+    "4": {"distribution": "lognormal", "mean": 60.0, "cv": 0.15},
+    "5": {"distribution": "lognormal", "mean": 85.0, "cv": 0.15},
+}
+
+# Relative cost of the expensive node types, every other node has a weight of 1
+NODE_WEIGHTS = {
+    "UltimateSDUpscale": 40,
+    "KSampler": 20,
+    "KSamplerAdvanced": 20,
+    "SamplerCustomAdvanced": 20,
+    "Florence2Run": 8,
+    "SAMLoader": 4,
+    "GroundingDinoSAMSegment (segment anything)": 6,
+    "DepthAnything_V2": 4,
+    "UpscaleModelLoader": 2,
+    "CheckpointLoaderSimple": 4,
+    "UnetLoaderGGUF": 4,
+    "StableContusionPsdBatchSaver": 3,
+}
+
+
+def sample_duration(spec, rng):
+    """Draw an execution time in seconds from a distribution spec"""
+    distribution = spec.get("distribution", "fixed")
+    mean = float(spec.get("mean", 1.0))
+    cv = float(spec.get("cv", 0.0))
+    if distribution == "fixed" or mean <= 0 or cv <= 0:
+        return max(mean, 0.0)
+    if distribution == "uniform":
+        half_width = mean * cv * math.sqrt(3)
+        return max(rng.uniform(mean - half_width, mean + half_width), 0.0)
+    if distribution == "normal":
+        return max(rng.gauss(mean, mean * cv), 0.0)
+    if distribution == "lognormal":
+        sigma = math.sqrt(math.log(1 + cv ** 2))
+        return rng.lognormvariate(math.log(mean) - sigma ** 2 / 2, sigma)
+    raise ValueError(f"Unknown distribution: {distribution}")
+
+
+def tiling_grid(graph):
+    """Read the tiling grid of a workflow, None if it has no tile grid node"""
+    for node in graph.values():
+        if isinstance(node, dict) and node.get("class_type") == "StableContusionTileGrid":
+            return node.get("inputs", {}).get("grid_cols")
+    return None
+
+
+def topological_order(graph):
+    """Order the nodes so that every node comes after the nodes it links to"""
+    dependencies = {}
+    for node_id, node in graph.items():
+        links = {
+            str(value[0]) for value in node.get("inputs", {}).values()
+            if isinstance(value, list) and len(value) == 2 and str(value[0]) in graph
+        }
+        dependencies[node_id] = links
+    order = []
+    ready = sorted(node_id for node_id, links in dependencies.items() if not links)
+    remaining = {node_id: set(links) for node_id, links in dependencies.items() if links}
+    while ready:
+        node_id = ready.pop(0)
+        order.append(node_id)
+        for other, links in list(remaining.items()):
+            links.discard(node_id)
+            if not links:
+                del remaining[other]
+                ready.append(other)
+        ready.sort()
+    # Cycles are invalid in ComfyUI, keep whatever is left in id order
+    return order + sorted(remaining)
+
+
+class Prompt:
+    def __init__(self, number, prompt_id, graph, client_id):
+        self.number = number
+        self.prompt_id = prompt_id
+        self.graph = graph
+        self.client_id = client_id
+        self.inject = None
+
+    def queue_item(self):
+        return [self.number, self.prompt_id, self.graph, {"client_id": self.client_id}, []]
+
+
+class ComfyUIEmulator:
+    """
+    The emulator state and HTTP application. Run it in-process with start() or
+    from the command line.
+    """
+
+    def __init__(self, host="127.0.0.1", port=8188, output_dir=None, input_dir=None, latency=None,
+                 time_scale=0.02, output_size=1024, output_count=2, error_rate=0.0, hang_rate=0.0,
+                 seed=None, workflows_dir=WORKFLOWS_DIR):
+        self.host = host
+        self.port = port
+        self.output_dir = output_dir or os.environ.get("COMFY_OUTPUT_PATH", "/comfyui/output")
+        self.input_dir = input_dir or os.environ.get("COMFY_INPUT_PATH", "/comfyui/input")
+        self.latency = latency or DEFAULT_LATENCY
+        self.time_scale = time_scale
+        self.output_size = output_size
+        self.output_count = output_count
+        self.error_rate = error_rate
+        self.hang_rate = hang_rate
+        self.rng = random.Random(seed)
+        self.workflows_dir = workflows_dir
+
+        self.pending = []
+        self.running = None
+        self.history = {}
+        self.cache = set()
+        self.next_number = 0
+        self.injected = {"errors": 0, "hangs": 0}
+        self.sockets = {}
+        self.object_info = self._build_object_info()
+
+        self._queue_changed = None
+        self._interrupt = None
+        self._worker_task = None
+        self._loop = None
+        self._runner = None
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    # --------------------------------------------------------------- application
+
+    def create_app(self):
+        app = web.Application(client_max_size=1024 ** 3)
+        app.router.add_get("/", self.handle_root)
+        app.router.add_post("/prompt", self.handle_prompt)
+        app.router.add_get("/history", self.handle_history)
+        app.router.add_get("/history/{prompt_id}", self.handle_history)
+        app.router.add_get("/queue", self.handle_get_queue)
+        app.router.add_post("/queue", self.handle_post_queue)
+        app.router.add_post("/interrupt", self.handle_interrupt)
+        app.router.add_post("/free", self.handle_free)
+        app.router.add_get("/system_stats", self.handle_system_stats)
+        app.router.add_get("/object_info", self.handle_object_info)
+        app.router.add_get("/object_info/{node_class}", self.handle_object_info)
+        app.router.add_post("/upload/image", self.handle_upload_image)
+        app.router.add_get("/ws", self.handle_ws)
+        app.router.add_post("/emulator/inject", self.handle_inject)
+        app.on_startup.append(self._on_startup)
+        app.on_cleanup.append(self._on_cleanup)
+        return app
+
+    async def _on_startup(self, app):
+        self._queue_changed = asyncio.Event()
+        self._interrupt = asyncio.Event()
+        self._worker_task = asyncio.create_task(self._worker())
+
+    async def _on_cleanup(self, app):
+        self._worker_task.cancel()
+        for ws in list(self.sockets.values()):
+            await ws.close()
+
+    def start(self):
+        """Serve the emulator from a background thread"""
+        started = threading.Event()
+        errors = []
+
+        def serve():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            try:
+                self._runner = web.AppRunner(self.create_app())
+                self._loop.run_until_complete(self._runner.setup())
+                site = web.TCPSite(self._runner, self.host, self.port)
+                self._loop.run_until_complete(site.start())
+                if self.port == 0:
+                    self.port = site._server.sockets[0].getsockname()[1]
+            except Exception as e:
+                errors.append(e)
+                started.set()
+                return
+            started.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self._runner.cleanup())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=serve, name="comfyui-emulator", daemon=True)
+        self._thread.start()
+        started.wait(10)
+        if errors:
+            raise errors[0]
+
+    def shutdown(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(10)
+
+    # ------------------------------------------------------------------ handlers
+
+    async def handle_root(self, request):
+        return web.Response(text="OK")
+
+    async def handle_prompt(self, request):
+        try:
+            data = await request.json()
+        except ValueError:
+            return web.json_response({"error": {"type": "invalid_prompt", "message": "Invalid JSON"}}, status=400)
+        graph = data.get("prompt") if isinstance(data, dict) else None
+        if not isinstance(graph, dict) or not graph:
+            return web.json_response(
+                {"error": {"type": "invalid_prompt", "message": "No prompt provided"}, "node_errors": {}},
+                status=400,
+            )
+        invalid = [node_id for node_id, node in graph.items() if not isinstance(node, dict) or "class_type" not in node]
+        if invalid:
+            return web.json_response(
+                {
+                    "error": {"type": "invalid_prompt", "message": "Cannot execute because a node is missing the class_type property."},
+                    "node_errors": {node_id: {"errors": [], "class_type": None} for node_id in invalid},
+                },
+                status=400,
+            )
+
+        prompt = Prompt(self.next_number, str(uuid.uuid4()), graph, data.get("client_id"))
+        self.next_number += 1
+        if self.injected["errors"]:
+            self.injected["errors"] -= 1
+            prompt.inject = "error"
+        elif self.injected["hangs"]:
+            self.injected["hangs"] -= 1
+            prompt.inject = "hang"
+        elif self.rng.random() < self.error_rate:
+            prompt.inject = "error"
+        elif self.rng.random() < self.hang_rate:
+            prompt.inject = "hang"
+
+        self.pending.append(prompt)
+        self._queue_changed.set()
+        await self._send_status()
+        return web.json_response({"prompt_id": prompt.prompt_id, "number": prompt.number, "node_errors": {}})
+
+    async def handle_history(self, request):
+        prompt_id = request.match_info.get("prompt_id")
+        if prompt_id is None:
+            return web.json_response(self.history)
+        if prompt_id in self.history:
+            return web.json_response({prompt_id: self.history[prompt_id]})
+        return web.json_response({})
+
+    async def handle_get_queue(self, request):
+        return web.json_response({
+            "queue_running": [self.running.queue_item()] if self.running else [],
+            "queue_pending": [prompt.queue_item() for prompt in self.pending],
+        })
+
+    async def handle_post_queue(self, request):
+        data = await request.json()
+        if data.get("clear"):
+            self.pending.clear()
+        for prompt_id in data.get("delete", []):
+            self.pending = [prompt for prompt in self.pending if prompt.prompt_id != prompt_id]
+        await self._send_status()
+        return web.Response()
+
+    async def handle_interrupt(self, request):
+        if self.running is not None:
+            self._interrupt.set()
+        return web.Response()
+
+    async def handle_free(self, request):
+        data = await request.json() if request.can_read_body else {}
+        if data.get("unload_models") or data.get("free_memory"):
+            self.cache.clear()
+        return web.Response()
+
+    async def handle_system_stats(self, request):
+        return web.json_response({
+            "system": {
+                "os": os.name,
+                "python_version": "emulated",
+                "embedded_python": False,
+                "comfyui_version": "emulator",
+            },
+            "devices": [{
+                "name": "cuda:0 Emulated GPU",
+                "type": "cuda",
+                "index": 0,
+                "vram_total": 24 * 1024 ** 3,
+                "vram_free": (24 - min(len(self.cache), 20)) * 1024 ** 3,
+                "torch_vram_total": 24 * 1024 ** 3,
+                "torch_vram_free": (24 - min(len(self.cache), 20)) * 1024 ** 3,
+            }],
+        })
+
+    async def handle_object_info(self, request):
+        node_class = request.match_info.get("node_class")
+        if node_class is None:
+            return web.json_response(self.object_info)
+        if node_class in self.object_info:
+            return web.json_response({node_class: self.object_info[node_class]})
+        return web.json_response({})
+
+    async def handle_upload_image(self, request):
+        reader = await request.multipart()
+        fields = {}
+        image_name = None
+        image_path = None
+        async for part in reader:
+            if part.name == "image":
+                image_name = os.path.basename(part.filename or "image.png")
+                os.makedirs(self.input_dir, exist_ok=True)
+                image_path = os.path.join(self.input_dir, f".upload-{uuid.uuid4()}")
+                with open(image_path, "wb") as f:
+                    while True:
+                        chunk = await part.read_chunk(1024 * 1024)
+                        if not chunk:
+                            break
+                        f.write(chunk)
+            else:
+                fields[part.name] = await part.text()
+        if image_path is None:
+            return web.Response(status=400)
+
+        subfolder = fields.get("subfolder", "")
+        target_dir = os.path.join(self.input_dir, subfolder)
+        os.makedirs(target_dir, exist_ok=True)
+        name = image_name
+        if fields.get("overwrite", "").lower() not in ("true", "1"):
+            # Like ComfyUI, rename instead of overwriting an existing file
+            base, extension = os.path.splitext(image_name)
+            counter = 1
+            while os.path.exists(os.path.join(target_dir, name)):
+                name = f"{base} ({counter}){extension}"
+                counter += 1
+        os.replace(image_path, os.path.join(target_dir, name))
+        return web.json_response({"name": name, "subfolder": subfolder, "type": fields.get("type", "input")})
+
+    async def handle_ws(self, request):
+        client_id = request.query.get("clientId") or uuid.uuid4().hex
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.sockets[client_id] = ws
+        try:
+            await ws.send_json({"type": "status", "data": {"status": self._status(), "sid": client_id}})
+            async for _ in ws:
+                pass
+        finally:
+            if self.sockets.get(client_id) is ws:
+                del self.sockets[client_id]
+        return ws
+
+    async def handle_inject(self, request):
+        data = await request.json()
+        self.injected["errors"] += int(data.get("errors", 0))
+        self.injected["hangs"] += int(data.get("hangs", 0))
+        return web.json_response(self.injected)
+
+    # ----------------------------------------------------------------- execution
+
+    def _status(self):
+        return {"exec_info": {"queue_remaining": len(self.pending) + (1 if self.running else 0)}}
+
+    async def _send(self, client_id, event_type, data):
+        ws = self.sockets.get(client_id) if client_id else None
+        if ws is None or ws.closed:
+            return
+        try:
+            await ws.send_json({"type": event_type, "data": data})
+        except ConnectionError:
+            pass
+
+    async def _send_status(self):
+        for client_id in list(self.sockets):
+            await self._send(client_id, "status", {"status": self._status()})
+
+    async def _worker(self):
+        while True:
+            while not self.pending:
+                self._queue_changed.clear()
+                await self._queue_changed.wait()
+            self.running = self.pending.pop(0)
+            self._interrupt.clear()
+            try:
+                await self._execute(self.running)
+            finally:
+                self.running = None
+                await self._send_status()
+
+    def _signatures(self, graph, order):
+        """Cache keys of the nodes: their inputs, the keys of their upstream nodes and input image files"""
+        signatures = {}
+        for node_id in order:
+            node = graph[node_id]
+            inputs = {}
+            for name, value in node.get("inputs", {}).items():
+                if isinstance(value, list) and len(value) == 2 and str(value[0]) in signatures:
+                    inputs[name] = [signatures[str(value[0])], value[1]]
+                elif name == "image" and isinstance(value, str):
+                    # Image loaders re-execute when the file changes
+                    path = os.path.join(self.input_dir, value)
+                    stat = os.stat(path) if os.path.exists(path) else None
+                    inputs[name] = [value, stat.st_mtime_ns if stat else None, stat.st_size if stat else None]
+                else:
+                    inputs[name] = value
+            payload = json.dumps([node.get("class_type"), inputs], sort_keys=True, default=str)
+            signatures[node_id] = hashlib.sha1(payload.encode()).hexdigest()
+        return signatures
+
+    async def _execute(self, prompt):
+        graph = prompt.graph
+        order = topological_order(graph)
+        signatures = self._signatures(graph, order)
+        cached = [node_id for node_id in order if signatures[node_id] in self.cache]
+        executed_nodes = [node_id for node_id in order if signatures[node_id] not in self.cache]
+        messages = []
+
+        def message(event_type, data):
+            data = {**data, "prompt_id": prompt.prompt_id, "timestamp": int(time.time() * 1000)}
+            messages.append([event_type, data])
+            return data
+
+        self.history.pop(prompt.prompt_id, None)
+        await self._send(prompt.client_id, "execution_start", message("execution_start", {}))
+        await self._send(prompt.client_id, "execution_cached", message("execution_cached", {"nodes": cached}))
+
+        grid = tiling_grid(graph)
+        spec = self.latency.get(str(grid), self.latency.get("default", {}))
+        total_weight = sum(NODE_WEIGHTS.get(graph[node_id].get("class_type"), 1) for node_id in order) or 1
+        duration = sample_duration(spec, self.rng) * self.time_scale
+
+        failing_node = None
+        if prompt.inject and executed_nodes:
+            failing_node = self.rng.choice(executed_nodes)
+
+        for node_id in executed_nodes:
+            class_type = graph[node_id].get("class_type")
+            await self._send(prompt.client_id, "executing", {"node": node_id, "display_node": node_id, "prompt_id": prompt.prompt_id})
+
+            if node_id == failing_node and prompt.inject == "hang":
+                # Never finishes on its own, only /interrupt ends it
+                await self._interrupt.wait()
+            node_time = duration * NODE_WEIGHTS.get(class_type, 1) / total_weight
+            try:
+                await asyncio.wait_for(self._interrupt.wait(), timeout=node_time)
+            except asyncio.TimeoutError:
+                pass
+            if self._interrupt.is_set():
+                data = message("execution_interrupted", {
+                    "node_id": node_id,
+                    "node_type": class_type,
+                    "executed": [other for other in order if other in cached or other == node_id],
+                })
+                await self._send(prompt.client_id, "execution_interrupted", data)
+                self._finish(prompt, messages, {}, "error")
+                return
+            if node_id == failing_node and prompt.inject == "error":
+                data = message("execution_error", {
+                    "node_id": node_id,
+                    "node_type": class_type,
+                    "executed": cached,
+                    "exception_message": "Injected error",
+                    "exception_type": "RuntimeError",
+                    "traceback": [],
+                    "current_inputs": {},
+                    "current_outputs": {},
+                })
+                await self._send(prompt.client_id, "execution_error", data)
+                self._finish(prompt, messages, {}, "error")
+                return
+            self.cache.add(signatures[node_id])
+
+        outputs = await asyncio.get_running_loop().run_in_executor(None, self._write_outputs, prompt, order)
+        for node_id, output in outputs.items():
+            await self._send(prompt.client_id, "executed", {"node": node_id, "display_node": node_id, "output": output, "prompt_id": prompt.prompt_id})
+        await self._send(prompt.client_id, "executing", {"node": None, "prompt_id": prompt.prompt_id})
+        await self._send(prompt.client_id, "execution_success", message("execution_success", {}))
+        self._finish(prompt, messages, outputs, "success")
+
+    def _finish(self, prompt, messages, outputs, status):
+        self.history[prompt.prompt_id] = {
+            "prompt": prompt.queue_item(),
+            "outputs": outputs,
+            "status": {"status_str": status, "completed": status == "success", "messages": messages},
+        }
+
+    def _write_outputs(self, prompt, order):
+        """Write the output files like the PSD batch saver does"""
+        batch_dir = os.path.join(self.output_dir, "batch_output")
+        psd_dir = os.path.join(self.output_dir, "psd_output")
+        os.makedirs(batch_dir, exist_ok=True)
+        os.makedirs(psd_dir, exist_ok=True)
+
+        prefix = prompt.prompt_id[:8]
+        images = []
+        for i in range(1, self.output_count + 1):
+            filename = f"result_{prefix}_{i}.png"
+            self._write_file(os.path.join(batch_dir, filename))
+            images.append({"filename": filename, "subfolder": "batch_output", "type": "output"})
+        psd_name = f"result_{prefix}.psd"
+        self._write_file(os.path.join(psd_dir, psd_name))
+        images.append({"filename": psd_name, "subfolder": "psd_output", "type": "output"})
+        with open(os.path.join(psd_dir, f"psd_saver_report_{prefix}.txt"), "w") as f:
+            f.write(f"PSD processing report\nFiles processed: {self.output_count}\n")
+
+        output_node = next(
+            (node_id for node_id in order if "Save" in str(prompt.graph[node_id].get("class_type"))),
+            order[-1] if order else "output",
+        )
+        return {output_node: {"images": images}}
+
+    def _write_file(self, path):
+        with open(path, "wb") as f:
+            remaining = self.output_size
+            while remaining > 0:
+                chunk = min(remaining, 1024 * 1024)
+                f.write(os.urandom(chunk))
+                remaining -= chunk
+
+    def _build_object_info(self):
+        """Describe every node type used by the bundled workflows"""
+        object_info = {}
+        if not os.path.isdir(self.workflows_dir):
+            return object_info
+        for variant in sorted(os.listdir(self.workflows_dir)):
+            path = os.path.join(self.workflows_dir, variant, "workflow.json")
+            if not os.path.exists(path):
+                continue
+            with open(path) as f:
+                graph = json.load(f)
+            for node in graph.values():
+                class_type = node.get("class_type")
+                info = object_info.setdefault(class_type, {
+                    "input": {"required": {}, "optional": {}},
+                    "output": [],
+                    "name": class_type,
+                    "display_name": class_type,
+                    "category": "emulated",
+                    "output_node": "Save" in class_type,
+                })
+                for name in node.get("inputs", {}):
+                    info["input"]["required"].setdefault(name, ["*"])
+        return object_info
+
+
+def parse_latency(values):
+    """Parse --latency GRID=DISTRIBUTION:MEAN[,CV] options into a latency config"""
+    latency = {key: dict(value) for key, value in DEFAULT_LATENCY.items()}
+    for value in values or []:
+        grid, _, spec = value.partition("=")
+        distribution, _, parameters = spec.partition(":")
+        mean, _, cv = parameters.partition(",")
+        latency[grid] = {"distribution": distribution, "mean": float(mean), "cv": float(cv or 0)}
+    return latency
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8188)
+    parser.add_argument("--output-dir", default=os.environ.get("COMFY_OUTPUT_PATH", "/comfyui/output"))
+    parser.add_argument("--input-dir", default=os.environ.get("COMFY_INPUT_PATH", "/comfyui/input"))
+    parser.add_argument(
+        "--latency", action="append",
+        help="Execution time per tiling grid, e.g. 2=lognormal:25,0.15 or default=fixed:10 (repeatable)",
+    )
+    parser.add_argument("--latency-config", help="JSON file with the execution time distribution per tiling grid")
+    parser.add_argument("--time-scale", type=float, default=0.02, help="Multiply all execution times by this factor")
+    parser.add_argument("--output-size", type=int, default=1024, help="Size of each output image in bytes")
+    parser.add_argument("--output-count", type=int, default=2, help="Number of PNG outputs per prompt, next to one PSD")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability that a prompt fails")
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="Probability that a prompt hangs until /interrupt")
+    parser.add_argument("--seed", type=int, help="Random seed for reproducible runs")
+    args = parser.parse_args()
+
+    latency = parse_latency(args.latency)
+    if args.latency_config:
+        with open(args.latency_config) as f:
+            latency.update(json.load(f))
+
+    emulator = ComfyUIEmulator(
+        host=args.host,
+        port=args.port,
+        output_dir=args.output_dir,
+        input_dir=args.input_dir,
+        latency=latency,
+        time_scale=args.time_scale,
+        output_size=args.output_size,
+        output_count=args.output_count,
+        error_rate=args.error_rate,
+        hang_rate=args.hang_rate,
+        seed=args.seed,
+    )
+    print(f"ComfyUI emulator listening on {emulator.url}")
+    web.run_app(emulator.create_app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
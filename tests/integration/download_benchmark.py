@@ -0,0 +1,177 @@
+"""
+Download throughput benchmark of the input path.
+
+Runs `rp_download.download` against mock_http_server.py for every
+combination of input file size, DOWNLOAD_CONCURRENCY and DOWNLOAD_RANGE_SIZE,
+and reports MB/s and CPU time of the downloading process. The HTTP server
+runs in its own process and can cap the bandwidth of each response with
+--stream-mbps, like a cross-region link where a single TCP stream is the
+bottleneck. --no-ranges measures the single stream fallback.
+
+Usage:
+    python download_benchmark.py --file-sizes 64MB,512MB --concurrency 1,4,8 \\
+        --range-sizes 8MB,32MB --stream-mbps 400
+"""
+import argparse
+import datetime
+import hashlib
+import itertools
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(SCRIPT_DIR)
+sys.path.append(os.path.abspath(os.path.join(SCRIPT_DIR, "../..")))
+
+from benchmark import SIZE_UNITS, format_size, parse_size, summarize
+from upload_benchmark import generate_file, parse_list
+
+HTTP_PORT = 8001
+
+
+class HttpServerProcess:
+    """Runs mock_http_server.py in a subprocess"""
+
+    def __init__(self, directory, stream_mbps, ranges, port=HTTP_PORT, verbose=False):
+        self.url = f"http://127.0.0.1:{port}"
+        self.command = [
+            sys.executable, os.path.join(SCRIPT_DIR, "mock_http_server.py"),
+            "--port", str(port),
+            "--directory", directory,
+            "--stream-mbps", str(stream_mbps),
+        ]
+        if not ranges:
+            self.command.append("--no-ranges")
+        if not verbose:
+            self.command.append("--quiet")
+        self.verbose = verbose
+        self.process = None
+
+    def start(self):
+        output = None if self.verbose else subprocess.DEVNULL
+        self.process = subprocess.Popen(self.command, stdout=output, stderr=output)
+        for _ in range(100):
+            try:
+                if requests.get(self.url, timeout=1).status_code == 200:
+                    return
+            except requests.RequestException:
+                pass
+            time.sleep(0.1)
+        raise RuntimeError("Mock HTTP server did not start properly")
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait()
+
+
+def sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(SIZE_UNITS["MB"]), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def run_cell(url, save_path, concurrency, range_size, expected_sha256):
+    from src import rp_download
+
+    cpu_before = os.times()
+    start = time.perf_counter()
+    result = rp_download.download(url, save_path, concurrency=concurrency, range_size=range_size)
+    wall_seconds = time.perf_counter() - start
+    cpu_after = os.times()
+    return {
+        "result": result,
+        "wall_seconds": wall_seconds,
+        "cpu_seconds": (cpu_after.user - cpu_before.user) + (cpu_after.system - cpu_before.system),
+        "verified": sha256(save_path) == expected_sha256,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--file-sizes", default="64MB", help="Comma separated input file sizes")
+    parser.add_argument("--concurrency", default="1,4,8", help="Comma separated DOWNLOAD_CONCURRENCY values")
+    parser.add_argument("--range-sizes", default="8MB,16MB", help="Comma separated DOWNLOAD_RANGE_SIZE values")
+    parser.add_argument("--repeat", type=int, default=3, help="Downloads per cell")
+    parser.add_argument("--stream-mbps", type=float, default=400, help="Bandwidth of each response, 0 for unlimited")
+    parser.add_argument("--no-ranges", action="store_true", help="Serve without range support")
+    parser.add_argument("--output", default="download_benchmark_results.json", help="JSON file to write the results to")
+    parser.add_argument("--verbose", action="store_true", help="Keep the mock server logs")
+    args = parser.parse_args()
+
+    output_path = os.path.abspath(args.output)
+    workdir = tempfile.mkdtemp(prefix="download-benchmark-")
+    source_dir = os.path.join(workdir, "sources")
+    os.makedirs(source_dir)
+    server = HttpServerProcess(source_dir, args.stream_mbps, not args.no_ranges, verbose=args.verbose)
+    server.start()
+
+    cells = []
+    try:
+        for file_size in parse_list(args.file_sizes, parse_size):
+            name = f"input_{format_size(file_size)}.bin"
+            generate_file(os.path.join(source_dir, name), file_size)
+            expected_sha256 = sha256(os.path.join(source_dir, name))
+
+            for concurrency, range_size in itertools.product(parse_list(args.concurrency), parse_list(args.range_sizes, parse_size)):
+                measurements = [
+                    run_cell(f"{server.url}/{name}", os.path.join(workdir, "input.jpg"), concurrency, range_size, expected_sha256)
+                    for _ in range(args.repeat)
+                ]
+                wall = [m["wall_seconds"] for m in measurements if m["verified"]]
+                cell = {
+                    "file_size_bytes": file_size,
+                    "concurrency": concurrency,
+                    "range_size_bytes": range_size,
+                    "mode": measurements[0]["result"]["mode"],
+                    "repeats": len(measurements),
+                    "failures": sum(1 for m in measurements if not m["verified"]),
+                    "wall_seconds": summarize(wall),
+                    "mb_per_second": summarize([file_size / SIZE_UNITS["MB"] / seconds for seconds in wall if seconds]),
+                    "cpu_seconds": summarize([m["cpu_seconds"] for m in measurements]),
+                }
+                mb_per_second = cell["mb_per_second"].get("p50")
+                print(
+                    f"{format_size(file_size):>7} concurrency={concurrency} range={format_size(range_size):>5} "
+                    f"mode={cell['mode']:>6}  MB/s={mb_per_second or 0:>8.1f} "
+                    f"cpu={cell['cpu_seconds'].get('p50') or 0:.3f}s failures={cell['failures']}"
+                )
+                cells.append(cell)
+            os.remove(os.path.join(source_dir, name))
+    finally:
+        server.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "host": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+        },
+        "config": {
+            "repeat": args.repeat,
+            "stream_mbps": args.stream_mbps,
+            "ranges": not args.no_ranges,
+        },
+        "cells": cells,
+    }
+    with open(output_path, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {output_path}")
+
+    return 1 if any(cell["failures"] for cell in cells) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+"""
+Import-time regression benchmark of the handler.
+
+Imports rp_handler in a number of fresh interpreters with `-X importtime`
+and reports the median cumulative import time together with the slowest
+modules. Optional dependencies that must stay lazy (runpod, tusclient,
+loki_logger_handler) are checked to not be imported at all.
+
+Compare against a saved baseline to catch regressions:
+
+    python import_benchmark.py --save-baseline import_baseline.json
+    python import_benchmark.py --baseline import_baseline.json --max-regression 0.25
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, "../../src"))
+
+# Only imported on demand, see rp_handler
+LAZY_MODULES = ("runpod", "tusclient", "loki_logger_handler")
+
+
+def parse_importtime(stderr):
+    """
+    Parse the output of `python -X importtime`.
+
+    Returns:
+        list: (module, self microseconds, cumulative microseconds) per imported module.
+    """
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules.append((name.strip(), int(self_us), int(cumulative_us)))
+    return modules
+
+
+def measure_once(module):
+    env = {key: value for key, value in os.environ.items() if key != "LOKI_URL"}
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=SRC_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    modules = parse_importtime(process.stderr)
+    total = next(cumulative for name, _, cumulative in modules if name == module)
+    return total / 1e6, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="rp_handler", help="Module to import")
+    parser.add_argument("--runs", type=int, default=10, help="Fresh interpreters to measure")
+    parser.add_argument("--top", type=int, default=10, help="Slowest modules to report")
+    parser.add_argument("--baseline", help="Fail if slower than the median in this baseline file")
+    parser.add_argument("--max-regression", type=float, default=0.25, help="Allowed slowdown against the baseline")
+    parser.add_argument("--save-baseline", help="Write the results to this file as the new baseline")
+    args = parser.parse_args()
+
+    totals = []
+    runs = []
+    for _ in range(args.runs):
+        total, modules = measure_once(args.module)
+        totals.append(total)
+        runs.append(modules)
+
+    median = statistics.median(totals)
+    modules = runs[totals.index(min(totals, key=lambda total: abs(total - median)))]
+    slowest = sorted(modules, key=lambda module: module[1], reverse=True)[:args.top]
+    imported_lazy = sorted({
+        lazy for name, _, _ in modules for lazy in LAZY_MODULES
+        if name == lazy or name.startswith(lazy + ".")
+    })
+
+    results = {
+        "module": args.module,
+        "python": platform.python_version(),
+        "runs": args.runs,
+        "median_seconds": round(median, 4),
+        "min_seconds": round(min(totals), 4),
+        "max_seconds": round(max(totals), 4),
+        "module_count": len(modules),
+        "imported_lazy_modules": imported_lazy,
+        "slowest_modules": [
+            {"module": name, "self_seconds": round(self_us / 1e6, 4), "cumulative_seconds": round(cumulative_us / 1e6, 4)}
+            for name, self_us, cumulative_us in slowest
+        ],
+    }
+
+    print(f"import {args.module}: median {median:.3f}s, min {min(totals):.3f}s, max {max(totals):.3f}s, {len(modules)} modules")
+    for entry in results["slowest_modules"]:
+        print(f"  {entry['self_seconds']:>8.4f}s self {entry['cumulative_seconds']:>8.4f}s cumulative  {entry['module']}")
+
+    failed = False
+    if imported_lazy:
+        print(f"FAIL: lazily loaded modules were imported: {', '.join(imported_lazy)}")
+        failed = True
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        limit = baseline["median_seconds"] * (1 + args.max_regression)
+        print(f"baseline median {baseline['median_seconds']:.3f}s, limit {limit:.3f}s")
+        if median > limit:
+            print(f"FAIL: import time regressed by {median / baseline['median_seconds'] - 1:.0%}")
+            failed = True
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline written to {os.path.abspath(args.save_baseline)}")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,340 @@
+"""
+Trace-driven load replay against the local serve API.
+
+Starts the mock ComfyUI, HTTP and TUS servers and the handler with
+`--rp_serve_api`, then replays job arrivals against `/runsync`:
+
+- open loop (default): jobs are sent at the arrival times of the trace,
+  independent of how fast the worker answers. `--rates` replaces the recorded
+  arrival times with Poisson arrivals at each given rate (jobs per second)
+  while keeping the recorded job mix and sizes.
+- closed loop (`--concurrency 1,2,4`): each of N clients sends its next job as
+  soon as the previous one returned, to find the saturation throughput.
+
+The trace is either recorded with JOB_TRACE_FILE (see src/rp_job_trace.py) or
+generated with `--synthetic N`.
+
+Usage:
+    python load_replay.py --trace jobs.jsonl --rates 0.5,1,2 --output replay.json
+    python load_replay.py --synthetic 50 --input-sizes 1MB,8MB --concurrency 1,2,4
+"""
+import argparse
+import concurrent.futures
+import datetime
+import json
+import logging
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+from benchmark import SCRIPT_DIR, VARIANTS, MockComfyUI, clear_uploads, parse_size, summarize
+
+from src import rp_job_trace
+
+# Port of the handler's local API; 8000 is taken by the mock HTTP server
+API_PORT = 8010
+PHASES = ("download", "queue", "execution", "upload", "total")
+
+
+def synthetic_trace(count, rate, input_sizes, output_sizes, seed):
+    """Generate a trace with Poisson arrivals and a uniform job mix"""
+    rng = random.Random(seed)
+    arrived_at = 0.0
+    records = []
+    for _ in range(count):
+        arrived_at += rng.expovariate(rate)
+        tiling, denoise = rng.choice(VARIANTS)
+        records.append({
+            "arrived_at": arrived_at,
+            "params": {"tiling": tiling, "denoise": denoise},
+            "input_size_bytes": rng.choice(input_sizes),
+            "output_size_bytes": rng.choice(output_sizes),
+        })
+    return records
+
+
+def with_poisson_arrivals(records, rate, seed):
+    """Keep the job mix of a trace but replace its arrival times"""
+    rng = random.Random(seed)
+    arrived_at = 0.0
+    replaced = []
+    for record in records:
+        arrived_at += rng.expovariate(rate)
+        replaced.append({**record, "arrived_at": arrived_at})
+    return replaced
+
+
+def size_bucket(size):
+    """Round input sizes up to a power of two so that only a few input files are needed"""
+    bucket = 4096
+    while bucket < (size or 0):
+        bucket *= 2
+    return bucket
+
+
+class HandlerAPI:
+    """Runs rp_handler.py with --rp_serve_api in a subprocess"""
+
+    def __init__(self, workdir, verbose):
+        self.workdir = workdir
+        self.verbose = verbose
+        self.url = f"http://127.0.0.1:{API_PORT}"
+        self.process = None
+
+    def start(self):
+        output = None if self.verbose else subprocess.DEVNULL
+        self.process = subprocess.Popen(
+            [
+                sys.executable, os.path.join(SCRIPT_DIR, "../../src/rp_handler.py"),
+                "--rp_serve_api", "--rp_api_host", "127.0.0.1", "--rp_api_port", str(API_PORT),
+            ],
+            cwd=self.workdir,
+            env=os.environ.copy(),
+            stdout=output,
+            stderr=output,
+        )
+        for _ in range(300):
+            try:
+                if requests.get(f"{self.url}/docs", timeout=1).status_code == 200:
+                    return
+            except requests.RequestException:
+                pass
+            time.sleep(0.1)
+        raise RuntimeError("Handler API did not start properly")
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait()
+
+
+class Replay:
+    """Sends jobs to the handler API and collects the client and server side latencies"""
+
+    def __init__(self, api_url, http_url, tus_url):
+        self.api_url = api_url
+        self.http_url = http_url
+        self.tus_url = tus_url
+        self.lock = threading.Lock()
+        self.samples = []
+
+    def send(self, record, scheduled_at=None):
+        job_input = {
+            "input": f"{self.http_url}/input_{size_bucket(record.get('input_size_bytes'))}.bin",
+            "output": self.tus_url,
+            "params": record["params"],
+        }
+        start = time.perf_counter()
+        try:
+            response = requests.post(f"{self.api_url}/runsync", json={"input": job_input}, timeout=3600)
+            body = response.json()
+            error = body.get("error") if body.get("status") != "COMPLETED" else None
+            output = body.get("output") or {}
+        except (requests.RequestException, ValueError) as e:
+            error = str(e)
+            output = {}
+        end = time.perf_counter()
+
+        sample = {
+            "latency": end - start,
+            # How late the request was sent compared to the schedule, i.e. client side overload
+            "send_lag": start - scheduled_at if scheduled_at is not None else 0,
+            "finished_at": end,
+            "error": error,
+            "timings": output.get("timings", {}),
+        }
+        with self.lock:
+            self.samples.append(sample)
+
+    def report(self, started_at):
+        ok = [sample for sample in self.samples if not sample["error"]]
+        wall = max((sample["finished_at"] for sample in self.samples), default=started_at) - started_at
+        return {
+            "sent": len(self.samples),
+            "completed": len(ok),
+            "errors": len(self.samples) - len(ok),
+            "error_messages": sorted({sample["error"] for sample in self.samples if sample["error"]})[:10],
+            "wall_seconds": round(wall, 4),
+            "throughput_jobs_per_second": round(len(ok) / wall, 4) if wall > 0 else None,
+            "latency": summarize([sample["latency"] for sample in ok]),
+            # Time spent waiting for the worker, outside of the handler
+            "wait": summarize([sample["latency"] - sample["timings"]["total"] for sample in ok if "total" in sample["timings"]]),
+            "send_lag": summarize([sample["send_lag"] for sample in self.samples]),
+            "phases": {
+                phase: summarize([sample["timings"][phase] for sample in ok if phase in sample["timings"]])
+                for phase in PHASES
+            },
+        }
+
+
+def run_open_loop(api, http_server, tus_server, records):
+    replay = Replay(api.url, http_server.url, tus_server.url)
+    offset = records[0]["arrived_at"] if records else 0
+    threads = []
+    started_at = time.perf_counter()
+    for record in records:
+        scheduled_at = started_at + record["arrived_at"] - offset
+        delay = scheduled_at - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        thread = threading.Thread(target=replay.send, args=(record, scheduled_at), daemon=True)
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    clear_uploads(tus_server)
+    return replay.report(started_at)
+
+
+def run_closed_loop(api, http_server, tus_server, records, concurrency):
+    replay = Replay(api.url, http_server.url, tus_server.url)
+    started_at = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(replay.send, records))
+    clear_uploads(tus_server)
+    return replay.report(started_at)
+
+
+def print_run(label, run):
+    print(
+        f"\n{label}: completed={run['completed']}/{run['sent']} throughput={run['throughput_jobs_per_second']} jobs/s "
+        f"latency p50={run['latency'].get('p50')} p95={run['latency'].get('p95')} p99={run['latency'].get('p99')} "
+        f"wait p95={run['wait'].get('p95')}"
+    )
+    for message in run["error_messages"]:
+        print(f"  error: {message}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trace", help="JSONL trace recorded with JOB_TRACE_FILE")
+    parser.add_argument("--synthetic", type=int, help="Generate a synthetic trace with this many jobs instead")
+    parser.add_argument("--rate", type=float, default=1.0, help="Arrival rate of the synthetic trace in jobs per second")
+    parser.add_argument("--input-sizes", default="1MB", help="Input sizes of the synthetic trace")
+    parser.add_argument("--output-sizes", default="3MB", help="Total output sizes per job of the synthetic trace")
+    parser.add_argument("--rates", help="Open loop: replay at these Poisson arrival rates instead of the recorded times")
+    parser.add_argument("--speed", type=float, default=1.0, help="Open loop: speed up the recorded arrival times by this factor")
+    parser.add_argument("--concurrency", help="Closed loop: comma separated numbers of concurrent clients to sweep")
+    parser.add_argument("--limit", type=int, help="Only replay the first N jobs of the trace")
+    parser.add_argument("--comfy-delay", type=float, default=0.5, help="Simulated ComfyUI execution time in seconds")
+    parser.add_argument(
+        "--emulator-time-scale", type=float,
+        help="Use comfyui_emulator.py with its per tiling grid latencies scaled by this factor instead of the mock",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for synthetic traces and arrivals")
+    parser.add_argument("--output", default="replay_results.json", help="JSON file to write the results to")
+    parser.add_argument("--verbose", action="store_true", help="Show the handler and mock server logs")
+    args = parser.parse_args()
+    output_path = os.path.abspath(args.output)
+
+    if args.synthetic:
+        records = synthetic_trace(
+            args.synthetic,
+            args.rate,
+            [parse_size(size) for size in args.input_sizes.split(",")],
+            [parse_size(size) for size in args.output_sizes.split(",")],
+            args.seed,
+        )
+    elif args.trace:
+        records = rp_job_trace.read_trace(args.trace)
+    else:
+        parser.error("either --trace or --synthetic is required")
+    records = [record for record in records if record.get("params")][:args.limit]
+    if not records:
+        parser.error("the trace contains no jobs")
+
+    # The mock ComfyUI writes the same output size for every job, use the median of the trace.
+    # Every job produces three images next to a small report.
+    output_sizes = sorted(record.get("output_size_bytes") or 0 for record in records)
+    image_size = output_sizes[len(output_sizes) // 2] // 3
+
+    workdir = tempfile.mkdtemp(prefix="comfy-replay-")
+    input_dir = os.path.join(workdir, "inputs")
+    os.makedirs(input_dir)
+    os.chdir(workdir)
+    os.environ["COMFY_INPUT_PATH"] = os.path.join(workdir, "comfyui_input")
+    os.environ["COMFY_OUTPUT_PATH"] = os.path.join(workdir, "comfyui_output")
+    os.environ.setdefault("COMFY_POLLING_INTERVAL_MS", "50")
+    os.environ.setdefault("COMFY_POLLING_MAX_RETRIES", "100000")
+    if not args.verbose:
+        os.environ.setdefault("UVICORN_LOG_LEVEL", "warning")
+    os.makedirs(os.environ["COMFY_INPUT_PATH"])
+    os.makedirs(os.environ["COMFY_OUTPUT_PATH"])
+
+    for bucket in {size_bucket(record.get("input_size_bytes")) for record in records}:
+        with open(os.path.join(input_dir, f"input_{bucket}.bin"), "wb") as f:
+            f.write(os.urandom(bucket))
+
+    from mock_http_server import MockHTTPServer
+    from mock_tus_server import TusServer
+
+    if not args.verbose:
+        for name in ("werkzeug", "TUS-Server"):
+            logging.getLogger(name).setLevel(logging.WARNING)
+
+    http_server = MockHTTPServer(directory=input_dir)
+    http_server.start()
+    tus_server = TusServer()
+    tus_server.start()
+    comfy = MockComfyUI(os.environ["COMFY_OUTPUT_PATH"], args.comfy_delay, image_size, workdir, args.emulator_time_scale)
+    comfy.start()
+    api = HandlerAPI(workdir, args.verbose)
+    api.start()
+
+    runs = []
+    try:
+        if args.concurrency:
+            for concurrency in (int(value) for value in args.concurrency.split(",")):
+                run = run_closed_loop(api, http_server, tus_server, records, concurrency)
+                run.update({"mode": "closed", "concurrency": concurrency})
+                print_run(f"concurrency={concurrency}", run)
+                runs.append(run)
+        elif args.rates:
+            for rate in (float(value) for value in args.rates.split(",")):
+                run = run_open_loop(api, http_server, tus_server, with_poisson_arrivals(records, rate, args.seed))
+                run.update({"mode": "open", "offered_rate": rate})
+                print_run(f"rate={rate}", run)
+                runs.append(run)
+        else:
+            offset = records[0]["arrived_at"]
+            scaled = [{**record, "arrived_at": (record["arrived_at"] - offset) / args.speed} for record in records]
+            span = scaled[-1]["arrived_at"]
+            run = run_open_loop(api, http_server, tus_server, scaled)
+            run.update({"mode": "open", "speed": args.speed, "offered_rate": round(len(scaled) / span, 4) if span else None})
+            print_run(f"trace x{args.speed}", run)
+            runs.append(run)
+    finally:
+        api.stop()
+        comfy.stop()
+        tus_server.shutdown()
+        os.chdir(SCRIPT_DIR)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "config": {
+            "trace": args.trace,
+            "synthetic": args.synthetic,
+            "jobs": len(records),
+            "comfy_delay_seconds": args.comfy_delay,
+            "emulator_time_scale": args.emulator_time_scale,
+            "mock_image_size_bytes": image_size,
+        },
+        "runs": runs,
+    }
+    with open(output_path, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {output_path}")
+
+    return 1 if any(run["errors"] for run in runs) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
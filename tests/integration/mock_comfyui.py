@@ -9,12 +9,24 @@ app = Flask(__name__)
 # Store prompts and their "outputs"
 prompts = {}
 output_dir = os.environ.get('COMFY_OUTPUT_PATH', '/comfyui/output')
+input_dir = os.environ.get('COMFY_INPUT_PATH', '/comfyui/input')
 test_data_dir = os.environ.get('TEST_DATA_DIR', 'data/comfy')
+# Simulated execution time of a prompt in seconds
+execution_delay = float(os.environ.get('MOCK_COMFY_DELAY_S', 1))
+# Size of each generated image file in bytes (0 keeps the short test contents)
+output_size = int(os.environ.get('MOCK_OUTPUT_SIZE_BYTES', 0))
 
 # Ensure output directory exists
 os.makedirs(output_dir, exist_ok=True)
 os.makedirs(test_data_dir, exist_ok=True)
 
+def write_output(path, content):
+    """Write an output file, padded to MOCK_OUTPUT_SIZE_BYTES if set"""
+    with open(path, 'wb') as f:
+        f.write(content)
+        if output_size > len(content):
+            f.write(os.urandom(output_size - len(content)))
+
 # For debugging - log the prompts dictionary
 def log_prompts():
     print(f"ComfyUI Mock Server: Current prompts: {list(prompts.keys())}")
@@ -39,7 +51,7 @@ def handle_prompt():
         
         # Schedule completion after a brief delay
         def complete_job():
-            time.sleep(1)  # Reduced time for faster tests
+            time.sleep(execution_delay)  # Reduced time for faster tests
             
             # Create subdirectories like real ComfyUI
             batch_output_dir = os.path.join(output_dir, 'batch_output')
@@ -51,13 +63,11 @@ def handle_prompt():
             # Batch output files
             for i in range(1, 3):  # 2 PNG files
                 test_image_path = os.path.join(batch_output_dir, f'result_image_{i}.png')
-                with open(test_image_path, 'wb') as f:
-                    f.write(f'Result image {i}'.encode())
+                write_output(test_image_path, f'Result image {i}'.encode())
             
             # PSD output files
             psd_path = os.path.join(psd_output_dir, 'result.psd')
-            with open(psd_path, 'wb') as f:
-                f.write(b'Result image 3')
+            write_output(psd_path, b'Result image 3')
             
             # Create a report file in psd_output
             report_path = os.path.join(psd_output_dir, 'psd_saver_report.txt')
@@ -121,14 +131,23 @@ def upload_image():
         return jsonify({'success': False, 'error': 'No image in request'})
     
     image = request.files['image']
-    filename = image.filename
+    filename = os.path.basename(image.filename)
+    subfolder = request.form.get('subfolder', '')
     
-    # Save the image to a temporary location
-    save_path = os.path.join(output_dir, filename)
+    # Save the image to the input directory, renamed like ComfyUI unless overwrite is set
+    target_dir = os.path.join(input_dir, subfolder)
+    os.makedirs(target_dir, exist_ok=True)
+    if request.form.get('overwrite', '').lower() not in ('true', '1'):
+        base, extension = os.path.splitext(filename)
+        counter = 1
+        while os.path.exists(os.path.join(target_dir, filename)):
+            filename = f"{base} ({counter}){extension}"
+            counter += 1
+    save_path = os.path.join(target_dir, filename)
     print(f"ComfyUI Mock Server: Saving uploaded image to {save_path}")
     image.save(save_path)
     
-    return jsonify({'success': True, 'filename': filename})
+    return jsonify({'name': filename, 'subfolder': subfolder, 'type': request.form.get('type', 'input')})
 
 @app.route('/', methods=['GET'])
 def health_check():
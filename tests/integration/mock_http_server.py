@@ -1,17 +1,42 @@
-from flask import Flask, send_from_directory, jsonify
+from flask import Flask, Response, request, jsonify
+from werkzeug.utils import safe_join
+import argparse
+import logging
+import mimetypes
 import threading
 import os
+import re
 import time
 
 app = Flask(__name__)
 
+RANGE_PATTERN = re.compile(r'bytes=(\d*)-(\d*)$')
+BLOCK_SIZE = 64 * 1024
+
+
 class MockHTTPServer:
-    def __init__(self, host='127.0.0.1', port=8000, directory=None):
+    """
+    Serves the files of a directory, with single byte range requests.
+
+    Args:
+        accept_ranges (bool): Answer `Range` requests with 206, ignore them otherwise.
+        stream_mbps (float): Bandwidth of each response in megabits per second, 0 for
+            unlimited, to simulate a link where one TCP stream is the bottleneck.
+        fail_ranges (int): Number of range responses that break off halfway, to test retries.
+    """
+
+    def __init__(self, host='127.0.0.1', port=8000, directory=None, accept_ranges=True, stream_mbps=None, fail_ranges=0):
         self.host = host
         self.port = port
         self.directory = directory or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
         self.url = f'http://{host}:{port}'
         self.server_thread = None
+        self.accept_ranges = accept_ranges
+        if stream_mbps is None:
+            stream_mbps = float(os.environ.get('MOCK_HTTP_STREAM_MBPS', 0))
+        self.bytes_per_second = stream_mbps * 1000 * 1000 / 8
+        self.fail_ranges = fail_ranges
+        self.range_requests = 0
         
         # Ensure the directory exists
         if not os.path.exists(self.directory):
@@ -33,12 +58,54 @@ class MockHTTPServer:
         @app.route('/<path:filename>')
         def serve_file(filename):
             print(f"Mock HTTP Server: Serving file: {filename}")
-            try:
-                return send_from_directory(app.config['MOCK_HTTP_SERVER_DIR'], filename)
-            except Exception as e:
-                print(f"Mock HTTP Server ERROR: {str(e)}")
+            path = safe_join(app.config['MOCK_HTTP_SERVER_DIR'], filename)
+            if path is None or not os.path.isfile(path):
+                print(f"Mock HTTP Server ERROR: File not found: {filename}")
                 return jsonify({"error": f"File not found: {filename}"}), 404
+            return self.file_response(path)
     
+    def file_response(self, path):
+        size = os.path.getsize(path)
+        start, end, status = 0, size - 1, 200
+        headers = {'Accept-Ranges': 'bytes' if self.accept_ranges else 'none'}
+        match = RANGE_PATTERN.match(request.headers.get('Range', ''))
+        if match and self.accept_ranges:
+            if match.group(1):
+                start = int(match.group(1))
+                end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+            else:
+                start = max(size - int(match.group(2)), 0)
+            if start > end:
+                return Response(status=416, headers={'Content-Range': f'bytes */{size}'})
+            status = 206
+            headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+            self.range_requests += 1
+        length = end - start + 1
+        # Break off halfway, the client sees a body shorter than its Content-Length
+        fail = status == 206 and self.fail_ranges > 0
+        if fail:
+            self.fail_ranges -= 1
+
+        def generate():
+            sent = 0
+            began = time.monotonic()
+            with open(path, 'rb') as f:
+                f.seek(start)
+                while sent < length:
+                    if fail and sent >= length // 2:
+                        return
+                    block = f.read(min(BLOCK_SIZE, length - sent))
+                    sent += len(block)
+                    yield block
+                    if self.bytes_per_second:
+                        wait = began + sent / self.bytes_per_second - time.monotonic()
+                        if wait > 0:
+                            time.sleep(wait)
+
+        headers['Content-Length'] = str(length)
+        mime_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        return Response(generate(), status=status, headers=headers, mimetype=mime_type, direct_passthrough=True)
+
     def start(self):
         """Start the HTTP server in a background thread."""
         def run_server():
@@ -60,7 +127,18 @@ class MockHTTPServer:
         print(f"Mock HTTP server at {self.url} has been shut down")
 
 if __name__ == '__main__':
-    server = MockHTTPServer()
+    parser = argparse.ArgumentParser(description='Serve input files for the worker')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--directory', help='Directory to serve, data/ next to this script by default')
+    parser.add_argument('--stream-mbps', type=float, help='Bandwidth of each response, 0 for unlimited')
+    parser.add_argument('--no-ranges', action='store_true', help='Ignore Range requests')
+    parser.add_argument('--quiet', action='store_true', help='Do not log requests')
+    args = parser.parse_args()
+    if args.quiet:
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    server = MockHTTPServer(port=args.port, directory=args.directory, accept_ranges=not args.no_ranges,
+                            stream_mbps=args.stream_mbps)
     server.start()
     
     try:
@@ -0,0 +1,172 @@
+"""
+Minimal S3 stand-in for the s3:// output sink.
+
+Serves path style requests (`/<bucket>/<key>`) for PutObject, GetObject and
+the multipart upload calls. Content-MD5 headers are checked like S3 does;
+signatures are not. Objects are kept in memory.
+
+Run it standalone for the benchmarks:
+
+    python mock_s3_server.py --port 9000
+    BUCKET_ENDPOINT_URL=http://127.0.0.1:9000 S3_ADDRESSING_STYLE=path \\
+        BUCKET_ACCESS_KEY_ID=test BUCKET_SECRET_ACCESS_KEY=test ...
+"""
+import argparse
+import base64
+import hashlib
+import http.server
+import threading
+import urllib.parse
+import uuid
+import xml.etree.ElementTree as ET
+
+
+def error_xml(code, message):
+    return f"<?xml version=\"1.0\" encoding=\"UTF-8\"?><Error><Code>{code}</Code><Message>{message}</Message></Error>".encode()
+
+
+class S3Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def parse(self):
+        parts = urllib.parse.urlsplit(self.path)
+        bucket, _, key = parts.path.lstrip("/").partition("/")
+        query = urllib.parse.parse_qs(parts.query, keep_blank_values=True)
+        return bucket, urllib.parse.unquote(key), {name: values[0] for name, values in query.items()}
+
+    def read_body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def reply(self, status, body=b"", headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def check_md5(self, body):
+        """Reply with BadDigest and return False if the body does not match its Content-MD5"""
+        expected = self.headers.get("Content-MD5")
+        if expected and base64.b64decode(expected) != hashlib.md5(body).digest():
+            self.reply(400, error_xml("BadDigest", "The Content-MD5 you specified did not match what we received."))
+            return False
+        return True
+
+    def do_PUT(self):
+        bucket, key, query = self.parse()
+        body = self.read_body()
+        self.server.requests.append(("PUT", key, query.get("partNumber")))
+        if not self.check_md5(body):
+            return
+        etag = f"\"{hashlib.md5(body).hexdigest()}\""
+        if "uploadId" in query:
+            upload = self.server.uploads.get(query["uploadId"])
+            if upload is None:
+                return self.reply(404, error_xml("NoSuchUpload", "The specified upload does not exist."))
+            part_number = int(query["partNumber"])
+            if part_number in self.server.fail_parts:
+                return self.reply(400, error_xml("InvalidRequest", "Injected failure."))
+            upload["parts"][part_number] = (etag, body)
+        else:
+            self.server.objects[(bucket, key)] = body
+        self.reply(200, headers={"ETag": etag})
+
+    def do_POST(self):
+        bucket, key, query = self.parse()
+        body = self.read_body()
+        self.server.requests.append(("POST", key, None))
+        if "uploads" in query:
+            upload_id = uuid.uuid4().hex
+            self.server.uploads[upload_id] = {"bucket": bucket, "key": key, "parts": {}}
+            return self.reply(200, (
+                "<?xml version=\"1.0\" encoding=\"UTF-8\"?><InitiateMultipartUploadResult>"
+                f"<Bucket>{bucket}</Bucket><Key>{key}</Key><UploadId>{upload_id}</UploadId>"
+                "</InitiateMultipartUploadResult>"
+            ).encode())
+        upload = self.server.uploads.pop(query.get("uploadId"), None)
+        if upload is None:
+            return self.reply(404, error_xml("NoSuchUpload", "The specified upload does not exist."))
+        data = []
+        root = ET.fromstring(body)
+        for part in root.iter():
+            if part.tag.endswith("Part"):
+                number = int(next(child.text for child in part if child.tag.endswith("PartNumber")))
+                etag = next(child.text for child in part if child.tag.endswith("ETag"))
+                if upload["parts"].get(number, (None,))[0] != etag:
+                    return self.reply(400, error_xml("InvalidPart", f"Part {number} was not uploaded."))
+                data.append(upload["parts"][number][1])
+        self.server.objects[(bucket, key)] = b"".join(data)
+        self.reply(200, (
+            "<?xml version=\"1.0\" encoding=\"UTF-8\"?><CompleteMultipartUploadResult>"
+            f"<Bucket>{bucket}</Bucket><Key>{key}</Key><ETag>\"{len(data)}\"</ETag>"
+            "</CompleteMultipartUploadResult>"
+        ).encode())
+
+    def do_DELETE(self):
+        bucket, key, query = self.parse()
+        self.server.requests.append(("DELETE", key, None))
+        if "uploadId" in query:
+            self.server.uploads.pop(query["uploadId"], None)
+        else:
+            self.server.objects.pop((bucket, key), None)
+        self.reply(204)
+
+    def do_GET(self):
+        bucket, key, _ = self.parse()
+        body = self.server.objects.get((bucket, key))
+        if body is None:
+            return self.reply(404, error_xml("NoSuchKey", "The specified key does not exist."))
+        self.reply(200, body, {"ETag": f"\"{hashlib.md5(body).hexdigest()}\""})
+
+    def log_message(self, *args):
+        if not self.server.quiet:
+            super().log_message(*args)
+
+
+class S3Server(http.server.ThreadingHTTPServer):
+    """
+    The S3 stand-in, serving from a background thread after `start()`.
+
+    Args:
+        host (str, optional): The address to listen on.
+        port (int, optional): The port to listen on, 0 for any free port.
+        quiet (bool, optional): Do not log every request.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=9000, quiet=True):
+        super().__init__((host, port), S3Handler)
+        self.quiet = quiet
+        # (bucket, key) -> bytes
+        self.objects = {}
+        # upload id -> {"bucket", "key", "parts": {number: (etag, bytes)}}
+        self.uploads = {}
+        # Part numbers answered with an error, to test aborted uploads
+        self.fail_parts = set()
+        # (method, key, part number) of every write request
+        self.requests = []
+
+    @property
+    def url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mock S3 server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--quiet", action="store_true")
+    args = parser.parse_args()
+    server = S3Server(args.host, args.port, quiet=args.quiet)
+    print(f"Mock S3 server listening on {server.url}")
+    server.serve_forever()
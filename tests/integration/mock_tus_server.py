@@ -6,6 +6,8 @@ import base64
 import logging
 import hashlib
 import shutil
+import time
+import argparse
 
 app = Flask(__name__)
 
@@ -18,202 +20,89 @@ uploads = {}
 upload_dir = 'data/uploads'
 os.makedirs(upload_dir, exist_ok=True)
 
-@app.route('/files', methods=['POST'])
-def create_upload():
-    """Create a new upload endpoint according to the tus protocol"""
-    # Check for tus resumable header
-    if request.headers.get('Tus-Resumable') != '1.0.0':
-        logger.warning("Invalid or missing Tus-Resumable header")
-        response = jsonify({'error': 'Tus-Resumable header must be 1.0.0'})
-        response.status_code = 412
-        return response
-    
+
+class LinkShaper:
+    """
+    Simulates a shared uplink: every request waits for the given latency and
+    request bodies queue up behind each other at the given bandwidth.
+    """
+
+    def __init__(self, bandwidth_mbps=0, latency_ms=0):
+        self.bytes_per_second = bandwidth_mbps * 1000 * 1000 / 8
+        self.latency = latency_ms / 1000
+        self._lock = threading.Lock()
+        self._next_free = 0
+
+    def delay(self, size):
+        wait = self.latency
+        if self.bytes_per_second and size:
+            with self._lock:
+                now = time.monotonic()
+                self._next_free = max(now, self._next_free) + size / self.bytes_per_second
+                wait += self._next_free - now
+        if wait > 0:
+            time.sleep(wait)
+
+
+# Bandwidth (megabits per second, 0 = unlimited) and latency of the simulated link
+shaper = LinkShaper(
+    float(os.environ.get('MOCK_TUS_BANDWIDTH_MBPS', 0)),
+    float(os.environ.get('MOCK_TUS_LATENCY_MS', 0)),
+)
+
+
+@app.route('/files', methods=['OPTIONS'])
+def options():
+    """Advertise the supported protocol extensions"""
+    response = jsonify({})
+    response.headers['Tus-Resumable'] = '1.0.0'
+    response.headers['Tus-Version'] = '1.0.0'
+    response.headers['Tus-Extension'] = 'creation,creation-defer-length,concatenation'
+    response.status_code = 204
+    return response
+
+
+def concatenate_uploads(upload_concat, metadata_dict):
+    """Create a final upload from finished partial uploads (concatenation extension)"""
+    part_ids = [url.rstrip('/').rsplit('/', 1)[-1] for url in upload_concat[len('final;'):].split()]
+    for part_id in part_ids:
+        part = uploads.get(part_id)
+        if part is None or not part.get('partial') or part['offset'] != part['size']:
+            logger.warning(f"Cannot concatenate unknown or unfinished partial upload {part_id}")
+            response = jsonify({'error': f'Partial upload {part_id} is not complete'})
+            response.status_code = 400
+            return response
+
     upload_id = str(uuid.uuid4())
-    upload_metadata = request.headers.get('Upload-Metadata', '')
-    upload_length = request.headers.get('Upload-Length', '0')
-    
-    # Extract filename from metadata if available
-    filename = f"file-{upload_id}"
-    metadata_dict = {}
-    if upload_metadata:
-        for item in upload_metadata.split(','):
-            if item.strip():
-                try:
-                    key, value = item.split(' ', 1)
-                    metadata_dict[key] = base64.b64decode(value).decode('utf-8')
-                    if key == 'filename':
-                        filename = metadata_dict[key]
-                except Exception as e:
-                    logger.warning(f"Error parsing metadata item {item}: {str(e)}")
-    
-    # Create a unique filename to prevent collisions
-    file_extension = os.path.splitext(filename)[1] if '.' in filename else ''
-    unique_filename = f"{os.path.splitext(filename)[0]}-{upload_id}{file_extension}"
+    filename = metadata_dict.get('filename', f"file-{upload_id}")
+    unique_filename = f"{os.path.splitext(filename)[0]}-{upload_id}{os.path.splitext(filename)[1]}"
     upload_path = os.path.join(upload_dir, unique_filename)
-    
-    # Create an empty file to start with
     with open(upload_path, 'wb') as f:
-        pass  # Just create an empty file
-    
+        for part_id in part_ids:
+            part = uploads.pop(part_id)
+            with open(part['path'], 'rb') as part_file:
+                shutil.copyfileobj(part_file, f, 1024 * 1024)
+            os.remove(part['path'])
+
+    size = os.path.getsize(upload_path)
     uploads[upload_id] = {
         'id': upload_id,
         'path': upload_path,
-        'size': int(upload_length),
-        'offset': 0,
+        'size': size,
+        'offset': size,
         'filename': unique_filename,
         'original_filename': filename,
-        'metadata': metadata_dict
+        'metadata': metadata_dict,
+        'parts': len(part_ids),
     }
-    
-    logger.info(f"Created upload: {upload_id} for file: {filename}")
-    
-    # According to tus protocol
+    logger.info(f"Concatenated {len(part_ids)} partial uploads into {upload_id}")
+
     response = jsonify({})
     response.headers['Location'] = f'/files/{upload_id}'
     response.headers['Tus-Resumable'] = '1.0.0'
     response.status_code = 201
     return response
 
-@app.route('/files/<upload_id>', methods=['PATCH'])
-def upload_chunk(upload_id):
-    """Handle chunk upload"""
-    logger.info(f"TUS Server: Received PATCH request for upload {upload_id}")
-    logger.info(f"TUS Server: Headers: {dict(request.headers)}")
-    
-    # Check for tus resumable header
-    if request.headers.get('Tus-Resumable') != '1.0.0':
-        logger.warning("Invalid or missing Tus-Resumable header in PATCH request")
-        response = jsonify({'error': 'Tus-Resumable header must be 1.0.0'})
-        response.status_code = 412
-        return response
-    
-    if upload_id not in uploads:
-        logger.warning(f"Upload ID not found: {upload_id}")
-        return '', 404
-    
-    upload = uploads[upload_id]
-    offset = int(request.headers.get('Upload-Offset', '0'))
-    
-    # Verify offset matches our records
-    if offset != upload['offset']:
-        logger.warning(f"Offset mismatch: got {offset}, expected {upload['offset']}")
-        response = jsonify({'error': 'Offset conflict'})
-        response.status_code = 409
-        return response
-    
-    content_length = int(request.headers.get('Content-Length', '0'))
-    chunk = request.data
-    
-    # Check if content length matches actual data length
-    if len(chunk) != content_length:
-        logger.warning(f"Content-Length mismatch: {content_length} vs {len(chunk)}")
-        response = jsonify({'error': 'Content-Length mismatch'})
-        response.status_code = 400
-        return response
-    
-    # Append data to file
-    with open(upload['path'], 'ab') as f:
-        f.write(chunk)
-    
-    # Update offset
-    upload['offset'] += len(chunk)
-    logger.info(f"Updated {upload_id}: received {len(chunk)} bytes, new offset {upload['offset']}")
-    
-    # Check if upload is complete
-    if upload['offset'] == upload['size']:
-        logger.info(f"Upload complete for {upload_id} ({upload['original_filename']})")
-        
-        # Verify file size
-        file_size = os.path.getsize(upload['path'])
-        if file_size != upload['size']:
-            logger.warning(f"File size mismatch: {file_size} vs {upload['size']}")
-    
-    # Return the new offset
-    response = jsonify({})
-    response.headers['Upload-Offset'] = str(upload['offset'])
-    response.headers['Tus-Resumable'] = '1.0.0'
-    response.status_code = 204
-    return response
-
-def run_server(host='127.0.0.1', port=1080):
-    app.run(host=host, port=port, use_reloader=False)
-
-class TusServer:
-    def __init__(self, host='127.0.0.1', port=1080):
-        self.host = host
-        self.port = port
-        self.url = f'http://{host}:{port}/files'
-        self.server_thread = None
-        
-        # Clean up the uploads directory before starting
-        if os.path.exists(upload_dir):
-            for filename in os.listdir(upload_dir):
-                file_path = os.path.join(upload_dir, filename)
-                try:
-                    if os.path.isfile(file_path):
-                        os.unlink(file_path)
-                except Exception as e:
-                    logger.error(f"Error cleaning up file {file_path}: {str(e)}")
-    
-    def start(self):
-        self.server_thread = threading.Thread(target=run_server, args=(self.host, self.port))
-        self.server_thread.daemon = True
-        self.server_thread.start()
-        logger.info(f"TUS server started at {self.url}")
-    
-    def shutdown(self):
-        # No clean way to shut down a Flask app in a thread
-        # We'll rely on the daemon thread to be killed when the program exits
-        logger.info(f"TUS server at {self.url} shutting down")
-        # cleanup files in upload_dir
-        for filename in os.listdir(upload_dir):
-            file_path = os.path.join(upload_dir, filename)
-            try:
-                if os.path.isfile(file_path):
-                    os.unlink(file_path)
-            except Exception as e:
-                logger.error(f"Error cleaning up file {file_path}: {str(e)}")
-    
-    def get_uploads(self):
-        """Return the current uploads dictionary for verification"""
-        return uploads
-    
-    def clear_uploads(self):
-        """Clear all uploads - useful for testing"""
-        global uploads
-        uploads.clear()
-        logger.info("Cleared all uploads")
-
-if __name__ == '__main__':
-    server = TusServer()
-    server.start()
-    
-    try:
-        # Keep the server running until interrupted
-        while True:
-            import time
-            time.sleep(1)
-    except KeyboardInterrupt:
-        server.shutdown() 
-from flask import Flask, request, jsonify, send_file
-import os
-import threading
-import uuid
-import base64
-import logging
-import hashlib
-import shutil
-
-app = Flask(__name__)
-
-# Configure logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger("TUS-Server")
-
-# Store uploaded files
-uploads = {}
-upload_dir = 'data/uploads'
-os.makedirs(upload_dir, exist_ok=True)
 
 @app.route('/files', methods=['POST'])
 def create_upload():
@@ -225,6 +114,7 @@ def create_upload():
         response.status_code = 412
         return response
     
+    shaper.delay(0)
     logger.info(f"TUS Server: Received POST request to create upload")
     logger.info(f"TUS Server: Headers: {dict(request.headers)}")
     
@@ -246,6 +136,10 @@ def create_upload():
                 except Exception as e:
                     logger.warning(f"Error parsing metadata item {item}: {str(e)}")
     
+    upload_concat = request.headers.get('Upload-Concat', '')
+    if upload_concat.startswith('final;'):
+        return concatenate_uploads(upload_concat, metadata_dict)
+
     # Create a unique filename to prevent collisions
     file_extension = os.path.splitext(filename)[1] if '.' in filename else ''
     unique_filename = f"{os.path.splitext(filename)[0]}-{upload_id}{file_extension}"
@@ -258,11 +152,13 @@ def create_upload():
     uploads[upload_id] = {
         'id': upload_id,
         'path': upload_path,
-        'size': int(upload_length),
+        # None until a PATCH sends it with Upload-Defer-Length
+        'size': None if request.headers.get('Upload-Defer-Length') == '1' else int(upload_length),
         'offset': 0,
         'filename': unique_filename,
         'original_filename': filename,
-        'metadata': metadata_dict
+        'metadata': metadata_dict,
+        'partial': upload_concat == 'partial',
     }
     
     logger.info(f"Created upload: {upload_id} for file: {filename}")
@@ -301,8 +197,12 @@ def upload_chunk(upload_id):
         response.status_code = 409
         return response
     
+    if upload['size'] is None and 'Upload-Length' in request.headers:
+        upload['size'] = int(request.headers['Upload-Length'])
+
     content_length = int(request.headers.get('Content-Length', '0'))
     chunk = request.data
+    shaper.delay(len(chunk))
     
     # Check if content length matches actual data length
     if len(chunk) != content_length:
@@ -335,11 +235,30 @@ def upload_chunk(upload_id):
     response.status_code = 204
     return response
 
+@app.route('/files/<upload_id>', methods=['HEAD'])
+def upload_offset(upload_id):
+    """Report the offset of an upload, used to resume after a failed chunk"""
+    if upload_id not in uploads:
+        return '', 404
+
+    response = app.response_class(status=200)
+    response.headers['Upload-Offset'] = str(uploads[upload_id]['offset'])
+    if uploads[upload_id]['size'] is None:
+        response.headers['Upload-Defer-Length'] = '1'
+    else:
+        response.headers['Upload-Length'] = str(uploads[upload_id]['size'])
+    response.headers['Tus-Resumable'] = '1.0.0'
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
 def run_server(host='127.0.0.1', port=1080):
     app.run(host=host, port=port, use_reloader=False)
 
 class TusServer:
-    def __init__(self, host='127.0.0.1', port=1080):
+    def __init__(self, host='127.0.0.1', port=1080, bandwidth_mbps=None, latency_ms=None):
+        global shaper
+        if bandwidth_mbps is not None or latency_ms is not None:
+            shaper = LinkShaper(bandwidth_mbps or 0, latency_ms or 0)
         self.host = host
         self.port = port
         self.url = f'http://{host}:{port}/files'
@@ -385,13 +304,27 @@ class TusServer:
         logger.info("Cleared all uploads")
 
 if __name__ == '__main__':
-    server = TusServer()
+    parser = argparse.ArgumentParser(description="Mock TUS server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=1080)
+    parser.add_argument('--upload-dir', default=upload_dir, help="Directory to store the uploads in")
+    parser.add_argument('--bandwidth-mbps', type=float, help="Simulated link bandwidth in megabits per second")
+    parser.add_argument('--latency-ms', type=float, help="Simulated latency added to every request")
+    parser.add_argument('--quiet', action='store_true', help="Only log warnings")
+    args = parser.parse_args()
+
+    upload_dir = args.upload_dir
+    os.makedirs(upload_dir, exist_ok=True)
+    if args.quiet:
+        for name in ('TUS-Server', 'werkzeug'):
+            logging.getLogger(name).setLevel(logging.WARNING)
+
+    server = TusServer(args.host, args.port, args.bandwidth_mbps, args.latency_ms)
     server.start()
     
     try:
         # Keep the server running until interrupted
         while True:
-            import time
             time.sleep(1)
     except KeyboardInterrupt:
-        server.shutdown() 
\ No newline at end of file
+        server.shutdown()
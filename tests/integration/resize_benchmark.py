@@ -0,0 +1,124 @@
+"""
+Time and bytes saved by the CPU pre-resize of oversized inputs.
+
+Generates JPEG photos of several resolutions and compares loading the
+original the way ComfyUI does (decode, EXIF transpose, RGB, LANCZOS scale to
+the side the workflow uses) with `rp_resize.resize_image` followed by the
+same load of the resized file. The resize runs on the worker before the job
+gets ComfyUI, so the "load" columns are the time taken out of the ComfyUI
+slot.
+
+Usage:
+    python resize_benchmark.py --resolutions 3000x2000,6000x4000,8000x6000 --max-sides 1536,896
+"""
+import argparse
+import datetime
+import itertools
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(SCRIPT_DIR)
+sys.path.append(os.path.abspath(os.path.join(SCRIPT_DIR, "../..")))
+
+from benchmark import summarize
+from upload_benchmark import parse_list
+
+
+def parse_resolution(text):
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+def generate_photo(path, resolution):
+    """A JPEG with smooth areas and noise, closer to a photo than either alone"""
+    from PIL import Image
+
+    gradient = Image.linear_gradient("L").resize(resolution)
+    noise = Image.effect_noise(resolution, 40)
+    Image.merge("RGB", (gradient, noise, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT))).save(path, quality=92)
+
+
+def comfy_load(path, side):
+    """Load an image like ComfyUI's loader and scale it to `side` like DF_Image_scale_to_side"""
+    from PIL import Image, ImageOps
+
+    start = time.perf_counter()
+    with Image.open(path) as image:
+        image = ImageOps.exif_transpose(image).convert("RGB")
+    scale = side / max(image.size)
+    if scale < 1:
+        image.resize((round(image.size[0] * scale), round(image.size[1] * scale)), Image.Resampling.LANCZOS)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--resolutions", default="3000x2000,6000x4000,8000x6000", help="Comma separated input resolutions")
+    parser.add_argument("--max-sides", default="1536,896", help="Comma separated longest sides to resize to")
+    parser.add_argument("--repeat", type=int, default=3, help="Measurements per cell")
+    parser.add_argument("--output", default="resize_benchmark_results.json", help="JSON file to write the results to")
+    args = parser.parse_args()
+
+    from src import rp_resize
+
+    workdir = tempfile.mkdtemp(prefix="resize-benchmark-")
+    cells = []
+    try:
+        for resolution, max_side in itertools.product(parse_list(args.resolutions, parse_resolution), parse_list(args.max_sides)):
+            source = os.path.join(workdir, f"{resolution[0]}x{resolution[1]}.jpg")
+            if not os.path.exists(source):
+                generate_photo(source, resolution)
+            original_load, resize, resized_load, reports = [], [], [], []
+            for _ in range(args.repeat):
+                original_load.append(comfy_load(source, max_side))
+                path = os.path.join(workdir, "input.jpg")
+                shutil.copyfile(source, path)
+                report = rp_resize.resize_image(path, max_side)
+                reports.append(report)
+                resize.append(report["seconds"])
+                resized_load.append(comfy_load(path, max_side))
+            cell = {
+                "resolution": list(resolution),
+                "max_side": max_side,
+                "original_bytes": reports[0]["original_bytes"],
+                "bytes": reports[0]["bytes"],
+                "bytes_saved": reports[0]["bytes_saved"],
+                "original_load_seconds": summarize(original_load),
+                "resize_seconds": summarize(resize),
+                "resized_load_seconds": summarize(resized_load),
+            }
+            saved = cell["original_load_seconds"]["p50"] - cell["resized_load_seconds"]["p50"]
+            print(
+                f"{resolution[0]:>5}x{resolution[1]:<5} side={max_side:<5} "
+                f"bytes {cell['original_bytes'] / 1024 ** 2:6.1f}MB -> {cell['bytes'] / 1024 ** 2:5.2f}MB  "
+                f"load {cell['original_load_seconds']['p50']:.3f}s -> {cell['resized_load_seconds']['p50']:.3f}s "
+                f"(saved {saved:.3f}s in the ComfyUI slot, resize {cell['resize_seconds']['p50']:.3f}s before it)"
+            )
+            cells.append(cell)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "host": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+        },
+        "config": {"repeat": args.repeat},
+        "cells": cells,
+    }
+    with open(os.path.abspath(args.output), "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {os.path.abspath(args.output)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
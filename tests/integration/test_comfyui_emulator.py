@@ -0,0 +1,167 @@
+import unittest
+import os
+import json
+import time
+import asyncio
+import shutil
+import tempfile
+import threading
+
+import aiohttp
+import requests
+
+from comfyui_emulator import ComfyUIEmulator, WORKFLOWS_DIR, tiling_grid, topological_order
+
+FIXED_LATENCY = {"default": {"distribution": "fixed", "mean": 0.2}, "5": {"distribution": "fixed", "mean": 0.5}}
+
+
+def load_workflow(variant="2_0.4"):
+    with open(os.path.join(WORKFLOWS_DIR, variant, "workflow.json")) as f:
+        return json.load(f)
+
+
+class ComfyUIEmulatorTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, True)
+        self.emulator = ComfyUIEmulator(
+            port=0,
+            output_dir=os.path.join(self.tmp, "output"),
+            input_dir=os.path.join(self.tmp, "input"),
+            latency=FIXED_LATENCY,
+            time_scale=1,
+            output_size=2048,
+            seed=1,
+        )
+        self.emulator.start()
+        self.addCleanup(self.emulator.shutdown)
+        self.url = self.emulator.url
+
+    def queue(self, graph, client_id=None):
+        response = requests.post(f"{self.url}/prompt", json={"prompt": graph, "client_id": client_id})
+        response.raise_for_status()
+        return response.json()["prompt_id"]
+
+    def wait_for_history(self, prompt_id, timeout=10):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            history = requests.get(f"{self.url}/history/{prompt_id}").json()
+            if prompt_id in history:
+                return history[prompt_id]
+            time.sleep(0.05)
+        self.fail(f"Prompt {prompt_id} did not finish")
+
+    def test_graph_helpers(self):
+        graph = load_workflow("4_0.6")
+        self.assertEqual(tiling_grid(graph), 4)
+        order = topological_order(graph)
+        self.assertEqual(sorted(order), sorted(graph))
+        position = {node_id: i for i, node_id in enumerate(order)}
+        for node_id, node in graph.items():
+            for value in node["inputs"].values():
+                if isinstance(value, list) and len(value) == 2 and str(value[0]) in graph:
+                    self.assertLess(position[str(value[0])], position[node_id])
+
+    def test_fifo_queue_with_unique_prompt_ids(self):
+        graph = load_workflow()
+        prompt_ids = [self.queue(graph) for _ in range(3)]
+        self.assertEqual(len(set(prompt_ids)), 3)
+
+        queue = requests.get(f"{self.url}/queue").json()
+        self.assertEqual(queue["queue_running"][0][1], prompt_ids[0])
+        self.assertEqual([item[1] for item in queue["queue_pending"]], prompt_ids[1:])
+
+        entries = [self.wait_for_history(prompt_id) for prompt_id in prompt_ids]
+        finished = [entry["status"]["messages"][-1][1]["timestamp"] for entry in entries]
+        self.assertEqual(finished, sorted(finished))
+        self.assertTrue(all(entry["status"]["status_str"] == "success" for entry in entries))
+
+        images = next(iter(entries[0]["outputs"].values()))["images"]
+        self.assertEqual(len(images), 3)
+        path = os.path.join(self.emulator.output_dir, images[0]["subfolder"], images[0]["filename"])
+        self.assertEqual(os.path.getsize(path), 2048)
+
+    def test_execution_time_depends_on_tiling_grid(self):
+        start = time.time()
+        self.wait_for_history(self.queue(load_workflow("5_0.4")))
+        self.assertGreaterEqual(time.time() - start, 0.5)
+
+    def test_unchanged_nodes_are_cached_until_free(self):
+        graph = load_workflow()
+        first = self.wait_for_history(self.queue(graph))
+        second = self.wait_for_history(self.queue(graph))
+        requests.post(f"{self.url}/free", json={"unload_models": True})
+        third = self.wait_for_history(self.queue(graph))
+
+        def cached(entry):
+            return next(data["nodes"] for event, data in entry["status"]["messages"] if event == "execution_cached")
+
+        self.assertEqual(cached(first), [])
+        self.assertEqual(len(cached(second)), len(graph))
+        self.assertEqual(cached(third), [])
+
+    def test_injected_error(self):
+        requests.post(f"{self.url}/emulator/inject", json={"errors": 1})
+        failed = self.wait_for_history(self.queue(load_workflow()))
+        succeeded = self.wait_for_history(self.queue(load_workflow("2_0.6")))
+
+        self.assertEqual(failed["status"]["status_str"], "error")
+        self.assertEqual(failed["outputs"], {})
+        self.assertEqual(failed["status"]["messages"][-1][0], "execution_error")
+        self.assertEqual(succeeded["status"]["status_str"], "success")
+
+    def test_injected_hang_until_interrupt(self):
+        requests.post(f"{self.url}/emulator/inject", json={"hangs": 1})
+        prompt_id = self.queue(load_workflow())
+        time.sleep(0.5)
+        self.assertEqual(requests.get(f"{self.url}/history/{prompt_id}").json(), {})
+
+        requests.post(f"{self.url}/interrupt")
+        entry = self.wait_for_history(prompt_id)
+        self.assertEqual(entry["status"]["messages"][-1][0], "execution_interrupted")
+
+    def test_websocket_events(self):
+        events = []
+        connected = threading.Event()
+
+        async def listen():
+            async with aiohttp.ClientSession() as session:
+                async with session.ws_connect(f"{self.url}/ws?clientId=client") as ws:
+                    connected.set()
+                    async for message in ws:
+                        event = json.loads(message.data)
+                        events.append(event)
+                        if event["type"] in ("execution_success", "execution_error"):
+                            return
+
+        thread = threading.Thread(target=asyncio.run, args=(listen(),))
+        thread.start()
+        connected.wait(5)
+        graph = load_workflow()
+        self.queue(graph, client_id="client")
+        thread.join(10)
+
+        types = [event["type"] for event in events]
+        self.assertEqual(types[0], "status")
+        self.assertIn("execution_start", types)
+        executing = [event["data"]["node"] for event in events if event["type"] == "executing"]
+        self.assertEqual(executing[-1], None)
+        self.assertEqual(set(executing[:-1]), set(graph))
+        self.assertEqual(types[-1], "execution_success")
+
+    def test_upload_image_renames_existing_files(self):
+        files = {"image": ("input.png", b"first", "image/png")}
+        first = requests.post(f"{self.url}/upload/image", files=files).json()
+        second = requests.post(f"{self.url}/upload/image", files={"image": ("input.png", b"second", "image/png")}).json()
+        self.assertEqual(first["name"], "input.png")
+        self.assertEqual(second["name"], "input (1).png")
+
+    def test_system_stats_and_object_info(self):
+        stats = requests.get(f"{self.url}/system_stats").json()
+        self.assertEqual(stats["devices"][0]["type"], "cuda")
+        object_info = requests.get(f"{self.url}/object_info/StableContusionImageLoader").json()
+        self.assertIn("image", object_info["StableContusionImageLoader"]["input"]["required"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,309 @@
+"""
+Upload throughput benchmark of the TUS output path.
+
+Runs `process_output_images` against mock_tus_server.py for every combination
+of upload engine (TUS_ENGINE), output file size, TUS chunk size, parallel parts
+per file and files uploaded in parallel per job, and reports MB/s, CPU time and peak RSS of the
+uploading process. For the stream engine the chunk size is the first and
+smallest chunk (TUS_MIN_CHUNK_SIZE), it grows with the measured link. The TUS server runs in its own process so its CPU time is
+not counted, and can simulate a slow link with --bandwidth-mbps/--latency-ms.
+
+Every cell runs in a fresh subprocess, as the handler reads its upload
+settings at import time and RSS peaks can only be reset per process.
+
+Usage:
+    python upload_benchmark.py --engines tuspy,stream --file-sizes 1MB,64MB,500MB --chunk-sizes 1MB,5MB,32MB \\
+        --parts 1,4 --concurrency 1,3 --bandwidth-mbps 1000 --latency-ms 20
+"""
+import argparse
+import datetime
+import itertools
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(SCRIPT_DIR)
+sys.path.append(os.path.abspath(os.path.join(SCRIPT_DIR, "../..")))
+
+from benchmark import SIZE_UNITS, format_size, parse_size, summarize
+
+TUS_PORT = 1081
+# Files of at least this size are named .psd, smaller ones .png
+PSD_MIN_SIZE = 100 * SIZE_UNITS["MB"]
+
+
+def output_name(size, index):
+    extension = "psd" if size >= PSD_MIN_SIZE else "png"
+    return f"output_{format_size(size)}_{index}.{extension}"
+
+
+def generate_file(path, size, block_size=16 * SIZE_UNITS["MB"]):
+    """Write `size` random bytes without holding them all in memory"""
+    with open(path, "wb") as f:
+        remaining = size
+        while remaining > 0:
+            block = os.urandom(min(block_size, remaining))
+            f.write(block)
+            remaining -= len(block)
+
+
+class TusServerProcess:
+    """Runs mock_tus_server.py in a subprocess"""
+
+    def __init__(self, upload_dir, bandwidth_mbps, latency_ms, port=TUS_PORT, verbose=False):
+        self.upload_dir = upload_dir
+        self.url = f"http://127.0.0.1:{port}/files"
+        self.command = [
+            sys.executable, os.path.join(SCRIPT_DIR, "mock_tus_server.py"),
+            "--port", str(port),
+            "--upload-dir", upload_dir,
+            "--bandwidth-mbps", str(bandwidth_mbps),
+            "--latency-ms", str(latency_ms),
+        ]
+        if not verbose:
+            self.command.append("--quiet")
+        self.verbose = verbose
+        self.process = None
+
+    def start(self):
+        output = None if self.verbose else subprocess.DEVNULL
+        self.process = subprocess.Popen(self.command, cwd=os.path.dirname(self.upload_dir), stdout=output, stderr=output)
+        for _ in range(100):
+            try:
+                if requests.options(self.url, timeout=1).status_code == 204:
+                    return
+            except requests.RequestException:
+                pass
+            time.sleep(0.1)
+        raise RuntimeError("Mock TUS server did not start properly")
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait()
+
+    def received_bytes(self):
+        return sum(entry.stat().st_size for entry in os.scandir(self.upload_dir) if entry.is_file())
+
+    def clear(self):
+        for entry in os.scandir(self.upload_dir):
+            os.remove(entry.path)
+
+
+def run_cell(cell_path):
+    """
+    Child process: upload the prepared output directory once and write the
+    measurements next to the cell description
+    """
+    with open(cell_path) as f:
+        cell = json.load(f)
+
+    from src import rp_handler, rp_memory
+    import logging
+    rp_handler.setup_logger().setLevel(logging.WARNING)
+
+    rss_before = rp_memory.read_rss()
+    cpu_before = os.times()
+    start = time.perf_counter()
+    result = rp_handler.process_output_images(cell["job_id"], cell["upload_url"])
+    wall_seconds = time.perf_counter() - start
+    cpu_after = os.times()
+    rss_after = rp_memory.read_rss()
+
+    measurement = {
+        "result": result,
+        "wall_seconds": wall_seconds,
+        "cpu_seconds": (cpu_after.user - cpu_before.user) + (cpu_after.system - cpu_before.system),
+        "rss_before_bytes": rss_before.get("rss_bytes"),
+        "peak_rss_bytes": rss_after.get("rss_peak_bytes"),
+    }
+    with open(cell["result_path"], "w") as f:
+        json.dump(measurement, f)
+
+
+def run_matrix_cell(args, workdir, source_files, tus_server, engine, file_size, chunk_size, parts, concurrency, repeat):
+    """Run one cell of the matrix in a subprocess and return its measurements"""
+    output_dir = os.path.join(workdir, "comfyui_output")
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.makedirs(output_dir)
+    # Hard links, the handler removes the files after uploading them
+    for path in source_files:
+        os.link(path, os.path.join(output_dir, os.path.basename(path)))
+
+    cell_path = os.path.join(workdir, "cell.json")
+    result_path = os.path.join(workdir, "cell_result.json")
+    with open(cell_path, "w") as f:
+        json.dump({
+            "job_id": f"upload-benchmark-{format_size(file_size)}-{repeat}",
+            "upload_url": tus_server.url,
+            "result_path": result_path,
+        }, f)
+
+    env = os.environ.copy()
+    env.update({
+        "COMFY_OUTPUT_PATH": output_dir,
+        "TUS_ENGINE": engine,
+        "TUS_CHUNK_SIZE": str(chunk_size),
+        "TUS_MIN_CHUNK_SIZE": str(chunk_size),
+        "TUS_PARALLEL_PARTS": str(parts),
+        "UPLOAD_CONCURRENCY": str(concurrency),
+    })
+    output = None if args.verbose else subprocess.DEVNULL
+    subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--run-cell", cell_path],
+        env=env, cwd=workdir, stdout=output, stderr=output, check=True,
+    )
+    with open(result_path) as f:
+        measurement = json.load(f)
+
+    expected_bytes = file_size * len(source_files)
+    measurement["verified"] = tus_server.received_bytes() == expected_bytes
+    tus_server.clear()
+    return measurement
+
+
+def summarize_cell(engine, file_size, files_per_job, chunk_size, parts, concurrency, measurements):
+    failures = [
+        m["result"].get("message") for m in measurements
+        if m["result"].get("status") != "success" or not m["verified"]
+    ]
+    succeeded = [
+        m for m in measurements
+        if m["result"].get("status") == "success" and m["verified"]
+    ]
+    job_bytes = file_size * files_per_job
+    wall = [m["wall_seconds"] for m in succeeded]
+    return {
+        "engine": engine,
+        "file_size_bytes": file_size,
+        "files_per_job": files_per_job,
+        "chunk_size_bytes": chunk_size,
+        "parallel_parts": parts,
+        "upload_concurrency": concurrency,
+        "repeats": len(measurements),
+        "failures": len(failures),
+        "failure_messages": sorted(set(str(message) for message in failures))[:10],
+        "wall_seconds": summarize(wall),
+        "mb_per_second": summarize([job_bytes / SIZE_UNITS["MB"] / seconds for seconds in wall if seconds]),
+        "cpu_seconds": summarize([m["cpu_seconds"] for m in succeeded]),
+        "cpu_seconds_per_gb": summarize([
+            m["cpu_seconds"] / (job_bytes / SIZE_UNITS["GB"]) for m in succeeded
+        ]),
+        "peak_rss_bytes": max((m["peak_rss_bytes"] or 0 for m in succeeded), default=None),
+        "peak_rss_over_baseline_bytes": max(
+            ((m["peak_rss_bytes"] or 0) - (m["rss_before_bytes"] or 0) for m in succeeded), default=None
+        ),
+    }
+
+
+def print_cell(cell):
+    mb_per_second = cell["mb_per_second"].get("p50")
+    cpu = cell["cpu_seconds"].get("p50")
+    rss = cell["peak_rss_bytes"]
+    mb_per_second = f"{mb_per_second:.1f}" if mb_per_second is not None else "-"
+    cpu = f"{cpu:.3f}s" if cpu is not None else "-"
+    rss = f"{rss // SIZE_UNITS['MB']}MB" if rss else "-"
+    print(
+        f"{cell['engine']:>6} {format_size(cell['file_size_bytes']):>7} x{cell['files_per_job']} "
+        f"chunk={format_size(cell['chunk_size_bytes']):>5} parts={cell['parallel_parts']} "
+        f"concurrency={cell['upload_concurrency']}  "
+        f"MB/s={mb_per_second:>8} cpu={cpu:>8} peak_rss={rss:>6} failures={cell['failures']}"
+    )
+
+
+def parse_list(text, parse=int):
+    return [parse(item) for item in text.split(",") if item.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--engines", default="tuspy,stream", help="Comma separated TUS_ENGINE values")
+    parser.add_argument("--file-sizes", default="1MB,64MB", help="Comma separated output file sizes, e.g. 1MB,500MB")
+    parser.add_argument("--files-per-job", type=int, default=3, help="Output files written per job")
+    parser.add_argument("--chunk-sizes", default="1MB,5MB,16MB", help="Comma separated TUS_CHUNK_SIZE values")
+    parser.add_argument("--parts", default="1,4", help="Comma separated TUS_PARALLEL_PARTS values")
+    parser.add_argument("--concurrency", default="1,3", help="Comma separated UPLOAD_CONCURRENCY values")
+    parser.add_argument("--repeat", type=int, default=3, help="Uploads per cell")
+    parser.add_argument("--bandwidth-mbps", type=float, default=0, help="Simulated link bandwidth, 0 for unlimited")
+    parser.add_argument("--latency-ms", type=float, default=0, help="Simulated latency per request")
+    parser.add_argument("--output", default="upload_benchmark_results.json", help="JSON file to write the results to")
+    parser.add_argument("--verbose", action="store_true", help="Keep the handler and mock server logs")
+    parser.add_argument("--run-cell", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_cell:
+        run_cell(args.run_cell)
+        return 0
+
+    output_path = os.path.abspath(args.output)
+    engines = parse_list(args.engines, lambda engine: engine.strip().lower())
+    file_sizes = parse_list(args.file_sizes, parse_size)
+    chunk_sizes = parse_list(args.chunk_sizes, parse_size)
+    parts_values = parse_list(args.parts)
+    concurrency_values = parse_list(args.concurrency)
+
+    workdir = tempfile.mkdtemp(prefix="upload-benchmark-")
+    source_dir = os.path.join(workdir, "sources")
+    upload_dir = os.path.join(workdir, "uploads")
+    os.makedirs(source_dir)
+    os.makedirs(upload_dir)
+
+    tus_server = TusServerProcess(upload_dir, args.bandwidth_mbps, args.latency_ms, verbose=args.verbose)
+    tus_server.start()
+
+    cells = []
+    try:
+        for file_size in file_sizes:
+            source_files = []
+            for index in range(args.files_per_job):
+                path = os.path.join(source_dir, output_name(file_size, index))
+                generate_file(path, file_size)
+                source_files.append(path)
+
+            for engine, chunk_size, parts, concurrency in itertools.product(engines, chunk_sizes, parts_values, concurrency_values):
+                measurements = [
+                    run_matrix_cell(args, workdir, source_files, tus_server, engine, file_size, chunk_size, parts, concurrency, repeat)
+                    for repeat in range(args.repeat)
+                ]
+                cell = summarize_cell(engine, file_size, args.files_per_job, chunk_size, parts, concurrency, measurements)
+                print_cell(cell)
+                cells.append(cell)
+
+            for path in source_files:
+                os.remove(path)
+    finally:
+        tus_server.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "host": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+        },
+        "config": {
+            "files_per_job": args.files_per_job,
+            "repeat": args.repeat,
+            "bandwidth_mbps": args.bandwidth_mbps,
+            "latency_ms": args.latency_ms,
+        },
+        "cells": cells,
+    }
+    with open(output_path, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {output_path}")
+
+    return 1 if any(cell["failures"] for cell in cells) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
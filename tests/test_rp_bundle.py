@@ -0,0 +1,96 @@
+import unittest
+import sys
+import os
+import io
+import shutil
+import tarfile
+import zipfile
+import tempfile
+import importlib.util
+
+# Make sure that "src" is known and can be used to import rp_bundle.py
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+from src import rp_bundle
+
+HAS_ZSTANDARD = importlib.util.find_spec("zstandard") is not None
+
+
+class TestRpBundle(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, True)
+        self.contents = {
+            "output_0001.png": os.urandom(5000),
+            "psd_saver_report.txt": b"saved 1 file\n",
+            "psd/output_0001.psd": os.urandom(70000),
+            "empty.json": b"",
+        }
+        self.files = []
+        for name, data in self.contents.items():
+            path = os.path.join(self.tmp, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(data)
+            self.files.append(path)
+
+    def archive(self, bundle):
+        return b"".join(bundle.chunks())
+
+    def assert_manifest(self, bundle, data):
+        manifest = bundle.manifest()
+        self.assertEqual([entry["name"] for entry in manifest], list(self.contents))
+        for entry in manifest:
+            # The offsets point at the data of the entries
+            self.assertEqual(data[entry["offset"]:entry["offset"] + entry["size"]], self.contents[entry["name"]])
+        self.assertEqual(manifest[0]["mime_type"], "image/png")
+        self.assertEqual(manifest[1]["mime_type"], "text/plain")
+
+    def test_tar(self):
+        bundle = rp_bundle.Bundle(self.files, self.tmp, "tar")
+        data = self.archive(bundle)
+
+        self.assertEqual(len(data), bundle.size)
+        self.assertEqual(bundle.mime_type, "application/x-tar")
+        with tarfile.open(fileobj=io.BytesIO(data)) as archive:
+            self.assertEqual(archive.getnames(), list(self.contents))
+            for name, content in self.contents.items():
+                self.assertEqual(archive.extractfile(name).read(), content)
+        self.assert_manifest(bundle, data)
+        # Only the headers are held in memory, the file contents are ranges
+        self.assertIn((self.files[2], 0, 70000), bundle.segments)
+
+    def test_zip_with_stored_entries(self):
+        bundle = rp_bundle.Bundle(self.files, self.tmp, "zip")
+        data = self.archive(bundle)
+
+        self.assertEqual(len(data), bundle.size)
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertEqual(archive.namelist(), list(self.contents))
+            self.assertTrue(all(info.compress_type == zipfile.ZIP_STORED for info in archive.infolist()))
+            self.assertEqual(archive.read("psd/output_0001.psd"), self.contents["psd/output_0001.psd"])
+        self.assert_manifest(bundle, data)
+
+    @unittest.skipUnless(HAS_ZSTANDARD, "requires zstandard")
+    def test_zstd_tar(self):
+        import zstandard
+
+        bundle = rp_bundle.Bundle(self.files, self.tmp, "tar.zst")
+        data = zstandard.ZstdDecompressor().decompressobj().decompress(self.archive(bundle))
+
+        with tarfile.open(fileobj=io.BytesIO(data)) as archive:
+            self.assertEqual(archive.getnames(), list(self.contents))
+        self.assert_manifest(bundle, data)
+
+    def test_missing_package(self):
+        self.assertIsNone(rp_bundle.missing_package("tar"))
+        self.assertIsNone(rp_bundle.missing_package("zip"))
+        self.assertEqual(rp_bundle.missing_package("tar.zst"), None if HAS_ZSTANDARD else "zstandard")
+
+    def test_unsupported_format(self):
+        with self.assertRaises(ValueError):
+            rp_bundle.Bundle(self.files, self.tmp, "rar")
+
+
+if __name__ == "__main__":
+    unittest.main()
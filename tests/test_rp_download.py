@@ -0,0 +1,153 @@
+import unittest
+import sys
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import http.server
+import email.parser
+from unittest.mock import patch
+
+# Make sure that "src" is known and can be used to import rp_download.py
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+from src import rp_download
+
+
+class RangeHandler(http.server.BaseHTTPRequestHandler):
+    """Serves `data` with single range requests, and breaks off some of them halfway"""
+
+    data = b""
+    accept_ranges = True
+    fail_ranges = 0
+    ranges = []
+
+    def do_GET(self):
+        start, end = 0, len(self.data) - 1
+        match = re.match(r"bytes=(\d+)-(\d+)$", self.headers.get("Range", ""))
+        if match and RangeHandler.accept_ranges:
+            start, end = int(match.group(1)), int(match.group(2))
+            RangeHandler.ranges.append((start, end))
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(self.data)}")
+        else:
+            self.send_response(200)
+        self.send_header("Accept-Ranges", "bytes" if RangeHandler.accept_ranges else "none")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        body = self.data[start:end + 1]
+        if match and RangeHandler.fail_ranges:
+            RangeHandler.fail_ranges -= 1
+            body = body[:len(body) // 2]
+        try:
+            self.wfile.write(body)
+        except OSError:
+            # The client closed the probe response after its first range
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+class TestRpDownload(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, True)
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), RangeHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.url = f"http://127.0.0.1:{server.server_port}/input.png"
+        self.save_path = os.path.join(self.tmp, "input.jpg")
+        RangeHandler.data = os.urandom(1000000)
+        RangeHandler.accept_ranges = True
+        RangeHandler.fail_ranges = 0
+        RangeHandler.ranges = []
+
+    def read(self):
+        with open(self.save_path, "rb") as f:
+            return f.read()
+
+    @patch.object(rp_download, "BACKOFF_S", 0)
+    @patch.object(rp_download, "BLOCK_SIZE", 10000)
+    def test_parallel_ranges_with_a_retry(self):
+        RangeHandler.fail_ranges = 1
+
+        result = rp_download.download(self.url, self.save_path, concurrency=4, range_size=300000)
+
+        self.assertEqual(result, {"bytes": 1000000, "mode": "ranged", "ranges": 4})
+        self.assertEqual(self.read(), RangeHandler.data)
+        # The probe serves the first range, the broken range resumes where it stopped
+        starts = sorted(start for start, _ in RangeHandler.ranges)
+        self.assertEqual(len(starts), 4)
+        self.assertNotIn(0, starts)
+        self.assertEqual(len([start for start in starts if start % 300000]), 1)
+
+    def test_single_stream_without_range_support(self):
+        RangeHandler.accept_ranges = False
+
+        result = rp_download.download(self.url, self.save_path, concurrency=4, range_size=300000)
+
+        self.assertEqual(result["mode"], "stream")
+        self.assertEqual(self.read(), RangeHandler.data)
+
+        # Small files are streamed as well
+        RangeHandler.accept_ranges = True
+        result = rp_download.download(self.url, self.save_path, concurrency=4, range_size=600000)
+        self.assertEqual(result["mode"], "stream")
+        self.assertEqual(RangeHandler.ranges, [])
+
+    @patch.object(rp_download, "BACKOFF_S", 0)
+    def test_gives_up_after_the_retries(self):
+        RangeHandler.fail_ranges = 10
+        with self.assertRaises(rp_download.DownloadError):
+            rp_download.download(self.url, self.save_path, concurrency=2, range_size=500000, retries=2)
+
+    def test_first_failed_range_cancels_the_rest(self):
+        def fetch_range(url, fd, start, size, retries, response=None):
+            if start == 100000:
+                raise rp_download.DownloadError("Range 100000-199999 failed")
+            time.sleep(0.05)
+
+        with patch.object(rp_download, "fetch_range", side_effect=fetch_range) as mock_fetch_range:
+            with self.assertRaisesRegex(rp_download.DownloadError, "Range 100000-199999 failed"):
+                rp_download.download(self.url, self.save_path, concurrency=2, range_size=100000)
+
+        # The ranges in flight finish, the other seven are not downloaded
+        self.assertLessEqual(mock_fetch_range.call_count, 3)
+
+    def test_size_limit(self):
+        with self.assertRaises(rp_download.InputTooLarge):
+            rp_download.download(self.url, self.save_path, max_bytes=999999)
+
+    def test_multipart_body(self):
+        blocks = [b"\x89PNG", os.urandom(1000), b"--end"]
+        body = rp_download.MultipartBody({"overwrite": "true"}, "image", "input.jpg", "image/jpeg", iter(blocks), 1009)
+        data = b"".join(body)
+
+        self.assertEqual(len(data), body.len)
+        message = email.parser.BytesParser().parsebytes(b"Content-Type: " + body.content_type.encode() + b"\r\n\r\n" + data)
+        overwrite, image = message.get_payload()
+        self.assertEqual(overwrite.get_payload(), "true")
+        self.assertEqual(image.get_filename(), "input.jpg")
+        self.assertEqual(image.get_payload(decode=True), b"".join(blocks))
+
+        # Without a known size the body is sent chunked
+        body = rp_download.MultipartBody({}, "image", "input.jpg", "image/jpeg", iter(blocks))
+        headers = rp_download.requests.Request("POST", self.url, data=body).prepare().headers
+        self.assertEqual(headers["Transfer-Encoding"], "chunked")
+        self.assertNotIn("Content-Length", headers)
+
+    def test_open_stream(self):
+        response, size, blocks = rp_download.open_stream(self.url)
+        with response:
+            self.assertEqual(size, 1000000)
+            self.assertEqual(b"".join(blocks), RangeHandler.data)
+
+        with self.assertRaises(rp_download.InputTooLarge):
+            rp_download.open_stream(self.url, max_bytes=999999)
+
+
+if __name__ == "__main__":
+    unittest.main()
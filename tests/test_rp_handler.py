@@ -3,8 +3,12 @@ from unittest.mock import patch, MagicMock, mock_open, Mock
 import sys
 import os
 import json
+import base64
 import requests
 import uuid
+import tempfile
+import shutil
+import threading
 
 # Mock modules before importing rp_handler
 sys.modules['runpod'] = MagicMock()
@@ -265,6 +269,139 @@ class TestRunpodWorkerComfy(unittest.TestCase):
         # Verify MIME type header was still set
         mock_tus_client.set_headers.assert_called_with({"mimeType": "image/png"})
 
+    @patch("rp_handler.os.walk")
+    @patch("rp_handler.os.path.exists")
+    @patch("rp_handler.os.path.getsize")
+    @patch("rp_handler.os.remove")
+    @patch("rp_handler.get_mime_type")
+    @patch.object(rp_handler, "UPLOAD_CONCURRENCY", 3)
+    @patch.dict(
+        os.environ, {"COMFY_OUTPUT_PATH": RUNPOD_WORKER_COMFY_TEST_RESOURCES_IMAGES}
+    )
+    def test_process_output_images_concurrent_upload(self, mock_get_mime_type, mock_remove, mock_getsize, mock_exists, mock_walk):
+        """Test that files are uploaded in parallel when UPLOAD_CONCURRENCY is set."""
+        mock_walk.return_value = [
+            (RUNPOD_WORKER_COMFY_TEST_RESOURCES_IMAGES, [], ["test1.png", "test2.png", "test3.psd"])
+        ]
+        mock_exists.return_value = True
+        mock_getsize.return_value = 1024
+        mock_get_mime_type.return_value = "image/png"
+
+        rp_handler.tus_client.reset_mock()
+        mock_tus_client = MagicMock()
+        mock_tus_client.uploader.return_value.url = "http://example.com/tus/uploaded_file"
+        rp_handler.tus_client.TusClient.return_value = mock_tus_client
+
+        result = rp_handler.process_output_images("test_job", "http://example.com/tus")
+
+        self.assertEqual(mock_tus_client.uploader.call_count, 3)
+        self.assertEqual(mock_remove.call_count, 3)
+        self.assertEqual(result["status"], "success")
+        self.assertEqual(result["uploaded_count"], 3)
+        self.assertEqual(result["uploaded_bytes"], 3072)
+
+    @patch.object(rp_handler, "UPLOAD_CONCURRENCY", 2)
+    @patch.object(rp_handler, "upload_output_file")
+    def test_process_output_images_concurrent_upload_stops_at_failure(self, mock_upload):
+        """Test that the uploads not started yet are cancelled when a concurrent upload fails."""
+        output_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_path, True)
+        names = [f"output_000{i}.png" for i in range(5)]
+        for name in names:
+            with open(os.path.join(output_path, name), "wb") as f:
+                f.write(b"\0" * 100)
+        release = threading.Event()
+
+        def upload(job_id, file_path, sink, job_dir):
+            if os.path.basename(file_path) == names[0]:
+                return 0, "Error uploading file output_0000.png using TUS protocol: Connection reset"
+            # Keeps both threads busy until the failure has been seen
+            release.wait(0.2)
+            return 100, None
+
+        mock_upload.side_effect = upload
+        with patch.dict(os.environ, {"COMFY_OUTPUT_PATH": output_path}), patch("rp_handler.os.walk", return_value=[(output_path, [], names)]):
+            result = rp_handler.process_output_images("test_job", "http://example.com/tus")
+
+        self.assertEqual(result["status"], "error")
+        self.assertEqual(result["message"], "Error uploading file output_0000.png using TUS protocol: Connection reset")
+        self.assertEqual(mock_upload.call_count, 3)
+
+    @patch.object(rp_handler, "UPLOAD_CONCURRENCY", 3)
+    def test_process_output_images_concurrent_upload_spans(self):
+        """Test that the spans of concurrent uploads are children of the span of the job."""
+        output_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_path, True)
+        for name in ("output_0001.png", "output_0002.png", "output_0003.png"):
+            with open(os.path.join(output_path, name), "wb") as f:
+                f.write(b"\0" * 100)
+        traces_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, traces_dir, True)
+        traces_file = os.path.join(traces_dir, "spans.jsonl")
+        self.addCleanup(rp_handler.rp_tracing.shutdown)
+        if not rp_handler.rp_tracing.init_tracing(traces_file=traces_file):
+            self.skipTest("requires the OpenTelemetry SDK")
+
+        sink = MagicMock(url="s3://outputs/job", protocol="S3")
+        sink.upload.return_value = "s3://outputs/job/output.png"
+        with patch.dict(os.environ, {"COMFY_OUTPUT_PATH": output_path}), \
+                patch.object(rp_handler.rp_output_sink, "get_sink", return_value=sink), \
+                rp_handler.rp_tracing.span("handler"):
+            result = rp_handler.process_output_images("test_job", "s3://outputs/job")
+        rp_handler.rp_tracing.shutdown()
+
+        self.assertEqual(result["uploaded_count"], 3)
+        with open(traces_file) as f:
+            spans = [json.loads(line) for line in f]
+        job_span_id = next(span["context"]["span_id"] for span in spans if span["name"] == "handler")
+        upload_spans = [span for span in spans if span["name"] == "upload"]
+        self.assertEqual([span["parent_id"] for span in upload_spans], [job_span_id] * 3)
+
+    def test_process_output_images_bundle(self):
+        """Test that a bundle uploads all outputs as one archive and returns its manifest."""
+        output_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_path, True)
+        for name in ("output_0001.png", "psd_saver_report.txt"):
+            with open(os.path.join(output_path, name), "wb") as f:
+                f.write(b"\0" * 100)
+
+        with patch.dict(os.environ, {"COMFY_OUTPUT_PATH": output_path}), \
+                patch.object(rp_handler.rp_bundle.Bundle, "upload", return_value=("http://example.com/tus/bundle", 3072)) as upload:
+            result = rp_handler.process_output_images("test_job", "http://example.com/tus", bundle="tar")
+
+        upload.assert_called_once_with("http://example.com/tus", "test_job.tar")
+        self.assertEqual(result["status"], "success")
+        self.assertEqual(result["uploaded_count"], 2)
+        self.assertEqual(result["bundle"]["url"], "http://example.com/tus/bundle")
+        self.assertEqual(sorted(entry["name"] for entry in result["bundle"]["entries"]), ["output_0001.png", "psd_saver_report.txt"])
+        self.assertEqual(os.listdir(output_path), [])
+
+        with open(os.path.join(output_path, "output_0001.png"), "wb") as f:
+            f.write(b"\0")
+        with patch.dict(os.environ, {"COMFY_OUTPUT_PATH": output_path}):
+            result = rp_handler.process_output_images("test_job", "s3://bucket/outputs", bundle="tar")
+        self.assertEqual(result["message"], "Bundles can only be uploaded to a TUS endpoint")
+
+    def test_file_slice_reads_only_its_range(self):
+        """Test that a FileSlice behaves like a file holding only its byte range."""
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(b"0123456789")
+            f.flush()
+            with rp_handler.FileSlice(f.name, 3, 4) as part:
+                self.assertEqual(part.seek(0, os.SEEK_END), 4)
+                part.seek(0)
+                self.assertEqual(part.read(3), b"345")
+                self.assertEqual(part.read(), b"6")
+                self.assertEqual(part.read(), b"")
+                part.seek(1)
+                self.assertEqual(part.read(10), b"456")
+
+    def test_process_output_images_unsupported_scheme(self):
+        result = rp_handler.process_output_images("test_job", "ftp://example.com/outputs")
+
+        self.assertEqual(result["status"], "error")
+        self.assertEqual(result["message"], "Unsupported output URL scheme: 'ftp'")
+
     @patch("rp_handler.os.path.exists")
     @patch.dict(
         os.environ, {"COMFY_OUTPUT_PATH": RUNPOD_WORKER_COMFY_TEST_RESOURCES_IMAGES}
@@ -410,6 +547,53 @@ class TestRunpodWorkerComfy(unittest.TestCase):
         self.assertIn("error", result)
         self.assertEqual(result["error"], "'output' must be a string containing a presigned URL")
         
+    @patch.object(rp_handler, "JOB_CONCURRENCY", 2)
+    @patch.object(rp_handler, "fetch_input_image")
+    def test_process_job_removes_a_failed_input(self, mock_fetch):
+        def fetch(source, save_path):
+            with open(save_path, "wb") as f:
+                f.write(b"partial")
+            return False, "Error downloading image: connection reset"
+
+        mock_fetch.side_effect = fetch
+        job = {"id": "test_job", "input": {"input": "https://example.com/image.png", "output": "https://example.com/output", "params": {"tiling": 2, "denoise": "0.4"}}}
+        with tempfile.TemporaryDirectory() as tmp, patch.dict(os.environ, {"COMFY_INPUT_PATH": tmp}):
+            result = rp_handler.process_job(job, {})
+
+            self.assertEqual(result, {"error": "Error downloading image: connection reset"})
+            self.assertEqual(os.listdir(tmp), [])
+
+    @patch.object(rp_handler, "JOB_CONCURRENCY", 2)
+    @patch.object(rp_handler, "INPUT_TRANSFER", "upload")
+    @patch.object(rp_handler, "upload_names", [])
+    @patch.object(rp_handler, "upload_names_count", 0)
+    @patch.object(rp_handler, "stream_input_to_comfy", return_value=(False, "Error downloading image: 404"))
+    def test_process_job_reuses_upload_names(self, mock_stream):
+        job = {"id": "test_job", "input": {"input": "https://example.com/image.png", "output": "https://example.com/output", "params": {"tiling": 2, "denoise": "0.4"}}}
+        for _ in range(3):
+            self.assertEqual(rp_handler.process_job(job, {}), {"error": "Error downloading image: 404"})
+        self.assertEqual([call.args[1] for call in mock_stream.call_args_list], ["input_1.jpg"] * 3)
+
+        # Jobs running at once get names of their own
+        first, second = rp_handler.take_upload_name(), rp_handler.take_upload_name()
+        self.assertEqual((first, second), ("input_1.jpg", "input_2.jpg"))
+        rp_handler.release_upload_name(second)
+        self.assertEqual(rp_handler.take_upload_name(), "input_2.jpg")
+
+    @patch.object(rp_handler.rp_memory, "MEMORY_PROFILING", True)
+    @patch.object(rp_handler.rp_memory, "JobMemoryProfiler")
+    @patch.object(rp_handler.rp_profiler, "JobProfiler")
+    @patch.object(rp_handler, "process_job", side_effect=RuntimeError("ComfyUI went away"))
+    def test_handler_stops_the_profilers_when_the_job_raises(self, mock_process_job, mock_cpu_profiler, mock_memory_profiler):
+        with self.assertRaises(RuntimeError):
+            rp_handler.handler({"id": "test_job", "input": {"input": "https://example.com/image.png", "profile": True}})
+
+        mock_cpu_profiler.assert_called_once_with("test_job")
+        mock_cpu_profiler.return_value.start.assert_called_once()
+        mock_cpu_profiler.return_value.stop.assert_called_once()
+        mock_memory_profiler.return_value.start.assert_called_once()
+        mock_memory_profiler.return_value.stop.assert_called_once()
+
     @patch("rp_handler.requests.get")
     @patch("builtins.open", new_callable=mock_open)
     def test_download_image_successful(self, mock_file, mock_get):
@@ -475,6 +659,7 @@ class TestRunpodWorkerComfy(unittest.TestCase):
         mock_response = MagicMock()
         mock_response.status_code = 200
         mock_response.raise_for_status = MagicMock()
+        mock_response.json.return_value = {"name": "test-uuid.png", "subfolder": "", "type": "input"}
         mock_post.return_value = mock_response
 
         # Test data
@@ -549,3 +734,179 @@ class TestRunpodWorkerComfy(unittest.TestCase):
         validated_data, error = rp_handler.validate_input(input_data)
         self.assertIsNotNone(error)
         self.assertEqual(error, "'params' must be a dictionary")
+
+    def test_priority_param(self):
+        input_data = {
+            "input": "https://example.com/image.png",
+            "output": "https://example.com/output",
+            "params": {"tiling": 2, "denoise": "0.4"},
+            "priority": 3
+        }
+        validated_data, error = rp_handler.validate_input(input_data)
+        self.assertIsNone(error)
+        self.assertEqual(validated_data["priority"], 3)
+
+        for priority in (11, "high", True):
+            validated_data, error = rp_handler.validate_input({**input_data, "priority": priority})
+            self.assertEqual(error, "'priority' must be an integer between -10 and 10")
+
+    def test_callback_param(self):
+        input_data = {
+            "input": "https://example.com/image.png",
+            "output": "https://example.com/output",
+            "params": {"tiling": 2, "denoise": "0.4"},
+            "callback": "https://example.com/done"
+        }
+        validated_data, error = rp_handler.validate_input(input_data)
+        self.assertIsNone(error)
+        self.assertEqual(validated_data["callback"], "https://example.com/done")
+
+        validated_data, error = rp_handler.validate_input({**input_data, "callback": "file:///etc/passwd"})
+        self.assertEqual(error, "'callback' must be an http(s) URL")
+
+    def test_inline_input_param(self):
+        input_data = {
+            "output": "https://example.com/output",
+            "params": {"tiling": 2, "denoise": "0.4"},
+        }
+        for source in ("data:image/png;base64,iVBORw0KGgo=", "iVBORw0KGgo=", "data:;base64,"):
+            with self.subTest(source=source):
+                validated_data, error = rp_handler.validate_input({**input_data, "input": source})
+                self.assertIsNone(error)
+                self.assertEqual(validated_data["input"], source)
+
+        for source in ("not an image", "data:image/png,%89PNG", "iVBORw0KGgo", "ftp://example.com/image.png"):
+            with self.subTest(source=source):
+                validated_data, error = rp_handler.validate_input({**input_data, "input": source})
+                self.assertEqual(error, "'input' must be an image URL, a base64 data: URI or base64")
+
+        with patch.object(rp_handler, "INPUT_MAX_BYTES", 7):
+            validated_data, error = rp_handler.validate_input({**input_data, "input": "iVBORw0KGgo="})
+        self.assertEqual(error, "'input' is larger than 7 bytes")
+
+    @patch.object(rp_handler, "INLINE_DECODE_CHUNK", 8)
+    def test_decode_inline_image(self):
+        data = bytes(range(256)) * 3 + b"end"
+        with tempfile.TemporaryDirectory() as tmp:
+            save_path = os.path.join(tmp, "input.jpg")
+            source = "data:image/jpeg;base64," + base64.b64encode(data).decode()
+
+            self.assertEqual(rp_handler.fetch_input_image(source, save_path), (True, None))
+            with open(save_path, "rb") as f:
+                self.assertEqual(f.read(), data)
+
+            with patch.object(rp_handler, "INPUT_MAX_BYTES", len(data) - 1):
+                success, error = rp_handler.decode_inline_image(source, save_path)
+            self.assertFalse(success)
+            self.assertEqual(error, f"Input image is larger than {len(data) - 1} bytes")
+
+    @patch.object(rp_handler, "INPUT_MAX_BYTES", 10)
+    @patch("rp_handler.requests.get")
+    def test_download_image_size_limit(self, mock_get):
+        mock_get.return_value.headers = {"Content-Length": "11"}
+        success, error = rp_handler.download_image("https://example.com/image.png", "/test/path/input.jpg")
+        self.assertFalse(success)
+        self.assertEqual(error, "Input image is larger than 10 bytes")
+
+    @patch("rp_handler.requests.get")
+    def test_download_image_removes_a_partial_download(self, mock_get):
+        def cut_off(chunk_size):
+            yield b"\0" * 40
+            raise requests.exceptions.ChunkedEncodingError("Connection broken: IncompleteRead(40 bytes read, 60 more expected)")
+
+        mock_get.return_value.headers = {"Content-Length": "100"}
+        mock_get.return_value.iter_content.side_effect = cut_off
+        with tempfile.TemporaryDirectory() as tmp:
+            save_path = os.path.join(tmp, "input.jpg")
+            success, error = rp_handler.download_image("https://example.com/image.png", save_path)
+
+            self.assertFalse(success)
+            self.assertTrue(error.startswith("Error downloading image"))
+            self.assertFalse(os.path.exists(save_path))
+
+    @patch.object(rp_handler, "INLINE_DECODE_CHUNK", 8)
+    @patch("rp_handler.requests.post")
+    @patch("rp_handler.requests.get")
+    def test_stream_input_to_comfy(self, mock_get, mock_post):
+        png = b"\x89PNG\r\n\x1a\n\0\0\0\rIHDR\0\0\x07\x80\0\0\x048" + bytes(range(256)) * 4
+        received = []
+
+        def upload(url, data, headers):
+            # Read the streamed body like the connection would
+            received.append((url, headers["Content-Type"], b"".join(data)))
+            response = MagicMock()
+            response.json.return_value = {"name": "input (1).jpg", "subfolder": "jobs", "type": "input"}
+            return response
+
+        mock_post.side_effect = upload
+        mock_get.return_value.headers = {"Content-Length": str(len(png))}
+        mock_get.return_value.iter_content.return_value = iter([png[:100], png[100:]])
+
+        for source in ("https://example.com/image.png", base64.b64encode(png).decode()):
+            with self.subTest(source=source[:24]):
+                received.clear()
+                success, result = rp_handler.stream_input_to_comfy(source, "input.jpg")
+
+                self.assertTrue(success)
+                self.assertEqual(result, {"filename": "jobs/input (1).jpg", "size_bytes": len(png), "megapixels": 1920 * 1080 / 1_000_000})
+                url, content_type, body = received[0]
+                self.assertEqual(url, f"http://{rp_handler.COMFY_HOST}/upload/image")
+                self.assertTrue(content_type.startswith("multipart/form-data; boundary="))
+                self.assertIn(b'filename="input.jpg"', body)
+                self.assertIn(png, body)
+        mock_get.return_value.close.assert_called_once()
+
+        # A download that ends early fails the job instead of handing ComfyUI a cut off image
+        mock_get.return_value.iter_content.return_value = iter([png[:100]])
+        success, error = rp_handler.stream_input_to_comfy("https://example.com/image.png", "input.jpg")
+        self.assertFalse(success)
+        self.assertIn("ended after 100", error)
+
+    def test_resize_input_keeps_the_original_on_errors(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            input_path = os.path.join(tmp, "input.jpg")
+            with open(input_path, "wb") as f:
+                f.write(b"not an image")
+
+            self.assertIsNone(rp_handler.resize_input(input_path, 1440))
+            with open(input_path, "rb") as f:
+                self.assertEqual(f.read(), b"not an image")
+
+        report = {"original_size": [6000, 4000], "size": [1440, 960], "bytes_saved": 100, "seconds": 0.2}
+        with patch.object(rp_handler.rp_resize, "resize", return_value=report) as mock_resize:
+            self.assertEqual(rp_handler.resize_input("/comfyui/input/input.jpg", 1440), report)
+        mock_resize.assert_called_once_with("/comfyui/input/input.jpg", 1440)
+
+    def test_bundle_param(self):
+        input_data = {
+            "input": "https://example.com/image.png",
+            "output": "https://example.com/output",
+            "params": {"tiling": 2, "denoise": "0.4"},
+        }
+        validated_data, error = rp_handler.validate_input({**input_data, "bundle": "zip"})
+        self.assertIsNone(error)
+        self.assertEqual(validated_data["bundle"], "zip")
+
+        validated_data, error = rp_handler.validate_input(input_data)
+        self.assertNotIn("bundle", validated_data)
+
+        validated_data, error = rp_handler.validate_input({**input_data, "bundle": "rar"})
+        self.assertEqual(error, "'bundle' must be one of tar, zip, tar.zst")
+
+        with patch.object(rp_handler.rp_bundle, "REQUIRED_PACKAGES", {"tar.zst": "not_installed_package"}):
+            validated_data, error = rp_handler.validate_input({**input_data, "bundle": "tar.zst"})
+        self.assertIsNone(validated_data)
+        self.assertEqual(error, "'bundle' tar.zst needs the not_installed_package package, which is not installed")
+
+    def test_count_cached_nodes(self):
+        history_entry = {
+            "status": {
+                "messages": [
+                    ["execution_start", {"prompt_id": "123"}],
+                    ["execution_cached", {"nodes": ["1", "2", "3"], "prompt_id": "123"}],
+                    ["execution_success", {"prompt_id": "123"}],
+                ]
+            }
+        }
+        self.assertEqual(rp_handler.count_cached_nodes(history_entry), 3)
+        self.assertEqual(rp_handler.count_cached_nodes({}), 0)
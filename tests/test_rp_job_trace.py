@@ -0,0 +1,45 @@
+import unittest
+import sys
+import os
+import tempfile
+
+# Make sure that "src" is known and can be used to import rp_job_trace.py
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+from src import rp_job_trace
+
+
+class TestRpJobTrace(unittest.TestCase):
+    def test_record_leaves_out_urls_and_unknown_fields(self):
+        job_input = {
+            "input": "https://example.com/input.png?X-Amz-Signature=secret",
+            "output": "https://example.com/files",
+            "params": {"tiling": 3, "denoise": "0.6", "customer": "acme"},
+        }
+        result = {"status": "success", "uploaded_bytes": 300, "input_size_bytes": 100, "timings": {"total": 1.5}}
+
+        record = rp_job_trace.make_record(job_input, result, 1700000000.12345)
+
+        self.assertEqual(record, {
+            "arrived_at": 1700000000.123,
+            "params": {"tiling": 3, "denoise": "0.6"},
+            "input_size_bytes": 100,
+            "output_size_bytes": 300,
+            "status": "success",
+            "timings": {"total": 1.5},
+        })
+
+    def test_record_and_read_trace(self):
+        job_input = {"params": {"tiling": 2, "denoise": "0.4"}}
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "trace.jsonl")
+            rp_job_trace.record_job(job_input, {"error": "Error queuing workflow"}, 20.0, path)
+            rp_job_trace.record_job(job_input, {"status": "success"}, 10.0, path)
+
+            records = rp_job_trace.read_trace(path)
+
+        self.assertEqual([record["arrived_at"] for record in records], [10.0, 20.0])
+        self.assertEqual([record["status"] for record in records], ["success", "error"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,125 @@
+import unittest
+import sys
+import os
+import json
+import logging
+import threading
+
+# Make sure that "src" is known and can be used to import rp_logging.py
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+from src import rp_logging
+
+
+class RecordingHandler(logging.Handler):
+    """Collects records and counts how often it was woken up to send."""
+
+    def __init__(self):
+        super().__init__()
+        self.records = []
+        self.flush_event = threading.Event()
+        self.flushes = 0
+
+    def emit(self, record):
+        self.records.append(record)
+
+    def wait_for_flush(self, timeout=2):
+        flushed = self.flush_event.wait(timeout)
+        self.flush_event.clear()
+        self.flushes += 1
+        return flushed
+
+
+def make_logger(name, queue_handler):
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    logger.handlers = [queue_handler]
+    return logger
+
+
+class TestRpLogging(unittest.TestCase):
+    def test_drop_oldest_when_queue_is_full(self):
+        drops = []
+        queue_handler = rp_logging.DropOldestQueueHandler(2, on_drop=lambda: drops.append(1))
+        logger = make_logger("test_drop_oldest", queue_handler)
+
+        for i in range(5):
+            logger.info("message %d", i)
+
+        self.assertEqual(queue_handler.dropped, 3)
+        self.assertEqual(len(drops), 3)
+        remaining = [queue_handler.queue.get_nowait().getMessage() for _ in range(2)]
+        self.assertEqual(remaining, ["message 3", "message 4"])
+
+    def test_batch_is_shipped_when_full(self):
+        target = RecordingHandler()
+        queue_handler, listener = rp_logging.create_queue_pipeline(target, batch_size=3, flush_interval=60)
+        logger = make_logger("test_batch_size", queue_handler)
+        listener.start()
+        self.addCleanup(listener.stop)
+
+        for i in range(3):
+            logger.info("message %d", i)
+
+        self.assertTrue(target.wait_for_flush())
+        self.assertEqual([record.getMessage() for record in target.records], ["message 0", "message 1", "message 2"])
+
+    def test_batch_is_shipped_after_interval(self):
+        target = RecordingHandler()
+        queue_handler, listener = rp_logging.create_queue_pipeline(target, batch_size=100, flush_interval=0.1)
+        logger = make_logger("test_batch_interval", queue_handler)
+        listener.start()
+        self.addCleanup(listener.stop)
+
+        logger.info("single message")
+
+        self.assertTrue(target.wait_for_flush())
+        self.assertEqual(len(target.records), 1)
+
+    def test_stop_ships_remaining_records_and_reports_drops(self):
+        target = RecordingHandler()
+        queue_handler, listener = rp_logging.create_queue_pipeline(target, maxsize=2, batch_size=100, flush_interval=60)
+        logger = make_logger("test_stop", queue_handler)
+
+        # Fill the queue before the listener runs so that records are dropped
+        for i in range(4):
+            logger.info("message %d", i)
+        listener.start()
+        listener.stop()
+
+        messages = [record.getMessage() for record in target.records]
+        self.assertIn("message 3", messages)
+        dropped = [record for record in target.records if hasattr(record, "dropped_records")]
+        self.assertEqual(len(dropped), 1)
+        self.assertEqual(dropped[0].levelno, logging.WARNING)
+        self.assertEqual(dropped[0].dropped_records_total, queue_handler.dropped)
+
+    def test_lazy_json_is_serialized_on_the_listener(self):
+        payload = {"prompt": {"outputs": [1, 2, 3]}}
+        target = RecordingHandler()
+        queue_handler, listener = rp_logging.create_queue_pipeline(target, batch_size=1, flush_interval=60)
+        logger = make_logger("test_lazy", queue_handler)
+
+        logger.debug("Polling iteration", extra={"history": rp_logging.LazyJson(payload)})
+        queued = queue_handler.queue.queue[0]
+        self.assertIsInstance(queued.history, rp_logging.LazyJson)
+
+        listener.start()
+        self.assertTrue(target.wait_for_flush())
+        listener.stop()
+        self.assertEqual(json.loads(target.records[0].history), payload)
+
+    def test_lazy_json_is_never_serialized_without_consumer(self):
+        class Exploding:
+            pass
+
+        lazy = rp_logging.LazyJson(Exploding())
+        logger = logging.getLogger("test_lazy_unused")
+        logger.propagate = False
+        logger.handlers = [logging.NullHandler()]
+        # Would raise TypeError if json.dumps ran on the calling thread
+        logger.debug("Polling iteration", extra={"history": lazy})
+
+
+if __name__ == "__main__":
+    unittest.main()
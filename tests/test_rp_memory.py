@@ -0,0 +1,60 @@
+import unittest
+import sys
+import os
+import subprocess
+import time
+import tracemalloc
+import unittest.mock
+
+# Make sure that "src" is known and can be used to import rp_memory.py
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+from src import rp_memory
+
+LEAK = []
+
+
+class TestRpMemory(unittest.TestCase):
+    @unittest.skipUnless(os.path.exists("/proc/self/status"), "requires /proc")
+    def test_read_rss_of_current_process(self):
+        rss = rp_memory.read_rss()
+        self.assertGreater(rss["rss_bytes"], 0)
+        self.assertGreaterEqual(rss["rss_peak_bytes"], rss["rss_bytes"])
+
+    def test_read_rss_of_missing_process(self):
+        self.assertIsNone(rp_memory.read_rss(2 ** 31))
+
+    @unittest.skipUnless(os.path.exists("/proc/self/cmdline"), "requires /proc")
+    def test_sample_rss_finds_comfyui_process(self):
+        process = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(10)", "fake-comfyui/main.py"])
+        self.addCleanup(process.wait)
+        self.addCleanup(process.kill)
+
+        with unittest.mock.patch.object(rp_memory, "COMFYUI_CMDLINE", "fake-comfyui/main.py"):
+            # The command line only changes once the child has called exec
+            for _ in range(50):
+                rss = rp_memory.sample_rss()
+                if rss["comfyui"] is not None:
+                    break
+                time.sleep(0.1)
+
+        self.assertEqual(rss["comfyui"]["pid"], process.pid)
+        self.assertGreater(rss["comfyui"]["rss_bytes"], 0)
+
+    def test_profiler_reports_allocations_of_the_job(self):
+        self.addCleanup(tracemalloc.stop)
+        self.addCleanup(LEAK.clear)
+        profiler = rp_memory.JobMemoryProfiler(top=5, frames=1)
+
+        profiler.start()
+        LEAK.extend(bytearray(1024 * 1024) for _ in range(4))
+        report = profiler.stop()
+
+        self.assertGreaterEqual(report["traced_peak_bytes"], 4 * 1024 * 1024)
+        top = report["top_allocations"][0]
+        self.assertIn(os.path.basename(__file__), top["location"])
+        self.assertGreaterEqual(top["size_diff_bytes"], 4 * 1024 * 1024)
+        self.assertIn("handler", report["rss"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import threading
+import urllib.request
+
+# Make sure that "src" is known and can be used to import rp_metrics.py
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+from src import rp_metrics
+
+
+class TestRpMetrics(unittest.TestCase):
+    def setUp(self):
+        patcher = patch.object(rp_metrics, "ENABLED", True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # Keep test metrics out of the shared registry
+        registry_patcher = patch.object(rp_metrics, "REGISTRY", [])
+        registry_patcher.start()
+        self.addCleanup(registry_patcher.stop)
+
+    def test_counter_sums_shards_across_threads(self):
+        counter = rp_metrics.Counter("test_total", "Test counter.")
+
+        def work():
+            for _ in range(1000):
+                counter.inc()
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertIn("test_total 4000", counter.render())
+
+    def test_shards_of_exited_threads_are_retired(self):
+        counter = rp_metrics.Counter("retired_total", "Retired.")
+        histogram = rp_metrics.Histogram("retired_seconds", "Retired.", buckets=(1,))
+
+        def work():
+            counter.inc()
+            histogram.observe(0.5)
+
+        for _ in range(3):
+            # A new pool thread per job
+            thread = threading.Thread(target=work)
+            thread.start()
+            thread.join()
+            counter.render()
+            histogram.render()
+        counter.inc()
+
+        self.assertEqual(len(counter._shards), 1)
+        self.assertEqual(histogram._shards, [])
+        self.assertIn("retired_total 4", counter.render())
+        lines = histogram.render()
+        self.assertIn('retired_seconds_bucket{le="1"} 3', lines)
+        self.assertIn("retired_seconds_count 3", lines)
+
+    def test_counter_with_labels(self):
+        counter = rp_metrics.Counter("nodes_total", "Nodes.", ("result",))
+        counter.inc(3, "cached")
+        counter.inc(5, "executed")
+
+        lines = counter.render()
+        self.assertIn('nodes_total{result="cached"} 3', lines)
+        self.assertIn('nodes_total{result="executed"} 5', lines)
+
+    def test_histogram_renders_cumulative_buckets(self):
+        histogram = rp_metrics.Histogram("latency_seconds", "Latency.", ("phase",), buckets=(1, 5))
+        histogram.observe(0.5, "download")
+        histogram.observe(3, "download")
+        histogram.observe(10, "download")
+
+        lines = histogram.render()
+        self.assertIn('latency_seconds_bucket{phase="download",le="1"} 1', lines)
+        self.assertIn('latency_seconds_bucket{phase="download",le="5"} 2', lines)
+        self.assertIn('latency_seconds_bucket{phase="download",le="+Inf"} 3', lines)
+        self.assertIn('latency_seconds_sum{phase="download"} 13.5', lines)
+        self.assertIn('latency_seconds_count{phase="download"} 3', lines)
+
+    def test_gauge_inc_dec_and_function(self):
+        gauge = rp_metrics.Gauge("in_progress", "In progress.")
+        gauge.inc()
+        gauge.inc()
+        gauge.dec()
+        self.assertIn("in_progress 1", gauge.render())
+
+        gauge.set_function(lambda: 7)
+        self.assertIn("in_progress 7", gauge.render())
+
+        gauge.set_function(lambda: 1 / 0)
+        self.assertEqual(len(gauge.render()), 2)  # Only HELP and TYPE
+
+    def test_disabled_metrics_record_nothing(self):
+        counter = rp_metrics.Counter("disabled_total", "Disabled.")
+        histogram = rp_metrics.Histogram("disabled_seconds", "Disabled.")
+        with patch.object(rp_metrics, "ENABLED", False):
+            counter.inc()
+            histogram.observe(1)
+
+        self.assertEqual(counter._shards, [])
+        self.assertEqual(histogram._shards, [])
+
+    def test_label_values_are_escaped(self):
+        counter = rp_metrics.Counter("escaped_total", "Escaped.", ("name",))
+        counter.inc(1, 'a"b')
+        self.assertIn('escaped_total{name="a\\"b"} 1', counter.render())
+
+    def test_server_serves_metrics(self):
+        counter = rp_metrics.Counter("served_total", "Served.")
+        counter.inc(2)
+
+        server = rp_metrics.start_server(port=0, host="127.0.0.1")
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        port = server.server_address[1]
+
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+            body = response.read().decode()
+            content_type = response.headers["Content-Type"]
+
+        self.assertIn("# TYPE served_total counter", body)
+        self.assertIn("served_total 2", body)
+        self.assertTrue(content_type.startswith("text/plain"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import unittest
+import sys
+import os
+import json
+import hashlib
+import shutil
+import tempfile
+
+# Make sure that "src" is known and can be used to import rp_model_cache.py
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+from src import rp_model_cache, rp_model_fetch
+
+
+class TestRpModelCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, True)
+        self.volume = os.path.join(self.tmp, "volume")
+        self.link_dir = os.path.join(self.tmp, "comfyui", "models")
+        self.search_paths = {
+            folder: [os.path.join(self.link_dir, folder), os.path.join(self.volume, "models", folder)]
+            for folder in ("unet", "loras", "vae")
+        }
+
+    def write(self, path, data):
+        path = os.path.join(self.tmp, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def cache(self, max_bytes=10000):
+        return rp_model_cache.ModelCache(os.path.join(self.tmp, "cache"), max_bytes, self.link_dir, self.search_paths)
+
+    def test_copies_verifies_and_links(self):
+        data = os.urandom(3000)
+        self.write("volume/models/unet/flux.gguf", data)
+        self.write("comfyui/models/vae/ae.safetensors", b"baked into the image")
+
+        cache = self.cache()
+        cache.use([("unet", "flux.gguf"), ("vae", "ae.safetensors"), ("loras", "missing.safetensors")])
+        cache.wait()
+
+        link = os.path.join(self.link_dir, "unet", "flux.gguf")
+        self.assertTrue(os.path.islink(link))
+        self.assertEqual(os.readlink(link), os.path.join(self.tmp, "cache", "unet", "flux.gguf"))
+        with open(link, "rb") as f:
+            self.assertEqual(f.read(), data)
+        # Files that are already local are left alone
+        self.assertFalse(os.path.islink(os.path.join(self.link_dir, "vae", "ae.safetensors")))
+        self.assertEqual(cache.stats(), {"models": 1, "bytes": 3000, "max_bytes": 10000})
+        self.assertEqual(cache.errors, {})
+        self.assertEqual(os.listdir(os.path.join(self.tmp, "cache", ".tmp")), [])
+
+    def test_evicts_least_recently_used(self):
+        for name in ("a", "b", "c"):
+            self.write(f"volume/models/loras/{name}.safetensors", os.urandom(4000))
+
+        cache = self.cache()
+        cache.add("loras", "a.safetensors")
+        cache.add("loras", "b.safetensors")
+        cache.touch([("loras", "a.safetensors")])
+        cache.add("loras", "c.safetensors")
+
+        cached = sorted(os.listdir(os.path.join(self.tmp, "cache", "loras")))
+        self.assertEqual(cached, ["a.safetensors", "c.safetensors"])
+        self.assertFalse(os.path.lexists(os.path.join(self.link_dir, "loras", "b.safetensors")))
+        # A new cache on the same directory picks up the index
+        self.assertEqual(self.cache().stats()["bytes"], 8000)
+
+    def test_checksum_mismatch_with_the_fetch_state(self):
+        source = self.write("volume/models/unet/flux.gguf", os.urandom(1000))
+        stat = os.stat(source)
+        with open(os.path.join(self.volume, rp_model_fetch.STATE_FILE), "w") as f:
+            json.dump({"models/unet/flux.gguf": {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": "0" * 64}}, f)
+
+        with self.assertRaises(rp_model_cache.CacheError):
+            self.cache().add("unet", "flux.gguf")
+
+        self.assertFalse(os.path.lexists(os.path.join(self.link_dir, "unet", "flux.gguf")))
+        self.assertEqual(self.cache().stats()["models"], 0)
+        self.assertEqual(os.listdir(os.path.join(self.tmp, "cache", ".tmp")), [])
+
+        with open(source, "rb") as f:
+            sha256 = hashlib.sha256(f.read()).hexdigest()
+        with open(os.path.join(self.volume, rp_model_fetch.STATE_FILE), "w") as f:
+            json.dump({"models/unet/flux.gguf": {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256}}, f)
+        self.assertIsNotNone(self.cache().add("unet", "flux.gguf"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,147 @@
+import unittest
+import sys
+import os
+import json
+import hashlib
+import shutil
+import tempfile
+import threading
+import http.server
+from unittest.mock import patch
+
+# Make sure that "src" is known and can be used to import rp_model_fetch.py
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+from src import rp_model_fetch
+
+MODEL = os.urandom(3 * 1024 * 1024 + 123)
+MODEL_SHA256 = hashlib.sha256(MODEL).hexdigest()
+
+
+class ModelHandler(http.server.BaseHTTPRequestHandler):
+    """Serves MODEL at /model.bin with range support and a Hugging Face style repo API"""
+    requests_seen = []
+
+    def do_GET(self):
+        ModelHandler.requests_seen.append((self.path, self.headers.get("Range")))
+        if self.path.startswith("/api/models/acme/repo/revision/main"):
+            body = json.dumps({"siblings": [
+                {"rfilename": "config.json", "size": 2},
+                {"rfilename": "model.bin", "size": len(MODEL), "lfs": {"sha256": MODEL_SHA256, "size": len(MODEL)}},
+            ]}).encode()
+            return self.reply(200, body)
+        if self.path == "/acme/repo/resolve/main/config.json":
+            return self.reply(200, b"{}")
+        if not self.path.endswith("/model.bin"):
+            return self.reply(404, b"")
+
+        range_header = self.headers.get("Range")
+        if range_header:
+            start = int(range_header.split("=")[1].rstrip("-"))
+            if start >= len(MODEL):
+                return self.reply(416, b"")
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(MODEL) - 1}/{len(MODEL)}")
+            body = MODEL[start:]
+        else:
+            self.send_response(200)
+            body = MODEL
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def reply(self, status, body):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestRpModelFetch(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), ModelHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f"http://127.0.0.1:{cls.server.server_port}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        ModelHandler.requests_seen.clear()
+        self.dest = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dest, True)
+        self.entry = {"url": f"{self.url}/model.bin", "path": "models/unet/model.bin", "size": len(MODEL), "sha256": MODEL_SHA256}
+
+    def read_model(self):
+        with open(os.path.join(self.dest, "models/unet/model.bin"), "rb") as f:
+            return f.read()
+
+    def test_download_verifies_and_skips_on_second_run(self):
+        report = rp_model_fetch.ModelFetcher(self.dest, retries=1).fetch([self.entry])
+        self.assertEqual(report["downloaded"], 1)
+        self.assertEqual(report["downloaded_bytes"], len(MODEL))
+        self.assertEqual(self.read_model(), MODEL)
+
+        # A new fetcher skips the verified file without downloading it again
+        ModelHandler.requests_seen.clear()
+        report = rp_model_fetch.ModelFetcher(self.dest, retries=1).fetch([self.entry])
+        self.assertEqual(report["skipped"], 1)
+        self.assertEqual(ModelHandler.requests_seen, [])
+
+    def test_resumes_partial_download(self):
+        part_path = os.path.join(self.dest, "models/unet/model.bin.part")
+        os.makedirs(os.path.dirname(part_path))
+        with open(part_path, "wb") as f:
+            f.write(MODEL[:1000000])
+
+        report = rp_model_fetch.ModelFetcher(self.dest, retries=1).fetch([self.entry])
+
+        self.assertEqual(report["downloaded"], 1)
+        self.assertEqual(report["downloaded_bytes"], len(MODEL) - 1000000)
+        self.assertEqual(ModelHandler.requests_seen, [("/model.bin", "bytes=1000000-")])
+        self.assertEqual(self.read_model(), MODEL)
+        self.assertFalse(os.path.exists(part_path))
+
+    def test_checksum_mismatch_fails_without_installing_the_file(self):
+        entry = {**self.entry, "sha256": "0" * 64}
+        report = rp_model_fetch.ModelFetcher(self.dest, retries=1).fetch([entry])
+
+        self.assertEqual(report["failed"], 1)
+        self.assertIn("Checksum mismatch", report["files"][0]["error"])
+        self.assertEqual(os.listdir(os.path.join(self.dest, "models/unet")), [])
+
+    def test_repo_entries_and_manifest_update(self):
+        manifest_path = os.path.join(self.dest, "models.json")
+        with open(manifest_path, "w") as f:
+            json.dump({"models": [{"url": f"{self.url}/model.bin", "path": "models/unet/model.bin"}]}, f)
+
+        with patch.object(rp_model_fetch, "HF_ENDPOINT", self.url):
+            files = rp_model_fetch.expand_repo({"repo": "acme/repo", "path": "models/LLM/repo"})
+            exit_code = rp_model_fetch.main(["--manifest", manifest_path, "--dest", self.dest, "--update-manifest"])
+
+        self.assertEqual([entry["path"] for entry in files], ["models/LLM/repo/config.json", "models/LLM/repo/model.bin"])
+        self.assertEqual(files[1]["sha256"], MODEL_SHA256)
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(rp_model_fetch.load_manifest(manifest_path)[0]["sha256"], MODEL_SHA256)
+
+
+    @patch.object(rp_model_fetch.time, "sleep")
+    def test_failed_repo_listing_does_not_stop_the_other_models(self, mock_sleep):
+        fetcher = rp_model_fetch.ModelFetcher(self.dest, retries=2)
+        with patch.object(rp_model_fetch, "HF_ENDPOINT", self.url):
+            report = fetcher.fetch([{"repo": "acme/missing", "path": "models/LLM/missing"}, self.entry])
+
+        self.assertEqual((report["downloaded"], report["failed"]), (1, 1))
+        failed = report["files"][0]
+        self.assertEqual((failed["path"], failed["repo"], failed["status"]), ("models/LLM/missing", "acme/missing", "failed"))
+        self.assertIn("404", failed["error"])
+        self.assertEqual(sum(1 for path, _ in ModelHandler.requests_seen if path.startswith("/api/models/acme/missing")), 2)
+        self.assertEqual(self.read_model(), MODEL)
+
+if __name__ == "__main__":
+    unittest.main()
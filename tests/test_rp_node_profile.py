@@ -0,0 +1,126 @@
+import unittest
+import sys
+import os
+import json
+import asyncio
+import tempfile
+import threading
+
+# Make sure that "src" is known and can be used to import rp_node_profile.py
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+from src import rp_node_profile
+
+WORKFLOW = {
+    "1": {"class_type": "StableContusionImageLoader", "inputs": {}},
+    "2": {"class_type": "Florence2Run", "inputs": {}},
+    "3": {"class_type": "UltimateSDUpscale", "inputs": {}},
+    "4": {"class_type": "StableContusionPsdBatchSaver", "inputs": {}},
+}
+
+
+def record_events(profile):
+    profile.record("execution_start", {"prompt_id": "p1"}, 100.0)
+    profile.record("execution_cached", {"nodes": ["1"], "prompt_id": "p1"}, 100.0)
+    profile.record("executing", {"node": "2", "prompt_id": "p1"}, 100.5)
+    profile.record("executing", {"node": "3", "prompt_id": "p1"}, 102.0)
+    profile.record("executing", {"node": "4", "prompt_id": "p1"}, 110.0)
+    profile.record("executed", {"node": "4", "prompt_id": "p1"}, 111.0)
+    return profile.record("executing", {"node": None, "prompt_id": "p1"}, 111.5)
+
+
+class TestNodeProfile(unittest.TestCase):
+    def test_summary_sorted_by_self_time_with_cache_hits(self):
+        profile = rp_node_profile.NodeProfile("p1", WORKFLOW)
+        finished = record_events(profile)
+
+        self.assertTrue(finished)
+        summary = profile.summary()
+        self.assertEqual(
+            [entry["class_type"] for entry in summary],
+            ["UltimateSDUpscale", "Florence2Run", "StableContusionPsdBatchSaver", "StableContusionImageLoader"],
+        )
+        self.assertEqual(summary[0]["self_time_seconds"], 8.0)
+        self.assertEqual(summary[2]["self_time_seconds"], 1.0)
+        self.assertTrue(summary[3]["cached"])
+        self.assertEqual(summary[3]["calls"], 0)
+
+    def test_events_of_other_prompts_are_ignored(self):
+        profile = rp_node_profile.NodeProfile("p1", WORKFLOW)
+        profile.record("executing", {"node": "2", "prompt_id": "other"}, 1.0)
+        self.assertFalse(profile.record("executing", {"node": None, "prompt_id": "other"}, 2.0))
+        self.assertEqual(profile.summary(), [])
+
+    def test_chrome_trace(self):
+        profile = rp_node_profile.NodeProfile("p1", WORKFLOW)
+        record_events(profile)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "trace.json")
+            profile.write_chrome_trace(path)
+            with open(path) as f:
+                trace = json.load(f)
+
+        complete = [event for event in trace["traceEvents"] if event["ph"] == "X"]
+        cached = [event for event in trace["traceEvents"] if event["cat"] == "cached"]
+        self.assertEqual(len(complete), 3)
+        self.assertEqual(len(cached), 1)
+        upscale = next(event for event in complete if event["name"] == "UltimateSDUpscale")
+        self.assertEqual(upscale["ts"], 2000000)
+        self.assertEqual(upscale["dur"], 8000000)
+
+
+class TestNodeProfileListener(unittest.TestCase):
+    def test_listener_collects_events_from_websocket(self):
+        from aiohttp import web
+
+        events = [
+            {"type": "status", "data": {"status": {"exec_info": {"queue_remaining": 1}}}},
+            {"type": "execution_start", "data": {"prompt_id": "p1"}},
+            {"type": "executing", "data": {"node": "2", "prompt_id": "p1"}},
+            {"type": "executing", "data": {"node": "3", "prompt_id": "p1"}},
+            {"type": "executing", "data": {"node": None, "prompt_id": "p1"}},
+        ]
+
+        async def websocket_handler(request):
+            ws = web.WebSocketResponse()
+            await ws.prepare(request)
+            await ws.send_bytes(b"preview")
+            for event in events:
+                await ws.send_str(json.dumps(event))
+            await asyncio.sleep(0.5)
+            await ws.close()
+            return ws
+
+        started = threading.Event()
+        state = {}
+
+        def serve():
+            loop = asyncio.new_event_loop()
+            app = web.Application()
+            app.router.add_get("/ws", websocket_handler)
+            runner = web.AppRunner(app)
+            loop.run_until_complete(runner.setup())
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            loop.run_until_complete(site.start())
+            state["port"] = site._server.sockets[0].getsockname()[1]
+            state["loop"] = loop
+            started.set()
+            loop.run_forever()
+            loop.run_until_complete(runner.cleanup())
+
+        server_thread = threading.Thread(target=serve, daemon=True)
+        server_thread.start()
+        started.wait(5)
+        self.addCleanup(lambda: state["loop"].call_soon_threadsafe(state["loop"].stop))
+
+        listener = rp_node_profile.NodeProfileListener(f"127.0.0.1:{state['port']}", "client", WORKFLOW)
+        self.assertTrue(listener.start())
+        listener.set_prompt_id("p1")
+        profile = listener.stop(timeout=5)
+
+        self.assertIsNone(listener.error)
+        self.assertEqual({entry["node_id"] for entry in profile.summary()}, {"2", "3"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import unittest
+import sys
+import os
+import shutil
+import tempfile
+from unittest.mock import patch
+
+# Make sure that "src" is known and can be used to import rp_output_sink.py
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "integration")))
+from src import rp_output_sink
+from mock_s3_server import S3Server
+
+
+class TestRpOutputSink(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = S3Server(port=0).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.server.objects.clear()
+        self.server.requests.clear()
+        self.server.fail_parts.clear()
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, True)
+        patches = [
+            patch.object(rp_output_sink, "BUCKET_ENDPOINT_URL", self.server.url),
+            patch.object(rp_output_sink, "BUCKET_ACCESS_KEY_ID", "test"),
+            patch.object(rp_output_sink, "BUCKET_SECRET_ACCESS_KEY", "test"),
+            patch.object(rp_output_sink, "S3_ADDRESSING_STYLE", "path"),
+            patch.object(rp_output_sink, "_s3_client", None),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def write(self, name, size):
+        path = os.path.join(self.tmp, name)
+        with open(path, "wb") as f:
+            f.write(os.urandom(size))
+        return path
+
+    def read(self, path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    def test_get_sink_by_scheme(self):
+        sink = rp_output_sink.get_sink("s3://outputs/jobs/123/")
+        self.assertIsInstance(sink, rp_output_sink.S3Sink)
+        self.assertEqual((sink.bucket, sink.prefix), ("outputs", "jobs/123/"))
+        with self.assertRaisesRegex(ValueError, "Unsupported output URL scheme: 'ftp'"):
+            rp_output_sink.get_sink("ftp://example.com/out")
+
+    def test_small_file_single_put(self):
+        path = self.write("image.png", 1000)
+        url = rp_output_sink.get_sink("s3://outputs/job/").upload(path, "image.png", "image/png")
+
+        self.assertEqual(url, "s3://outputs/job/image.png")
+        self.assertEqual(self.server.objects[("outputs", "job/image.png")], self.read(path))
+        self.assertEqual(self.server.requests, [("PUT", "job/image.png", None)])
+
+    def test_prefix_without_trailing_slash(self):
+        self.assertEqual(rp_output_sink.S3Sink("s3://outputs/job", client=object()).key("image.png"), "job/image.png")
+        self.assertEqual(rp_output_sink.S3Sink("s3://outputs", client=object()).key("image.png"), "image.png")
+
+        path = self.write("image.png", 1000)
+        url = rp_output_sink.get_sink("s3://outputs/job").upload(path, "image.png", "image/png")
+        self.assertEqual(url, "s3://outputs/job/image.png")
+        self.assertEqual(self.server.objects[("outputs", "job/image.png")], self.read(path))
+
+    def test_large_file_parallel_multipart(self):
+        path = self.write("image.png", 5 * 1024 * 1024 * 3 + 17)
+        sink = rp_output_sink.S3Sink("s3://outputs/job/", part_size=5 * 1024 * 1024, concurrency=3)
+        url = sink.upload(path, os.path.join("sub", "image.png"), "image/png")
+
+        self.assertEqual(url, "s3://outputs/job/sub/image.png")
+        self.assertEqual(self.server.objects[("outputs", "job/sub/image.png")], self.read(path))
+        parts = sorted(int(number) for method, _, number in self.server.requests if number)
+        self.assertEqual(parts, [1, 2, 3, 4])
+
+    def test_failed_part_aborts_the_upload(self):
+        self.server.fail_parts.add(2)
+        path = self.write("image.png", 5 * 1024 * 1024 * 2)
+        sink = rp_output_sink.S3Sink("s3://outputs/job/", part_size=5 * 1024 * 1024, concurrency=2)
+
+        with self.assertRaises(Exception):
+            sink.upload(path, "image.png", "image/png")
+
+        self.assertNotIn(("outputs", "job/image.png"), self.server.objects)
+        self.assertEqual(self.server.uploads, {})
+        self.assertIn(("DELETE", "job/image.png", None), self.server.requests)
+
+
+if __name__ == "__main__":
+    unittest.main()
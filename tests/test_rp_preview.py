@@ -0,0 +1,100 @@
+import unittest
+import sys
+import os
+import io
+import shutil
+import importlib.util
+import tempfile
+from unittest.mock import patch
+
+# Make sure that "src" is known and can be used to import rp_preview.py
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+from src import rp_preview
+
+HAS_PILLOW = importlib.util.find_spec("PIL") is not None
+
+
+class TestRpPreview(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, True)
+
+    def write(self, name, data):
+        path = os.path.join(self.tmp, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    @unittest.skipUnless(HAS_PILLOW, "requires Pillow")
+    def test_make_preview(self):
+        from PIL import Image
+
+        path = os.path.join(self.tmp, "output.png")
+        Image.new("RGBA", (4000, 3000), (200, 100, 50, 255)).save(path)
+
+        data, width, height = rp_preview.make_preview(path, max_size=512, image_format="jpeg")
+
+        self.assertEqual((width, height), (512, 384))
+        with Image.open(io.BytesIO(data)) as preview:
+            self.assertEqual(preview.format, "JPEG")
+            self.assertEqual(preview.size, (512, 384))
+
+    @unittest.skipUnless(HAS_PILLOW, "requires Pillow")
+    def test_make_preview_of_palette_bilevel_and_16_bit_pngs(self):
+        from PIL import Image
+
+        images = {
+            "P": Image.linear_gradient("L").resize((3000, 2000)).convert("P"),
+            "1": Image.new("1", (3000, 2000), 1),
+            "I;16": Image.new("I;16", (3000, 2000), 40000),
+        }
+        for mode, image in images.items():
+            with self.subTest(mode=mode):
+                path = os.path.join(self.tmp, "output.png")
+                image.save(path)
+
+                data, width, height = rp_preview.make_preview(path, max_size=300, image_format="jpeg")
+
+                self.assertEqual((width, height), (300, 200))
+                with Image.open(io.BytesIO(data)) as preview:
+                    self.assertEqual(preview.mode, "RGB")
+        # 16-bit values are scaled, not clipped to white
+        with Image.open(io.BytesIO(data)) as preview:
+            self.assertAlmostEqual(preview.getpixel((150, 100))[0], 156, delta=2)
+
+    def test_previews_the_first_complete_png(self):
+        published = []
+
+        def publish(data, name, mime_type):
+            published.append((data, name, mime_type))
+            return {"data": "..."}
+
+        self.write("old.png", b"from the job before")
+        job = rp_preview.PreviewJob(self.tmp, publish, ignore=[os.path.join(self.tmp, "old.png")])
+        with patch.object(rp_preview, "make_preview", return_value=(b"jpeg", 512, 384)) as make_preview:
+            job.poll()
+            self.write("output_0001.psd", b"psd")
+            self.write("output_0001.png", b"partial")
+            job.poll()
+            self.assertIsNone(job.result())
+
+            # Its size did not change since the last poll
+            job.poll()
+            preview = job.result(5)
+
+        make_preview.assert_called_once_with(os.path.join(self.tmp, "output_0001.png"))
+        self.assertEqual(published, [(b"jpeg", "output_0001_preview.jpg", "image/jpeg")])
+        self.assertEqual(preview["source"], "output_0001.png")
+        self.assertEqual((preview["width"], preview["height"], preview["bytes"]), (512, 384, 4))
+
+    def test_final_poll_takes_any_png_and_reports_errors(self):
+        job = rp_preview.PreviewJob(self.tmp, lambda *args: {})
+        self.write("output.png", b"not a png")
+        with patch.object(rp_preview, "make_preview", side_effect=OSError("cannot identify image file")):
+            job.poll(final=True)
+            self.assertIsNone(job.result(5))
+        self.assertEqual(job.error, "cannot identify image file")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+import sys
+import os
+import shutil
+import tempfile
+
+# Make sure that "src" is known and can be used to import rp_prewarm.py
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+from src import rp_prewarm
+
+WORKFLOWS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "workflows"))
+
+
+class TestRpPrewarm(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, True)
+
+    def write(self, path, size):
+        path = os.path.join(self.tmp, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(b"\0" * size)
+        return path
+
+    def test_required_models_of_the_workflows(self):
+        models = rp_prewarm.required_models(WORKFLOWS_DIR)
+
+        self.assertIn(("unet", "flux1-dev-F16.gguf"), models)
+        self.assertIn(("clip", "t5xxl_fp8_e4m3fn.safetensors"), models)
+        self.assertIn(("sams", "sam_hq_vit_h.pth"), models)
+        self.assertIn(("loras", "big melt/melt_LF_no_g_v1-000018.safetensors"), models)
+        self.assertIn(("LLM", "Florence-2-large-PromptGen-v2.0"), models)
+        self.assertEqual(len(models), len(set(models)))
+
+    def test_resolve_through_extra_model_paths_and_prewarm(self):
+        volume = os.path.join(self.tmp, "volume")
+        comfyui = os.path.join(self.tmp, "comfyui")
+        config = os.path.join(self.tmp, "extra_model_paths.yaml")
+        with open(config, "w") as f:
+            f.write(f"worker:\n  base_path: {volume}\n  unet: models/unet/\n  LLM: models/LLM/\n")
+        unet = self.write("volume/models/unet/flux1-dev-F16.gguf", 3000)
+        self.write("volume/models/LLM/Florence-2-base/model.safetensors", 2000)
+        self.write("volume/models/LLM/Florence-2-base/config.json", 10)
+        # The default ComfyUI folder wins over the network volume
+        local_vae = self.write("comfyui/models/vae/ae.safetensors", 500)
+        self.write("volume/models/vae/ae.safetensors", 500)
+
+        models = [("unet", "flux1-dev-F16.gguf"), ("LLM", "Florence-2-base"), ("vae", "ae.safetensors"), ("loras", "missing.safetensors")]
+        resolved, missing = rp_prewarm.resolve_models(models, rp_prewarm.model_search_paths(config, comfyui))
+
+        self.assertEqual(resolved[("unet", "flux1-dev-F16.gguf")], unet)
+        self.assertEqual(resolved[("vae", "ae.safetensors")], local_vae)
+        self.assertEqual(missing, [("loras", "missing.safetensors")])
+
+        report = rp_prewarm.prewarm(list(resolved.values()), mode="read", workers=2)
+        self.assertEqual(report["files"], 4)
+        self.assertEqual(report["bytes"], 5510)
+        self.assertEqual(report["errors"], {})
+
+        report = rp_prewarm.prewarm(list(resolved.values()), mode="fadvise", max_bytes=4000)
+        self.assertEqual(report["bytes"], 3510)
+        self.assertEqual(len(report["skipped_over_budget"]), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
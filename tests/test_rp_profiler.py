@@ -0,0 +1,56 @@
+import unittest
+import sys
+import os
+import pstats
+import tempfile
+import time
+
+# Make sure that "src" is known and can be used to import rp_profiler.py
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+from src import rp_profiler
+
+
+def busy_loop(seconds):
+    end = time.perf_counter() + seconds
+    total = 0
+    while time.perf_counter() < end:
+        total += sum(range(100))
+    return total
+
+
+class TestRpProfiler(unittest.TestCase):
+    def test_both_profilers_write_files(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            profiler = rp_profiler.JobProfiler("job-1", profiler="both", interval_ms=1, output_dir=tmp)
+            profiler.start()
+            busy_loop(0.2)
+            report = profiler.stop()
+
+            self.assertEqual(
+                [os.path.basename(path) for path in report["files"]],
+                ["cpu_profile_job-1.pstats", "cpu_profile_job-1.collapsed"],
+            )
+            stats = pstats.Stats(report["files"][0])
+            self.assertTrue(any(name == "busy_loop" for _, _, name in stats.stats))
+            with open(report["files"][1]) as f:
+                lines = f.read().splitlines()
+
+        self.assertGreater(report["samples"], 0)
+        self.assertEqual(sum(int(line.rsplit(" ", 1)[1]) for line in lines), report["samples"])
+        self.assertTrue(any("busy_loop (test_rp_profiler.py:" in line for line in lines))
+        self.assertIn("function", report["top_functions"][0])
+
+    def test_sampling_only(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            profiler = rp_profiler.JobProfiler("job-2", profiler="sampling", interval_ms=1, output_dir=tmp)
+            profiler.start()
+            busy_loop(0.05)
+            report = profiler.stop()
+
+        self.assertEqual(len(report["files"]), 1)
+        self.assertTrue(report["files"][0].endswith(".collapsed"))
+        self.assertNotIn("top_functions", report)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+import unittest
+import sys
+import os
+import json
+import shutil
+import tempfile
+import importlib.util
+
+# Make sure that "src" is known and can be used to import rp_resize.py
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+from src import rp_resize
+
+HAS_PILLOW = importlib.util.find_spec("PIL") is not None
+WORKFLOWS_DIR = os.path.join(os.path.dirname(__file__), "..", "workflows")
+
+
+def scale_node(image, side_length):
+    return {
+        "class_type": "DF_Image_scale_to_side",
+        "inputs": {"side_length": side_length, "side": "Longest", "upscale_method": "lanczos", "crop": "disabled", "image": image},
+    }
+
+
+class TestRpResize(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, True)
+
+    def test_workflow_max_side(self):
+        workflow = {
+            "1": {"class_type": "LoadImage", "inputs": {"image": "input.jpg"}},
+            "2": scale_node(["1", 0], 1440),
+            "3": scale_node(["1", 0], 896),
+            # Only reads the output of a scale node
+            "4": {"class_type": "SaveImage", "inputs": {"images": ["2", 0]}},
+        }
+        self.assertEqual(rp_resize.workflow_max_side(workflow), 1440)
+        self.assertEqual(rp_resize.target_side(workflow, max_side=1000), 1000)
+        self.assertIsNone(rp_resize.workflow_max_side(workflow, "input_1.jpg"))
+
+        # A node that reads the original image needs its full resolution
+        workflow["5"] = {"class_type": "ImageStitch", "inputs": {"original_image": ["1", 0]}}
+        self.assertIsNone(rp_resize.workflow_max_side(workflow))
+        self.assertIsNone(rp_resize.target_side(workflow, max_side=0))
+
+        with open(os.path.join(WORKFLOWS_DIR, "2_0.4", "workflow.json")) as f:
+            self.assertIsNone(rp_resize.workflow_max_side(json.load(f)))
+
+    @unittest.skipUnless(HAS_PILLOW, "requires Pillow")
+    def test_resize_jpeg_with_exif_orientation(self):
+        from PIL import Image
+
+        path = os.path.join(self.tmp, "input.jpg")
+        exif = Image.Exif()
+        exif[rp_resize.EXIF_ORIENTATION] = 6
+        Image.linear_gradient("L").resize((3000, 2000)).convert("RGB").save(path, quality=95, exif=exif)
+        # Spilled staging inputs are links
+        link = os.path.join(self.tmp, "link.jpg")
+        os.symlink(path, link)
+
+        report = rp_resize.resize(link, 600)
+
+        self.assertEqual(report["original_size"], [2000, 3000])
+        self.assertEqual(report["size"], [400, 600])
+        self.assertEqual(report["original_bytes"] - report["bytes"], report["bytes_saved"])
+        self.assertGreater(report["bytes_saved"], 0)
+        self.assertTrue(os.path.islink(link))
+        with Image.open(link) as image:
+            self.assertEqual(image.format, "JPEG")
+            self.assertEqual(image.size, (400, 600))
+            self.assertNotIn(rp_resize.EXIF_ORIENTATION, image.getexif())
+
+    @unittest.skipUnless(HAS_PILLOW, "requires Pillow")
+    def test_resize_png_and_small_images(self):
+        from PIL import Image
+
+        path = os.path.join(self.tmp, "input.jpg")
+        Image.linear_gradient("L").resize((1000, 500)).convert("P").save(path, format="PNG")
+        with open(path, "rb") as f:
+            original = f.read()
+
+        self.assertIsNone(rp_resize.resize_image(path, 1000))
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), original)
+
+        report = rp_resize.resize_image(path, 250)
+        self.assertEqual(report["size"], [250, 125])
+        with Image.open(path) as image:
+            self.assertEqual(image.format, "PNG")
+            self.assertEqual(image.mode, "RGBA")
+        self.assertEqual([name for name in os.listdir(self.tmp)], ["input.jpg"])
+
+
+    @unittest.skipUnless(HAS_PILLOW, "requires Pillow")
+    def test_resize_keeps_webp_and_skips_larger_results(self):
+        from PIL import Image
+
+        path = os.path.join(self.tmp, "input.jpg")
+        Image.effect_noise((2000, 1000), 40).convert("RGB").save(path, format="WEBP", quality=80)
+
+        report = rp_resize.resize_image(path, 500)
+        self.assertGreater(report["bytes_saved"], 0)
+        with Image.open(path) as image:
+            self.assertEqual(image.format, "WEBP")
+            self.assertEqual(image.size, (500, 250))
+
+        # A flat GIF compresses better than the resized PNG
+        Image.new("P", (2000, 1000)).save(path, format="GIF")
+        with open(path, "rb") as f:
+            original = f.read()
+        self.assertIsNone(rp_resize.resize_image(path, 1999))
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), original)
+        self.assertEqual(os.listdir(self.tmp), ["input.jpg"])
+
+if __name__ == "__main__":
+    unittest.main()
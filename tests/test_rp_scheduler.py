@@ -0,0 +1,100 @@
+import unittest
+import sys
+import os
+import json
+import struct
+import shutil
+import tempfile
+import threading
+import time
+
+# Make sure that "src" is known and can be used to import rp_scheduler.py
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+from src import rp_scheduler
+
+
+class TestRpScheduler(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, True)
+
+    def write(self, name, data):
+        path = os.path.join(self.tmp, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def test_image_size_from_the_header(self):
+        png = self.write("a.png", b"\x89PNG\r\n\x1a\n" + struct.pack(">I", 13) + b"IHDR" + struct.pack(">II", 1920, 1080) + b"\x08\x02\0\0\0")
+        # SOI, an APP0 segment, then a baseline start of frame
+        jpeg = self.write("a.jpg", b"\xff\xd8" + b"\xff\xe0" + struct.pack(">H", 6) + b"JFIF" + b"\xff\xc0" + struct.pack(">HBHH", 17, 8, 600, 800) + b"\0" * 12)
+        webp = self.write("a.webp", b"RIFF\0\0\0\0WEBPVP8X" + struct.pack("<I", 10) + b"\0\0\0\0" + (3999).to_bytes(3, "little") + (2999).to_bytes(3, "little"))
+
+        self.assertEqual(rp_scheduler.image_size(png), (1920, 1080))
+        self.assertEqual(rp_scheduler.image_size(jpeg), (800, 600))
+        self.assertEqual(rp_scheduler.image_size(webp), (4000, 3000))
+        self.assertIsNone(rp_scheduler.image_size(self.write("a.txt", b"not an image")))
+        self.assertIsNone(rp_scheduler.image_size(self.write("b.jpg", b"\xff\xd8\xff\xe0")))
+
+        with open(jpeg, "rb") as f:
+            header = f.read()
+        self.assertEqual(rp_scheduler.header_image_size(header), (800, 600))
+        self.assertIsNone(rp_scheduler.header_image_size(header[:12]))
+
+    def test_cost_model_learns_from_history(self):
+        model = rp_scheduler.CostModel(tile_seconds=5)
+        self.assertEqual(model.estimate(2, "0.4"), 20)
+        self.assertEqual(model.estimate(5, "0.4"), 125)
+
+        model.record("2_0.4", 10, megapixels=1)
+        model.record("2_0.4", 20, megapixels=1)
+        self.assertAlmostEqual(model.estimate(2, "0.4"), 13)
+        self.assertAlmostEqual(model.estimate(2, "0.4", megapixels=2), 26)
+
+        trace = os.path.join(self.tmp, "trace.jsonl")
+        with open(trace, "w") as f:
+            for status, seconds in (("success", 40), ("error", 1), ("success", 50)):
+                f.write(json.dumps({"params": {"tiling": 3, "denoise": "0.6"}, "status": status, "timings": {"execution": seconds}}) + "\n")
+        self.assertEqual(model.load_trace(trace), 2)
+        self.assertAlmostEqual(model.estimate(3, "0.6"), 43)
+
+    def run_jobs(self, scheduler, jobs, gap=0):
+        """Queue jobs (name, cost, priority) behind a running one and return the order they ran in"""
+        order = []
+        release = threading.Event()
+
+        def run(name, cost, priority):
+            with scheduler.slot(name, cost, priority):
+                if name == "running":
+                    release.wait()
+                order.append(name)
+
+        threads = [threading.Thread(target=run, args=("running", 0, 0))]
+        threads[0].start()
+        while scheduler._running == 0:
+            time.sleep(0.001)
+        for job in jobs:
+            threads.append(threading.Thread(target=run, args=job))
+            threads[-1].start()
+            while scheduler.waiting() < len(threads) - 1:
+                time.sleep(0.001)
+            time.sleep(gap)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        return order[1:]
+
+    def test_cheapest_job_first_with_priority(self):
+        scheduler = rp_scheduler.PriorityScheduler(priority_seconds=60, aging=0)
+        order = self.run_jobs(scheduler, [("tiling_5", 125, 0), ("tiling_2", 20, 0), ("tiling_4", 80, 0), ("urgent", 125, 2)])
+        self.assertEqual(order, ["urgent", "tiling_2", "tiling_4", "tiling_5"])
+
+    def test_aging_prevents_starvation(self):
+        scheduler = rp_scheduler.PriorityScheduler(aging=100000)
+        order = self.run_jobs(scheduler, [("expensive", 100, 0)] + [(f"cheap_{i}", 1, 0) for i in range(3)], gap=0.01)
+        # The jobs queued later are cheaper, but the expensive one has waited longer
+        self.assertEqual(order[0], "expensive")
+
+
+if __name__ == "__main__":
+    unittest.main()
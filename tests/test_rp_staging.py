@@ -0,0 +1,89 @@
+import unittest
+import sys
+import os
+import shutil
+import tempfile
+
+# Make sure that "src" is known and can be used to import rp_staging.py
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+from src import rp_staging
+
+
+class TestRpStaging(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, True)
+        self.tmpfs_dir = os.path.join(self.tmp, "shm")
+        self.disk_dir = os.path.join(self.tmp, "comfyui")
+        # The capacity of the "tmpfs" is capped at 1000 bytes, 400 of them reserved for outputs
+        self.staging = rp_staging.Staging(self.tmpfs_dir, os.path.join(self.disk_dir, "staging"), self.disk_dir, 1000, 400)
+
+    def write(self, path, size):
+        with open(path, "wb") as f:
+            f.write(b"\0" * size)
+        return path
+
+    def test_prepare_links_the_directories(self):
+        report = self.staging.prepare()
+
+        self.assertEqual(report, {"location": "tmpfs", "capacity_bytes": 1000, "reserve_bytes": 400})
+        for name in rp_staging.DIRECTORIES:
+            self.assertEqual(self.staging.location(name), "tmpfs")
+        self.write(os.path.join(self.staging.link("output"), "output_0001.psd"), 10)
+        self.assertTrue(os.path.exists(os.path.join(self.tmpfs_dir, "output", "output_0001.psd")))
+
+        # Preparing again keeps the links working
+        self.staging.prepare()
+        self.assertTrue(os.path.exists(os.path.join(self.staging.link("output"), "output_0001.psd")))
+
+    def test_too_small_tmpfs_stays_on_disk(self):
+        self.staging.reserve_bytes = 2000
+
+        report = self.staging.prepare()
+
+        self.assertEqual(report["location"], "disk")
+        self.assertFalse(self.staging.enabled)
+        self.assertEqual(os.path.realpath(self.staging.link("input")), os.path.realpath(os.path.join(self.disk_dir, "input")))
+
+    def test_inputs_spill_to_disk(self):
+        self.staging.prepare()
+        input_dir = self.staging.link("input")
+
+        first = os.path.join(input_dir, "input_a.jpg")
+        self.assertEqual(self.staging.place_input(first), first)
+        self.write(first, 700)
+
+        # 300 bytes are left, less than the reserve for the outputs
+        second = os.path.join(input_dir, "input_b.jpg")
+        spill_path = self.staging.place_input(second)
+        self.assertEqual(spill_path, os.path.join(self.disk_dir, "input", "input_b.jpg"))
+        self.write(spill_path, 500)
+        with open(second, "rb") as f:
+            self.assertEqual(len(f.read()), 500)
+
+        rp_staging.remove(second)
+        self.assertFalse(os.path.lexists(second))
+        self.assertFalse(os.path.exists(spill_path))
+
+    def test_select_moves_the_outputs(self):
+        self.staging.prepare()
+        self.write(os.path.join(self.staging.link("temp"), "ComfyUI_temp_00001_.png"), 100)
+        self.assertEqual(self.staging.select(), "tmpfs")
+        # The previews of the previous job are gone
+        self.assertEqual(os.listdir(self.staging.link("temp")), [])
+
+        self.write(os.path.join(self.staging.link("input"), "input.jpg"), 700)
+        self.assertEqual(self.staging.select(), "disk")
+        self.assertEqual(self.staging.location("output"), "disk")
+        self.assertEqual(self.staging.location("temp"), "disk")
+
+        # An output left behind keeps the outputs where they are
+        self.write(os.path.join(self.staging.link("output"), "output_0001.png"), 10)
+        os.remove(os.path.join(self.staging.link("input"), "input.jpg"))
+        self.assertEqual(self.staging.select(), "disk")
+        os.remove(os.path.join(self.staging.link("output"), "output_0001.png"))
+        self.assertEqual(self.staging.select(), "tmpfs")
+
+
+if __name__ == "__main__":
+    unittest.main()
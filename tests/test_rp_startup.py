@@ -0,0 +1,65 @@
+import unittest
+import sys
+import os
+import json
+import subprocess
+import threading
+import http.server
+
+# Make sure that "src" is known and can be used to import rp_startup.py
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.append(SRC_DIR)
+from src import rp_startup
+
+
+class ReadyHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, *args):
+        pass
+
+
+class TestRpStartup(unittest.TestCase):
+    def test_events_are_recorded_once(self):
+        timeline = rp_startup.StartupTimeline()
+        self.assertTrue(timeline.mark("comfyui_spawned", 100.0))
+        self.assertTrue(timeline.mark("comfyui_http_ready", 112.5))
+        self.assertFalse(timeline.mark("comfyui_http_ready", 200.0))
+        self.assertTrue(timeline.mark("first_job_accepted", 115.0))
+
+        self.assertEqual(timeline.durations(), {
+            "comfyui_http_ready_seconds": 12.5,
+            "first_job_seconds": 15.0,
+        })
+
+    def test_watch_comfyui(self):
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), ReadyHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        timeline = rp_startup.StartupTimeline()
+        ready = threading.Event()
+        timeline.watch_comfyui(f"127.0.0.1:{server.server_port}", on_ready=ready.set, timeout=5)
+
+        self.assertTrue(ready.wait(5))
+        self.assertLessEqual(timeline.events["comfyui_http_ready"], timeline.events["comfyui_object_info_ready"])
+
+    def test_handler_import_skips_optional_dependencies(self):
+        code = (
+            "import json, sys; import rp_handler; "
+            "print(json.dumps([name for name in ('runpod', 'tusclient', 'loki_logger_handler') if name in sys.modules]))"
+        )
+        env = {key: value for key, value in os.environ.items() if key != "LOKI_URL"}
+        output = subprocess.run(
+            [sys.executable, "-c", code], cwd=SRC_DIR, env=env, capture_output=True, text=True, check=True
+        ).stdout
+
+        self.assertEqual(json.loads(output.strip().splitlines()[-1]), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+import sys
+import os
+import json
+import tempfile
+
+# Make sure that "src" is known and can be used to import rp_tracing.py
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+from src import rp_tracing
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_SPAN_ID = "00f067aa0ba902b7"
+
+
+class TestRpTracing(unittest.TestCase):
+    def setUp(self):
+        rp_tracing.shutdown()
+        self.addCleanup(rp_tracing.shutdown)
+
+    def read_spans(self, path):
+        rp_tracing.shutdown()
+        with open(path) as f:
+            return [json.loads(line) for line in f]
+
+    def test_spans_are_noop_without_configuration(self):
+        self.assertFalse(rp_tracing.init_tracing())
+        with rp_tracing.span("handler") as current_span:
+            self.assertIsNone(current_span)
+        self.assertIsNone(rp_tracing.extract_context({"traceparent": f"00-{TRACE_ID}-{PARENT_SPAN_ID}-01"}))
+
+    def test_job_span_continues_traceparent(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "spans.jsonl")
+            self.assertTrue(rp_tracing.init_tracing(traces_file=path))
+
+            job_input = {"traceparent": f"00-{TRACE_ID}-{PARENT_SPAN_ID}-01"}
+            with rp_tracing.span("handler", {"job.id": "job-1"}, context=rp_tracing.extract_context(job_input)):
+                with rp_tracing.span("download"):
+                    pass
+            spans = {span["name"]: span for span in self.read_spans(path)}
+
+        self.assertEqual(set(spans), {"handler", "download"})
+        self.assertEqual(spans["handler"]["context"]["trace_id"], "0x" + TRACE_ID)
+        self.assertEqual(spans["handler"]["parent_id"], "0x" + PARENT_SPAN_ID)
+        self.assertEqual(spans["handler"]["attributes"]["job.id"], "job-1")
+        self.assertEqual(spans["download"]["parent_id"], spans["handler"]["context"]["span_id"])
+
+    def test_set_error_marks_span_as_failed(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "spans.jsonl")
+            rp_tracing.init_tracing(traces_file=path)
+
+            with rp_tracing.span("handler") as current_span:
+                rp_tracing.set_error(current_span, "Error queuing workflow")
+            spans = self.read_spans(path)
+
+        self.assertEqual(spans[0]["status"]["status_code"], "ERROR")
+        self.assertEqual(spans[0]["status"]["description"], "Error queuing workflow")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,184 @@
+import unittest
+import sys
+import os
+import shutil
+import tempfile
+import threading
+import http.server
+
+# Make sure that "src" is known and can be used to import rp_tus.py
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+from src import rp_tus
+
+
+class TusHandler(http.server.BaseHTTPRequestHandler):
+    """A minimal TUS server keeping the uploads in memory"""
+
+    protocol_version = "HTTP/1.1"
+    uploads = {}
+    lengths = {}
+    requests = []
+    connections = set()
+    # Number of PATCHes that store only half of their chunk and fail
+    fail_patches = 0
+    # Status of the creation requests
+    create_status = 201
+
+    def reply(self, status, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self):
+        TusHandler.connections.add(self.client_address)
+        TusHandler.requests.append(("POST", dict(self.headers)))
+        if TusHandler.create_status != 201:
+            return self.reply(TusHandler.create_status)
+        upload_id = str(len(TusHandler.uploads))
+        TusHandler.uploads[upload_id] = bytearray()
+        TusHandler.lengths[upload_id] = self.headers.get("Upload-Length")
+        self.reply(201, {"Location": f"/files/{upload_id}"})
+
+    def do_HEAD(self):
+        upload = TusHandler.uploads[self.path.rsplit("/", 1)[1]]
+        self.reply(200, {"Upload-Offset": str(len(upload))})
+
+    def do_PATCH(self):
+        TusHandler.connections.add(self.client_address)
+        upload_id = self.path.rsplit("/", 1)[1]
+        upload = TusHandler.uploads[upload_id]
+        if "Upload-Length" in self.headers:
+            TusHandler.lengths[upload_id] = self.headers["Upload-Length"]
+        chunk = self.rfile.read(int(self.headers["Content-Length"]))
+        TusHandler.requests.append(("PATCH", dict(self.headers)))
+        if int(self.headers["Upload-Offset"]) != len(upload):
+            return self.reply(409)
+        if TusHandler.fail_patches:
+            TusHandler.fail_patches -= 1
+            upload.extend(chunk[:len(chunk) // 2])
+            return self.reply(500)
+        upload.extend(chunk)
+        self.reply(204, {"Upload-Offset": str(len(upload))})
+
+    def log_message(self, *args):
+        pass
+
+
+class TestRpTus(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, True)
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), TusHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.url = f"http://127.0.0.1:{server.server_port}/files"
+        TusHandler.uploads.clear()
+        TusHandler.lengths.clear()
+        TusHandler.requests.clear()
+        TusHandler.connections.clear()
+        TusHandler.fail_patches = 0
+        TusHandler.create_status = 201
+
+    def write(self, size):
+        self.data = os.urandom(size)
+        path = os.path.join(self.tmp, "output.png")
+        with open(path, "wb") as f:
+            f.write(self.data)
+        return path
+
+    def test_chunk_size_follows_the_link(self):
+        sizer = rp_tus.ChunkSizer(minimum=64 * 1024, maximum=64 * 1024 * 1024, rtt_overhead=0.05)
+        self.assertEqual(sizer.size, 64 * 1024)
+
+        # 100 MB/s with a 20 ms round trip: 19 round trips of data per chunk
+        sizer.record_rtt(0.02)
+        sizer.record_chunk(1024 * 1024, 0.01)
+        self.assertAlmostEqual(sizer.size, 100 * 1024 * 1024 * 0.02 * 19, delta=64 * 1024)
+        self.assertEqual(sizer.size % (64 * 1024), 0)
+        sizer.record_chunk(1024 * 1024 * 1024, 1)
+        self.assertEqual(sizer.size, 64 * 1024 * 1024)
+
+    def test_sendfile_upload_on_one_connection(self):
+        path = self.write(3 * 1024 * 1024 + 123)
+        uploader = rp_tus.StreamUploader([(path, 0, len(self.data))], self.url, {"mimeType": "image/png"},
+                                         sizer=rp_tus.ChunkSizer(minimum=256 * 1024, maximum=1024 * 1024))
+        self.assertTrue(uploader.use_sendfile)
+
+        url = uploader.upload()
+
+        self.assertEqual(url, f"{self.url}/0")
+        self.assertEqual(bytes(TusHandler.uploads["0"]), self.data)
+        self.assertEqual(len(TusHandler.connections), 1)
+        method, headers = TusHandler.requests[0]
+        self.assertEqual((method, headers["Tus-Resumable"], headers["mimeType"]), ("POST", "1.0.0", "image/png"))
+        self.assertEqual(headers["Upload-Length"], str(len(self.data)))
+        sizes = [size for size, _ in uploader.chunks]
+        self.assertEqual(sum(sizes), len(self.data))
+        self.assertEqual(sizes[0], 256 * 1024)
+
+    def test_rejected_creation_closes_the_connection(self):
+        TusHandler.create_status = 413
+        path = self.write(1000)
+        for uploader in (
+            rp_tus.StreamUploader([(path, 0, len(self.data))], self.url),
+            rp_tus.DeferredUploader(iter([self.data]), self.url),
+        ):
+            with self.subTest(uploader=type(uploader).__name__):
+                with self.assertRaisesRegex(rp_tus.TusError, "status 413"):
+                    uploader.upload()
+                self.assertIsNone(uploader._connection)
+
+    def test_mmap_upload_of_a_byte_range_resumes_a_failed_chunk(self):
+        path = self.write(1024 * 1024)
+        TusHandler.fail_patches = 1
+        uploader = rp_tus.StreamUploader([(path, 5000, 600000)], self.url, {"Upload-Concat": "partial"},
+                                         sizer=rp_tus.ChunkSizer(minimum=200000, maximum=200000))
+        uploader.use_sendfile = False
+
+        uploader.upload()
+
+        self.assertEqual(bytes(TusHandler.uploads["0"]), self.data[5000:605000])
+        self.assertEqual(TusHandler.requests[0][1]["Upload-Concat"], "partial")
+        # The failed chunk continues from the half the server kept
+        offsets = [int(headers["Upload-Offset"]) for method, headers in TusHandler.requests if method == "PATCH"]
+        self.assertEqual(offsets, [0, 100000, 300000, 500000])
+
+    def test_segments_of_bytes_and_files(self):
+        path = self.write(300000)
+        segments = [b"header", (path, 1000, 200000), b"", (path, 0, 10), b"end"]
+        for use_sendfile in (True, False):
+            with self.subTest(use_sendfile=use_sendfile):
+                uploader = rp_tus.StreamUploader(segments, self.url, metadata={"filename": "bundle.tar"},
+                                                 sizer=rp_tus.ChunkSizer(minimum=65536, maximum=65536))
+                uploader.use_sendfile = use_sendfile
+                uploader.upload()
+
+                self.assertEqual(uploader.length, 200019)
+                self.assertEqual(bytes(TusHandler.uploads[uploader.url.rsplit("/", 1)[1]]),
+                                 b"header" + self.data[1000:201000] + self.data[:10] + b"end")
+        self.assertEqual(TusHandler.requests[0][1]["Upload-Metadata"], "filename YnVuZGxlLnRhcg==")
+
+    def test_deferred_length_stream(self):
+        chunks = [os.urandom(30000) for _ in range(5)]
+        TusHandler.fail_patches = 1
+        uploader = rp_tus.DeferredUploader(iter(chunks), self.url, sizer=rp_tus.ChunkSizer(minimum=50000, maximum=50000))
+
+        uploader.upload()
+
+        self.assertEqual(bytes(TusHandler.uploads["0"]), b"".join(chunks))
+        self.assertEqual(TusHandler.requests[0][1]["Upload-Defer-Length"], "1")
+        self.assertEqual(TusHandler.lengths["0"], "150000")
+        self.assertEqual(uploader.length, 150000)
+
+    def test_empty_file(self):
+        path = self.write(0)
+        rp_tus.upload(path, self.url)
+        self.assertEqual(bytes(TusHandler.uploads["0"]), b"")
+        self.assertEqual([method for method, _ in TusHandler.requests], ["POST"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,173 @@
+import unittest
+import sys
+import os
+import json
+import shutil
+import tempfile
+import threading
+import http.server
+
+# Make sure that "src" is known and can be used to import rp_upload_spool.py
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+from src import rp_upload_spool
+
+
+class CallbackHandler(http.server.BaseHTTPRequestHandler):
+    received = []
+
+    def do_POST(self):
+        CallbackHandler.received.append(json.loads(self.rfile.read(int(self.headers["Content-Length"]))))
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class TestRpUploadSpool(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, True)
+        self.output = os.path.join(self.tmp, "output")
+        self.spool_dir = os.path.join(self.tmp, "spool")
+        os.makedirs(self.spool_dir)
+        self.uploaded = []
+        self.failures = {}
+
+    def write(self, name, size):
+        path = os.path.join(self.output, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(b"\0" * size)
+        return path
+
+    def upload(self, job_id, file_path, upload_url, job_dir):
+        relative_path = os.path.relpath(file_path, job_dir)
+        if self.failures.get(relative_path, 0) > 0:
+            self.failures[relative_path] -= 1
+            return 0, "connection reset"
+        self.uploaded.append((job_id, relative_path, upload_url))
+        return os.path.getsize(file_path), None
+
+    def spool(self, **kwargs):
+        return rp_upload_spool.UploadSpool(self.spool_dir, self.upload, min_free_bytes=0, backoff=0, **kwargs)
+
+    def read_status(self, job_id):
+        with open(os.path.join(self.spool_dir, "status", f"{job_id}.json")) as f:
+            return json.load(f)
+
+    def test_spools_and_uploads_with_retries_and_callback(self):
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), CallbackHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        CallbackHandler.received.clear()
+
+        files = [self.write("a.png", 100), self.write("psd/b.psd", 300)]
+        self.failures["psd/b.psd"] = 2
+        spool = self.spool(retries=3)
+
+        status = spool.put("job-1", files, self.output, "http://tus/files", f"http://127.0.0.1:{server.server_port}/done")
+        self.assertEqual(status["status"], "queued")
+        self.assertEqual(status["total_bytes"], 400)
+        self.assertFalse(os.path.exists(files[0]))
+        self.assertTrue(spool.wait(5))
+
+        self.assertEqual(sorted(self.uploaded), [("job-1", "a.png", "http://tus/files"), ("job-1", "psd/b.psd", "http://tus/files")])
+        self.assertEqual(self.read_status("job-1")["status"], "done")
+        self.assertEqual(self.read_status("job-1")["uploaded_bytes"], 400)
+        self.assertFalse(os.path.exists(os.path.join(self.spool_dir, "job-1")))
+        self.assertEqual([status["status"] for status in CallbackHandler.received], ["done"])
+
+    def test_fails_after_retries(self):
+        self.failures["a.png"] = 5
+        spool = self.spool(retries=2)
+        spool.put("job-1", [self.write("a.png", 100)], self.output, "http://tus/files")
+        self.assertTrue(spool.wait(5))
+
+        status = self.read_status("job-1")
+        self.assertEqual(status["status"], "failed")
+        self.assertEqual(status["error"], "connection reset")
+        self.assertEqual(self.failures["a.png"], 3)
+        # The outputs are kept, outside the byte budget
+        self.assertEqual(status["failed_path"], os.path.join(self.spool_dir, "failed", "job-1"))
+        self.assertTrue(os.path.exists(os.path.join(status["failed_path"], "a.png")))
+        self.assertFalse(os.path.exists(os.path.join(self.spool_dir, "job-1")))
+        self.assertEqual(spool._bytes, 0)
+
+        # Failed jobs are not resumed
+        self.assertEqual(self.spool()._pending, [])
+
+    def test_resumes_a_spool_left_behind(self):
+        job_dir = os.path.join(self.spool_dir, "job-1")
+        os.makedirs(job_dir)
+        for name in ("a.png", "b.png"):
+            with open(os.path.join(job_dir, name), "wb") as f:
+                f.write(b"\0" * 10)
+        rp_upload_spool.write_json(os.path.join(job_dir, "job.json"), {
+            "job_id": "job-1",
+            "upload_url": "http://tus/files",
+            "callback": None,
+            "files": {"a.png": {"size": 10, "uploaded": True}, "b.png": {"size": 10, "uploaded": False}},
+        })
+
+        spool = self.spool()
+        spool.start()
+        self.assertTrue(spool.wait(5))
+
+        self.assertEqual(self.uploaded, [("job-1", "b.png", "http://tus/files")])
+        self.assertEqual(self.read_status("job-1")["uploaded_count"], 2)
+
+    def test_workers_sharing_the_spool_claim_their_jobs(self):
+        job_dir = os.path.join(self.spool_dir, "job-1")
+        os.makedirs(job_dir)
+        with open(os.path.join(job_dir, "a.png"), "wb") as f:
+            f.write(b"\0" * 10)
+        rp_upload_spool.write_json(os.path.join(job_dir, "job.json"), {
+            "job_id": "job-1",
+            "upload_url": "http://tus/files",
+            "callback": None,
+            "files": {"a.png": {"size": 10, "uploaded": False}},
+        })
+        release = threading.Event()
+
+        def slow_upload(*args):
+            release.wait(5)
+            return self.upload(*args)
+
+        first = rp_upload_spool.UploadSpool(self.spool_dir, slow_upload, min_free_bytes=0, backoff=0)
+        first.put("job-2", [self.write("job-2.png", 10)], self.output, "http://tus/files")
+        # Another worker starting on the same spool leaves both jobs to the first one
+        second = self.spool()
+        self.assertEqual(second._pending, [])
+
+        release.set()
+        self.assertTrue(first.wait(5))
+        self.assertEqual([job_id for job_id, _, _ in self.uploaded], ["job-1", "job-2"])
+        self.assertEqual(sorted(os.listdir(self.spool_dir)), ["status"])
+
+    def test_backpressure_over_the_byte_budget(self):
+        release = threading.Event()
+
+        def slow_upload(*args):
+            release.wait(5)
+            return self.upload(*args)
+
+        spool = rp_upload_spool.UploadSpool(self.spool_dir, slow_upload, max_bytes=150, min_free_bytes=0, backoff=0)
+        spool.put("job-1", [self.write("job-1.png", 100)], self.output, "http://tus/files")
+
+        second = threading.Thread(target=spool.put, args=("job-2", [self.write("job-2.png", 100)], self.output, "http://tus/files"))
+        second.start()
+        second.join(0.3)
+        # The second job waits until the first one is uploaded
+        self.assertTrue(second.is_alive())
+        self.assertFalse(os.path.exists(os.path.join(self.spool_dir, "job-2")))
+
+        release.set()
+        second.join(5)
+        self.assertTrue(spool.wait(5))
+        self.assertEqual([job_id for job_id, _, _ in self.uploaded], ["job-1", "job-2"])
+
+
+if __name__ == "__main__":
+    unittest.main()